@@ -0,0 +1,5 @@
+import sys
+
+from .e2e import main
+
+main(sys.argv[1:])
@@ -0,0 +1,210 @@
+"""
+Minimal NXTCP client used to generate load.
+"""
+
+import socket
+from struct import pack, unpack_from
+
+from nervixd.util.decoder import BaseDecoder
+from nervixd.util.encoder import BaseEncoder
+
+from nervixd.services.nxtcp.defines import *
+
+SESSION_ENDED = 0
+SESSION_STANDBY = 1
+SESSION_ACTIVE = 2
+
+MESSAGE_OK = 0
+
+
+class BenchClient:
+    """
+    NXTCP client that runs on a nervixd mainloop.
+
+    Downstream packets are passed to the on_* attributes, when they are
+    set. The scenarios use these to drive the load.
+    """
+
+    def __init__(self, mainloop, address):
+        self.mainloop = mainloop
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.setblocking(False)
+        self.socket.connect_ex(address)
+
+        self.decoder = BaseDecoder(chunksize=65536)
+        self.encoder = BaseEncoder(chunksize=65536)
+
+        self.proxy = mainloop.register(self.socket)
+        self.proxy.set_read_handler(self.__on_read)
+        self.proxy.set_write_handler(self.__on_write)
+        self.proxy.set_interest(read=True)
+
+        self.closed = False
+
+        # handlers, called with the fields of the packet
+        self.on_welcome = None
+        self.on_session = None
+        self.on_call = None
+        self.on_message = None
+        self.on_interest = None
+        self.on_close = None
+
+        self.handlers = {
+            PACKET_WELCOME: self.__handle_welcome,
+            PACKET_SESSION: self.__handle_session,
+            PACKET_CALL: self.__handle_call,
+            PACKET_MESSAGE: self.__handle_message,
+            PACKET_INTEREST: self.__handle_interest,
+            PACKET_PING: self.__handle_ping,
+        }
+
+    def login(self, name, persist=False, standby=False, enforce=False, shared=False, weight=None):
+        flags = persist | standby << 1 | enforce << 2 | shared << 3
+
+        body = pack('>B', flags) + self.__string(name)
+
+        if weight is not None:
+            body += pack('>B', weight)
+
+        self.__send(PACKET_LOGIN, body)
+
+    def logout(self, name):
+        self.__send(PACKET_LOGOUT, self.__string(name))
+
+    def request(self, name, messageref, payload, unidirectional=False, timeout=5.0):
+        body = self.__string(name) + pack('>BII', unidirectional, messageref, int(timeout * 1000))
+        self.__send(PACKET_REQUEST, body + self.__blob(payload))
+
+    def post(self, postref, payload):
+        self.__send(PACKET_POST, pack('>I', postref) + self.__blob(payload))
+
+    def subscribe(self, messageref, name, topic):
+        self.__send(PACKET_SUBSCRIBE, pack('>I', messageref) + self.__string(name) + self.__blob(topic))
+
+    def unsubscribe(self, name, topic):
+        self.__send(PACKET_UNSUBSCRIBE, self.__string(name) + self.__blob(topic))
+
+    def backlog(self):
+        """
+        Return the number of bytes that are not written to the socket
+        yet.
+        """
+
+        return self.encoder.pending
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+
+        self.proxy.unregister()
+        self.socket.close()
+
+        if self.on_close:
+            self.on_close()
+
+    def __send(self, packet_type, body):
+        if self.closed:
+            return
+
+        self.encoder.add_encoded_chunk(pack('>IB', len(body), packet_type) + body)
+        self.proxy.start_writing()
+
+    def __on_write(self):
+        try:
+            n = self.encoder.write_to_socket(self.socket)
+
+        except OSError:
+            self.close()
+            return
+
+        if n == 0 or not self.encoder.pending:
+            self.proxy.stop_writing()
+
+    def __on_read(self):
+        try:
+            n = self.decoder.read_from_socket(self.socket)
+
+        except OSError:
+            n = 0
+
+        while not self.closed:
+
+            header = self.decoder.get(5)
+
+            if not header:
+                break
+
+            length, packet_type = unpack_from('>IB', header)
+
+            frame = self.decoder.get(length, 5)
+
+            if frame is None:
+                break
+
+            self.decoder.commit()
+
+            handler = self.handlers.get(packet_type, None)
+
+            if handler:
+                handler(bytes(frame))
+
+        if n == 0:
+            self.close()
+
+    def __handle_welcome(self, frame):
+        if self.on_welcome:
+            self.on_welcome()
+
+    def __handle_session(self, frame):
+        state, = unpack_from('>B', frame, 0)
+        name = self.__get_string(frame, 1)
+
+        if self.on_session:
+            self.on_session(name, state)
+
+    def __handle_call(self, frame):
+        flags, postref = unpack_from('>BI', frame, 0)
+        name = self.__get_string(frame, 5)
+        payload = self.__get_blob(frame, 6 + len(name))
+
+        if self.on_call:
+            self.on_call(postref if not flags & 1 else None, name, payload)
+
+    def __handle_message(self, frame):
+        status, messageref = unpack_from('>BI', frame, 0)
+        payload = self.__get_blob(frame, 5) if status == MESSAGE_OK else None
+
+        if self.on_message:
+            self.on_message(messageref, status, payload)
+
+    def __handle_interest(self, frame):
+        status, postref = unpack_from('>BI', frame, 0)
+        topic = self.__get_blob(frame, 5)
+
+        if self.on_interest:
+            self.on_interest(postref, bool(status), topic)
+
+    def __handle_ping(self, frame):
+        self.__send(PACKET_PONG, b'')
+
+    @staticmethod
+    def __string(value):
+        return pack('>B', len(value)) + value
+
+    @staticmethod
+    def __blob(value):
+        return pack('>I', len(value)) + value
+
+    @staticmethod
+    def __get_string(frame, offset):
+        length = frame[offset]
+        return frame[offset + 1:offset + 1 + length]
+
+    @staticmethod
+    def __get_blob(frame, offset):
+        length, = unpack_from('>I', frame, offset)
+        return frame[offset + 4:offset + 4 + length]
@@ -0,0 +1,174 @@
+"""
+End-to-end benchmark of nervixd over NXTCP on loopback.
+
+Run with: python -m benchmarks [scenario ...] [--server inprocess|subprocess] [--output file]
+
+The results are reported as JSON, so they can be compared between
+releases or used to gate regressions.
+"""
+
+import sys
+import json
+import time
+import resource
+import platform
+import argparse
+
+from nervixd.mainloop import Mainloop
+
+from .server import InProcessServer, SubprocessServer, find_free_port
+from .scenarios import SCENARIOS
+
+SERVERS = {
+    InProcessServer.name: InProcessServer,
+    SubprocessServer.name: SubprocessServer,
+}
+
+
+def percentile(ordered, p):
+    """
+    Return the given percentile of a sorted list, using the nearest
+    rank.
+    """
+
+    if not ordered:
+        return None
+
+    index = min(len(ordered) - 1, int(len(ordered) * p / 100.0))
+    return ordered[index]
+
+
+def run_until(mainloop, condition, timeout):
+    """
+    Run the mainloop until the condition holds, returns False on
+    timeout.
+    """
+
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        mainloop.run_once(0.1)
+
+    return True
+
+
+def run_scenario(name, options):
+    """
+    Run a single scenario against a fresh server, returning its report.
+    """
+
+    mainloop = Mainloop()
+    address = (options.host, find_free_port(options.host))
+
+    server = SERVERS[options.server](mainloop, address)
+    scenario = SCENARIOS[name](mainloop, address, options)
+
+    try:
+        scenario.setup()
+
+        if not run_until(mainloop, scenario.is_ready, options.setup_timeout):
+            raise RuntimeError("Scenario {} did not get ready in time".format(name))
+
+        server_before = server.resources()
+        client_before = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+
+        scenario.start()
+
+        end = start + options.duration
+        run_until(mainloop, lambda: time.perf_counter() >= end, options.duration + 1.0)
+
+        elapsed = time.perf_counter() - start
+
+        server_after = server.resources()
+        client_after = resource.getrusage(resource.RUSAGE_SELF)
+
+        scenario.stop()
+
+    finally:
+        server.stop()
+
+    latencies = sorted(scenario.latencies)
+
+    def us(value):
+        return None if value is None else round(value * 1e6, 1)
+
+    def delta(key):
+        if server_before[key] is None or server_after[key] is None:
+            return None
+
+        return server_after[key] - server_before[key]
+
+    server_cpu = delta('cpu_seconds')
+
+    return {
+        'scenario': name,
+        'server': options.server,
+        'params': scenario.params(),
+        'duration': round(elapsed, 3),
+        'operations': scenario.operations,
+        'errors': scenario.errors,
+        'throughput': round(scenario.operations / elapsed, 1),
+        'latency_us': {
+            'mean': us(sum(latencies) / len(latencies) if latencies else None),
+            'p50': us(percentile(latencies, 50)),
+            'p90': us(percentile(latencies, 90)),
+            'p99': us(percentile(latencies, 99)),
+            'max': us(latencies[-1] if latencies else None),
+        },
+        'server_cpu_seconds': server_cpu,
+        'server_cpu_percent': None if server_cpu is None else round(server_cpu / elapsed * 100.0, 1),
+        'server_rss_bytes': server_after['rss_bytes'],
+        'client_cpu_seconds': round(
+            client_after.ru_utime + client_after.ru_stime - client_before.ru_utime - client_before.ru_stime, 3
+        ),
+    }
+
+
+def main(arg_list):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip().splitlines()[0])
+
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='Scenarios to run: {}, all by default'.format(', '.join(SCENARIOS)))
+    parser.add_argument('--server', choices=list(SERVERS), default=InProcessServer.name,
+                        help='Run the server in this process, sharing the mainloop, or in a subprocess')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to run the server on')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds to run each scenario')
+    parser.add_argument('--setup-timeout', type=float, default=30.0, help='Seconds a scenario may take to set up')
+    parser.add_argument('--clients', type=int, default=8, help='Number of clients that generate load')
+    parser.add_argument('--owners', type=int, default=4, help='Number of owners of the shared name (rpc)')
+    parser.add_argument('--subscribers', type=int, default=100, help='Number of subscribers (fanout)')
+    parser.add_argument('--topics', type=int, default=1000, help='Number of topics per client (churn)')
+    parser.add_argument('--window', type=int, default=16, help='Messages in flight per client')
+    parser.add_argument('--payload-size', type=int, default=64, help='Size of the payloads in bytes')
+    parser.add_argument('--output', help='Write the report to this file instead of stdout')
+
+    options = parser.parse_args(arg_list)
+
+    for name in options.scenarios:
+        if name not in SCENARIOS:
+            parser.error("Unknown scenario '{}'".format(name))
+
+    report = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': [run_scenario(name, options) for name in options.scenarios or SCENARIOS],
+    }
+
+    output = json.dumps(report, indent=2)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
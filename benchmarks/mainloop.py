@@ -0,0 +1,183 @@
+"""
+Compare the native mainloop with the asyncio based mainloop.
+
+Run with: python -m benchmarks.mainloop [--rounds n] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+
+from nervixd.mainloop import Mainloop
+from nervixd.mainloop.aio import AsyncioMainloop
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+def get_mainloops():
+    """
+    Return the mainloop factories to compare, by name.
+    """
+
+    mainloops = {
+        'native': Mainloop,
+        'asyncio': lambda: AsyncioMainloop(asyncio.new_event_loop()),
+    }
+
+    if uvloop:
+        mainloops['uvloop'] = lambda: AsyncioMainloop(uvloop.new_event_loop())
+
+    return mainloops
+
+
+def bench_ping_pong(mainloop, rounds):
+    """
+    Bounce a single byte between both ends of a socketpair, every
+    round trip takes two read events.
+    """
+
+    a, b = socket.socketpair()
+    a.setblocking(False)
+    b.setblocking(False)
+
+    remaining = [rounds]
+
+    proxy_a = mainloop.register(a)
+    proxy_b = mainloop.register(b)
+
+    def on_read_a():
+        a.recv(1)
+
+        remaining[0] -= 1
+
+        if remaining[0] > 0:
+            a.send(b'x')
+
+    def on_read_b():
+        b.recv(1)
+        b.send(b'x')
+
+    proxy_a.set_read_handler(on_read_a)
+    proxy_b.set_read_handler(on_read_b)
+    proxy_a.set_interest(read=True)
+    proxy_b.set_interest(read=True)
+
+    a.send(b'x')
+
+    while remaining[0] > 0:
+        mainloop.run_once(1.0)
+
+    proxy_a.unregister()
+    proxy_b.unregister()
+    a.close()
+    b.close()
+
+
+def bench_timers(mainloop, rounds):
+    """
+    Set a timer from the handler of the previous one.
+    """
+
+    timer = mainloop.timer()
+    remaining = [rounds]
+
+    def on_timer():
+        remaining[0] -= 1
+
+        if remaining[0] > 0:
+            timer.set(0)
+
+    timer.set_handler(on_timer)
+    timer.set(0)
+
+    while remaining[0] > 0:
+        mainloop.run_once(1.0)
+
+
+def bench_deferred(mainloop, rounds):
+    """
+    Defer a callback from the previous one.
+    """
+
+    remaining = [rounds]
+
+    def callback():
+        remaining[0] -= 1
+
+        if remaining[0] > 0:
+            mainloop.call_soon(callback)
+
+    mainloop.call_soon(callback)
+
+    while remaining[0] > 0:
+        mainloop.run_once(1.0)
+
+
+BENCHMARKS = {
+    'ping-pong': bench_ping_pong,
+    'timers': bench_timers,
+    'deferred': bench_deferred,
+}
+
+
+def run(rounds):
+    """
+    Run all benchmarks on all mainloops, returning a list of results.
+    """
+
+    results = []
+
+    for loop_name, factory in get_mainloops().items():
+        for bench_name, bench in BENCHMARKS.items():
+
+            mainloop = factory()
+
+            start = time.perf_counter()
+            bench(mainloop, rounds)
+            elapsed = time.perf_counter() - start
+
+            loop = getattr(mainloop, 'loop', None)
+            if loop:
+                loop.close()
+
+            results.append({
+                'mainloop': loop_name,
+                'benchmark': bench_name,
+                'rounds': rounds,
+                'seconds': elapsed,
+                'ops_per_second': rounds / elapsed,
+                'us_per_op': elapsed / rounds * 1e6,
+            })
+
+    return results
+
+
+def main(arg_list):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+
+    parser.add_argument('--rounds', type=int, default=20000, help='Number of operations per benchmark')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    args = parser.parse_args(arg_list)
+
+    results = run(args.rounds)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:<10} {:<10} {:>12} {:>10}'.format('mainloop', 'benchmark', 'ops/s', 'us/op'))
+
+    for result in results:
+        print('{mainloop:<10} {benchmark:<10} {ops_per_second:>12.0f} {us_per_op:>10.2f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,323 @@
+"""
+Microbenchmarks of the reactor, driven through channels without any IO.
+
+Run with: python -m benchmarks.reactor [benchmark ...] [--sizes n,n,...] [--json]
+
+Like tests/test_reactor.py, the reactor is only fed verbs with
+put_upstream(), and the verbs it sends downstream are popped right
+away. Timers and deferred calls go to a mainloop stand-in that does not
+touch any filedescriptors, so only the work done by the reactor and its
+state is measured.
+"""
+
+import sys
+import json
+import time
+import argparse
+from collections import deque
+
+from nervixd.reactor import Reactor
+from nervixd.reactor.verbs import *
+from nervixd.tracer import BaseTracer
+
+clock = time.perf_counter_ns
+
+
+class BenchMainloop:
+    """
+    Mainloop stand-in that keeps timers and deferred calls in memory.
+    """
+
+    def __init__(self):
+        self.timer_handlers = dict()
+        self.deferred = deque()
+        self.monitor = None
+
+    def now(self):
+        return time.monotonic()
+
+    def timer(self):
+        return BenchTimer(self)
+
+    def call_soon(self, func, *args):
+        call = BenchDeferred(func, args)
+        self.deferred.append(call)
+        return call
+
+    def call_later(self, delay, func, *args):
+        timer = self.timer()
+        timer.set_handler(func, *args)
+        timer.set(delay)
+        return timer
+
+    def run_deferred(self):
+        """
+        Run the deferred calls until there are none left.
+        """
+
+        deferred = self.deferred
+
+        while deferred:
+            call = deferred.popleft()
+
+            if not call.cancelled:
+                call.func(*call.args)
+
+
+class BenchDeferred:
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class BenchTimer:
+
+    def __init__(self, mainloop):
+        self.mainloop = mainloop
+        self.handler = None
+        self.args = ()
+
+    def set_handler(self, handler=None, *args, **kwargs):
+        self.handler = handler
+        self.args = args
+
+    def set(self, timeout):
+        self.mainloop.timer_handlers[self] = self.handler
+
+    def cancel(self):
+        self.mainloop.timer_handlers.pop(self, None)
+
+
+def get_reactor():
+    reactor = Reactor(BenchMainloop(), BaseTracer())
+
+    # the benchmarks queue more than a client would
+    reactor.high_watermark_verbs = reactor.low_watermark_verbs = 2 ** 30
+    reactor.max_outstanding_requests = 2 ** 30
+
+    return reactor
+
+
+def get_channel(reactor, handler=None):
+    """
+    Create a channel that pops every verb send to it, passing it to the
+    handler if given.
+    """
+
+    channel = reactor.channel()
+
+    if handler:
+        channel.set_downstream_handler(lambda: handler(channel.pop_downstream()))
+    else:
+        channel.set_downstream_handler(channel.pop_downstream)
+
+    return channel
+
+
+def timed(func, *args):
+    """
+    Call the function, returning the number of nanoseconds it took.
+    """
+
+    start = clock()
+    func(*args)
+    return clock() - start
+
+
+def put_all(channel, verbs):
+    put_upstream = channel.put_upstream
+
+    for verb in verbs:
+        put_upstream(verb)
+
+
+def bench_login(n):
+    """
+    A single channel logs in to n names, and logs out of them again.
+    """
+
+    reactor = get_reactor()
+    channel = get_channel(reactor)
+
+    names = [b'name-%d' % i for i in range(n)]
+
+    logins = [LoginVerb(name=name, enforce=False, standby=False, persist=False) for name in names]
+    logouts = [LogoutVerb(name=name) for name in names]
+
+    return {
+        'login': timed(put_all, channel, logins),
+        'logout': timed(put_all, channel, logouts),
+    }
+
+
+def bench_request(n):
+    """
+    n requests are send to a name, which the owner answers right away.
+    """
+
+    reactor = get_reactor()
+
+    def on_owner_verb(verb):
+        if verb.__class__ is CallVerb:
+            owner.put_upstream(PostVerb(postref=verb.postref, payload=verb.payload))
+
+    owner = get_channel(reactor, on_owner_verb)
+    owner.put_upstream(LoginVerb(name=b'service', enforce=False, standby=False, persist=False))
+
+    requester = get_channel(reactor)
+
+    requests = [
+        RequestVerb(name=b'service', unidirectional=False, messageref=i + 1, timeout=5.0, payload=b'payload')
+        for i in range(n)
+    ]
+
+    return {
+        'round_trip': timed(put_all, requester, requests),
+    }
+
+
+def bench_subscribe(n):
+    """
+    A single channel subscribes to n topics of an owned name, and
+    unsubscribes from them again.
+    """
+
+    reactor = get_reactor()
+
+    owner = get_channel(reactor)
+    owner.put_upstream(LoginVerb(name=b'feed', enforce=False, standby=False, persist=False))
+
+    subscriber = get_channel(reactor)
+
+    topics = [b'topic-%d' % i for i in range(n)]
+
+    subscribes = [SubscribeVerb(name=b'feed', messageref=1, topic=topic) for topic in topics]
+    unsubscribes = [UnsubscribeVerb(name=b'feed', topic=topic) for topic in topics]
+
+    return {
+        'subscribe': timed(put_all, subscriber, subscribes),
+        'unsubscribe': timed(put_all, subscriber, unsubscribes),
+    }
+
+
+def bench_close(n):
+    """
+    A channel that is subscribed to n topics is closed. Includes the
+    slices of work that are deferred.
+    """
+
+    reactor = get_reactor()
+
+    owner = get_channel(reactor)
+    owner.put_upstream(LoginVerb(name=b'feed', enforce=False, standby=False, persist=False))
+
+    subscriber = get_channel(reactor)
+    put_all(subscriber, [SubscribeVerb(name=b'feed', messageref=1, topic=b'topic-%d' % i) for i in range(n)])
+
+    def close():
+        subscriber.close()
+        reactor.mainloop.run_deferred()
+
+    return {
+        'close_per_subscription': timed(close),
+    }
+
+
+def bench_fanout(n):
+    """
+    A message is posted on a topic with n subscribers. Includes the
+    slices of work that are deferred.
+    """
+
+    reactor = get_reactor()
+
+    postrefs = []
+
+    def on_owner_verb(verb):
+        if verb.__class__ is InterestVerb:
+            postrefs.append(verb.postref)
+
+    owner = get_channel(reactor, on_owner_verb)
+    owner.put_upstream(LoginVerb(name=b'feed', enforce=False, standby=False, persist=False))
+
+    for i in range(n):
+        get_channel(reactor).put_upstream(SubscribeVerb(name=b'feed', messageref=1, topic=b'topic'))
+
+    def post():
+        owner.put_upstream(PostVerb(postref=postrefs[0], payload=b'payload'))
+        reactor.mainloop.run_deferred()
+
+    return {
+        'fanout_per_subscriber': timed(post),
+    }
+
+
+BENCHMARKS = {
+    'login': bench_login,
+    'request': bench_request,
+    'subscribe': bench_subscribe,
+    'close': bench_close,
+    'fanout': bench_fanout,
+}
+
+
+def run(names, sizes):
+    """
+    Run the benchmarks at every size, returning a list of results.
+    """
+
+    results = []
+
+    for name in names:
+        for n in sizes:
+            for operation, elapsed in BENCHMARKS[name](n).items():
+                results.append({
+                    'benchmark': name,
+                    'operation': operation,
+                    'size': n,
+                    'ns_per_op': round(elapsed / n, 1),
+                })
+
+    return results
+
+
+def main(arg_list):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.reactor', description=__doc__.strip().splitlines()[0])
+
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='Benchmarks to run: {}, all by default'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma separated numbers of entries to run each benchmark with')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    args = parser.parse_args(arg_list)
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark '{}'".format(name))
+
+    try:
+        sizes = [int(size) for size in args.sizes.split(',')]
+
+    except ValueError:
+        parser.error("Invalid sizes '{}'".format(args.sizes))
+
+    results = run(args.benchmarks or BENCHMARKS, sizes)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:<10} {:<24} {:>9} {:>12}'.format('benchmark', 'operation', 'size', 'ns/op'))
+
+    for result in results:
+        print('{benchmark:<10} {operation:<24} {size:>9} {ns_per_op:>12.1f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,294 @@
+"""
+Replay captured traffic against a nervixd server.
+
+Run with: python -m benchmarks.replay capture [--nxtcp host:port] [--telnet host:port] [--speed factor]
+
+The capture is recorded by a server that runs with --capture. Every
+connection in it is opened again, and the bytes it sent are send again
+at the same moments, or faster with a speed factor above one. A speed
+of zero sends everything as fast as possible. The bytes are send in the
+order they were recorded in, also between connections. Whatever the
+server sends back is read and counted, but otherwise ignored.
+"""
+
+import sys
+import json
+import time
+import socket
+import argparse
+
+from nervixd.mainloop import Mainloop
+from nervixd.util.encoder import BaseEncoder
+from nervixd.util.capture import read_capture, RECORD_OPEN, RECORD_DATA, RECORD_CLOSE
+
+
+class ReplayConnection:
+    """
+    Connection that sends the recorded bytes of a single captured
+    connection.
+    """
+
+    def __init__(self, replay, address):
+        self.replay = replay
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.setblocking(False)
+        self.socket.connect_ex(address)
+
+        self.encoder = BaseEncoder(chunksize=65536)
+
+        self.proxy = replay.mainloop.register(self.socket)
+        self.proxy.set_read_handler(self.__on_read)
+        self.proxy.set_write_handler(self.__on_write)
+        self.proxy.set_interest(read=True, write=True)
+
+        self.connected = False
+        self.closing = False
+        self.closed = False
+
+    def send(self, data):
+        if self.closed:
+            return
+
+        self.encoder.add_encoded_chunk(data)
+
+        # write right away, so the bytes leave in the order they were
+        # recorded in
+        if self.connected:
+            self.__write()
+
+    def close(self):
+        """
+        Close the connection once all bytes have been written.
+        """
+
+        self.closing = True
+
+        if self.connected and not self.encoder.pending:
+            self.__close()
+
+    def __on_write(self):
+        self.connected = True
+
+        self.__write()
+
+        if not self.encoder.pending:
+            self.proxy.stop_writing()
+
+            if self.closing:
+                self.__close()
+
+    def __write(self):
+        while self.encoder.pending:
+            try:
+                n = self.encoder.write_to_socket(self.socket)
+
+            except OSError:
+                self.__close()
+                return
+
+            if n == 0:
+                self.proxy.start_writing()
+                return
+
+    def __on_read(self):
+        try:
+            data = self.socket.recv(65536)
+
+        except OSError:
+            data = b''
+
+        self.replay.bytes_received += len(data)
+
+        if not data:
+            self.__close()
+
+    def __close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+
+        self.proxy.unregister()
+        self.socket.close()
+
+        self.replay.on_connection_closed(self)
+
+
+class Replay:
+    """
+    Replays the records of a capture on a mainloop.
+    """
+
+    def __init__(self, mainloop, records, addresses, speed=1.0):
+        self.mainloop = mainloop
+        self.records = iter(records)
+        self.addresses = addresses
+        self.speed = speed
+
+        # connections by their id in the capture, and those that are
+        # still open
+        self.connections = dict()
+        self.open_connections = set()
+
+        self.start = None
+        self.next_record = None
+        self.done = False
+
+        self.nr_connections = 0
+        self.nr_skipped = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.max_lag = 0.0
+
+        self.batch_size = 1000
+
+        self.timer = mainloop.timer()
+        self.timer.set_handler(self.__on_timer)
+
+    def run(self):
+        """
+        Replay all records, returning once the last connection is
+        closed.
+        """
+
+        self.start = self.mainloop.now()
+        self.next_record = next(self.records, None)
+
+        self.__on_timer()
+
+        while not self.done or self.open_connections:
+            self.mainloop.run_once(1.0)
+
+    def report(self):
+        return {
+            'connections': self.nr_connections,
+            'skipped_connections': self.nr_skipped,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'max_lag': round(self.max_lag, 6),
+        }
+
+    def on_connection_closed(self, connection):
+        self.open_connections.discard(connection)
+
+    def __on_timer(self):
+        """
+        Replay the records that are due, and set the timer for the next
+        one.
+        """
+
+        # replay in batches, so the mainloop gets to read from the
+        # server in between when replaying as fast as possible
+        batch = self.batch_size
+
+        while self.next_record:
+            record_type, connection_id, timestamp, data = self.next_record
+
+            due = self.start + timestamp / self.speed if self.speed else self.mainloop.now()
+            lag = self.mainloop.now() - due
+
+            if lag < 0:
+                self.timer.set(-lag)
+                return
+
+            if batch == 0:
+                self.timer.set(0)
+                return
+
+            batch -= 1
+
+            self.max_lag = max(self.max_lag, lag)
+
+            self.__replay(record_type, connection_id, data)
+
+            self.next_record = next(self.records, None)
+
+        # the capture has ended, close what the capture left open
+        self.done = True
+
+        for connection in list(self.connections.values()):
+            connection.close()
+
+    def __replay(self, record_type, connection_id, data):
+        if record_type == RECORD_OPEN:
+            address = self.addresses.get(data.decode(), None)
+
+            if not address:
+                self.nr_skipped += 1
+                return
+
+            connection = ReplayConnection(self, address)
+            self.connections[connection_id] = connection
+            self.open_connections.add(connection)
+            self.nr_connections += 1
+
+            return
+
+        connection = self.connections.get(connection_id, None)
+
+        if not connection:
+            return
+
+        if record_type == RECORD_DATA:
+            connection.send(data)
+            self.bytes_sent += len(data)
+
+        elif record_type == RECORD_CLOSE:
+            del self.connections[connection_id]
+            connection.close()
+
+
+def argparse_validate_address(value):
+    host, sep, port = value.rpartition(':')
+
+    try:
+        return host, int(port)
+
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid address '{}'".format(value))
+
+
+def main(arg_list):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.replay', description=__doc__.strip().splitlines()[0])
+
+    parser.add_argument('capture', help='Capture file recorded with nervixd --capture')
+    parser.add_argument('--nxtcp', type=argparse_validate_address, metavar='host:port',
+                        help='Address to replay the NXTCP connections to, they are skipped when not given')
+    parser.add_argument('--telnet', type=argparse_validate_address, metavar='host:port',
+                        help='Address to replay the telnet connections to, they are skipped when not given')
+    parser.add_argument('--speed', type=float, default=1.0, metavar='factor',
+                        help='Replay this many times faster than recorded, 0 replays as fast as possible')
+
+    args = parser.parse_args(arg_list)
+
+    if args.speed < 0:
+        parser.error("Speed must not be negative")
+
+    addresses = {
+        'nxtcp': args.nxtcp,
+        'telnet': args.telnet,
+    }
+
+    mainloop = Mainloop()
+
+    with open(args.capture, 'rb') as f:
+        replay = Replay(mainloop, read_capture(f), addresses, args.speed)
+
+        start = time.perf_counter()
+        replay.run()
+
+        report = {
+            'capture': args.capture,
+            'speed': args.speed,
+            'wall_seconds': round(time.perf_counter() - start, 3),
+        }
+
+    report.update(replay.report())
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
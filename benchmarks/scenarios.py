@@ -0,0 +1,428 @@
+"""
+Load scenarios of the end-to-end benchmark.
+
+Every scenario creates its clients in setup(), and is ready once they
+are logged in and subscribed. From start() on it keeps the server busy
+while counting the operations done and their latencies. The load is
+window based, a client only sends a new message when one of its
+previous messages made it through, so the server is never flooded with
+more than it can handle.
+"""
+
+import time
+from struct import pack, unpack_from
+from collections import deque
+
+from .client import BenchClient, SESSION_ACTIVE, MESSAGE_OK
+
+clock = time.perf_counter
+
+
+def stamp(payload_size):
+    """
+    Return a payload carrying the current time.
+    """
+
+    return pack('>d', clock()).ljust(payload_size, b'.')
+
+
+def read_stamp(payload):
+    return unpack_from('>d', payload, 0)[0]
+
+
+class Scenario:
+    name = None
+
+    def __init__(self, mainloop, address, options):
+        self.mainloop = mainloop
+        self.address = address
+        self.options = options
+
+        self.clients = []
+
+        self.running = False
+        self.operations = 0
+        self.errors = 0
+        self.latencies = []
+
+    def params(self):
+        """
+        Return the parameters of the scenario, for the report.
+        """
+
+        return {}
+
+    def setup(self):
+        pass
+
+    def is_ready(self):
+        return True
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+        for client in self.clients:
+            client.on_close = None
+            client.close()
+
+    def client(self):
+        client = BenchClient(self.mainloop, self.address)
+        client.on_close = self.__on_unexpected_close
+
+        self.clients.append(client)
+
+        return client
+
+    def record(self, start):
+        """
+        Count a completed operation that was started at the given time.
+        """
+
+        if self.running:
+            self.operations += 1
+            self.latencies.append(clock() - start)
+
+    def __on_unexpected_close(self):
+        self.errors += 1
+
+
+class FloodScenario(Scenario):
+    """
+    Producers send unidirectional requests to a single owner.
+    """
+
+    name = 'flood'
+
+    def params(self):
+        return {
+            'producers': self.options.clients,
+            'window': self.options.window,
+            'payload_size': self.options.payload_size,
+        }
+
+    def setup(self):
+        self.active = False
+
+        self.owner = self.client()
+        self.owner.on_session = self.__on_session
+        self.owner.on_call = self.__on_call
+        self.owner.login(b'flood')
+
+        self.producers = [self.client() for _ in range(self.options.clients)]
+
+    def is_ready(self):
+        return self.active
+
+    def start(self):
+        Scenario.start(self)
+
+        for producer in self.producers:
+            for _ in range(self.options.window):
+                self.__send(producer)
+
+    def __send(self, producer):
+        producer.request(b'flood', 0, stamp(self.options.payload_size), unidirectional=True)
+
+    def __on_session(self, name, state):
+        self.active = state == SESSION_ACTIVE
+
+    def __on_call(self, postref, name, payload):
+        self.record(read_stamp(payload))
+
+        # keep every producer at its window, round robin
+        if self.running:
+            producer = self.producers[self.operations % len(self.producers)]
+            self.__send(producer)
+
+
+class RpcScenario(Scenario):
+    """
+    Clients do requests to a name that is shared by a number of owners,
+    which respond to every call.
+    """
+
+    name = 'rpc'
+
+    def params(self):
+        return {
+            'clients': self.options.clients,
+            'owners': self.options.owners,
+            'window': self.options.window,
+            'payload_size': self.options.payload_size,
+        }
+
+    def setup(self):
+        self.active = 0
+
+        for _ in range(self.options.owners):
+            owner = self.client()
+            owner.on_session = self.__on_session
+            owner.on_call = lambda postref, name, payload, owner=owner: owner.post(postref, payload)
+            owner.login(b'rpc', shared=True)
+
+        self.requesters = []
+
+        for _ in range(self.options.clients):
+            requester = self.client()
+            requester.on_message = lambda ref, status, payload, r=requester: self.__on_message(r, status, payload)
+            self.requesters.append(requester)
+
+    def is_ready(self):
+        return self.active == self.options.owners
+
+    def start(self):
+        Scenario.start(self)
+
+        for requester in self.requesters:
+            for _ in range(self.options.window):
+                requester.request(b'rpc', 1, stamp(self.options.payload_size))
+
+    def __on_session(self, name, state):
+        if state == SESSION_ACTIVE:
+            self.active += 1
+
+    def __on_message(self, requester, status, payload):
+        if status != MESSAGE_OK:
+            self.errors += 1
+
+        else:
+            self.record(read_stamp(payload))
+
+        if self.running:
+            requester.request(b'rpc', 1, stamp(self.options.payload_size))
+
+
+class FanoutScenario(Scenario):
+    """
+    A single publisher posts messages on a topic, which are fanned out
+    to all subscribers. Every delivery counts as an operation.
+    """
+
+    name = 'fanout'
+
+    def params(self):
+        return {
+            'subscribers': self.options.subscribers,
+            'window': self.options.window,
+            'payload_size': self.options.payload_size,
+        }
+
+    def setup(self):
+        self.postref = None
+        self.published = 0
+
+        self.publisher = self.client()
+        self.publisher.on_interest = self.__on_interest
+        self.publisher.login(b'fanout')
+
+        # the last message number received by each subscriber, and per
+        # message in flight the number of subscribers still to reach
+        self.received = []
+        self.remaining = dict()
+
+        for i in range(self.options.subscribers):
+            subscriber = self.client()
+            subscriber.on_message = lambda ref, status, payload, i=i: self.__on_message(i, payload)
+            subscriber.subscribe(1, b'fanout', b'bench')
+
+            self.received.append(0)
+
+        self.probe_timer = self.mainloop.timer()
+        self.probe_timer.set_handler(self.__probe)
+
+    def is_ready(self):
+        # all subscribers received the probe messages
+        return self.postref is not None and min(self.received) > 0
+
+    def start(self):
+        Scenario.start(self)
+
+        self.probe_timer.cancel()
+
+        for _ in range(self.options.window):
+            self.__publish()
+
+    def stop(self):
+        self.probe_timer.cancel()
+
+        Scenario.stop(self)
+
+    def __publish(self):
+        self.published += 1
+        self.remaining[self.published] = self.options.subscribers
+
+        self.publisher.post(self.postref, pack('>I', self.published) + stamp(self.options.payload_size))
+
+    def __probe(self):
+        """
+        Publish until every subscriber is known to receive the messages.
+        """
+
+        self.published += 1
+        self.publisher.post(self.postref, pack('>I', self.published) + stamp(self.options.payload_size))
+
+        self.probe_timer.set(0.01)
+
+    def __on_interest(self, postref, interest, topic):
+        if interest and self.postref is None:
+            self.postref = postref
+            self.__probe()
+
+    def __on_message(self, i, payload):
+        number, = unpack_from('>I', payload, 0)
+
+        self.record(read_stamp(payload[4:]))
+
+        # messages skipped by the subscriber are dropped for it, so they
+        # are done as well
+        for n in range(self.received[i] + 1, number + 1):
+
+            left = self.remaining.get(n, None)
+
+            if left is None:
+                continue
+
+            if left > 1:
+                self.remaining[n] = left - 1
+                continue
+
+            # a message reached all subscribers, the next may be send
+            del self.remaining[n]
+
+            if self.running:
+                self.__publish()
+
+        self.received[i] = number
+
+
+class ChurnScenario(Scenario):
+    """
+    Clients that hold many subscriptions, on distinct topics, keep
+    replacing them with new ones. The latency is the time it takes for
+    the interest in a new topic to reach the owner.
+    """
+
+    name = 'churn'
+
+    def params(self):
+        return {
+            'clients': self.options.clients,
+            'topics': self.options.topics,
+            'window': self.options.window,
+        }
+
+    def setup(self):
+        self.active = False
+        self.nr_interest = 0
+
+        self.owner = self.client()
+        self.owner.on_interest = self.__on_interest
+        self.owner.login(b'churn')
+
+        # subscribe times of the topics, and per client the topics in
+        # the order they were subscribed
+        self.pending = dict()
+        self.subscribed = []
+        self.next_topic = []
+
+        for i in range(self.options.clients):
+            self.client()
+            self.subscribed.append(deque())
+            self.next_topic.append(0)
+
+            for _ in range(self.options.topics):
+                self.__subscribe(i)
+
+    def is_ready(self):
+        return self.nr_interest >= self.options.clients * self.options.topics
+
+    def start(self):
+        Scenario.start(self)
+
+        for i in range(self.options.clients):
+            for _ in range(self.options.window):
+                self.__subscribe(i)
+
+    def __subscribe(self, i):
+        client = self.clients[i + 1]
+
+        topic = b'%d-%d' % (i, self.next_topic[i])
+        self.next_topic[i] += 1
+
+        self.pending[topic] = (i, clock())
+        self.subscribed[i].append(topic)
+
+        client.subscribe(1, b'churn', topic)
+
+    def __on_interest(self, postref, interest, topic):
+        if not interest:
+            return
+
+        self.nr_interest += 1
+
+        i, start = self.pending.pop(bytes(topic))
+
+        self.record(start)
+
+        if self.running:
+            self.clients[i + 1].unsubscribe(b'churn', self.subscribed[i].popleft())
+            self.__subscribe(i)
+
+
+class ConnectScenario(Scenario):
+    """
+    Clients connect, login, and disconnect as soon as their session is
+    active. The latency is the time from connect to active session.
+    """
+
+    name = 'connect'
+
+    def params(self):
+        return {
+            'concurrency': self.options.clients,
+        }
+
+    def start(self):
+        Scenario.start(self)
+
+        self.next_name = 0
+
+        for _ in range(self.options.clients):
+            self.__connect()
+
+    def __connect(self):
+        start = clock()
+
+        name = b'conn-%d' % self.next_name
+        self.next_name += 1
+
+        client = self.client()
+        client.on_welcome = lambda: client.login(name)
+        client.on_session = lambda name, state: self.__on_session(client, state, start)
+
+    def __on_session(self, client, state, start):
+        if state != SESSION_ACTIVE:
+            return
+
+        self.record(start)
+
+        self.clients.remove(client)
+        client.on_close = None
+        client.close()
+
+        if self.running:
+            self.__connect()
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in (
+        FloodScenario,
+        RpcScenario,
+        FanoutScenario,
+        ChurnScenario,
+        ConnectScenario,
+    )
+}
@@ -0,0 +1,161 @@
+"""
+The nervixd server under test, started in-process or as a subprocess.
+
+The server is set up like nervixd.main does, except that it uses the
+BaseTracer, so the output of the PrintTracer does not dominate the
+results. Run with: python -m benchmarks.server host:port
+"""
+
+import os
+import sys
+import time
+import socket
+import resource
+import subprocess
+
+from nervixd.mainloop import Mainloop
+from nervixd.reactor import Reactor
+from nervixd.controller import Controller
+from nervixd.services.nxtcp.service import NxtcpService
+from nervixd.tracer import BaseTracer
+
+
+def build_server(mainloop, address):
+    """
+    Create a reactor with a NXTCP service on the given mainloop.
+    """
+
+    controller = Controller(mainloop, None)
+    reactor = Reactor(mainloop, BaseTracer())
+
+    NxtcpService(controller, mainloop, reactor, reactor.tracer, address)
+
+    return controller
+
+
+def find_free_port(host='127.0.0.1'):
+    """
+    Return a TCP port that is not in use at the moment.
+    """
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(address, timeout=10.0):
+    """
+    Wait until the server accepts connections on the given address.
+    """
+
+    deadline = time.monotonic() + timeout
+
+    while True:
+        try:
+            socket.create_connection(address, timeout=1.0).close()
+            return
+
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+
+            time.sleep(0.05)
+
+
+class InProcessServer:
+    """
+    Server that runs on the same mainloop as the load generator, its
+    resource usage is the usage of the whole process.
+    """
+
+    name = 'inprocess'
+
+    def __init__(self, mainloop, address):
+        self.controller = build_server(mainloop, address)
+
+    def resources(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+
+        return {
+            'cpu_seconds': usage.ru_utime + usage.ru_stime,
+            'rss_bytes': read_rss(os.getpid()) or usage.ru_maxrss * 1024,
+        }
+
+    def stop(self):
+        self.controller.start_server_shutdown()
+
+
+class SubprocessServer:
+    """
+    Server that runs in a process of its own.
+    """
+
+    name = 'subprocess'
+
+    def __init__(self, mainloop, address):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.server', '{}:{}'.format(*address)],
+            stdout=subprocess.DEVNULL,
+        )
+
+        wait_for_port(address)
+
+    def resources(self):
+        return {
+            'cpu_seconds': read_cpu_seconds(self.process.pid),
+            'rss_bytes': read_rss(self.process.pid),
+        }
+
+    def stop(self):
+        self.process.terminate()
+
+        try:
+            self.process.wait(10.0)
+
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def read_cpu_seconds(pid):
+    """
+    Return the user and system time used by a process, None if it can
+    not be determined on this platform.
+    """
+
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            fields = f.read().rpartition(')')[2].split()
+
+    except OSError:
+        return None
+
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def read_rss(pid):
+    """
+    Return the resident set size of a process in bytes, None if it can
+    not be determined on this platform.
+    """
+
+    try:
+        with open('/proc/{}/statm'.format(pid)) as f:
+            pages = int(f.read().split()[1])
+
+    except OSError:
+        return None
+
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def main(arg_list):
+    host, _, port = arg_list[0].rpartition(':')
+
+    mainloop = Mainloop()
+    build_server(mainloop, (host, int(port)))
+    mainloop.run_forever()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
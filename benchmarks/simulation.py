@@ -0,0 +1,140 @@
+"""
+Large scale simulation of nervixd in virtual time.
+
+Run with: python -m benchmarks.simulation [scenario ...] [--clients n] [--duration seconds]
+
+The server runs against thousands of virtual clients of the sysmock
+simulation, see tests/helpers/sysmock/simulation.py. No real sockets or
+real waiting are involved, so keepalive and timeout behaviour on large
+numbers of connections can be looked at in seconds. The results are
+deterministic for a given seed, except for the CPU time and wall time.
+
+The server_load in the report is the CPU time the server used per
+virtual second, a load above 1.0 means that a real server would not
+keep up with the simulated traffic.
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from nervixd.mainloop import Mainloop
+
+from tests.helpers.sysmock.simulation import Simulation, IdleModel, SilentModel, ServiceModel, RequesterModel, \
+    SubscriberModel, PublisherModel
+
+from .server import build_server
+
+ADDRESS = ('', 9999)
+
+
+def keepalive_scenario(simulation, options):
+    """
+    Idle clients that only answer pings, of which one in ten never
+    answers and is disconnected.
+    """
+
+    def model(i):
+        return SilentModel(simulation) if i % 10 == 0 else IdleModel(simulation)
+
+    simulation.add_clients(options.clients, model, ADDRESS, options.ramp)
+
+
+def rpc_scenario(simulation, options):
+    """
+    Clients do requests at the given rate to a name that is shared by
+    one service per hundred clients.
+    """
+
+    nr_services = max(1, options.clients // 100)
+
+    simulation.add_clients(nr_services, lambda i: ServiceModel(simulation, b'rpc'), ADDRESS)
+
+    simulation.add_clients(
+        options.clients,
+        lambda i: RequesterModel(simulation, b'rpc', options.rate),
+        ADDRESS,
+        options.ramp
+    )
+
+
+def pubsub_scenario(simulation, options):
+    """
+    Clients subscribe to one of a hundred topics, on which a single
+    publisher posts at the given rate.
+    """
+
+    simulation.add_clients(1, lambda i: PublisherModel(simulation, b'feed', options.rate), ADDRESS)
+
+    simulation.add_clients(
+        options.clients,
+        lambda i: SubscriberModel(simulation, b'feed', b'topic-%d' % (i % 100)),
+        ADDRESS,
+        options.ramp
+    )
+
+
+SCENARIOS = {
+    'keepalive': keepalive_scenario,
+    'rpc': rpc_scenario,
+    'pubsub': pubsub_scenario,
+}
+
+
+def run_scenario(name, options):
+    """
+    Simulate a single scenario against a fresh server, returning its
+    report.
+    """
+
+    with Simulation(seed=options.seed, trace_memory=options.memory) as simulation:
+        mainloop = Mainloop()
+        build_server(mainloop, ADDRESS)
+
+        SCENARIOS[name](simulation, options)
+
+        start = time.perf_counter()
+        simulation.run(mainloop, options.duration)
+        wall_time = time.perf_counter() - start
+
+        report = {
+            'scenario': name,
+            'seed': options.seed,
+            'wall_seconds': round(wall_time, 3),
+        }
+
+        report.update(simulation.report())
+        report['server_load'] = round(report['server_cpu_seconds'] / options.duration, 3)
+
+    return report
+
+
+def main(arg_list):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.simulation', description=__doc__.strip().splitlines()[0])
+
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='Scenarios to simulate: {}, all by default'.format(', '.join(SCENARIOS)))
+    parser.add_argument('--clients', type=int, default=10000, help='Number of simulated clients')
+    parser.add_argument('--duration', type=float, default=60.0, help='Number of virtual seconds to simulate')
+    parser.add_argument('--ramp', type=float, default=5.0,
+                        help='Number of virtual seconds over which the clients connect')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='Requests per second per client, or posts per second per topic')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+    parser.add_argument('--memory', action='store_true',
+                        help='Report the memory used by the server, this makes the simulation a lot slower')
+
+    args = parser.parse_args(arg_list)
+
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("Unknown scenario '{}'".format(name))
+
+    reports = [run_scenario(name, args) for name in args.scenarios or SCENARIOS]
+
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
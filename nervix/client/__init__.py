@@ -0,0 +1,3 @@
+from .client import Client, Session, Subscription
+from .pool import Pool
+from .client import NervixError, ConnectionLost, RequestError, RequestTimeout, Unreachable, Overloaded, RateLimited
@@ -0,0 +1,729 @@
+import asyncio
+import logging
+from inspect import isawaitable
+
+from nervixd.services.nxtcp.decoder import DecodingError
+
+from .codec import Decoder, encode_batch
+from .codec import SessionPacket, CallPacket, MessagePacket, InterestPacket, PingPacket, WelcomePacket, \
+    ByeByePacket, CompressAckPacket
+from .codec import LoginPacket, LogoutPacket, RequestPacket, PostPacket, SubscribePacket, UnsubscribePacket, \
+    PongPacket, QuitPacket
+
+logger = logging.getLogger(__name__)
+
+
+class NervixError(Exception):
+    """
+    Base class of the errors raised by the client.
+    """
+
+
+class ConnectionLost(NervixError):
+    """
+    The client is not connected, or the connection was lost before the
+    answer to a request was received.
+    """
+
+
+class RequestError(NervixError):
+    """
+    A request failed, status holds the MessagePacket status the server
+    answered with.
+    """
+
+    status = None
+
+
+class RequestTimeout(RequestError):
+    status = MessagePacket.STATUS_TIMEOUT
+
+
+class Unreachable(RequestError):
+    status = MessagePacket.STATUS_UNREACHABLE
+
+
+class Overloaded(RequestError):
+    status = MessagePacket.STATUS_OVERLOADED
+
+
+class RateLimited(RequestError):
+    status = MessagePacket.STATUS_RATE_LIMITED
+
+
+REQUEST_ERRORS = {error.status: error for error in (RequestTimeout, Unreachable, Overloaded, RateLimited)}
+
+
+class Session:
+    """
+    A name the client logged in to.
+
+    The state follows the SESSION packets of the server. It is
+    SessionPacket.STATE_ENDED until the server answered the login, and
+    after a reconnect until the server answered the login again.
+    """
+
+    def __init__(self, client, name, handler, flags):
+        self.client = client
+        self.name = name
+        self.handler = handler
+        self.flags = flags
+
+        self.state = SessionPacket.STATE_ENDED
+        self.state_changed = asyncio.Event()
+
+    @property
+    def active(self):
+        return self.state == SessionPacket.STATE_ACTIVE
+
+    async def wait_active(self):
+        """
+        Wait until the session is active.
+        """
+
+        while not self.active:
+            self.state_changed.clear()
+            await self.state_changed.wait()
+
+    def logout(self):
+        self.client.logout(self.name)
+
+    def set_state(self, state):
+        self.state = state
+        self.state_changed.set()
+
+
+class Subscription:
+    """
+    A subscription on a topic of a name. The handler is called with the
+    payload of every message that is posted on the topic.
+    """
+
+    def __init__(self, client, messageref, name, topic, handler):
+        self.client = client
+        self.messageref = messageref
+        self.name = name
+        self.topic = topic
+        self.handler = handler
+
+    def cancel(self):
+        self.client.unsubscribe(self.name, self.topic)
+
+
+class Client:
+    """
+    The Client class.
+
+    An asyncio client of the NXTCP protocol. Requests are pipelined, any
+    number of them can be outstanding on the connection at the same
+    time, they are matched with their answers by messageref.
+
+    Packets are not written one by one, all packets that are encoded
+    during one iteration of the event loop are written together, packed
+    into BATCH packets when the server supports those. Use drain() to
+    wait until the transport accepts more data when producing lots of
+    packets.
+
+    When the connection is lost the client reconnects, logs in to its
+    names and subscribes to its topics again. Outstanding requests fail
+    with ConnectionLost, as do new requests until the client is
+    connected again.
+    """
+
+    def __init__(self, host='localhost', port=9999, reconnect=True, reconnect_delay=0.1, max_reconnect_delay=5.0,
+                 connect_timeout=5.0, request_timeout=5.0, batch=True):
+        self.host = host
+        self.port = port
+
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.batch = batch
+
+        self.loop = None
+        self.connection = None
+        self.protocol_version = 0
+        self.ready = False
+        self.closing = False
+        self.reconnect_task = None
+        self.connected = None
+
+        # encoded chunks waiting to be flushed, and their size
+        self.outgoing = []
+        self.outgoing_size = 0
+        self.flush_scheduled = False
+
+        # flush right away once this many bytes are waiting, and pack
+        # at most this many bytes into a single BATCH packet
+        self.flush_size = 65536
+        self.max_batch_size = 65536
+
+        # set while the transport accepts more data
+        self.writable = None
+
+        # request futures and subscriptions by messageref
+        self.requests = dict()
+        self.subscriptions = dict()
+        self.subscriptions_by_key = dict()
+        self.next_messageref = 1
+
+        # sessions by name
+        self.sessions = dict()
+
+        # topics there is interest in by postref, and the postrefs of
+        # each topic, one for every name it is subscribed on
+        self.interests = dict()
+        self.interest_postrefs = dict()
+        self.interest_handler = None
+
+        self.packet_handlers = {
+            SessionPacket: self.__handle_session,
+            CallPacket: self.__handle_call,
+            MessagePacket: self.__handle_message,
+            InterestPacket: self.__handle_interest,
+            PingPacket: self.__handle_ping,
+            WelcomePacket: self.__handle_welcome,
+            ByeByePacket: self.__handle_byebye,
+            CompressAckPacket: self.__handle_compress_ack,
+        }
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def in_flight(self):
+        """
+        Number of requests that await an answer.
+        """
+
+        return len(self.requests)
+
+    async def connect(self):
+        """
+        Connect to the server, returning once it welcomed the client.
+        """
+
+        self.loop = asyncio.get_running_loop()
+        self.closing = False
+
+        self.connected = asyncio.Event()
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+        await self.__open()
+
+    async def close(self):
+        """
+        Close the connection, without reconnecting.
+        """
+
+        self.closing = True
+
+        if self.reconnect_task:
+            self.reconnect_task.cancel()
+            self.reconnect_task = None
+
+        connection = self.connection
+
+        if connection:
+            self.__flush()
+            connection.transport.write(QuitPacket().get_chunk())
+            connection.transport.close()
+            await connection.closed
+
+    async def drain(self):
+        """
+        Wait until the client is connected and its transport accepts
+        more data.
+        """
+
+        if self.outgoing_size >= self.flush_size:
+            self.__flush()
+
+        while not (self.ready and self.writable.is_set()):
+
+            if self.closing:
+                raise ConnectionLost("Client is closed")
+
+            await self.connected.wait()
+            await self.writable.wait()
+
+    def request(self, name, payload, timeout=None):
+        """
+        Send a request to a name, returning a future with the payload of
+        the answer. The future fails with a RequestError when the server
+        answers with an error status.
+        """
+
+        if not self.ready:
+            raise ConnectionLost("Not connected to {}:{}".format(self.host, self.port))
+
+        messageref = self.__get_messageref()
+
+        future = self.loop.create_future()
+        self.requests[messageref] = future
+
+        if timeout is None:
+            timeout = self.request_timeout
+
+        self.__send(RequestPacket(name, messageref, timeout, payload))
+
+        return future
+
+    def send(self, name, payload):
+        """
+        Send a unidirectional request to a name.
+        """
+
+        if not self.ready:
+            raise ConnectionLost("Not connected to {}:{}".format(self.host, self.port))
+
+        self.__send(RequestPacket(name, None, 0, payload))
+
+    def login(self, name, handler=None, persist=False, standby=False, enforce=False, shared=False, weight=None):
+        """
+        Login to a name, returning its Session. The handler is called
+        with the payload of every request to the name, its return value,
+        or the result when it returns an awaitable, is the answer. No
+        answer is send when it returns None.
+        """
+
+        flags = dict(persist=persist, standby=standby, enforce=enforce, shared=shared, weight=weight)
+
+        session = Session(self, name, handler, flags)
+        self.sessions[name] = session
+
+        if self.ready:
+            self.__send(LoginPacket(name, **flags))
+
+        return session
+
+    def logout(self, name):
+        session = self.sessions.pop(name, None)
+
+        if not session:
+            return
+
+        session.set_state(SessionPacket.STATE_ENDED)
+
+        if self.ready:
+            self.__send(LogoutPacket(name))
+
+    def subscribe(self, name, topic, handler):
+        """
+        Subscribe to a topic of a name, returning the Subscription.
+        """
+
+        if (name, topic) in self.subscriptions_by_key:
+            raise ValueError("Already subscribed to topic {!r} of {!r}".format(topic, name))
+
+        messageref = self.__get_messageref()
+
+        subscription = Subscription(self, messageref, name, topic, handler)
+        self.subscriptions[messageref] = subscription
+        self.subscriptions_by_key[(name, topic)] = subscription
+
+        if self.ready:
+            self.__send(SubscribePacket(messageref, name, topic))
+
+        return subscription
+
+    def unsubscribe(self, name, topic):
+        subscription = self.subscriptions_by_key.pop((name, topic), None)
+
+        if not subscription:
+            return
+
+        del self.subscriptions[subscription.messageref]
+
+        if self.ready:
+            self.__send(UnsubscribePacket(name, topic))
+
+    def set_interest_handler(self, handler):
+        """
+        Set the handler that is called with the topic and True or False
+        whenever the interest in a topic of one of the names of the
+        client starts or ends.
+        """
+
+        self.interest_handler = handler
+
+    def has_interest(self, topic):
+        return self.__get_interest_topic(topic) is not None
+
+    def publish(self, topic, payload):
+        """
+        Post a message on a topic if there is interest in it, returning
+        whether there was.
+
+        When the interest is in a wildcard topic covering the topic, the
+        message is posted on the most specific wildcard topic. The
+        INTEREST packet does not tell which name the interest is in, so
+        when the client owns more than one name with interest in the
+        same topic, the message is posted on all of them.
+        """
+
+        topic = self.__get_interest_topic(topic)
+
+        if topic is None:
+            return False
+
+        for postref in self.interest_postrefs[topic]:
+            self.__send(PostPacket(postref, payload))
+
+        return True
+
+    def __get_interest_topic(self, topic):
+        """
+        Return the topic with interest that covers the given topic, or
+        None.
+        """
+
+        interest_postrefs = self.interest_postrefs
+
+        if topic in interest_postrefs:
+            return topic
+
+        for end in range(len(topic), -1, -1):
+            wildcard = topic[:end] + b'*'
+
+            if wildcard in interest_postrefs:
+                return wildcard
+
+        return None
+
+    def __get_messageref(self):
+        """
+        Return a messageref that is not in use by a request or a
+        subscription.
+        """
+
+        messageref = self.next_messageref
+
+        while messageref in self.requests or messageref in self.subscriptions:
+            messageref = messageref % 0xffffffff + 1
+
+        self.next_messageref = messageref % 0xffffffff + 1
+
+        return messageref
+
+    def __send(self, packet):
+        chunk = packet.get_chunk()
+
+        self.outgoing.append(chunk)
+        self.outgoing_size += len(chunk)
+
+        if self.outgoing_size >= self.flush_size:
+            self.__flush()
+
+        elif not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.__flush)
+
+    def __flush(self):
+        """
+        Write the outgoing packets to the transport.
+        """
+
+        self.flush_scheduled = False
+
+        if not self.outgoing or not self.ready:
+            return
+
+        outgoing = self.outgoing
+        self.outgoing = []
+        self.outgoing_size = 0
+
+        if len(outgoing) == 1 or not self.batch or self.protocol_version < 2:
+            self.connection.transport.write(b''.join(outgoing))
+            return
+
+        data = []
+        batch = []
+        batch_size = 0
+
+        for chunk in outgoing:
+
+            if batch_size + len(chunk) > self.max_batch_size and batch:
+                data.append(encode_batch(batch) if len(batch) > 1 else batch[0])
+                batch = []
+                batch_size = 0
+
+            batch.append(chunk)
+            batch_size += len(chunk)
+
+        data.append(encode_batch(batch) if len(batch) > 1 else batch[0])
+
+        self.connection.transport.write(b''.join(data))
+
+    async def __open(self):
+        """
+        Open a new connection and wait for the welcome of the server.
+        """
+
+        connection = ClientConnection(self)
+
+        await self.loop.create_connection(lambda: connection, self.host, self.port)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(connection.welcomed), self.connect_timeout)
+
+        except asyncio.TimeoutError:
+            connection.transport.close()
+            raise ConnectionLost("No welcome received from {}:{}".format(self.host, self.port))
+
+    async def __reconnect(self):
+        delay = self.reconnect_delay
+
+        while not self.closing:
+            await asyncio.sleep(delay)
+
+            try:
+                await self.__open()
+
+            except (OSError, ConnectionLost) as e:
+                logger.warning("Unable to reconnect to %s:%d: %s", self.host, self.port, e)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            logger.info("Reconnected to %s:%d", self.host, self.port)
+            break
+
+        self.reconnect_task = None
+
+    def on_connection_lost(self, connection):
+        if connection is not self.connection:
+            return
+
+        was_ready = self.ready
+
+        self.connection = None
+        self.ready = False
+        self.connected.clear()
+
+        # the packets that were not written yet are lost along with the
+        # connection, as are the requests they belong to
+        self.outgoing = []
+        self.outgoing_size = 0
+
+        requests = self.requests
+        self.requests = dict()
+
+        for future in requests.values():
+            if not future.done():
+                future.set_exception(ConnectionLost("Connection to {}:{} lost".format(self.host, self.port)))
+
+        for session in self.sessions.values():
+            session.set_state(SessionPacket.STATE_ENDED)
+
+        # interest is send again after the reconnect
+        topics = list(self.interest_postrefs)
+        self.interests.clear()
+        self.interest_postrefs.clear()
+
+        if self.interest_handler:
+            for topic in topics:
+                self.interest_handler(topic, False)
+
+        # a connection that was never welcomed is handled by whoever
+        # opened it
+        if self.closing or not self.reconnect or not was_ready:
+            return
+
+        logger.warning("Connection to %s:%d lost, reconnecting", self.host, self.port)
+
+        self.reconnect_task = self.loop.create_task(self.__reconnect())
+
+    def on_packet(self, connection, packet):
+        if connection is not self.connection:
+            return
+
+        self.packet_handlers[type(packet)](packet)
+
+    def __handle_welcome(self, packet):
+        self.protocol_version = packet.protocol_version
+        self.ready = True
+
+        # restore the names and subscriptions ahead of anything else
+        for name, session in self.sessions.items():
+            self.__send(LoginPacket(name, **session.flags))
+
+        for (name, topic), subscription in self.subscriptions_by_key.items():
+            self.__send(SubscribePacket(subscription.messageref, name, topic))
+
+        self.connected.set()
+        self.connection.welcomed.set_result(None)
+
+    def __handle_session(self, packet):
+        session = self.sessions.get(packet.name, None)
+
+        if session:
+            session.set_state(packet.state)
+
+    def __handle_call(self, packet):
+        session = self.sessions.get(packet.name, None)
+
+        if not session or not session.handler:
+            return
+
+        try:
+            result = session.handler(packet.payload)
+
+        except Exception:
+            logger.exception("Handler of %r failed", packet.name)
+            return
+
+        if packet.unidirectional:
+            if isawaitable(result):
+                self.loop.create_task(result)
+            return
+
+        if isawaitable(result):
+            connection = self.connection
+            task = self.loop.create_task(result)
+            task.add_done_callback(lambda t: self.__post_result(connection, packet, t))
+            return
+
+        if result is not None:
+            self.__send(PostPacket(packet.postref, result))
+
+    def __post_result(self, connection, packet, task):
+        """
+        Post the result of a handler that returned an awaitable, as long
+        as the connection it was called on still exists.
+        """
+
+        if task.cancelled():
+            return
+
+        if task.exception():
+            logger.error("Handler of %r failed", packet.name, exc_info=task.exception())
+            return
+
+        result = task.result()
+
+        if result is not None and connection is self.connection and self.ready:
+            self.__send(PostPacket(packet.postref, result))
+
+    def __handle_message(self, packet):
+        future = self.requests.pop(packet.messageref, None)
+
+        if future:
+            if future.done():
+                return
+
+            if packet.status == MessagePacket.STATUS_OK:
+                future.set_result(packet.payload)
+            else:
+                future.set_exception(REQUEST_ERRORS.get(packet.status, RequestError)())
+
+            return
+
+        subscription = self.subscriptions.get(packet.messageref, None)
+
+        if subscription:
+            try:
+                subscription.handler(packet.payload)
+
+            except Exception:
+                logger.exception("Handler of subscription on %r failed", subscription.topic)
+
+    def __handle_interest(self, packet):
+        topic = packet.topic
+        postref = packet.postref
+
+        if packet.status == InterestPacket.STATUS_INTEREST:
+            self.interests[postref] = topic
+            postrefs = self.interest_postrefs.setdefault(topic, [])
+            postrefs.append(postref)
+            interest = len(postrefs) == 1
+
+        else:
+            if self.interests.pop(postref, None) is None:
+                return
+
+            postrefs = self.interest_postrefs[topic]
+            postrefs.remove(postref)
+            interest = bool(postrefs)
+
+            if not interest:
+                del self.interest_postrefs[topic]
+
+        if self.interest_handler and interest == (packet.status == InterestPacket.STATUS_INTEREST):
+            self.interest_handler(topic, interest)
+
+    def __handle_ping(self, packet):
+        self.connection.transport.write(PongPacket().get_chunk())
+
+    def __handle_byebye(self, packet):
+        logger.info("Server %s:%d is going away", self.host, self.port)
+
+    def __handle_compress_ack(self, packet):
+        pass
+
+    def pause_writing(self):
+        self.writable.clear()
+
+    def resume_writing(self):
+        self.writable.set()
+
+
+class ClientConnection(asyncio.Protocol):
+    """
+    A single connection of a Client, the client replaces it by a new one
+    when reconnecting.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.transport = None
+        self.decoder = Decoder()
+
+        loop = client.loop
+        self.welcomed = loop.create_future()
+        self.closed = loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.client.connection = self
+
+    def data_received(self, data):
+        decoder = self.decoder
+        decoder.add_chunk(data)
+
+        try:
+            while True:
+                packet = decoder.decode()
+
+                if packet is None:
+                    break
+
+                self.client.on_packet(self, packet)
+
+        except DecodingError as e:
+            logger.error("Unable to decode packet from server: %s", e)
+            self.transport.close()
+
+    def pause_writing(self):
+        if self.client.connection is self:
+            self.client.pause_writing()
+
+    def resume_writing(self):
+        if self.client.connection is self:
+            self.client.resume_writing()
+
+    def connection_lost(self, exc):
+        if not self.welcomed.done():
+            self.welcomed.set_exception(ConnectionLost("Connection closed before welcome"))
+            # retrieved by __open() when it still waits for it
+            self.welcomed.exception()
+
+        self.closed.set_result(None)
+
+        self.client.on_connection_lost(self)
@@ -0,0 +1,315 @@
+"""
+Client side of the NXTCP codec.
+
+The server side in nervixd.services.nxtcp decodes upstream and encodes
+downstream packets, this module does the opposite, using the same
+framing and field helpers.
+"""
+
+from struct import Struct, pack, unpack_from
+
+from nervixd.util.decoder import BaseDecoder
+from nervixd.services.nxtcp import encoder as nxtcp_encoder
+from nervixd.services.nxtcp import decoder as nxtcp_decoder
+from nervixd.services.nxtcp.defines import *
+from nervixd.services.nxtcp.decoder import DecodingError
+
+# fields of the packets that are send the most, which are packed in one
+# go instead of field by field
+REQUEST_FIELDS = Struct('>BIII')
+POST_FIELDS = Struct('>II')
+
+
+class Decoder(BaseDecoder):
+
+    def __init__(self, *args, **kwargs):
+        BaseDecoder.__init__(self, *args, **kwargs)
+
+        self.handler_map = {
+            PACKET_SESSION: SessionPacket,
+            PACKET_CALL: CallPacket,
+            PACKET_MESSAGE: MessagePacket,
+            PACKET_INTEREST: InterestPacket,
+            PACKET_PING: PingPacket,
+            PACKET_WELCOME: WelcomePacket,
+            PACKET_BYEBYE: ByeByePacket,
+            PACKET_COMPRESS_ACK: CompressAckPacket,
+        }
+
+    def decode(self):
+        """
+        Decode a single packet from the chunks that are currently
+        present in the chunkbuffer.
+
+        Returns None if no packet could be constructed.
+        """
+
+        header = self.get(5)
+
+        if not header:
+            return None
+
+        length, packet_type = unpack_from('>IB', header)
+
+        frame = self.get(length, 5)
+
+        if frame is None:
+            return None
+
+        self.commit()
+
+        handler = self.handler_map.get(packet_type, None)
+
+        if not handler:
+            raise DecodingError('Unknown packet type 0x{:02x}'.format(packet_type))
+
+        return handler(frame)
+
+
+class SessionPacket(nxtcp_decoder.BasePacket):
+    """
+    uint8: state
+    string: name
+    """
+
+    STATE_ENDED = 0
+    STATE_STANDBY = 1
+    STATE_ACTIVE = 2
+
+    def __init__(self, frame):
+        nxtcp_decoder.BasePacket.__init__(self, frame)
+
+        self.state = self.get_uint8(0)
+        self.name = self.get_string(1)
+
+
+class CallPacket(nxtcp_decoder.BasePacket):
+    """
+    uint8: flags
+        0: unidirectional
+    uint32: postref
+    string: name
+    blob: payload
+    """
+
+    def __init__(self, frame):
+        nxtcp_decoder.BasePacket.__init__(self, frame)
+
+        flags = self.get_uint8(0)
+
+        self.unidirectional = (flags & (1 << 0)) > 0
+        self.postref = None if self.unidirectional else self.get_uint32(1)
+
+        self.name = self.get_string(5)
+        self.payload = self.get_blob(self.nextbyte)
+
+
+class MessagePacket(nxtcp_decoder.BasePacket):
+    """
+    uint8: status
+    uint32: messageref
+    blob: payload (only when the status is STATUS_OK)
+    """
+
+    STATUS_OK = 0
+    STATUS_TIMEOUT = 1
+    STATUS_UNREACHABLE = 2
+    STATUS_OVERLOADED = 3
+    STATUS_RATE_LIMITED = 4
+
+    def __init__(self, frame):
+        nxtcp_decoder.BasePacket.__init__(self, frame)
+
+        self.status = self.get_uint8(0)
+        self.messageref = self.get_uint32(1)
+        self.payload = self.get_blob(5) if self.status == self.STATUS_OK else None
+
+
+class InterestPacket(nxtcp_decoder.BasePacket):
+    """
+    uint8: status
+    uint32: postref
+    blob: topic
+    """
+
+    STATUS_NO_INTEREST = 0
+    STATUS_INTEREST = 1
+
+    def __init__(self, frame):
+        nxtcp_decoder.BasePacket.__init__(self, frame)
+
+        self.status = self.get_uint8(0)
+        self.postref = self.get_uint32(1)
+        self.topic = self.get_blob(5)
+
+
+class PingPacket(nxtcp_decoder.BasePacket):
+    """
+    -
+    """
+
+
+class WelcomePacket(nxtcp_decoder.BasePacket):
+    """
+    uint32: server version
+    uint32: protocol version
+    """
+
+    def __init__(self, frame):
+        nxtcp_decoder.BasePacket.__init__(self, frame)
+
+        self.server_version = self.get_uint32(0)
+        self.protocol_version = self.get_uint32(4)
+
+
+class ByeByePacket(nxtcp_decoder.BasePacket):
+    """
+    -
+    """
+
+
+class CompressAckPacket(nxtcp_decoder.BasePacket):
+    """
+    uint32: threshold
+    """
+
+    def __init__(self, frame):
+        nxtcp_decoder.BasePacket.__init__(self, frame)
+
+        self.threshold = self.get_uint32(0)
+
+
+class LoginPacket(nxtcp_encoder.BasePacket):
+
+    def __init__(self, name, persist=False, standby=False, enforce=False, shared=False, weight=None):
+        nxtcp_encoder.BasePacket.__init__(self)
+
+        self.set_type(PACKET_LOGIN)
+
+        flags = 0
+        flags |= (1 << 0) if persist else 0
+        flags |= (1 << 1) if standby else 0
+        flags |= (1 << 2) if enforce else 0
+        flags |= (1 << 3) if shared else 0
+
+        self.add_uint8_field(flags)
+
+        self.add_string_field(name)
+
+        if shared and weight is not None:
+            self.add_uint8_field(weight)
+
+
+class LogoutPacket(nxtcp_encoder.BasePacket):
+
+    def __init__(self, name):
+        nxtcp_encoder.BasePacket.__init__(self)
+
+        self.set_type(PACKET_LOGOUT)
+
+        self.add_string_field(name)
+
+
+class RequestPacket(nxtcp_encoder.BasePacket):
+
+    def __init__(self, name, messageref, timeout, payload):
+        nxtcp_encoder.BasePacket.__init__(self)
+
+        self.set_type(PACKET_REQUEST)
+
+        self.add_string_field(name)
+
+        # a messageref of None makes the request unidirectional
+        if messageref is None:
+            self.add_field(REQUEST_FIELDS.pack(1, 0, int(timeout * 1000), len(payload)))
+        else:
+            self.add_field(REQUEST_FIELDS.pack(0, messageref, int(timeout * 1000), len(payload)))
+
+        self.add_field(payload)
+
+
+class PostPacket(nxtcp_encoder.BasePacket):
+
+    def __init__(self, postref, payload):
+        nxtcp_encoder.BasePacket.__init__(self)
+
+        self.set_type(PACKET_POST)
+
+        self.add_field(POST_FIELDS.pack(postref, len(payload)))
+
+        self.add_field(payload)
+
+
+class SubscribePacket(nxtcp_encoder.BasePacket):
+
+    def __init__(self, messageref, name, topic):
+        nxtcp_encoder.BasePacket.__init__(self)
+
+        self.set_type(PACKET_SUBSCRIBE)
+
+        self.add_uint32_field(messageref)
+
+        self.add_string_field(name)
+
+        self.add_blob_field(topic)
+
+
+class UnsubscribePacket(nxtcp_encoder.BasePacket):
+
+    def __init__(self, name, topic):
+        nxtcp_encoder.BasePacket.__init__(self)
+
+        self.set_type(PACKET_UNSUBSCRIBE)
+
+        self.add_string_field(name)
+
+        self.add_blob_field(topic)
+
+
+class PongPacket(nxtcp_encoder.BasePacket):
+
+    def __init__(self):
+        nxtcp_encoder.BasePacket.__init__(self)
+
+        self.set_type(PACKET_PONG)
+
+
+class QuitPacket(nxtcp_encoder.BasePacket):
+
+    def __init__(self):
+        nxtcp_encoder.BasePacket.__init__(self)
+
+        self.set_type(PACKET_QUIT)
+
+
+def encode_batch(chunks):
+    """
+    Pack the encoded chunks of LOGIN, LOGOUT, REQUEST, POST, SUBSCRIBE
+    and UNSUBSCRIBE packets into the chunk of a single BATCH packet.
+    """
+
+    body = bytearray()
+
+    for chunk in chunks:
+        length = len(chunk) - 5
+
+        if length < 0x80:
+            body.append(length)
+        else:
+            body += encode_varint(length)
+
+        body += memoryview(chunk)[4:]
+
+    return pack('>IB', len(body), PACKET_BATCH) + body
+
+
+def encode_varint(value):
+    data = bytearray()
+
+    while value > 0x7f:
+        data.append(0x80 | (value & 0x7f))
+        value >>= 7
+
+    data.append(value)
+
+    return data
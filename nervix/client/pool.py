@@ -0,0 +1,164 @@
+import asyncio
+import zlib
+
+from .client import Client, ConnectionLost
+
+
+class Pool:
+    """
+    The Pool class.
+
+    Spreads requests over a number of connections, to one or more
+    servers. Every request goes to the connection with the fewest
+    outstanding requests, and no connection gets more than max_in_flight
+    of them, further requests wait until one of them is answered.
+    Unidirectional requests have no answer to wait for, they are spread
+    round-robin.
+
+    Requests to sticky names always go to the same connection, so they
+    arrive in the order in which they were made. The connection of a
+    sticky name is picked by a hash of the name, when it is lost the
+    requests to the name fail until it is reconnected.
+
+    When the pool connects to more than one server, the names it sends
+    requests to must be owned on all of them.
+    """
+
+    def __init__(self, addresses, size=4, max_in_flight=1000, sticky=(), **kwargs):
+        self.clients = [Client(host, port, **kwargs) for host, port in addresses for _ in range(size)]
+
+        self.max_in_flight = max_in_flight
+        self.sticky = set(sticky)
+
+        # set whenever a request is answered while others wait for a
+        # connection with room for more
+        self.released = asyncio.Event()
+        self.nr_waiting = 0
+
+        self.next_client = 0
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def in_flight(self):
+        """
+        Number of requests that await an answer, over all connections.
+        """
+
+        return sum(client.in_flight for client in self.clients)
+
+    async def connect(self):
+        await asyncio.gather(*(client.connect() for client in self.clients))
+
+    async def close(self):
+        await asyncio.gather(*(client.close() for client in self.clients))
+
+    async def drain(self):
+        """
+        Wait until all connections accept more data.
+        """
+
+        await asyncio.gather(*(client.drain() for client in self.clients))
+
+    def add_sticky(self, name):
+        self.sticky.add(name)
+
+    def get_client(self, name):
+        """
+        Return the client that requests to a sticky name go to.
+        """
+
+        return self.clients[zlib.crc32(name) % len(self.clients)]
+
+    async def request(self, name, payload, timeout=None):
+        """
+        Send a request to a name via the least loaded connection, and
+        return the payload of the answer.
+        """
+
+        if name in self.sticky:
+            client = self.get_client(name)
+
+            while client.in_flight >= self.max_in_flight:
+                await self.__wait_released()
+
+        else:
+            client = await self.__get_least_loaded()
+
+        try:
+            return await client.request(name, payload, timeout)
+
+        finally:
+            if self.nr_waiting:
+                self.released.set()
+
+    def send(self, name, payload):
+        """
+        Send a unidirectional request to a name.
+        """
+
+        if name in self.sticky:
+            self.get_client(name).send(name, payload)
+            return
+
+        clients = self.clients
+
+        for _ in range(len(clients)):
+            client = clients[self.next_client]
+            self.next_client = (self.next_client + 1) % len(clients)
+
+            if client.ready:
+                client.send(name, payload)
+                return
+
+        raise ConnectionLost("None of the connections of the pool is connected")
+
+    async def __get_least_loaded(self):
+        """
+        Return the connected client with the fewest outstanding
+        requests, waiting until there is one with room for more.
+        """
+
+        while True:
+            best = None
+
+            for client in self.clients:
+                if client.ready and (best is None or client.in_flight < best.in_flight):
+                    best = client
+
+            if best is None:
+                await self.__wait_connected()
+
+            elif best.in_flight >= self.max_in_flight:
+                await self.__wait_released()
+
+            else:
+                return best
+
+    async def __wait_released(self):
+        self.nr_waiting += 1
+        self.released.clear()
+
+        try:
+            await self.released.wait()
+
+        finally:
+            self.nr_waiting -= 1
+
+    async def __wait_connected(self):
+        if all(client.closing for client in self.clients):
+            raise ConnectionLost("Pool is closed")
+
+        waiters = [asyncio.ensure_future(client.connected.wait()) for client in self.clients]
+
+        try:
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
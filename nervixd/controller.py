@@ -42,10 +42,34 @@ class Controller:
         # flag that indicates if we are in the process of shutting down the hole server
         self.server_shutdown_in_process = False
 
+        # profiler that is started on SIGUSR1, None if profiling is disabled
+        self.profiler = None
+
+        # capture that records the upstream traffic of the clients, None if capturing is disabled
+        self.capture = None
+
+        # allow admin commands that change the server at runtime, like RATELIMIT of the telnet protocol
+        self.admin_commands = False
+
         # set handlers for signals
         signal.signal(signal.SIGINT, self.__on_term_signal)
         signal.signal(signal.SIGTERM, self.__on_term_signal)
 
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.__on_profile_signal)
+
+    def set_profiler(self, profiler):
+        """ Set the profiler that can be started with SIGUSR1 or an admin command, None disables profiling.
+        """
+
+        self.profiler = profiler
+
+    def set_capture(self, capture):
+        """ Set the capture that records the upstream traffic of new client connections, None disables capturing.
+        """
+
+        self.capture = capture
+
     def register(self, key, description, shutdown_func):
         """ Called from a client or service in order to register itself with the controller.
         """
@@ -84,6 +108,10 @@ class Controller:
         # set the flag, when all units are unregistered this flag will be checked and the mainloop ended.
         self.server_shutdown_in_process = True
 
+        # write the profile while we still can
+        if self.profiler:
+            self.profiler.stop()
+
         # start shutdown of each unit
         for key in list(self.units):
             self.start_shutdown(key)
@@ -138,3 +166,17 @@ class Controller:
         logger.info("Received %s, starting server shutdown", signame)
 
         self.start_server_shutdown()
+
+    def __on_profile_signal(self, signo, stackframe):
+        """ Called when SIGUSR1 is received, starts the profiler or stops it when it is already running.
+        """
+
+        if not self.profiler:
+            logger.warning("Received SIGUSR1, but profiling is disabled")
+            return
+
+        if self.profiler.is_running():
+            self.profiler.stop()
+
+        else:
+            self.profiler.start()
@@ -18,12 +18,22 @@ import logging
 import argparse
 
 from nervixd.mainloop import Mainloop
+from nervixd.mainloop.aio import AsyncioMainloop
+from nervixd.mainloop.monitor import LoopMonitor
 
 from nervixd.reactor import Reactor
+from nervixd.reactor.reactor import Channel
+from nervixd.reactor.state import BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING, BALANCE_WEIGHTED
 
 from nervixd.controller import Controller
+from nervixd.util.profiler import Profiler, MODE_CPROFILE, MODE_SAMPLE
+from nervixd.util.capture import Capture
 from nervixd.services.telnet.service import TelnetService
 from nervixd.services.nxtcp.service import NxtcpService
+from nervixd.services.nxshm.service import NxshmService
+from nervixd.services.nxudp.service import NxudpService
+from nervixd.services.nxws.service import NxwsService
+from nervixd.services.trace.service import TraceService
 
 from nervixd.tracer import PrintTracer
 
@@ -76,6 +86,80 @@ def argparse_validate_timespan(value):
     return timespan
 
 
+def argparse_validate_watermarks(value):
+    high, sep, low = value.partition(':')
+
+    try:
+        high = int(high)
+        low = int(low) if sep else high // 2
+
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid watermarks")
+
+    if not 0 <= low <= high:
+        raise argparse.ArgumentTypeError("Low watermark must be between zero and the high watermark")
+
+    return high, low
+
+
+def argparse_validate_rate_limit(value):
+    rate, sep, burst = value.partition(':')
+
+    try:
+        rate = float(rate)
+        burst = float(burst) if sep else None
+
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid rate limit")
+
+    if rate <= 0 or (burst is not None and burst < 1):
+        raise argparse.ArgumentTypeError("Rate must be greater than zero and burst at least one")
+
+    return rate, burst
+
+
+def argparse_validate_name_rate_limit(value):
+    name, sep, limit = value.rpartition('=')
+
+    return name.encode() if sep else None, argparse_validate_rate_limit(limit)
+
+
+OVERLOAD_POLICIES = {
+    'drop-oldest': Channel.POLICY_DROP_OLDEST,
+    'fail-requests': Channel.POLICY_FAIL_REQUESTS,
+    'disconnect': Channel.POLICY_DISCONNECT,
+}
+
+
+def argparse_validate_overload_policy(value):
+    policy = 0
+
+    for name in value.split(','):
+
+        if name not in OVERLOAD_POLICIES:
+            raise argparse.ArgumentTypeError("Unknown policy '{}'".format(name))
+
+        policy |= OVERLOAD_POLICIES[name]
+
+    return policy
+
+
+BALANCE_POLICIES = {
+    'round-robin': BALANCE_ROUND_ROBIN,
+    'least-outstanding': BALANCE_LEAST_OUTSTANDING,
+    'weighted': BALANCE_WEIGHTED,
+}
+
+
+def argparse_validate_balance_policy(value):
+    name, sep, policy = value.rpartition('=')
+
+    if policy not in BALANCE_POLICIES:
+        raise argparse.ArgumentTypeError("Unknown balance policy '{}'".format(policy))
+
+    return name.encode() if sep else None, BALANCE_POLICIES[policy]
+
+
 def main(arg_list):
     parser = argparse.ArgumentParser()
 
@@ -99,26 +183,254 @@ def main(arg_list):
         default=[],
     )
 
+    parser.add_argument(
+        '--trace',
+        dest='trace_address',
+        help='Enable the trace service on the given host:port address, to follow the traffic live',
+        metavar='host:port',
+        type=argparse_validate_address,
+        default=None,
+    )
+
+    parser.add_argument(
+        '-w', '--nxws',
+        dest='nxws_addresses',
+        action='append',
+        help='Enable a NXWS (WebSocket) service on the given host:port address',
+        metavar='host:port',
+        type=argparse_validate_address,
+        default=[],
+    )
+
+    parser.add_argument(
+        '-u', '--nxudp',
+        dest='nxudp_addresses',
+        action='append',
+        help='Enable a NXUDP service on the given host:port address',
+        metavar='host:port',
+        type=argparse_validate_address,
+        default=[],
+    )
+
+    parser.add_argument(
+        '-s', '--nxshm',
+        dest='nxshm_paths',
+        action='append',
+        help='Enable a shared memory NXSHM service on the given unix socket path',
+        metavar='path',
+        default=[],
+    )
+
+    parser.add_argument(
+        '--watermarks',
+        dest='watermarks_bytes',
+        help='Downstream high and low watermarks per client in bytes, the low watermark defaults to half the high',
+        metavar='high[:low]',
+        type=argparse_validate_watermarks,
+        default=None,
+    )
+
+    parser.add_argument(
+        '--verb-watermarks',
+        dest='watermarks_verbs',
+        help='Downstream high and low watermarks per client in number of queued messages',
+        metavar='high[:low]',
+        type=argparse_validate_watermarks,
+        default=None,
+    )
+
+    parser.add_argument(
+        '--overload-policy',
+        dest='overload_policy',
+        help='Comma separated policies applied to clients that do not keep up: ' + ', '.join(OVERLOAD_POLICIES),
+        metavar='policy[,policy]',
+        type=argparse_validate_overload_policy,
+        default=None,
+    )
+
+    parser.add_argument(
+        '--max-outstanding',
+        dest='max_outstanding_requests',
+        help='Stop reading from a client while this many of its requests await a response, 0 means unlimited',
+        metavar='n',
+        type=int,
+        default=None,
+    )
+
+    parser.add_argument(
+        '--rate-limit',
+        dest='channel_rate_limit',
+        help='Limit the number of requests per second of each client, with an optional burst size',
+        metavar='rate[:burst]',
+        type=argparse_validate_rate_limit,
+        default=None,
+    )
+
+    parser.add_argument(
+        '--name-rate-limit',
+        dest='name_rate_limits',
+        action='append',
+        help='Limit the number of requests per second to the given name, or to every name if no name is given',
+        metavar='[name=]rate[:burst]',
+        type=argparse_validate_name_rate_limit,
+        default=[],
+    )
+
+    parser.add_argument(
+        '--balance',
+        dest='balance_policies',
+        action='append',
+        help='Policy used to balance calls over the shared owners of the given name, or of every name if no '
+             'name is given: ' + ', '.join(BALANCE_POLICIES),
+        metavar='[name=]policy',
+        type=argparse_validate_balance_policy,
+        default=[],
+    )
+
+    parser.add_argument(
+        '--mainloop',
+        dest='mainloop',
+        help='Mainloop implementation to use, asyncio uses uvloop when it is installed',
+        choices=['native', 'asyncio'],
+        default='native',
+    )
+
+    parser.add_argument(
+        '--slow-handler',
+        dest='slow_handler',
+        help='With --loop-monitor, log handlers that block the mainloop for longer than this many seconds',
+        metavar='seconds',
+        type=argparse_validate_timespan,
+        default=0.1,
+    )
+
+    parser.add_argument(
+        '--loop-monitor',
+        dest='loop_monitor',
+        help='Time the handlers and timers of the mainloop',
+        action='store_true',
+        default=False,
+    )
+
+    parser.add_argument(
+        '--profile-dir',
+        dest='profile_dir',
+        help='Enable profiling on SIGUSR1 or, with --admin-commands, the PROFILE telnet command, writing the results to '
+             'this directory',
+        metavar='path',
+        default=None,
+    )
+
+    parser.add_argument(
+        '--profile-mode',
+        dest='profile_mode',
+        help='Profile every call with cProfile, or take samples of the stack',
+        choices=[MODE_CPROFILE, MODE_SAMPLE],
+        default=MODE_CPROFILE,
+    )
+
+    parser.add_argument(
+        '--profile-duration',
+        dest='profile_duration',
+        help='Number of seconds to profile for',
+        metavar='seconds',
+        type=argparse_validate_timespan,
+        default=30.0,
+    )
+
+    parser.add_argument(
+        '--capture',
+        dest='capture_path',
+        help='Record the upstream traffic of NXTCP and telnet clients to this file, for replay with '
+             'python -m benchmarks.replay',
+        metavar='path',
+        default=None,
+    )
+
+    parser.add_argument(
+        '--admin-commands',
+        dest='admin_commands',
+        help='Allow telnet clients to change the server at runtime, like its rate limits, and to profile it',
+        action='store_true',
+        default=False,
+    )
+
     args = parser.parse_args(arg_list)
 
-    mainloop = Mainloop()
+    if args.mainloop == 'asyncio':
+        mainloop = AsyncioMainloop()
+    else:
+        mainloop = Mainloop()
+
+    if args.loop_monitor:
+        mainloop.set_monitor(LoopMonitor(mainloop.now, args.slow_handler))
 
     controller = Controller(mainloop, args)
+    controller.admin_commands = args.admin_commands
+
+    if args.profile_dir:
+        controller.set_profiler(Profiler(mainloop, args.profile_dir, args.profile_mode, args.profile_duration))
+
+    if args.capture_path:
+        controller.set_capture(Capture(args.capture_path, mainloop.now))
 
     tracer = PrintTracer()
 
     reactor = Reactor(mainloop, tracer)
 
+    if args.watermarks_bytes:
+        reactor.high_watermark_bytes, reactor.low_watermark_bytes = args.watermarks_bytes
+
+    if args.watermarks_verbs:
+        reactor.high_watermark_verbs, reactor.low_watermark_verbs = args.watermarks_verbs
+
+    if args.overload_policy is not None:
+        reactor.overload_policy = args.overload_policy
+
+    if args.max_outstanding_requests is not None:
+        reactor.max_outstanding_requests = args.max_outstanding_requests
+
+    if args.channel_rate_limit:
+        reactor.rate_limiter.set_channel_limit(*args.channel_rate_limit)
+
+    for name, limit in args.name_rate_limits:
+        reactor.rate_limiter.set_name_limit(name, *limit)
+
+    for name, policy in args.balance_policies:
+        if name is None:
+            reactor.balance_policy = policy
+        else:
+            reactor.set_balance_policy(name, policy)
+
     # create NXTCP services
     for address in args.nxtcp_addresses:
         service = NxtcpService(controller, mainloop, reactor, tracer, address)
 
+    # create NXWS services
+    for address in args.nxws_addresses:
+        service = NxwsService(controller, mainloop, reactor, tracer, address)
+
+    # create NXUDP services
+    for address in args.nxudp_addresses:
+        service = NxudpService(controller, mainloop, reactor, tracer, address)
+
+    # create NXSHM services
+    for path in args.nxshm_paths:
+        service = NxshmService(controller, mainloop, reactor, tracer, path)
+
     # create Telnet services
     for address in args.telnet_addresses:
         service = TelnetService(controller, mainloop, reactor, tracer, address)
 
+    # create trace service
+    if args.trace_address:
+        service = TraceService(controller, mainloop, reactor, tracer, args.trace_address)
+
     logger.info("Starting mainloop")
 
     mainloop.run_forever()
 
     logger.info("Mainloop finished")
+
+    if controller.capture:
+        controller.capture.close()
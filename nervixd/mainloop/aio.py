@@ -0,0 +1,386 @@
+import asyncio
+import logging
+from collections import deque
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from .mainloop import IOProxy, Timer, Deferred
+
+logger = logging.getLogger(__name__)
+
+
+def new_event_loop():
+    """
+    Create a new asyncio event loop, using uvloop when it is installed.
+    """
+
+    if uvloop:
+        return uvloop.new_event_loop()
+
+    return asyncio.new_event_loop()
+
+
+class AsyncioMainloop:
+    """
+    Mainloop that runs on an asyncio event loop.
+
+    It offers the same interface as the Mainloop class, so services and
+    the reactor run on it unmodified. Filedescriptors are watched with
+    add_reader() and add_writer(), and timers are scheduled with
+    call_at() of the event loop.
+
+    By default a new event loop is created, which is an uvloop loop when
+    uvloop is installed. To embed nervixd in an asyncio application,
+    pass the running loop of the application instead and do not call
+    run_forever() or run_once(), the application then drives the loop.
+    """
+
+    def __init__(self, loop=None):
+
+        self.loop = loop if loop else new_event_loop()
+
+        self.fd_reading = set()
+        self.fd_writing = set()
+        self.fd_read_handlers = dict()
+        self.fd_write_handlers = dict()
+
+        # filedescriptors that have buffered input left, in the order
+        # they will be serviced
+        self.fd_pending = dict()
+        self.fd_pending_handlers = dict()
+        self.pending_scheduled = False
+
+        self.timer_handlers = dict()
+        self.timer_handles = dict()
+
+        # callbacks deferred with call_soon(), and the number of seconds
+        # per cycle that may be spend on them
+        self.deferred = deque()
+        self.deferred_budget = 0.005
+        self.deferred_scheduled = False
+
+        # number of events handled since run_once() was called, the
+        # loop is stopped after the first cycle with events when
+        # stop_after_cycle is set
+        self.nr_events = 0
+        self.stop_after_cycle = False
+
+        # instrumentation, see set_monitor()
+        self.monitor = None
+
+        self.running = False
+        self.shutdown_flag = False
+
+    def now(self):
+        """ Return the current monotonic timestamp
+        """
+
+        return self.loop.time()
+
+    def shutdown(self):
+        """
+        Stop the loop if it is run by us. May be called from a signal
+        handler.
+        """
+
+        self.shutdown_flag = True
+
+        if self.running:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def set_monitor(self, monitor):
+        """
+        Set the LoopMonitor that times the handlers, None disables
+        monitoring.
+        """
+
+        self.monitor = monitor
+
+    def run_forever(self):
+
+        self.stop_after_cycle = False
+
+        while not self.shutdown_flag:
+            self.__run()
+
+    def run_once(self, max_timeout=None):
+        """
+        Run until the first cycle in which events are handled, or until
+        the timeout expires.
+        """
+
+        self.nr_events = 0
+        self.stop_after_cycle = True
+
+        stopper = None
+
+        if max_timeout is not None:
+            stopper = self.loop.call_later(max_timeout, self.loop.stop)
+
+        self.__run()
+
+        if stopper:
+            stopper.cancel()
+
+        self.stop_after_cycle = False
+
+        return self.nr_events
+
+    def register(self, fd):
+        """
+        Register a filedescriptor on the mainloop, returning an IOProxy
+        object.
+        """
+
+        proxy = IOProxy(self, fd)
+        return proxy
+
+    def timer(self):
+        """
+        Create a new timer on the mainloop, returning a Timer object.
+        """
+
+        timer = Timer(self)
+        return timer
+
+    def call_soon(self, func, *args, **kwargs):
+        """
+        Call the function in this or the next cycle, after the IO events
+        have been handled. Returns a Deferred object that can be used to
+        cancel the call.
+        """
+
+        deferred = Deferred(func, args, kwargs)
+        self.deferred.append(deferred)
+
+        if not self.deferred_scheduled:
+            self.deferred_scheduled = True
+            self.loop.call_soon(self.__on_deferred)
+
+        return deferred
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """
+        Call the function after the given delay in seconds. Returns the
+        Timer object that can be used to cancel the call.
+        """
+
+        timer = self.timer()
+        timer.set_handler(func, *args, **kwargs)
+        timer.set(delay)
+
+        return timer
+
+    def __run(self):
+        """
+        Run the event loop until it is stopped.
+        """
+
+        self.running = True
+
+        try:
+            self.loop.run_forever()
+
+        finally:
+            self.running = False
+
+    def __handled(self):
+        """
+        Called after every handled event.
+        """
+
+        self.nr_events += 1
+
+        if self.stop_after_cycle:
+            self.loop.stop()
+
+    def __call(self, kind, handler, *args, **kwargs):
+        """
+        Call a handler, via the monitor if there is one.
+        """
+
+        if self.monitor:
+            self.monitor.call(kind, handler, *args, **kwargs)
+        else:
+            handler(*args, **kwargs)
+
+    def __on_read(self, fd):
+        handler = self.fd_read_handlers.get(fd, None)
+
+        if handler:
+            self.__call('read', handler)
+
+        self.__handled()
+
+    def __on_write(self, fd):
+        handler = self.fd_write_handlers.get(fd, None)
+
+        if handler:
+            self.__call('write', handler)
+
+        self.__handled()
+
+    def __on_timer(self, timer_id, deadline):
+        self.timer_handles.pop(timer_id, None)
+
+        handler = self.timer_handlers.pop(timer_id, None)
+
+        # if handler is None, it means the timer is canceled.
+
+        if handler:
+            if self.monitor:
+                self.monitor.timer_expired(deadline)
+
+            self.__call('timer', handler)
+
+        self.__handled()
+
+    def __on_pending(self):
+        """
+        Give each pending filedescriptor one turn, those that become
+        pending meanwhile wait for the next cycle.
+        """
+
+        self.pending_scheduled = False
+
+        for fd in list(self.fd_pending):
+
+            if fd not in self.fd_pending:
+                continue
+
+            handler = self.fd_pending_handlers.get(fd, None)
+            if handler:
+                self.__call('pending', handler)
+
+            self.__handled()
+
+        if self.fd_pending:
+            self.__schedule_pending()
+
+    def __on_deferred(self):
+        """
+        Process the deferred callbacks, those deferred while doing so
+        wait for the next cycle.
+        """
+
+        self.deferred_scheduled = False
+
+        deferred = self.deferred
+        count = len(deferred)
+        deadline = self.now() + self.deferred_budget
+
+        while count and deferred:
+
+            count -= 1
+
+            call = deferred.popleft()
+
+            if call.cancelled:
+                continue
+
+            self.__call('deferred', call.func, *call.args, **call.kwargs)
+
+            self.__handled()
+
+            if self.now() >= deadline:
+                break
+
+        if deferred and not self.deferred_scheduled:
+            self.deferred_scheduled = True
+            self.loop.call_soon(self.__on_deferred)
+
+    def __schedule_pending(self):
+        if not self.pending_scheduled:
+            self.pending_scheduled = True
+            self.loop.call_soon(self.__on_pending)
+
+    def _update_interest(self, fd, read=None, write=None):
+        """
+        Modify the events that the event loop should watch.
+        """
+
+        if read is True and fd not in self.fd_reading:
+            self.loop.add_reader(fd, self.__on_read, fd)
+            self.fd_reading.add(fd)
+
+        elif read is False and fd in self.fd_reading:
+            self.loop.remove_reader(fd)
+            self.fd_reading.discard(fd)
+
+        if write is True and fd not in self.fd_writing:
+            self.loop.add_writer(fd, self.__on_write, fd)
+            self.fd_writing.add(fd)
+
+        elif write is False and fd in self.fd_writing:
+            self.loop.remove_writer(fd)
+            self.fd_writing.discard(fd)
+
+    def _update_read_handler(self, fd, func):
+        """
+        Set the handler for that will be called on read events.
+        """
+
+        self.fd_read_handlers[fd] = func
+
+    def _update_write_handler(self, fd, func):
+        """
+        Set the handler that will be called on write events.
+        """
+
+        self.fd_write_handlers[fd] = func
+
+    def _update_pending(self, fd, pending):
+        """
+        Mark or unmark the filedescriptor as having buffered input left.
+        """
+
+        if pending:
+            self.fd_pending[fd] = True
+            self.__schedule_pending()
+
+        else:
+            self.fd_pending.pop(fd, None)
+
+    def _update_pending_handler(self, fd, func):
+        """
+        Set the handler that will be called while the filedescriptor is
+        marked as pending.
+        """
+
+        self.fd_pending_handlers[fd] = func
+
+    def _unregister(self, fd):
+        self.fd_pending.pop(fd, None)
+        self.fd_pending_handlers.pop(fd, None)
+
+        self._update_interest(fd, read=False, write=False)
+        self.fd_read_handlers.pop(fd, None)
+        self.fd_write_handlers.pop(fd, None)
+
+    def _update_timer_timeout(self, timer_id, timeout):
+        """
+        Set the timeout after which the timer will expire
+        """
+
+        deadline = self.now() + timeout
+
+        handle = self.loop.call_at(deadline, self.__on_timer, timer_id, deadline)
+        self.timer_handles[timer_id] = handle
+
+    def _update_timer_handler(self, timer_id, func):
+        """
+        Set the handler that will be called when a timer expires.
+        """
+
+        if callable(func):
+            self.timer_handlers[timer_id] = func
+
+        else:
+            self.timer_handlers.pop(timer_id, None)
+
+            handle = self.timer_handles.pop(timer_id, None)
+            if handle:
+                handle.cancel()
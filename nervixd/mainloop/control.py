@@ -42,9 +42,15 @@ class Control:
 
     def signal(self, event):
         """
-        Send a signal.
+        Send a signal. A signal that is still pending is not send again,
+        every timer that is set sends a wakeup signal, and these would
+        otherwise fill up the pipe when many timers are set in a single
+        cycle.
         """
 
+        if event in self.events_pending:
+            return
+
         self.events_pending.append(event)
 
         buff = bytearray(1)
@@ -1,5 +1,6 @@
 import time
 import heapq
+from collections import deque
 
 try:
     import selectors
@@ -23,10 +24,27 @@ class Mainloop:
     know in which events we're interested and what functions should be
     called on a certain event.
 
+    A filedescriptor that has more buffered input than it is willing to
+    handle at once can mark itself as pending, its pending handler will
+    then be called once every cycle until it clears the mark. This way
+    all pending filedescriptors are serviced round-robin, without waiting
+    for IO.
+
     By creating a timer using the timer() method, a new timer is
     achieved. This object is used to let the mainloop know what function
     to call when the timer expires, and to set the timer timeout.
 
+    Work that does not have to be done right away can be deferred with
+    call_soon(), the callbacks are then called after the IO of the cycle
+    has been handled. Each cycle only runs the callbacks for as long as
+    the deferred budget allows, the rest waits for the next cycle, so
+    large amounts of deferred work do not block IO. The call_later()
+    method does the same after a delay.
+
+    A LoopMonitor can be set with set_monitor() to time every handler
+    that is called and the lag of the timers. Without one the handlers
+    are called directly.
+
     All this is executed by running the mainloop. This should be done by
     calling the run_once() or run_forever() methods.
 
@@ -49,9 +67,22 @@ class Mainloop:
         self.fd_read_handlers = dict()
         self.fd_write_handlers = dict()
 
+        # filedescriptors that have buffered input left, in the order
+        # they will be serviced
+        self.fd_pending = dict()
+        self.fd_pending_handlers = dict()
+
         self.timer_deadlines = list()
         self.timer_handlers = dict()
 
+        # callbacks deferred with call_soon(), and the number of seconds
+        # per cycle that may be spend on them
+        self.deferred = deque()
+        self.deferred_budget = 0.005
+
+        # instrumentation, see set_monitor()
+        self.monitor = None
+
         self.control = Control(self)
 
         self.shutdown_flag = False
@@ -65,6 +96,14 @@ class Mainloop:
     def shutdown(self):
         self.control.signal(Mainloop.SIG_SHUTDOWN)
 
+    def set_monitor(self, monitor):
+        """
+        Set the LoopMonitor that times the handlers, None disables
+        monitoring.
+        """
+
+        self.monitor = monitor
+
     def run_forever(self):
 
         while not self.shutdown_flag:
@@ -79,6 +118,8 @@ class Mainloop:
         nr_timers = 0
         nr_writes = 0
         nr_reads = 0
+        nr_pending = 0
+        nr_deferred = 0
         nr_signals = 0
 
         # retrieve the remaining time for the first timer to expire
@@ -96,13 +137,23 @@ class Mainloop:
         elif timer_timeout:
             timeout = timer_timeout
 
+        # do not wait when there is buffered input or deferred work left
+        if self.fd_pending or self.deferred:
+            timeout = 0
+
+        # the filedescriptors that get their turn this cycle, those that
+        # become pending while handling IO events wait for the next cycle
+        pending = list(self.fd_pending)
+
         # wait for events
         events = self.selector.select(timeout)
 
+        monitor = self.monitor
+
         # process expired timers
         expired_timers = self._get_expired_timers()
 
-        for key in expired_timers:
+        for deadline, key in expired_timers:
 
             nr_timers += 1
 
@@ -111,7 +162,11 @@ class Mainloop:
             # if handler is None, it means the timer is canceled.
 
             if handler:
-                handler()
+                if monitor:
+                    monitor.timer_expired(deadline)
+                    monitor.call('timer', handler)
+                else:
+                    handler()
 
         # process IO events
         for key, mask in events:
@@ -122,7 +177,10 @@ class Mainloop:
 
                 handler = self.fd_write_handlers.get(key.fd, None)
                 if handler:
-                    handler()
+                    if monitor:
+                        monitor.call('write', handler)
+                    else:
+                        handler()
 
             if mask & selectors.EVENT_READ:
 
@@ -130,8 +188,31 @@ class Mainloop:
 
                 handler = self.fd_read_handlers.get(key.fd, None)
                 if handler:
+                    if monitor:
+                        monitor.call('read', handler)
+                    else:
+                        handler()
+
+        # process buffered input, one turn per filedescriptor
+        for fd in pending:
+
+            if fd not in self.fd_pending:
+                continue
+
+            nr_pending += 1
+
+            handler = self.fd_pending_handlers.get(fd, None)
+            if handler:
+                if monitor:
+                    monitor.call('pending', handler)
+                else:
                     handler()
 
+        # process deferred callbacks, those deferred while doing so wait
+        # for the next cycle
+        if self.deferred:
+            nr_deferred = self._run_deferred(len(self.deferred))
+
         # process control signals
         for signal in self.control.signals():
 
@@ -140,7 +221,7 @@ class Mainloop:
             if signal == Mainloop.SIG_SHUTDOWN:
                 self.shutdown_flag = True
 
-        return nr_timers + nr_writes + nr_reads + nr_signals
+        return nr_timers + nr_writes + nr_reads + nr_pending + nr_deferred + nr_signals
 
     def register(self, fd):
         """
@@ -159,6 +240,63 @@ class Mainloop:
         timer = Timer(self)
         return timer
 
+    def call_soon(self, func, *args, **kwargs):
+        """
+        Call the function in this or the next cycle, after the IO events
+        have been handled. Returns a Deferred object that can be used to
+        cancel the call.
+        """
+
+        deferred = Deferred(func, args, kwargs)
+        self.deferred.append(deferred)
+
+        return deferred
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """
+        Call the function after the given delay in seconds. Returns the
+        Timer object that can be used to cancel the call.
+        """
+
+        timer = self.timer()
+        timer.set_handler(func, *args, **kwargs)
+        timer.set(delay)
+
+        return timer
+
+    def _run_deferred(self, count):
+        """
+        Call at most count deferred callbacks, stopping early when the
+        deferred budget is used up. Returns the number of calls made.
+        """
+
+        deferred = self.deferred
+        deadline = self.now() + self.deferred_budget
+        monitor = self.monitor
+
+        nr_calls = 0
+
+        while count and deferred:
+
+            count -= 1
+
+            call = deferred.popleft()
+
+            if call.cancelled:
+                continue
+
+            nr_calls += 1
+
+            if monitor:
+                monitor.call('deferred', call.func, *call.args, **call.kwargs)
+            else:
+                call.func(*call.args, **call.kwargs)
+
+            if self.now() >= deadline:
+                break
+
+        return nr_calls
+
     def _update_interest(self, fd, read=None, write=None):
         """
         Modify the events that the selector should select.
@@ -187,7 +325,7 @@ class Mainloop:
         elif new_events:
             self.selector.modify(fd, new_events)
 
-        else:
+        elif old_events:
             self.selector.unregister(fd)
 
         self.fd_events[fd] = new_events
@@ -206,7 +344,29 @@ class Mainloop:
 
         self.fd_write_handlers[fd] = func
 
+    def _update_pending(self, fd, pending):
+        """
+        Mark or unmark the filedescriptor as having buffered input left.
+        """
+
+        if pending:
+            self.fd_pending[fd] = True
+
+        else:
+            self.fd_pending.pop(fd, None)
+
+    def _update_pending_handler(self, fd, func):
+        """
+        Set the handler that will be called while the filedescriptor is
+        marked as pending.
+        """
+
+        self.fd_pending_handlers[fd] = func
+
     def _unregister(self, fd):
+        self.fd_pending.pop(fd, None)
+        self.fd_pending_handlers.pop(fd, None)
+
         if fd in self.fd_events:
             self._update_interest(fd, read=False, write=False)
             del self.fd_events[fd]
@@ -262,7 +422,7 @@ class Mainloop:
 
     def _get_expired_timers(self):
         """
-        Returns a list of the timers that have expired
+        Returns the deadlines and ids of the timers that have expired
         """
 
         now = self.now()
@@ -276,7 +436,7 @@ class Mainloop:
 
             heapq.heappop(self.timer_deadlines)
 
-            yield timer_id
+            yield deadline, timer_id
 
 
 class IOProxy:
@@ -347,6 +507,22 @@ class IOProxy:
 
         self.mainloop._update_write_handler(self.fd, handler)
 
+    def set_pending_handler(self, handler=None):
+        """
+        Set the function that will be called once every cycle while the
+        proxy is marked as pending.
+        """
+
+        self.mainloop._update_pending_handler(self.fd, handler)
+
+    def set_pending(self, pending):
+        """
+        Mark (True) or unmark (False) the proxy as having buffered input
+        left that should be handled in a next cycle.
+        """
+
+        self.mainloop._update_pending(self.fd, pending)
+
     def unregister(self):
         """
         Disconnect the proxy from the mainloop. Deleting all references.
@@ -369,6 +545,32 @@ class IOProxy:
         )
 
 
+class Deferred:
+    """
+    A callback deferred with the call_soon() method of the Mainloop
+    class.
+    """
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancel the call, if it did not happen yet.
+        """
+
+        self.cancelled = True
+
+    def __repr__(self):
+        return "<Deferred func={func} cancelled={cancelled}>".format(
+            func=getattr(self.func, '__name__', self.func),
+            cancelled=self.cancelled,
+        )
+
+
 class Timer:
     """
     The Timer class is used to interact with the mainloop about timers.
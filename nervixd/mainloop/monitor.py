@@ -0,0 +1,205 @@
+import logging
+from bisect import bisect_left
+
+from .mainloop import Timer
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the histogram buckets in seconds, values above the
+# last bound go into an extra overflow bucket
+BUCKET_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class LoopMonitor:
+    """
+    Instrumentation of the mainloop, used to find out what blocks it.
+
+    When a monitor is set on the mainloop, every handler the mainloop
+    calls is timed, and handlers that take longer than the slow
+    threshold are logged together with what they were working on. Also
+    the delay between the moment a timer should expire and the moment
+    its handler is actually called is measured, which is the lag every
+    client experiences.
+
+    The reactor notes the last verb it processed on the monitor with
+    annotate(), so a slow read handler can be traced back to the verb
+    that caused it.
+    """
+
+    def __init__(self, clock, slow_threshold=0.1):
+        self.clock = clock
+        self.slow_threshold = slow_threshold
+
+        self.lag = Histogram()
+        self.handler_time = Histogram()
+
+        # the last verb processed by the current handler
+        self.channel = None
+        self.verb = None
+
+        # stats
+        self.nr_slow = 0
+
+    def call(self, kind, handler, *args, **kwargs):
+        """
+        Call the handler, timing how long it takes.
+        """
+
+        self.channel = None
+        self.verb = None
+
+        start = self.clock()
+
+        handler(*args, **kwargs)
+
+        elapsed = self.clock() - start
+
+        self.handler_time.add(elapsed)
+
+        if elapsed >= self.slow_threshold:
+            self.nr_slow += 1
+            self.__report_slow(kind, handler, args, elapsed)
+
+    def timer_expired(self, deadline):
+        """
+        Called right before the handler of a timer is called, with the
+        time the timer should have expired.
+        """
+
+        self.lag.add(max(self.clock() - deadline, 0.0))
+
+    def annotate(self, channel, verb):
+        """
+        Note the verb that is being processed by the current handler.
+        """
+
+        self.channel = channel
+        self.verb = verb
+
+    def reset(self):
+        """
+        Clear the histograms and stats.
+        """
+
+        self.lag.reset()
+        self.handler_time.reset()
+        self.nr_slow = 0
+
+    def __report_slow(self, kind, handler, args, elapsed):
+        """
+        Log a handler that took too long.
+        """
+
+        context = ''
+
+        if self.verb is not None:
+            context = ', last verb {} from {}'.format(
+                self.verb.__class__.__name__,
+                describe_object(self.channel) or self.channel,
+            )
+
+        logger.warning("Slow %s handler %s took %.1f ms%s",
+                       kind, describe_handler(handler, args), elapsed * 1000.0, context)
+
+
+class Histogram:
+    """
+    Histogram of durations with fixed buckets.
+    """
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.reset()
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+        self.count += 1
+        self.total += value
+
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+
+        return self.total / self.count
+
+    def percentile(self, p):
+        """
+        Return the upper bound of the bucket that holds the given
+        percentile, or the maximum when it is in the overflow bucket.
+        """
+
+        if not self.count:
+            return 0.0
+
+        rank = self.count * p / 100.0
+        seen = 0
+
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def __repr__(self):
+        return "<{cls} count={count} mean={mean:.6f} max={max:.6f}>".format(
+            cls=self.__class__.__name__,
+            count=self.count,
+            mean=self.mean(),
+            max=self.max,
+        )
+
+
+def describe_handler(handler, args=()):
+    """
+    Return a description of a handler called by the mainloop, including
+    the object it belongs to.
+    """
+
+    owner = getattr(handler, '__self__', None)
+
+    # timers call a handler of their own, which calls the real handler
+    if isinstance(owner, Timer) and owner.handler:
+        args = owner.handler_args
+        handler = owner.handler
+        owner = getattr(handler, '__self__', None)
+
+    name = getattr(handler, '__qualname__', None) or repr(handler)
+
+    # prefer the description of the connection or channel involved
+    for obj in (owner,) + tuple(args):
+        description = describe_object(obj)
+
+        if description:
+            return '{} of {}'.format(name, description)
+
+    return name
+
+
+def describe_object(obj):
+    """
+    Return the description of a channel, or of the channel of a
+    connection, or None if the object has none.
+    """
+
+    description = getattr(obj, 'description', None)
+
+    if description is None:
+        channel = getattr(obj, 'channel', None)
+        description = getattr(channel, 'description', None)
+
+    if description is not None and not isinstance(description, str):
+        return None
+
+    return description
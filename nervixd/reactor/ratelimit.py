@@ -0,0 +1,216 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiting of requests.
+
+    Every channel can be given a bucket, and every target name can be
+    given a bucket shared by all channels. A request is only allowed
+    when both buckets, if any, hold a token. The buckets are refilled
+    lazily, from the time that passed since they were last used.
+
+    A limit is given as a rate in requests per second and a burst, the
+    number of requests that may be done at once after being idle.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+
+        # (rate, burst) tuples, None means unlimited
+        self.channel_limit = None
+        self.default_name_limit = None
+        self.name_limits = dict()
+
+        self.channel_buckets = dict()
+        self.name_buckets = dict()
+
+        # name buckets are pruned when there are more than this
+        self.prune_threshold = 1024
+
+        # stats
+        self.nr_rejected = 0
+
+        self.enabled = False
+
+    def set_channel_limit(self, rate, burst=None):
+        """
+        Limit the requests done by every channel. A rate of None
+        removes the limit.
+        """
+
+        self.channel_limit = self.__get_limit(rate, burst)
+
+        self.__update_buckets(self.channel_buckets, lambda key: self.channel_limit)
+        self.__update_enabled()
+
+    def set_name_limit(self, name, rate, burst=None):
+        """
+        Limit the requests done to the given name, over all channels. If
+        name is None, the limit applies to all names that have no limit
+        of their own. A rate of None removes the limit.
+        """
+
+        limit = self.__get_limit(rate, burst)
+
+        if name is None:
+            self.default_name_limit = limit
+
+        elif limit:
+            self.name_limits[name] = limit
+
+        else:
+            self.name_limits.pop(name, None)
+
+        self.__update_buckets(self.name_buckets, self.__get_name_limit)
+        self.__update_enabled()
+
+    def allow(self, channel, name):
+        """
+        Take a token from the buckets of the channel and name. Returns
+        False, without taking any token, if one of them is empty.
+        """
+
+        now = self.clock()
+
+        channel_bucket = None
+        name_bucket = None
+
+        if self.channel_limit:
+            channel_bucket = self.__get_bucket(self.channel_buckets, channel, self.channel_limit, now)
+
+            if not channel_bucket.refill(now):
+                self.nr_rejected += 1
+                return False
+
+        limit = self.__get_name_limit(name)
+
+        if limit:
+            name_bucket = self.__get_bucket(self.name_buckets, name, limit, now)
+
+            if not name_bucket.refill(now):
+                self.nr_rejected += 1
+                return False
+
+        if channel_bucket:
+            channel_bucket.tokens -= 1
+
+        if name_bucket:
+            name_bucket.tokens -= 1
+
+        return True
+
+    def forget_channel(self, channel):
+        """
+        Remove the bucket of a channel, called when it is closed.
+        """
+
+        self.channel_buckets.pop(channel, None)
+
+    def __get_name_limit(self, name):
+        return self.name_limits.get(name, self.default_name_limit)
+
+    def __get_bucket(self, buckets, key, limit, now):
+        """
+        Return the bucket for the given key, creating a full one if it
+        does not exist yet.
+        """
+
+        bucket = buckets.get(key, None)
+
+        if not bucket:
+
+            if len(buckets) >= self.prune_threshold:
+                self.__prune(buckets, now)
+
+            rate, burst = limit
+            bucket = TokenBucket(rate, burst, now)
+            buckets[key] = bucket
+
+        return bucket
+
+    def __prune(self, buckets, now):
+        """
+        Remove the buckets that are full again, they are no different
+        from a new bucket. If most buckets are still in use, the
+        threshold is raised to keep pruning cheap.
+        """
+
+        for key, bucket in list(buckets.items()):
+            if bucket.is_full(now):
+                del buckets[key]
+
+        if len(buckets) >= self.prune_threshold // 2:
+            self.prune_threshold *= 2
+
+    @staticmethod
+    def __update_buckets(buckets, get_limit):
+        """
+        Apply changed limits to the existing buckets.
+        """
+
+        for key, bucket in list(buckets.items()):
+
+            limit = get_limit(key)
+
+            if limit:
+                bucket.rate, bucket.burst = limit
+                bucket.tokens = min(bucket.tokens, bucket.burst)
+
+            else:
+                del buckets[key]
+
+    @staticmethod
+    def __get_limit(rate, burst):
+        if rate is None:
+            return None
+
+        if rate <= 0:
+            raise ValueError("Rate must be greater than zero")
+
+        # by default allow a burst of one second worth of requests
+        if burst is None:
+            burst = max(rate, 1)
+
+        if burst < 1:
+            raise ValueError("Burst must be at least one")
+
+        return rate, burst
+
+    def __update_enabled(self):
+        self.enabled = bool(self.channel_limit or self.default_name_limit or self.name_limits)
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def refill(self, now):
+        """
+        Add the tokens for the time passed since the last refill.
+        Returns True if there is at least one token available.
+        """
+
+        tokens = self.tokens + (now - self.stamp) * self.rate
+
+        self.tokens = min(tokens, self.burst)
+        self.stamp = now
+
+        return self.tokens >= 1
+
+    def is_full(self, now):
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+    def __repr__(self):
+        return "<{cls} rate={rate} burst={burst} tokens={tokens:.1f}>".format(
+            cls=self.__class__.__name__,
+            rate=self.rate,
+            burst=self.burst,
+            tokens=self.tokens,
+        )
@@ -1,8 +1,10 @@
 from collections import deque
+from itertools import islice
 import logging
 
 from .verbs import *
-from .state import State
+from .state import State, BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING, BALANCE_WEIGHTED
+from .ratelimit import RateLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +32,48 @@ class Reactor:
         self.watch_timeout_max = 60.0
         self.watch_timeout_timers = dict()
 
+        # downstream backpressure settings applied to new channels, see
+        # Channel.set_watermarks() and Channel.set_overload_policy()
+        self.high_watermark_bytes = 4 * 2 ** 20
+        self.low_watermark_bytes = 2 ** 20
+        self.high_watermark_verbs = 10000
+        self.low_watermark_verbs = 2500
+        # only messages on subscriptions are dropped by default, failing
+        # requests and disconnecting clients has to be enabled
+        self.overload_policy = Channel.POLICY_DROP_OLDEST
+
+        # upstream flow control setting applied to new channels, see
+        # Channel.is_upstream_blocked()
+        self.max_outstanding_requests = 1024
+
+        # token bucket rate limiting of requests, disabled until a limit
+        # is set on it
+        self.rate_limiter = RateLimiter(mainloop.now)
+
+        # policy used to balance calls over the owners of shared names,
+        # can be overridden per name with set_balance_policy()
+        self.balance_policy = BALANCE_ROUND_ROBIN
+        self.balance_policies = dict()
+
+        # interest is replayed to a newly activated owner in chunks of
+        # this many topics, one chunk per mainloop turn, so a takeover of
+        # a name with many topics does not stall the mainloop
+        self.interest_replay_chunk = 1024
+        self.interest_replay_retry = 0.01
+        self.interest_replays = dict()
+
+        # likewise messages on a subscription are fanned out to this many
+        # subscribers per mainloop turn, and a closed channel is
+        # unsubscribed from this many subscriptions per mainloop turn
+        self.fanout_slice = 1024
+        self.close_slice = 1024
+
+        # stats, totals over all channels
+        self.nr_dropped_verbs = 0
+        self.nr_dropped_bytes = 0
+        self.nr_failed_requests = 0
+        self.nr_overload_disconnects = 0
+
     def channel(self, description=None):
         """
         Create a new channel object.
@@ -44,6 +88,21 @@ class Reactor:
 
         return ch
 
+    def set_balance_policy(self, name, policy):
+        """
+        Set the policy used to balance calls over the shared owners of
+        the given name. A policy of None reverts to the default policy.
+        """
+
+        if policy is None:
+            self.balance_policies.pop(name, None)
+
+        elif policy not in (BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING, BALANCE_WEIGHTED):
+            raise ValueError("Unknown balance policy {}".format(policy))
+
+        else:
+            self.balance_policies[name] = policy
+
     def _process_verb(self, sender, verb):
         """
         Process a verb that is send upstream.
@@ -61,16 +120,38 @@ class Reactor:
             self.tracer.invalid_upstream_verb(sender, verb, str(e))
             raise
 
+        # reject requests that exceed a rate limit, before they reach
+        # the owner of the name
+        if self.rate_limiter.enabled and verb.__class__ is RequestVerb and \
+                not self.rate_limiter.allow(sender, verb.name):
+            self.__reject_rate_limited(sender, verb)
+            return
+
         # retrieve verb handler
         handler = self.handlers.get(
             verb.__class__,
             self.__process_not_implemented
         )
 
+        # let the loop monitor know what the current handler is busy with
+        monitor = self.mainloop.monitor
+        if monitor:
+            monitor.annotate(sender, verb)
+
         # handle the verb
         self.tracer.upstream_verb(sender, verb)
         handler(sender, verb)
 
+    def _process_verbs(self, sender, verbs):
+        """
+        Process a batch of verbs that is send upstream in one go.
+        """
+
+        process_verb = self._process_verb
+
+        for verb in verbs:
+            process_verb(sender, verb)
+
     def _close_channel(self, channel):
         """
         Close a channel.
@@ -96,16 +177,38 @@ class Reactor:
             if current_owner == channel:
                 self.state.clear_name_owner(name)
 
+            self.state.del_shared_name_owner(name, channel)
+
             # promote next name candidate
-            candidate = self.state.pop_name_owner_candidate(name)
+            if not self.state.get_name_owners(name):
+                self.__promote_candidates(name)
+
+        # unsubscribe all subscriptions done by this channel and stop
+        # watching its posts, in slices when there are many of them
+        subscriptions = list(self.state.get_channel_subscriptions(channel))
+        watches = list(self.state.get_post_watchers_from_channel(channel))
+
+        self.__release_channel(channel, subscriptions, watches)
+
+        self.rate_limiter.forget_channel(channel)
 
-            if candidate:
-                self.state.set_name_owner(name, candidate.channel, candidate.persist)
+        self.tracer.channel_closed(channel)
+        self.channels.remove(channel)
+
+    def __release_channel(self, channel, subscriptions, watches):
+        """
+        Remove the given subscriptions and watches of a closed channel.
+        Only a slice is handled right away, the rest is deferred to the
+        next mainloop turn.
+        """
 
-                self.__activate_session(candidate.channel, name)
+        budget = self.close_slice
 
-        # unsubscribe all subscriptions done by this channel
-        for name, topic in list(self.state.get_channel_subscriptions(channel)):
+        while subscriptions and budget:
+
+            budget -= 1
+
+            name, topic = subscriptions.pop()
 
             postnr = self.state.get_interest_post(name, topic)
 
@@ -117,9 +220,7 @@ class Reactor:
 
                 self.state.discard_post(postnr)
 
-                name_owner = self.state.get_name_owner(name)
-
-                if name_owner:
+                for name_owner in self.state.get_name_owners(name):
                     self.__put_downstream(name_owner, InterestVerb(
                         postref=postnr,
                         name=name,
@@ -130,8 +231,11 @@ class Reactor:
             # unregister the subscription of this channel
             self.state.del_channel_subscription(channel, name, topic)
 
-        watches = self.state.get_post_watchers_from_channel(channel)
-        for watch in list(watches):
+        while watches and budget:
+
+            budget -= 1
+
+            watch = watches.pop()
 
             # remove this channel as postwatcher
             self.state.del_post_watcher(watch.postnr, watch.channel)
@@ -142,20 +246,50 @@ class Reactor:
             if timer:
                 timer.cancel()
 
-        self.tracer.channel_closed(channel)
-        self.channels.remove(channel)
+        if subscriptions or watches:
+            self.mainloop.call_soon(self.__release_channel, channel, subscriptions, watches)
 
     def __process_login(self, sender, verb):
         """
         Process LOGIN verbs
         """
 
+        if verb.shared:
+            self.__process_shared_login(sender, verb)
+            return
+
         name = verb.name
         current_owner = self.state.get_name_owner(name)
 
+        # in case the name is owned by shared owners, an exclusive
+        # owner can only wait for all of them to leave
+        if self.state.is_name_shared(name):
+
+            # the sender is one of the shared owners and already has
+            # the interest, so its session is only confirmed
+            if self.state.is_shared_name_owner(name, sender):
+
+                # as the only shared owner the sender can take the name
+                # exclusively, otherwise it keeps sharing it until all
+                # other shared owners have left
+                if len(self.state.get_name_owners(name)) == 1:
+                    self.state.del_shared_name_owner(name, sender)
+                    self.state.set_name_owner(name, sender, verb.persist)
+
+                else:
+                    self.tracer.invalid_upstream_verb(sender, verb, 'name is shared with other owners')
+
+                self.__confirm_session(sender, name)
+
+            elif verb.standby:
+                self.__standby_session(sender, name, verb)
+
+            else:
+                self.__end_session(sender, name)
+
         # in case the name is not used or the sender already owns the
         # name:
-        if not current_owner or current_owner == sender:
+        elif not current_owner or current_owner == sender:
 
             self.state.set_name_owner(name, sender, verb.persist)
 
@@ -192,6 +326,113 @@ class Reactor:
             session.state = SessionVerb.STATE_ENDED
             self.__put_downstream(sender, session)
 
+    def __process_shared_login(self, sender, verb):
+        """
+        Process LOGIN verbs with the shared flag, all shared owners of a
+        name receive calls according to the balance policy.
+        """
+
+        name = verb.name
+        current_owner = self.state.get_name_owner(name)
+
+        # in case the sender owns the name exclusively it starts sharing
+        # it, the sender already has the interest:
+        if current_owner == sender:
+
+            self.state.clear_name_owner(name)
+            self.state.add_shared_name_owner(name, sender, verb.persist, verb.weight)
+
+            self.__confirm_session(sender, name)
+
+        # in case the sender already shares the name, only its weight
+        # and persistence are updated:
+        elif self.state.is_shared_name_owner(name, sender):
+
+            self.state.add_shared_name_owner(name, sender, verb.persist, verb.weight)
+
+            self.__confirm_session(sender, name)
+
+        # in case the name is not used or already shared:
+        elif not current_owner:
+
+            # the sender may have been waiting in standby before
+            self.state.del_name_owner_candidate(name, sender)
+            self.state.add_shared_name_owner(name, sender, verb.persist, verb.weight)
+
+            self.__activate_session(sender, name)
+
+        # in case the exclusive owner is not persistent and the sender
+        # used the force flag:
+        elif verb.enforce and not self.state.get_name_persistence(name):
+
+            self.state.clear_name_owner(name)
+            self.state.del_name_owner_candidate(name, current_owner)
+            self.state.add_shared_name_owner(name, sender, verb.persist, verb.weight)
+
+            self.__end_session(current_owner, name)
+
+            self.__activate_session(sender, name)
+
+        # in case the sender specified the standby flag:
+        elif verb.standby:
+            self.__standby_session(sender, name, verb)
+
+        # otherwise we just cannot own this name:
+        else:
+            self.__end_session(sender, name)
+
+    def __promote_candidates(self, name):
+        """
+        Give the name to the next candidate, called when the name has no
+        owners anymore. A shared candidate is promoted together with the
+        shared candidates directly following it.
+        """
+
+        candidate = self.state.pop_name_owner_candidate(name)
+
+        if not candidate:
+            return
+
+        if not candidate.shared:
+            self.state.set_name_owner(name, candidate.channel, candidate.persist)
+
+            self.__activate_session(candidate.channel, name)
+            return
+
+        while True:
+            self.state.add_shared_name_owner(name, candidate.channel, candidate.persist, candidate.weight)
+
+            self.__activate_session(candidate.channel, name)
+
+            candidate = self.state.peek_name_owner_candidate(name)
+
+            if not candidate or not candidate.shared:
+                break
+
+            self.state.pop_name_owner_candidate(name)
+
+    def __standby_session(self, sender, name, verb):
+        """
+        Add the sender as candidate for the name and let it know.
+        """
+
+        self.state.add_name_owner_candidate(name, sender, verb.persist, verb.shared, verb.weight)
+
+        session = SessionVerb()
+        session.name = name
+        session.state = SessionVerb.STATE_STANDBY
+        self.__put_downstream(sender, session)
+
+    def __end_session(self, channel, name):
+        """
+        Let the channel know it does not own the name.
+        """
+
+        session = SessionVerb()
+        session.name = name
+        session.state = SessionVerb.STATE_ENDED
+        self.__put_downstream(channel, session)
+
     def __process_logout(self, sender, verb):
         """
         Process LOGOUT verbs.
@@ -211,12 +452,14 @@ class Reactor:
 
             self.state.clear_name_owner(name)
 
-            candidate = self.state.pop_name_owner_candidate(name)
+            self.__promote_candidates(name)
 
-            if candidate:
-                self.state.set_name_owner(name, candidate.channel, candidate.persist)
+        # if the sender is one of the shared owners, the candidates
+        # only get their turn when the last shared owner left:
+        elif self.state.del_shared_name_owner(name, sender):
 
-                self.__activate_session(candidate.channel, name)
+            if not self.state.is_name_shared(name):
+                self.__promote_candidates(name)
 
         else:
             # the logout verb was NOT send by the owner, this is the
@@ -234,6 +477,13 @@ class Reactor:
         name = request.name
 
         owner = self.state.get_name_owner(name)
+        shared_owner = None
+
+        # select the shared owner that receives this call:
+        if not owner and self.state.is_name_shared(name):
+            policy = self.balance_policies.get(name, self.balance_policy)
+            shared_owner = self.state.select_shared_name_owner(name, policy)
+            owner = shared_owner.channel
 
         # if there is no channel owning the name:
         if not owner:
@@ -245,6 +495,19 @@ class Reactor:
                 message.reason = MessageVerb.REASON_UNREACHABLE
                 self.__put_downstream(sender, message)
 
+        # if the owner does not keep up and wants requests to fail:
+        elif owner.is_overloaded and owner.overload_policy & Channel.POLICY_FAIL_REQUESTS:
+
+            owner.nr_failed_requests += 1
+            self.nr_failed_requests += 1
+
+            if not request.unidirectional:
+                message = MessageVerb()
+                message.messageref = request.messageref
+                message.status = MessageVerb.STATUS_NOK
+                message.reason = MessageVerb.REASON_OVERLOADED
+                self.__put_downstream(sender, message)
+
         # if there is an owner and the request is unidirectional:
         elif request.unidirectional:
 
@@ -261,6 +524,12 @@ class Reactor:
             post = self.state.new_post(name, request.payload)
             watch = self.state.add_post_watcher(post.nr, sender, request.messageref)
 
+            # only the shared owner receiving the call may answer it
+            if shared_owner:
+                self.state.assign_post(post.nr, shared_owner)
+
+            sender._request_started()
+
             # determine timeout
             if request.timeout:
                 timeout = min(request.timeout, self.watch_timeout_max)
@@ -292,6 +561,8 @@ class Reactor:
         self.state.del_post_watcher(postnr, channel)
         self.watch_timeout_timers.pop(watch)
 
+        channel._request_finished()
+
         # send timeout message
         message = MessageVerb()
         message.messageref = watch.messageref
@@ -316,9 +587,34 @@ class Reactor:
 
             owner = self.state.get_post_owner(postnr)
 
-            if sender == owner:
+            if self.state.is_post_owner(postnr, sender):
+
+                # messages on subscriptions may be dropped when the
+                # subscriber does not keep up, a newer one will follow
+                droppable = self.state.is_post_persistent(postnr)
+
+                watchers = self.state.get_post_watchers(postnr)
+
+                # messages on a topic also go to the subscribers of the
+                # wildcard topics covering it, once per channel, on its
+                # most specific subscription
+                if droppable:
+                    watchers = list(watchers)
+                    channels = set(watcher.channel for watcher in watchers)
+
+                    for wildcard_postnr in reversed(self.state.get_wildcard_posts(postnr)):
+                        for watcher in self.state.get_post_watchers(wildcard_postnr):
+                            if watcher.channel not in channels:
+                                channels.add(watcher.channel)
+                                watchers.append(watcher)
+
+                    # fan out to a slice of the subscribers right away,
+                    # and to the rest in the next mainloop turns
+                    if len(watchers) > self.fanout_slice:
+                        self.mainloop.call_soon(self.__fan_out, watchers[self.fanout_slice:], verb.payload)
+                        watchers = watchers[:self.fanout_slice]
 
-                for watcher in self.state.get_post_watchers(postnr):
+                for watcher in watchers:
 
                     # cancel timeout timer
                     timer = self.watch_timeout_timers.pop(watcher, None)
@@ -332,7 +628,10 @@ class Reactor:
                     message.reason = MessageVerb.REASON_NONE
                     message.payload = verb.payload
 
-                    self.__put_downstream(watcher.channel, message)
+                    self.__put_downstream(watcher.channel, message, droppable)
+
+                    if not droppable:
+                        watcher.channel._request_finished()
 
                 if not self.state.is_post_persistent(postnr):
                     self.state.discard_post(postnr)
@@ -357,6 +656,29 @@ class Reactor:
             # debugging purposes
             self.tracer.unknown_postref(sender, verb)
 
+    def __fan_out(self, watchers, payload):
+        """
+        Send a message on a subscription to the next slice of the given
+        subscribers, deferring the rest to the next mainloop turn.
+        """
+
+        for watcher in watchers[:self.fanout_slice]:
+
+            # the subscriber may have left in the meantime
+            if not self.state.is_post_watcher(watcher.postnr, watcher.channel):
+                continue
+
+            message = MessageVerb()
+            message.messageref = watcher.messageref
+            message.status = MessageVerb.STATUS_OK
+            message.reason = MessageVerb.REASON_NONE
+            message.payload = payload
+
+            self.__put_downstream(watcher.channel, message, True)
+
+        if len(watchers) > self.fanout_slice:
+            self.mainloop.call_soon(self.__fan_out, watchers[self.fanout_slice:], payload)
+
     def __process_subscribe(self, sender, subscribe):
         """
         Process SUBSCRIBE verbs.
@@ -375,10 +697,9 @@ class Reactor:
             post = self.state.new_post(name, topic, True)
             postnr = post.nr
             self.state.set_interest_post(name, topic, postnr)
-            owner = self.state.get_post_owner(postnr)
 
-            # send interest if a channel is owning the name
-            if owner:
+            # send interest to the channels owning the name, if any
+            for owner in self.state.get_name_owners(name):
                 self.__put_downstream(owner, InterestVerb(
                     postref=postnr,
                     name=name,
@@ -421,9 +742,7 @@ class Reactor:
 
             self.state.discard_post(postnr)
 
-            name_owner = self.state.get_name_owner(name)
-
-            if name_owner:
+            for name_owner in self.state.get_name_owners(name):
                 self.__put_downstream(name_owner, InterestVerb(
                     postref=postnr,
                     name=name,
@@ -434,6 +753,50 @@ class Reactor:
         # unregister the subscription of this channel
         self.state.del_channel_subscription(sender, name, topic)
 
+    def __reject_rate_limited(self, sender, request):
+        """
+        Respond to a request that exceeded a rate limit.
+        """
+
+        self.tracer.request_rate_limited(sender, request)
+
+        if not request.unidirectional:
+            message = MessageVerb()
+            message.messageref = request.messageref
+            message.status = MessageVerb.STATUS_NOK
+            message.reason = MessageVerb.REASON_RATE_LIMITED
+            self.__put_downstream(sender, message)
+
+    def _fail_call(self, call):
+        """
+        Fail a call that was dropped from the downstream queue of an
+        overloaded channel, letting all watchers know that the request
+        could not be handled.
+        """
+
+        postnr = call.postref
+
+        if not self.state.check_post(postnr):
+            return
+
+        for watcher in self.state.get_post_watchers(postnr):
+
+            timer = self.watch_timeout_timers.pop(watcher, None)
+            if timer:
+                timer.cancel()
+
+            message = MessageVerb()
+            message.messageref = watcher.messageref
+            message.status = MessageVerb.STATUS_NOK
+            message.reason = MessageVerb.REASON_OVERLOADED
+            message.payload = None
+
+            self.__put_downstream(watcher.channel, message)
+
+            watcher.channel._request_finished()
+
+        self.state.discard_post(postnr)
+
     def __process_not_implemented(self, sender, verb):
         """
         Fallback handler for verbs that are not implmeneted yet.
@@ -456,21 +819,107 @@ class Reactor:
         self.__put_downstream(channel, session)
 
         # send any interest in this name
-        for topic in self.state.get_interest_on_name(name):
+        topics = self.state.get_interest_on_name(name)
+
+        if topics:
+            self.__start_interest_replay(channel, name, topics)
+
+        self.tracer.session_activated(channel, name)
+
+    def __confirm_session(self, channel, name):
+        """
+        Let the channel know it still owns the name, without sending
+        the interest again.
+        """
+
+        session = SessionVerb()
+        session.name = name
+        session.state = SessionVerb.STATE_ACTIVE
+        self.__put_downstream(channel, session)
+
+    def __start_interest_replay(self, channel, name, topics):
+        """
+        Start sending the interest in the given topics to the channel.
+        The first chunk is send right away, the rest follows in later
+        mainloop turns.
+        """
+
+        previous = self.interest_replays.pop((channel, name), None)
+
+        if previous:
+            previous.call.cancel()
+
+        # only the topics are copied here, their interest is looked up
+        # chunk by chunk
+        replay = InterestReplay(channel, name, tuple(topics), self.state.next_post_nr)
+
+        if not self.__send_interest_chunk(replay):
+            replay.call = self.mainloop.call_soon(self.__on_interest_replay, replay)
+
+            self.interest_replays[(channel, name)] = replay
+
+    def __on_interest_replay(self, replay):
+        """
+        Called from the mainloop to send the next chunk of a replay.
+        """
+
+        channel = replay.channel
+        name = replay.name
+
+        # the channel may have lost the name in the meantime
+        if self.state.get_name_owner(name) != channel and not self.state.is_shared_name_owner(name, channel):
+            del self.interest_replays[(channel, name)]
+            return
+
+        # wait for the client to catch up, rather than overloading it
+        if channel.is_paused or len(channel.downstream_queue) >= channel.low_watermark_verbs:
+            replay.call = self.mainloop.call_later(self.interest_replay_retry, self.__on_interest_replay, replay)
+            return
+
+        if self.__send_interest_chunk(replay):
+            del self.interest_replays[(channel, name)]
+
+        else:
+            replay.call = self.mainloop.call_soon(self.__on_interest_replay, replay)
+
+    def __send_interest_chunk(self, replay):
+        """
+        Send the next chunk of interest of a replay in one go. Returns
+        True when the replay is done.
+        """
+
+        name = replay.name
+        first_new_postnr = replay.first_new_postnr
+
+        topics = list(islice(replay.topics, self.interest_replay_chunk))
+
+        verbs = []
+
+        for topic in topics:
             postnr = self.state.get_interest_post(name, topic)
 
-            self.__put_downstream(channel, InterestVerb(
+            # skip the interest that is gone, or that was renewed and
+            # thus already send, since the replay started
+            if postnr is None or postnr >= first_new_postnr:
+                continue
+
+            verbs.append(InterestVerb(
                 postref=postnr,
                 name=name,
                 status=InterestVerb.STATUS_INTEREST,
                 topic=topic,
             ))
 
-        self.tracer.session_activated(channel, name)
+        if verbs:
+            self.tracer.interest_replayed(replay.channel, name, len(verbs))
+            replay.channel._put_downstream_batch(verbs)
 
-    def __put_downstream(self, channel, verb):
+        return len(topics) < self.interest_replay_chunk
+
+    def __put_downstream(self, channel, verb, droppable=False):
         """
-        Send a verb downstream.
+        Send a verb downstream. Droppable verbs may be discarded when the
+        channel is overloaded.
         """
 
         # validate verb
@@ -487,7 +936,7 @@ class Reactor:
 
         self.tracer.downstream_verb(channel, verb)
 
-        channel._put_downstream(verb)
+        channel._put_downstream(verb, droppable)
 
 
 class Channel:
@@ -495,8 +944,28 @@ class Channel:
     The Channel class.
 
     This class is used by services to interact with the reactor.
+
+    Downstream verbs are handed to the downstream handler right away,
+    unless the service reported a backlog above the high watermark via
+    set_backlog(). They are then kept in the downstream queue until the
+    backlog drops below the low watermark. When the queue itself exceeds
+    one of the high watermarks the channel is overloaded, and the
+    overload policy decides which verbs are dropped.
     """
 
+    # policies applied to an overloaded channel, these can be combined
+    # and are applied in this order until the queue is below the low
+    # watermarks again
+
+    # drop the oldest messages on subscriptions
+    POLICY_DROP_OLDEST = 1 << 0
+
+    # fail queued and new requests with REASON_OVERLOADED
+    POLICY_FAIL_REQUESTS = 1 << 1
+
+    # drop everything and ask the service to disconnect
+    POLICY_DISCONNECT = 1 << 2
+
     def __init__(self, reactor):
 
         self.reactor = reactor
@@ -506,6 +975,38 @@ class Channel:
         self.downstream_queue = deque()
         self.downstream_handler = None
 
+        # (size, droppable) of each verb in the downstream queue
+        self.downstream_info = deque()
+        self.downstream_bytes = 0
+
+        self.set_watermarks(
+            reactor.high_watermark_bytes,
+            reactor.low_watermark_bytes,
+            reactor.high_watermark_verbs,
+            reactor.low_watermark_verbs,
+        )
+
+        self.overload_policy = reactor.overload_policy
+        self.overload_handler = None
+
+        # number of requests send upstream that still await a message
+        self.nr_outstanding_requests = 0
+        self.max_outstanding_requests = reactor.max_outstanding_requests
+        self.unblock_handler = None
+
+        # number of bytes the service took from the queue but has not
+        # delivered yet
+        self.backlog = 0
+
+        self.is_paused = False
+        self.is_overloaded = False
+        self.is_disconnecting = False
+
+        # stats
+        self.nr_dropped_verbs = 0
+        self.nr_dropped_bytes = 0
+        self.nr_failed_requests = 0
+
         self.reactor.tracer.channel_opened(self)
 
         self.is_closed = False
@@ -526,6 +1027,94 @@ class Channel:
 
         self.downstream_handler = handler
 
+    def set_watermarks(self, high_bytes, low_bytes, high_verbs, low_verbs):
+        """
+        Set the watermarks of the downstream queue. The byte watermarks
+        also apply to the backlog reported by the service.
+        """
+
+        if low_bytes > high_bytes or low_verbs > high_verbs:
+            raise ValueError('Low watermark must not exceed the high watermark')
+
+        self.high_watermark_bytes = high_bytes
+        self.low_watermark_bytes = low_bytes
+        self.high_watermark_verbs = high_verbs
+        self.low_watermark_verbs = low_verbs
+
+    def set_overload_policy(self, policy):
+        """
+        Set the policy that is applied when the channel is overloaded,
+        a combination of the POLICY_* flags.
+        """
+
+        self.overload_policy = policy
+
+    def set_overload_handler(self, handler):
+        """
+        Set the function that will be called when the channel should be
+        disconnected because of the POLICY_DISCONNECT policy. The
+        handler must not close the channel synchronously.
+        """
+
+        self.overload_handler = handler
+
+    def set_max_outstanding_requests(self, maximum):
+        """
+        Set the number of outstanding requests at which the upstream of
+        this channel is considered blocked, zero means unlimited.
+        """
+
+        self.max_outstanding_requests = maximum
+
+    def set_unblock_handler(self, handler):
+        """
+        Set the function that will be called when the upstream is no
+        longer blocked.
+        """
+
+        self.unblock_handler = handler
+
+    def is_upstream_blocked(self):
+        """
+        Returns True when the number of outstanding requests reached the
+        maximum. Services should stop reading from their client until
+        the unblock handler is called.
+        """
+
+        return 0 < self.max_outstanding_requests <= self.nr_outstanding_requests
+
+    def get_upstream_capacity(self):
+        """
+        Returns the number of requests that can be put upstream before
+        the upstream is blocked, or None when this is unlimited.
+        """
+
+        if self.max_outstanding_requests <= 0:
+            return None
+
+        return max(self.max_outstanding_requests - self.nr_outstanding_requests, 0)
+
+    def set_backlog(self, nbytes):
+        """
+        Set the number of bytes the service took from the downstream
+        queue but has not been able to deliver yet. Delivery to the
+        downstream handler is paused while this exceeds the high
+        watermark, and resumed when it drops below the low watermark.
+        """
+
+        self.backlog = nbytes
+
+        if self.is_paused:
+
+            if nbytes <= self.low_watermark_bytes:
+                self.is_paused = False
+
+                if self.downstream_handler:
+                    self.__deliver()
+
+        elif nbytes > self.high_watermark_bytes:
+            self.is_paused = True
+
     def put_upstream(self, verb):
         """
         Put a verb into the upstream queue.
@@ -536,6 +1125,17 @@ class Channel:
 
         self.reactor._process_verb(self, verb)
 
+    def put_upstream_batch(self, verbs):
+        """
+        Put a sequence of verbs into the upstream queue. This has the
+        same effect as calling put_upstream() for every verb.
+        """
+
+        if self.is_closed:
+            raise RuntimeError('Cannot put verb upstream on a closed channel')
+
+        self.reactor._process_verbs(self, verbs)
+
     def pop_downstream(self):
         """
         Pop a verb from the downstream queue. This function is typically
@@ -543,7 +1143,15 @@ class Channel:
         set_downstream_handler() method.
         """
 
-        return self.downstream_queue.popleft()
+        verb = self.downstream_queue.popleft()
+
+        size, droppable = self.downstream_info.popleft()
+        self.downstream_bytes -= size
+
+        if self.is_overloaded and self.__is_below_low_watermarks(len(self.downstream_queue)):
+            self.is_overloaded = False
+
+        return verb
 
     def close(self):
         """
@@ -553,20 +1161,193 @@ class Channel:
         self.reactor._close_channel(self)
         self.is_closed = True
 
-    def _put_downstream(self, verb):
+    def _request_started(self):
+        """
+        Called from the reactor when a request from this channel starts
+        waiting for a message.
+        """
+
+        self.nr_outstanding_requests += 1
+
+    def _request_finished(self):
+        """
+        Called from the reactor when a request from this channel no
+        longer waits for a message.
+        """
+
+        self.nr_outstanding_requests -= 1
+
+        if self.nr_outstanding_requests == self.max_outstanding_requests - 1 and self.unblock_handler:
+            self.unblock_handler()
+
+    def _put_downstream(self, verb, droppable=False):
         """
         Put a verb downstream. Called from the reactor.
         """
 
+        # verbs still on their way to a closed channel are discarded
+        if self.is_closed:
+            return
+
+        size = get_verb_size(verb)
+
+        if self.is_disconnecting:
+            self.__count_drop(size)
+            return
+
         self.downstream_queue.append(verb)
+        self.downstream_info.append((size, droppable))
+        self.downstream_bytes += size
+
+        if self.downstream_handler and not self.is_paused:
+            self.__deliver()
+
+        if self.downstream_bytes > self.high_watermark_bytes or \
+                len(self.downstream_queue) > self.high_watermark_verbs:
+            self.__on_overload()
+
+    def _put_downstream_batch(self, verbs):
+        """
+        Put a number of verbs downstream at once. Called from the
+        reactor, the verbs are not droppable.
+        """
+
+        if self.is_closed:
+            return
+
+        if self.is_disconnecting:
+            for verb in verbs:
+                self.__count_drop(get_verb_size(verb))
+            return
+
+        queue = self.downstream_queue
+        info = self.downstream_info
+
+        for verb in verbs:
+            size = get_verb_size(verb)
 
-        if self.downstream_handler:
+            queue.append(verb)
+            info.append((size, False))
+            self.downstream_bytes += size
 
-            while self.downstream_queue:
-                self.downstream_handler()
+        if self.downstream_handler and not self.is_paused:
+            self.__deliver()
+
+        if self.downstream_bytes > self.high_watermark_bytes or \
+                len(self.downstream_queue) > self.high_watermark_verbs:
+            self.__on_overload()
+
+    def __deliver(self):
+        """
+        Hand queued verbs to the downstream handler until the queue is
+        empty or delivery is paused.
+        """
+
+        while self.downstream_queue and not self.is_paused:
+            self.downstream_handler()
+
+    def __on_overload(self):
+        """
+        Called when the downstream queue exceeds one of its high
+        watermarks.
+        """
+
+        if not self.is_overloaded:
+            self.is_overloaded = True
+            self.reactor.tracer.channel_overloaded(self)
+
+        policy = self.overload_policy
+
+        if policy & self.POLICY_DROP_OLDEST:
+            self.__drop_verbs(lambda verb, droppable: droppable)
+
+        if policy & self.POLICY_FAIL_REQUESTS:
+            failed = self.__drop_verbs(lambda verb, droppable: isinstance(verb, CallVerb))
+
+            # let the reactor fail the requests, now the queue is
+            # consistent again
+            for call in failed:
+                if not call.unidirectional:
+                    self.nr_failed_requests += 1
+                    self.reactor.nr_failed_requests += 1
+                    self.reactor._fail_call(call)
+
+        if policy & self.POLICY_DISCONNECT and not self.__is_below_low_watermarks(len(self.downstream_queue)):
+            self.is_disconnecting = True
+            self.reactor.nr_overload_disconnects += 1
+
+            self.__drop_verbs(lambda verb, droppable: True, until_low=False)
+
+            if self.overload_handler:
+                self.overload_handler()
+
+    def __drop_verbs(self, predicate, until_low=True):
+        """
+        Drop verbs matching predicate(verb, droppable) from the
+        downstream queue, oldest first, until the queue is below the low
+        watermarks. Returns a list with the dropped verbs.
+        """
+
+        queue = self.downstream_queue
+        info = self.downstream_info
+
+        remaining = len(queue)
+        dropped = []
+        kept = []
+
+        for verb, (size, droppable) in zip(queue, info):
+
+            if predicate(verb, droppable) and not (until_low and self.__is_below_low_watermarks(remaining)):
+                self.downstream_bytes -= size
+                remaining -= 1
+
+                self.__count_drop(size)
+                dropped.append(verb)
+
+            else:
+                kept.append((verb, (size, droppable)))
+
+        if dropped:
+            queue.clear()
+            info.clear()
+
+            for verb, verb_info in kept:
+                queue.append(verb)
+                info.append(verb_info)
+
+        return dropped
+
+    def __is_below_low_watermarks(self, nr_verbs):
+        return self.downstream_bytes <= self.low_watermark_bytes and nr_verbs <= self.low_watermark_verbs
+
+    def __count_drop(self, size):
+        self.nr_dropped_verbs += 1
+        self.nr_dropped_bytes += size
+
+        self.reactor.nr_dropped_verbs += 1
+        self.reactor.nr_dropped_bytes += size
 
     def __repr__(self):
         return "<{cls} {description}>".format(
             cls=self.__class__.__name__,
             description=self.description,
         )
+
+
+class InterestReplay:
+    """
+    The interest of a name that is being send to a newly activated owner.
+    """
+
+    def __init__(self, channel, name, topics, first_new_postnr):
+        self.channel = channel
+        self.name = name
+
+        # iterator over the topics with interest at the start of the
+        # replay, interest with a postnr from first_new_postnr on was
+        # added later and is send without the replay
+        self.topics = iter(topics)
+        self.first_new_postnr = first_new_postnr
+
+        # the deferred call or timer of the next chunk
+        self.call = None
@@ -5,8 +5,15 @@ from collections import defaultdict
 from collections import deque
 from collections import Counter
 
+from .topics import TopicTrie, is_wildcard, get_prefix
+
 logger = logging.getLogger(__name__)
 
+# policies for balancing calls over the owners of a shared name
+BALANCE_ROUND_ROBIN = 0
+BALANCE_LEAST_OUTSTANDING = 1
+BALANCE_WEIGHTED = 2
+
 
 def log_call(fn):
 
@@ -35,6 +42,7 @@ class State:
         self.name_candidates = defaultdict(deque)
         self.name_candidates_set = defaultdict(set)
         self.name_references_from_channel = defaultdict(set)
+        self.name_shared_owners = dict()
         
         # structures regarding posts
         self.next_post_nr = 1
@@ -49,6 +57,10 @@ class State:
         self.interest_on_name = defaultdict(set)
         self.channel_subscriptions = defaultdict(set)
 
+        # per name, the prefixes of wildcard topics with interest,
+        # holding the postnr of the interest
+        self.interest_tries = dict()
+
     @log_call
     def is_name_owned(self, name):
         """
@@ -57,7 +69,7 @@ class State:
         
         owner = self.name_owners.get(name, None)
         
-        return True if owner else False
+        return True if owner or name in self.name_shared_owners else False
 
     @log_call
     def get_name_owner(self, name):
@@ -105,14 +117,111 @@ class State:
         self.name_owners.pop(name)
 
     @log_call
-    def add_name_owner_candidate(self, name, channel, persist):
+    def is_name_shared(self, name):
+        """
+        Return whether or not the name is owned by shared owners.
+        """
+
+        return name in self.name_shared_owners
+
+    @log_call
+    def add_shared_name_owner(self, name, channel, persist, weight=1):
+        """
+        Add a channel to the shared owners of a name, the name must not
+        have an exclusive owner. If the channel already is a shared
+        owner, its weight is updated.
+        """
+
+        assert(name not in self.name_owners)
+
+        shared = self.name_shared_owners.get(name, None)
+
+        if not shared:
+            shared = SharedOwners(name)
+            self.name_shared_owners[name] = shared
+
+        candidate = shared.members.get(channel, None)
+
+        if candidate:
+            candidate.weight = weight
+            candidate.persist = persist
+
+        else:
+            candidate = NameCandidate(self, name, channel, persist, True, weight)
+            shared.add(candidate)
+
+        self.name_references_from_channel[channel].add(name)
+
+        return candidate
+
+    @log_call
+    def del_shared_name_owner(self, name, channel):
+        """
+        Remove a channel from the shared owners of a name. Returns
+        whether or not the channel was a shared owner.
+        """
+
+        shared = self.name_shared_owners.get(name, None)
+
+        if not shared or channel not in shared.members:
+            return False
+
+        shared.remove(channel)
+
+        if not shared.members:
+            del self.name_shared_owners[name]
+
+        self.name_references_from_channel[channel].discard(name)
+
+        return True
+
+    @log_call
+    def is_shared_name_owner(self, name, channel):
+        """
+        Return whether or not the channel is one of the shared owners of
+        the name.
+        """
+
+        shared = self.name_shared_owners.get(name, None)
+
+        return shared is not None and channel in shared.members
+
+    def select_shared_name_owner(self, name, policy):
+        """
+        Select the shared owner of the name that should receive the next
+        call, according to the given balancing policy. Returns None if
+        the name has no shared owners.
+        """
+
+        shared = self.name_shared_owners.get(name, None)
+
+        return shared.select(policy) if shared else None
+
+    @log_call
+    def get_name_owners(self, name):
+        """
+        Return the channels owning the name, the exclusive owner or all
+        shared owners.
+        """
+
+        owner = self.name_owners.get(name, None)
+
+        if owner:
+            return [owner.channel]
+
+        shared = self.name_shared_owners.get(name, None)
+
+        return list(shared.members) if shared else []
+
+    @log_call
+    def add_name_owner_candidate(self, name, channel, persist, shared=False, weight=1):
         """
         Add a channel as a potential candidate for the name.
         """
         
-        assert(name in self.name_owners)
+        assert(name in self.name_owners or name in self.name_shared_owners)
         
-        candidate = NameCandidate(self, name, channel, persist)
+        candidate = NameCandidate(self, name, channel, persist, shared, weight)
         
         if candidate in self.name_candidates_set[name]:
             raise ValueError('The channel is already a candidate')
@@ -143,6 +252,16 @@ class State:
         
         self.name_references_from_channel[channel].discard(name)
 
+    @log_call
+    def peek_name_owner_candidate(self, name):
+        """
+        Return the next candidate without removing it from the queue.
+        """
+
+        candidates = self.name_candidates.get(name, None)
+
+        return candidates[0] if candidates else None
+
     @log_call
     def pop_name_owner_candidate(self, name):
         """
@@ -207,15 +326,50 @@ class State:
     @log_call
     def get_post_owner(self, postnr):
         """
-        Returns the owning channel of the post specified by postnr.
+        Returns the owning channel of the post specified by postnr. This
+        is the shared owner the post was assigned to, if any, or else
+        the exclusive owner of the name.
         """
         
         post = self.posts[postnr]
+
+        if post.owner:
+            return post.owner.channel
         
         owner = self.get_name_owner(post.name)
         
         return owner
 
+    @log_call
+    def is_post_owner(self, postnr, channel):
+        """
+        Return whether or not the channel may post on the post specified
+        by postnr. Posts that are not assigned to a shared owner may be
+        posted on by every shared owner of the name.
+        """
+
+        post = self.posts[postnr]
+
+        if post.owner:
+            return post.owner.channel == channel
+
+        if self.is_shared_name_owner(post.name, channel):
+            return True
+
+        return self.get_name_owner(post.name) == channel
+
+    @log_call
+    def assign_post(self, postnr, candidate):
+        """
+        Assign the post to the given shared owner, which is the only one
+        that may answer it.
+        """
+
+        post = self.posts[postnr]
+
+        post.owner = candidate
+        candidate.outstanding += 1
+
     @log_call
     def is_post_persistent(self, postnr):
         """
@@ -232,6 +386,9 @@ class State:
         Discard the post specified by postnr.
         """
         post = self.posts[postnr]
+
+        if post.owner:
+            post.owner.outstanding -= 1
         
         self.posts_on_name[post.name].remove(post)
         self.posts.pop(postnr)
@@ -355,6 +512,9 @@ class State:
             self.interest_counter.pop(key)
             
             self.interest_posts.pop(key, None)
+
+            if is_wildcard(topic):
+                self.__del_wildcard_interest(name, topic)
             
             self.interest_on_name[name].remove(topic)
             
@@ -373,6 +533,51 @@ class State:
         
         self.interest_posts[key] = postnr
 
+        if is_wildcard(topic):
+            trie = self.interest_tries.get(name, None)
+
+            if not trie:
+                trie = TopicTrie()
+                self.interest_tries[name] = trie
+
+            trie.add(get_prefix(topic), postnr)
+
+    def __del_wildcard_interest(self, name, topic):
+        """
+        Remove the prefix of a wildcard topic from the trie of the name.
+        """
+
+        trie = self.interest_tries.get(name, None)
+
+        if not trie:
+            return
+
+        trie.remove(get_prefix(topic))
+
+        if not trie:
+            del self.interest_tries[name]
+
+    @log_call
+    def get_wildcard_posts(self, postnr):
+        """
+        Return the postnrs of the wildcard interest covering the topic of
+        the given subscription post, the post itself excluded.
+        """
+
+        post = self.posts[postnr]
+
+        trie = self.interest_tries.get(post.name, None)
+
+        if not trie:
+            return []
+
+        topic = post.payload
+
+        if is_wildcard(topic):
+            topic = get_prefix(topic)
+
+        return [nr for nr in trie.match(topic) if nr != postnr]
+
     @log_call
     def get_interest_post(self, name, topic):
         """
@@ -424,11 +629,17 @@ class State:
 
 class NameCandidate:
     
-    def __init__(self, state, name, channel, persist):
+    def __init__(self, state, name, channel, persist, shared=False, weight=1):
         self.state = state
         self.name = name
         self.channel = channel
         self.persist = persist
+        self.shared = shared
+        self.weight = weight
+
+        # balancing state, only used for shared owners
+        self.outstanding = 0
+        self.current_weight = 0
 
     def __eq__(self, other):
         return hash(self) == hash(other)
@@ -444,6 +655,90 @@ class NameCandidate:
         )
 
 
+class SharedOwners:
+    """
+    The shared owners of a single name, and the state needed to balance
+    calls over them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+        # channel -> NameCandidate, in the order they logged in
+        self.members = dict()
+        self.order = []
+        self.next_index = 0
+
+    def add(self, candidate):
+        self.members[candidate.channel] = candidate
+        self.order.append(candidate)
+
+    def remove(self, channel):
+        candidate = self.members.pop(channel)
+
+        index = self.order.index(candidate)
+        del self.order[index]
+
+        if index < self.next_index:
+            self.next_index -= 1
+
+        # start over fresh, so the remaining owners are treated equally
+        for member in self.order:
+            member.current_weight = 0
+
+    def select(self, policy):
+        """
+        Select the owner that should receive the next call.
+        """
+
+        order = self.order
+
+        if policy == BALANCE_WEIGHTED:
+
+            # smooth weighted round-robin, every owner gets a share of
+            # the calls proportional to its weight, evenly spread
+            total = 0
+            selected = None
+
+            for member in order:
+                member.current_weight += member.weight
+                total += member.weight
+
+                if not selected or member.current_weight > selected.current_weight:
+                    selected = member
+
+            selected.current_weight -= total
+
+            return selected
+
+        if self.next_index >= len(order):
+            self.next_index = 0
+
+        if policy == BALANCE_LEAST_OUTSTANDING:
+
+            # owners with the same number of outstanding calls are
+            # selected round-robin
+            selected = None
+            selected_index = 0
+
+            for i in range(len(order)):
+                index = (self.next_index + i) % len(order)
+                member = order[index]
+
+                if not selected or member.outstanding < selected.outstanding:
+                    selected = member
+                    selected_index = index
+
+            self.next_index = selected_index + 1
+
+            return selected
+
+        selected = order[self.next_index]
+        self.next_index += 1
+
+        return selected
+
+
 class Post:
     
     def __init__(self, state, name, nr, payload, persist):
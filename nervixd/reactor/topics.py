@@ -0,0 +1,131 @@
+"""
+Wildcard topic subscriptions.
+
+A topic ending with the wildcard character is a prefix subscription, it
+covers every topic starting with the part before the wildcard. So
+b'file-changes;*' covers b'file-changes;suffix=.JPG', and b'*' covers
+all topics of a name.
+"""
+
+WILDCARD = b'*'
+
+
+def is_wildcard(topic):
+    """
+    Return whether or not the topic is a prefix subscription.
+    """
+
+    return topic[-len(WILDCARD):] == WILDCARD
+
+
+def get_prefix(topic):
+    """
+    Return the prefix covered by a wildcard topic.
+    """
+
+    return topic[:-len(WILDCARD)]
+
+
+class TopicTrie:
+    """
+    Index of topic prefixes, each holding a value.
+
+    Looking up all prefixes that cover a topic takes a single walk down
+    the trie, so it only depends on the length of the topic and not on
+    the number of prefixes in the index.
+    """
+
+    def __init__(self):
+        self.root = TrieNode()
+        self.size = 0
+
+    def add(self, prefix, value):
+        """
+        Set the value of the given prefix.
+        """
+
+        node = self.root
+
+        for c in prefix:
+            child = node.children.get(c, None)
+
+            if not child:
+                child = TrieNode()
+                node.children[c] = child
+
+            node = child
+
+        if node.value is None:
+            self.size += 1
+
+        node.value = value
+
+    def remove(self, prefix):
+        """
+        Remove the given prefix, pruning the nodes that are no longer
+        needed. Returns the value it held, or None.
+        """
+
+        node = self.root
+        path = []
+
+        for c in prefix:
+            child = node.children.get(c, None)
+
+            if not child:
+                return None
+
+            path.append((node, c))
+            node = child
+
+        value = node.value
+
+        if value is None:
+            return None
+
+        node.value = None
+        self.size -= 1
+
+        # prune the branch bottom up, up to the first node still in use
+        for parent, c in reversed(path):
+
+            if node.value is not None or node.children:
+                break
+
+            del parent.children[c]
+            node = parent
+
+        return value
+
+    def match(self, topic):
+        """
+        Return the values of all prefixes of the topic, from the shortest
+        to the longest. The topic itself counts as a prefix too.
+        """
+
+        node = self.root
+        values = []
+
+        if node.value is not None:
+            values.append(node.value)
+
+        for c in topic:
+            node = node.children.get(c, None)
+
+            if not node:
+                break
+
+            if node.value is not None:
+                values.append(node.value)
+
+        return values
+
+    def __len__(self):
+        return self.size
+
+
+class TrieNode:
+
+    def __init__(self):
+        self.children = dict()
+        self.value = None
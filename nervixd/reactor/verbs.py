@@ -11,17 +11,21 @@ class BaseVerb:
 
 class LoginVerb(BaseVerb):
 
-    def __init__(self, name=None, enforce=None, standby=None, persist=None):
+    def __init__(self, name=None, enforce=None, standby=None, persist=None, shared=False, weight=1):
         self.name = name
         self.enforce = enforce
         self.standby = standby
         self.persist = persist
+        self.shared = shared
+        self.weight = weight
 
     def validate(self):
         validate_name(self.name)
         validate_bool(self.enforce)
         validate_bool(self.standby)
         validate_bool(self.persist)
+        validate_bool(self.shared)
+        validate_weight(self.weight)
 
 
 class LogoutVerb(BaseVerb):
@@ -122,6 +126,8 @@ class MessageVerb(BaseVerb):
     REASON_NONE = 0
     REASON_TIMEOUT = 1
     REASON_UNREACHABLE = 2
+    REASON_OVERLOADED = 3
+    REASON_RATE_LIMITED = 4
 
     def __init__(self, messageref=None, status=None, reason=None, payload=None):
         self.messageref = messageref
@@ -132,14 +138,15 @@ class MessageVerb(BaseVerb):
     def validate(self):
         validate_refnr(self.messageref)
         validate_enum(self.status, [self.STATUS_OK, self.STATUS_NOK])
-        validate_enum(self.reason, [self.REASON_NONE, self.REASON_TIMEOUT, self.REASON_UNREACHABLE])
+        validate_enum(self.reason, [self.REASON_NONE, self.REASON_TIMEOUT, self.REASON_UNREACHABLE,
+                                    self.REASON_OVERLOADED, self.REASON_RATE_LIMITED])
         validate_payload(self.payload)
 
     def __repr__(self):
         return "{cls}({messageref}, status={statusstr}, reason={reasonstr}, '{payload}')".format(
             cls=self.__class__.__name__,
             statusstr=['OK', 'NOK'][self.status],
-            reasonstr=['NONE', 'TIMEOUT', 'UNREACHABLE'][self.reason],
+            reasonstr=['NONE', 'TIMEOUT', 'UNREACHABLE', 'OVERLOADED', 'RATE_LIMITED'][self.reason],
             **self.__dict__
         )
 
@@ -204,6 +211,28 @@ class UnsubscribeVerb(BaseVerb):
         )
 
 
+# approximate number of bytes a verb occupies besides its variable
+# sized fields
+VERB_OVERHEAD = 16
+
+
+def get_verb_size(verb):
+    """
+    Return the approximate number of bytes the given verb will occupy
+    when it is encoded by a service.
+    """
+
+    size = VERB_OVERHEAD
+
+    for field in ('name', 'payload', 'topic'):
+        value = getattr(verb, field, None)
+
+        if value:
+            size += len(value)
+
+    return size
+
+
 def validate_name(name):
     if type(name) != bytes:
         raise ValueError("Name is not of 'bytes' type")
@@ -225,6 +254,14 @@ def validate_bool(value):
         raise ValueError("Expected value to be of type bool not '%s'" % type(value))
 
 
+def validate_weight(weight):
+    if type(weight) != int:
+        raise ValueError("Weight is of type '%s' not int" % type(weight))
+
+    elif not 1 <= weight <= 255:
+        raise ValueError("Weight must be between 1 and 255")
+
+
 def validate_refnr(nr):
     if nr is None:
         return
@@ -0,0 +1,263 @@
+import os
+import logging
+from struct import pack
+
+from nervixd.services.nxtcp.connection import NxtcpConnection
+
+from .ring import RingBuffer, fence
+
+logger = logging.getLogger(__name__)
+
+HANDSHAKE_MAGIC = b'NXSHM'
+
+
+class NxshmConnection(NxtcpConnection):
+    """
+    NXTCP connection that exchanges frames via a pair of shared memory
+    ring buffers instead of a socket.
+
+    The unix socket the client connected on is only used for the
+    handshake and, after that, as doorbell: a single byte is send to
+    wake the other side, but only when that side has flagged that it is
+    sleeping. While there is traffic the server polls the upstream ring
+    once every cycle of the mainloop. After poll_spins cycles without
+    data it polls with an interval that backs off exponentially, until
+    it decides to sleep on the doorbell again.
+    """
+
+    next_ring_nr = 1
+
+    def __init__(self, controller, mainloop, reactor, tracer, client_sock, ring_dir, ring_size):
+
+        # polling every cycle does not set a timer, which would wake
+        # the mainloop via its control pipe
+        self.poll_spins = 100
+        self.poll_interval_min = 0.0001
+        self.poll_interval_max = 0.005
+        self.nr_idle_polls = 0
+        self.polling = False
+        self.poll_call = None
+
+        self.poll_timer = mainloop.timer()
+        self.poll_timer.set_handler(self.__on_poll)
+
+        self.__create_rings(client_sock, ring_dir, ring_size)
+
+        NxtcpConnection.__init__(self, controller, mainloop, reactor, tracer, client_sock)
+
+    def __create_rings(self, client_sock, ring_dir, ring_size):
+        """
+        Create the upstream and downstream rings and let the client
+        know where to find them.
+        """
+
+        nr = NxshmConnection.next_ring_nr
+        NxshmConnection.next_ring_nr += 1
+
+        prefix = os.path.join(ring_dir, f'nxshm-{os.getpid()}-{nr}')
+
+        self.upstream_path = prefix + '-up'
+        self.downstream_path = prefix + '-down'
+
+        self.upstream = RingBuffer.create(self.upstream_path, ring_size)
+        self.downstream = RingBuffer.create(self.downstream_path, ring_size)
+
+        # the server is the consumer of the upstream ring, and will
+        # only start polling after the client rang the doorbell
+        self.upstream.set_consumer_sleeping(True)
+
+        handshake = bytearray(HANDSHAKE_MAGIC)
+
+        for path in (self.upstream_path, self.downstream_path):
+            path = path.encode()
+            handshake.extend(pack('>B', len(path)))
+            handshake.extend(path)
+
+        client_sock.sendall(handshake)
+
+    def _get_description(self):
+        """
+        Return the description used for the channel and controller.
+        """
+
+        return f'NXSHM_CLIENT_{self.socket.fileno()}'
+
+    def _read(self):
+        """
+        Called when the doorbell rang. Drains the upstream ring into the
+        decoder and returns the number of doorbell bytes read, zero
+        means the client has closed the connection.
+        """
+
+        try:
+            doorbell = self.socket.recv(1024)
+
+        except ConnectionResetError:
+            doorbell = b''
+
+        if self.__drain_upstream():
+            self.__start_polling()
+
+        # the doorbell is also rang when the client freed space in the
+        # downstream ring we were waiting for
+        if self.downstream.is_producer_waiting():
+            self.downstream.set_producer_waiting(False)
+            self.proxy.start_writing()
+
+        return len(doorbell)
+
+    def _write(self):
+        """
+        Write as much pending bytes from the encoder into the downstream
+        ring as possible, returning the number of bytes written.
+        """
+
+        n = 0
+
+        while True:
+
+            chunk = self.encoder.fetch_chunk(self.downstream.capacity)
+
+            if not chunk:
+                break
+
+            written = self.downstream.write(chunk)
+            self.encoder.commit(written)
+            n += written
+
+            if written < len(chunk):
+
+                # the ring is full, ask the client to ring the doorbell
+                # as soon as it freed some space
+                self.downstream.set_producer_waiting(True)
+                fence()
+
+                # the client may have freed space before it saw the flag
+                if not self.downstream.writable():
+                    break
+
+                self.downstream.set_producer_waiting(False)
+
+        if n:
+            fence()
+
+            if self.downstream.is_consumer_sleeping():
+                self.__ring_doorbell()
+
+        return n
+
+    def _close_transport(self):
+        """
+        Close the rings and the doorbell socket.
+        """
+
+        self.poll_timer.cancel()
+
+        if self.poll_call:
+            self.poll_call.cancel()
+
+        self.upstream.close()
+        self.downstream.close()
+
+        for path in (self.upstream_path, self.downstream_path):
+            try:
+                os.unlink(path)
+
+            except FileNotFoundError:
+                pass
+
+        self.socket.close()
+
+    def __on_poll(self):
+        """
+        Called every cycle or from the poll timer, checks the upstream
+        ring for new data and adapts the poll interval.
+        """
+
+        self.poll_call = None
+
+        # leave the data in the ring while there is buffered input left,
+        # so a flooding client is held back by the ring filling up
+        if not self.input_backlogged and self.__drain_upstream():
+            self._decode_packets()
+            self.nr_idle_polls = 0
+
+        else:
+            self.nr_idle_polls += 1
+
+        if self.nr_idle_polls <= self.poll_spins:
+            self.poll_call = self.mainloop.call_soon(self.__on_poll)
+            return
+
+        interval = self.poll_interval_min * 2 ** (self.nr_idle_polls - self.poll_spins - 1)
+
+        if interval <= self.poll_interval_max:
+            self.poll_timer.set(interval)
+            return
+
+        # go to sleep, the client will ring the doorbell on new data
+        self.upstream.set_consumer_sleeping(True)
+        fence()
+
+        # the client may have written data before it saw the flag
+        if self.upstream.readable():
+            self.__start_polling()
+            return
+
+        self.polling = False
+
+    def __start_polling(self):
+        """
+        Switch from sleeping on the doorbell to polling the ring every
+        cycle.
+        """
+
+        self.upstream.set_consumer_sleeping(False)
+        self.nr_idle_polls = 0
+
+        if not self.polling:
+            self.polling = True
+            self.poll_call = self.mainloop.call_soon(self.__on_poll)
+
+    def __drain_upstream(self):
+        """
+        Move all bytes that are available in the upstream ring into the
+        decoder. Returns the number of bytes moved.
+        """
+
+        chunk = self.upstream.read(self.upstream.capacity)
+
+        if not chunk:
+            return 0
+
+        # the rings carry plain NXTCP frames, so the capture replays
+        # them as an NXTCP connection
+        if self.capture:
+            self.capture.data(chunk)
+
+        self.decoder.add_chunk(chunk)
+
+        # the client may be waiting for the space we just freed
+        fence()
+
+        if self.upstream.is_producer_waiting():
+            self.__ring_doorbell()
+
+        return len(chunk)
+
+    def __ring_doorbell(self):
+        """
+        Wake up the client.
+        """
+
+        try:
+            self.socket.send(b'\x00')
+
+        except BlockingIOError:
+            # the doorbell buffer is full, so the client has pending
+            # wakeups anyway
+            pass
+
+        except (BrokenPipeError, ConnectionResetError):
+            # the client is gone, this will be noticed on the next read
+            pass
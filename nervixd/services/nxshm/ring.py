@@ -0,0 +1,189 @@
+import os
+import mmap
+import threading
+from struct import pack_into, unpack_from
+
+# layout of the ring header, the header occupies a full cache line so
+# the data region starts aligned
+HEADER_SIZE = 64
+
+OFFSET_HEAD = 0
+OFFSET_TAIL = 8
+OFFSET_CAPACITY = 16
+OFFSET_CONSUMER_SLEEPING = 20
+OFFSET_PRODUCER_WAITING = 21
+
+# lock that is only taken by fence()
+_fence_lock = threading.Lock()
+
+
+def fence():
+    """
+    Full memory barrier, so the stores before it are visible to the
+    other side before the loads after it are done.
+
+    Python has no fence of its own. Taking a lock is an atomic
+    read-modify-write, which on x86 orders all earlier stores before all
+    later loads. It costs no system call as the lock is never contended.
+    """
+
+    _fence_lock.acquire()
+    _fence_lock.release()
+
+
+class RingBuffer:
+    """
+    Single-producer/single-consumer ring buffer living in a shared
+    memory mapping.
+
+    The header holds two monotonic counters: head (total number of
+    bytes written) is only modified by the producer, tail (total number
+    of bytes read) is only modified by the consumer. Because each side
+    only writes its own counter no locking is required.
+
+    Two flags allow the sides to go to sleep: the consumer sets the
+    consumer_sleeping flag when it stops polling, the producer sets the
+    producer_waiting flag when the ring is full. The other side should
+    wake the sleeping side (via whatever doorbell mechanism is used)
+    when it sees the flag set.
+
+    A wakeup is not lost as long as both sides call fence() between a
+    store and the load that depends on it. The side going to sleep sets
+    its flag, calls fence() and then checks the ring again. The other
+    side updates its counter, calls fence() and then checks the flag.
+    """
+
+    def __init__(self, mm):
+        self.mm = mm
+        self.capacity = unpack_from('<I', mm, OFFSET_CAPACITY)[0]
+
+    @classmethod
+    def create(cls, path, capacity):
+        """
+        Create a new ring buffer backed by the file at the given path.
+        """
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+
+        try:
+            os.ftruncate(fd, HEADER_SIZE + capacity)
+            mm = mmap.mmap(fd, HEADER_SIZE + capacity)
+
+        finally:
+            os.close(fd)
+
+        pack_into('<QQI', mm, 0, 0, 0, capacity)
+
+        return cls(mm)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open an existing ring buffer backed by the file at the given
+        path.
+        """
+
+        fd = os.open(path, os.O_RDWR)
+
+        try:
+            mm = mmap.mmap(fd, 0)
+
+        finally:
+            os.close(fd)
+
+        return cls(mm)
+
+    def close(self):
+        """
+        Release the mapping.
+        """
+
+        self.mm.close()
+
+    def get_head(self):
+        return unpack_from('<Q', self.mm, OFFSET_HEAD)[0]
+
+    def get_tail(self):
+        return unpack_from('<Q', self.mm, OFFSET_TAIL)[0]
+
+    def readable(self):
+        """
+        Return the number of bytes that are available for reading.
+        """
+
+        return self.get_head() - self.get_tail()
+
+    def writable(self):
+        """
+        Return the number of bytes that can be written without
+        overwriting unread data.
+        """
+
+        return self.capacity - self.readable()
+
+    def write(self, data):
+        """
+        Write as much of data as fits into the ring, returning the
+        number of bytes written. Must only be called by the producer.
+        """
+
+        head = self.get_head()
+        tail = self.get_tail()
+
+        n = min(len(data), self.capacity - (head - tail))
+
+        if n <= 0:
+            return 0
+
+        start = head % self.capacity
+        first = min(n, self.capacity - start)
+
+        self.mm[HEADER_SIZE + start:HEADER_SIZE + start + first] = data[:first]
+
+        if first < n:
+            self.mm[HEADER_SIZE:HEADER_SIZE + n - first] = data[first:n]
+
+        # publish the data only after it has been copied
+        pack_into('<Q', self.mm, OFFSET_HEAD, head + n)
+
+        return n
+
+    def read(self, limit):
+        """
+        Read at most limit bytes from the ring. Returns an empty bytes
+        object if the ring is empty. Must only be called by the
+        consumer.
+        """
+
+        head = self.get_head()
+        tail = self.get_tail()
+
+        n = min(limit, head - tail)
+
+        if n <= 0:
+            return b''
+
+        start = tail % self.capacity
+        first = min(n, self.capacity - start)
+
+        data = self.mm[HEADER_SIZE + start:HEADER_SIZE + start + first]
+
+        if first < n:
+            data += self.mm[HEADER_SIZE:HEADER_SIZE + n - first]
+
+        # release the space only after the data has been copied
+        pack_into('<Q', self.mm, OFFSET_TAIL, tail + n)
+
+        return data
+
+    def set_consumer_sleeping(self, sleeping):
+        self.mm[OFFSET_CONSUMER_SLEEPING] = 1 if sleeping else 0
+
+    def is_consumer_sleeping(self):
+        return self.mm[OFFSET_CONSUMER_SLEEPING] != 0
+
+    def set_producer_waiting(self, waiting):
+        self.mm[OFFSET_PRODUCER_WAITING] = 1 if waiting else 0
+
+    def is_producer_waiting(self):
+        return self.mm[OFFSET_PRODUCER_WAITING] != 0
@@ -0,0 +1,70 @@
+import os
+import socket
+import tempfile
+
+from .connection import NxshmConnection
+
+
+class NxshmService:
+
+    def __init__(self, controller, mainloop, reactor, tracer, path):
+        self.controller = controller
+        self.mainloop = mainloop
+        self.reactor = reactor
+        self.tracer = tracer
+        self.path = path
+
+        # directory in which the ring buffers are created, prefer a
+        # memory backed filesystem when available
+        self.ring_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        self.ring_size = 1024 * 1024
+
+        self.__start()
+
+    def __start(self):
+        """
+        Start serving.
+        """
+
+        # remove a stale socket file of a previous run
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.setblocking(False)
+
+        self.socket.bind(self.path)
+        self.socket.listen()
+
+        self.proxy = self.mainloop.register(self.socket)
+        self.proxy.set_read_handler(self.__on_connect)
+        self.proxy.set_interest(read=True)
+
+        # let the controller know that a new service is running
+        description = f'NXSHM_SERVICE_{self.path}'
+        self.controller.register(self, description, self.__on_shutdown)
+
+    def __on_connect(self):
+        """
+        Called from the mainloop when a new connection is ready to be
+        accepted.
+        """
+
+        client_sock, address = self.socket.accept()
+
+        NxshmConnection(self.controller, self.mainloop, self.reactor, self.tracer, client_sock,
+                        self.ring_dir, self.ring_size)
+
+    def __on_shutdown(self, action):
+        """ Called from controller when the service should shut down. The action parameter
+        indicates weather the service should shutdown immediatly (SHUTDOWN_NOW) or
+        soon (SHUTDOWN_SOON).
+        """
+
+        self.proxy.unregister()
+        self.socket.close()
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.controller.unregister(self)
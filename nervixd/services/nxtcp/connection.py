@@ -1,5 +1,7 @@
 import logging
 
+from collections import deque
+
 from nervixd.util.keepalive import KeepAlive
 
 from .encoder import *
@@ -12,6 +14,10 @@ logger = logging.getLogger(__name__)
 
 class NxtcpConnection:
 
+    # protocol name used when the upstream traffic is captured, None
+    # when the connection can not be captured
+    capture_protocol = 'nxtcp'
+
     def __init__(self, controller, mainloop, reactor, tracer, client_sock):
 
         self.controller = controller
@@ -20,15 +26,21 @@ class NxtcpConnection:
         self.tracer = tracer
         self.socket = client_sock
 
+        # packets that translate to a single upstream verb
+        self.verb_factories = {
+            LoginPacket: self.__get_login_verb,
+            LogoutPacket: self.__get_logout_verb,
+            RequestPacket: self.__get_request_verb,
+            PostPacket: self.__get_post_verb,
+            SubscribePacket: self.__get_subscribe_verb,
+            UnsubscribePacket: self.__get_unsubscribe_verb,
+        }
+
         self.packet_handlers = {
-            LoginPacket: self.__handle_packet_login,
-            LogoutPacket: self.__handle_packet_logout,
-            RequestPacket: self.__handle_packet_request,
-            PostPacket: self.__handle_packet_post,
-            SubscribePacket: self.__handle_packet_subscribe,
-            UnsubscribePacket: self.__handle_packet_unsubscribe,
+            BatchPacket: self.__handle_packet_batch,
             PongPacket: self.__handle_packet_pong,
             QuitPacket: self.__handle_packet_quit,
+            CompressPacket: self.__handle_packet_compress,
         }
 
         self.verb_handlers = {
@@ -38,6 +50,14 @@ class NxtcpConnection:
             InterestVerb: self.__handle_interest_verb,
         }
 
+        # compression level used when the client asks for compression
+        self.compress_level = 6
+
+        # maximum number of packets and bytes handled in a single turn,
+        # after which other connections get their turn first
+        self.max_packets_per_turn = 64
+        self.max_bytes_per_turn = 65536
+
         self.__start()
 
     def __start(self):
@@ -51,13 +71,29 @@ class NxtcpConnection:
         self.proxy = self.mainloop.register(self.socket)
         self.proxy.set_read_handler(self.__on_read)
         self.proxy.set_write_handler(self.__on_write)
+        self.proxy.set_pending_handler(self.__on_pending)
         self.proxy.set_interest(read=True)
         self.__close_connection = False
 
+        # upstream flow control state
+        self.reading = True
+        self.input_backlogged = False
+        self.__eof = False
+
+        # verbs of a BATCH packet that are not handed to the reactor yet
+        self.pending_verbs = deque()
+
         # init protocol handlers
         self.encoder = Encoder()
         self.decoder = Decoder()
 
+        # init capture
+        self.capture = None
+
+        if self.controller.capture and self.capture_protocol:
+            self.capture = self.controller.capture.connection(self.capture_protocol)
+            self.decoder.capture = self.capture
+
         # init keepalive
         self.keepalive = KeepAlive(self.mainloop)
         self.keepalive.set_warning_handler(self.__on_keepalive_warning)
@@ -66,16 +102,18 @@ class NxtcpConnection:
         # init channel
         self.channel = self.reactor.channel()
 
-        peer_name, peer_port = self.socket.getpeername()
-        description = f'NXTCP_CLIENT_{peer_name}:{peer_port}'
+        description = self._get_description()
         self.channel.set_description(description)
         self.channel.set_downstream_handler(self.__on_downstream)
+        self.channel.set_overload_handler(self.__on_overload)
+        self.channel.set_unblock_handler(self.__on_unblock)
+        self.overload_timer = None
 
         # register on controller
         self.controller.register(self, description, self.__on_shutdown)
 
         # send welcome
-        self.encoder.encode(WelcomePacket(1, 1))
+        self.encoder.encode(WelcomePacket(1, PROTOCOL_VERSION))
         self.proxy.start_writing()
 
     def __on_read(self):
@@ -84,33 +122,47 @@ class NxtcpConnection:
         be read.
         """
 
-        n = self.decoder.read_from_socket(self.socket)
+        n = self._read()
 
-        while True:
+        if n == 0:
+            # if zero bytes were read from the server, it means that
+            # the client has closed the connection, it is closed on our
+            # side as well once the buffered input is handled
+            self.__eof = True
 
-            packet = self.decoder.decode()
+        self._decode_packets()
 
-            if not packet:
-                break
+    def __on_pending(self):
+        """
+        Called from the mainloop when it is our turn to handle more of
+        the buffered input.
+        """
 
-            self.__handle_packet(packet)
+        self._decode_packets()
 
-        if n == 0:
-            # if zero bytes were read from the server, it means that
-            # the client has closed the connection
+    def __on_unblock(self):
+        """
+        Called from the channel when the number of outstanding requests
+        dropped below the maximum.
+        """
 
-            self.__do_close_connection()
+        # continue in the next turn, the reactor is still busy with the
+        # channel at this point
+        if self.proxy.is_open():
+            self.proxy.set_pending(True)
 
     def __on_write(self):
         """
         Called from the mainloop when we should writ data to the socket.
         """
 
-        n = self.encoder.write_to_socket(self.socket)
+        n = self._write()
 
         if n == 0:
             self.proxy.stop_writing()
 
+        self.channel.set_backlog(self._get_backlog())
+
         if self.__close_connection:
             self.__do_close_connection()
 
@@ -125,6 +177,21 @@ class NxtcpConnection:
         if verb:
             self.__handle_verb(verb)
 
+        self.channel.set_backlog(self._get_backlog())
+
+    def __on_overload(self):
+        """
+        Called from the channel when the client does not keep up with
+        the verbs send to it. The connection is closed from a timer, as
+        the reactor is still busy with the channel at this point.
+        """
+
+        logger.warning("Disconnecting %s, it does not keep up", self.channel.description)
+
+        self.overload_timer = self.mainloop.timer()
+        self.overload_timer.set_handler(self.__do_close_connection)
+        self.overload_timer.set(0)
+
     def __on_keepalive_warning(self):
         """
         Called when the keepalive mechanism gives us a warning.
@@ -146,11 +213,120 @@ class NxtcpConnection:
 
         self.__close_connection = True
 
+    def _get_description(self):
+        """
+        Return the description used for the channel and controller.
+        """
+
+        peer_name, peer_port = self.socket.getpeername()
+        return f'NXTCP_CLIENT_{peer_name}:{peer_port}'
+
+    def _get_backlog(self):
+        """
+        Return the number of encoded bytes that are not written to the
+        transport yet.
+        """
+
+        return self.encoder.pending + self.encoder.batch_size
+
+    def _read(self):
+        """
+        Read a chunk from the transport into the decoder. Returns the
+        number of bytes read, zero means the client has closed the
+        connection.
+        """
+
+        return self.decoder.read_from_socket(self.socket)
+
+    def _write(self):
+        """
+        Write pending bytes from the encoder to the transport. Returns
+        the number of bytes written, zero means there is nothing left to
+        be written.
+        """
+
+        return self.encoder.write_to_socket(self.socket)
+
+    def _close_transport(self):
+        """
+        Close the underlying transport.
+        """
+
+        self.socket.close()
+
+    def _decode_packets(self):
+        """
+        Decode and handle the complete packets that are present in the
+        decoder, at most max_packets_per_turn packets and
+        max_bytes_per_turn bytes. When input is left the connection
+        waits for its next turn, without reading from the transport in
+        the meantime. Reading is also paused while the upstream of the
+        channel is blocked.
+        """
+
+        channel = self.channel
+
+        packets = self.max_packets_per_turn
+        nbytes = self.max_bytes_per_turn
+
+        drained = False
+
+        while packets > 0 and nbytes > 0 and not channel.is_upstream_blocked():
+
+            # the rest of a BATCH packet goes before the next packet
+            if self.pending_verbs:
+                packets -= self.__put_pending_verbs(packets)
+
+                if channel.is_closed:
+                    return
+
+                continue
+
+            packet = self.decoder.decode()
+
+            if not packet:
+                drained = True
+                break
+
+            self.__handle_packet(packet)
+
+            if channel.is_closed:
+                return
+
+            # the packets of a BATCH packet are counted when their verbs
+            # are handed to the reactor
+            if packet.__class__ is not BatchPacket:
+                packets -= 1
+
+            nbytes -= len(packet.frame)
+
+        if drained and self.__eof:
+            self.__do_close_connection()
+            return
+
+        blocked = channel.is_upstream_blocked()
+
+        self.input_backlogged = not drained
+        self.proxy.set_pending(not drained and not blocked)
+
+        reading = drained and not blocked and not self.__eof
+
+        if reading != self.reading:
+            self.reading = reading
+            self.proxy.set_interest(read=reading)
+
     def __handle_packet(self, packet):
         """
         Called when we have decoded an incoming packet from the client.
         """
 
+        factory = self.verb_factories.get(packet.__class__, None)
+
+        if factory:
+            self.keepalive.tickle()
+            self.channel.put_upstream(factory(packet))
+            return
+
         handler = self.packet_handlers.get(
             packet.__class__,
             None
@@ -204,8 +380,14 @@ class NxtcpConnection:
         # close keepalive
         self.keepalive.destroy()
 
+        if self.overload_timer:
+            self.overload_timer.cancel()
+
+        if self.capture:
+            self.capture.close()
+
         # close socket
-        self.socket.close()
+        self._close_transport()
 
         # unregister from controller
         self.controller.unregister(self)
@@ -213,70 +395,107 @@ class NxtcpConnection:
         # send trace
         # TODO
 
-    def __handle_packet_login(self, packet):
+    def __get_login_verb(self, packet):
         """
-        Handle a LOGIN packet.
+        Return the verb for a LOGIN packet.
         """
 
-        self.channel.put_upstream(LoginVerb(
+        return LoginVerb(
             name=packet.name,
             enforce=packet.enforce,
             standby=packet.standby,
-            persist=packet.persist
-        ))
+            persist=packet.persist,
+            shared=packet.shared,
+            weight=packet.weight
+        )
 
-    def __handle_packet_logout(self, packet):
+    def __get_logout_verb(self, packet):
         """
-        Handle a LOGOUT packet.
+        Return the verb for a LOGOUT packet.
         """
 
-        self.channel.put_upstream(LogoutVerb(
+        return LogoutVerb(
             name=packet.name
-        ))
+        )
 
-    def __handle_packet_request(self, packet):
+    def __get_request_verb(self, packet):
         """
-        Handle a REQUEST packet.
+        Return the verb for a REQUEST packet.
         """
 
-        self.channel.put_upstream(RequestVerb(
+        return RequestVerb(
             name=packet.name,
             unidirectional=packet.unidirectional,
             messageref=packet.messageref,
             timeout=packet.timeout,
             payload=packet.payload
-        ))
+        )
 
-    def __handle_packet_post(self, packet):
+    def __get_post_verb(self, packet):
         """
-        Handle a POST packet.
+        Return the verb for a POST packet.
         """
 
-        self.channel.put_upstream(PostVerb(
+        return PostVerb(
             postref=packet.postref,
             payload=packet.payload
-        ))
+        )
 
-    def __handle_packet_subscribe(self, packet):
+    def __get_subscribe_verb(self, packet):
         """
-        Handle a SUBSCRIBE packet.
+        Return the verb for a SUBSCRIBE packet.
         """
 
-        self.channel.put_upstream(SubscribeVerb(
+        return SubscribeVerb(
             name=packet.name,
             messageref=packet.messageref,
             topic=packet.topic
-        ))
+        )
 
-    def __handle_packet_unsubscribe(self, packet):
+    def __get_unsubscribe_verb(self, packet):
         """
-        Handle a UNSUBSCRIBE packet.
+        Return the verb for a UNSUBSCRIBE packet.
         """
 
-        self.channel.put_upstream(UnsubscribeVerb(
+        return UnsubscribeVerb(
             name=packet.name,
             topic=packet.topic
-        ))
+        )
+
+    def __handle_packet_batch(self, packet):
+        """
+        Handle a BATCH packet, the verbs of the packets it contains are
+        handed to the reactor by _decode_packets(), as many at once as
+        the limits of the turn and of the channel allow.
+        """
+
+        factories = self.verb_factories
+
+        self.pending_verbs.extend(
+            factories[sub.__class__](sub) for sub in packet.packets
+        )
+
+    def __put_pending_verbs(self, maximum):
+        """
+        Hand at most maximum of the pending verbs to the reactor in one
+        batch, without exceeding the number of outstanding requests of
+        the channel. Returns the number of verbs handed over.
+        """
+
+        pending = self.pending_verbs
+
+        count = min(maximum, len(pending))
+
+        # every verb is assumed to be a request, so the upstream cannot
+        # get blocked halfway the batch
+        capacity = self.channel.get_upstream_capacity()
+
+        if capacity is not None:
+            count = min(count, capacity)
+
+        self.channel.put_upstream_batch([pending.popleft() for _ in range(count)])
+
+        return count
 
     def __handle_packet_pong(self, packet):
         """
@@ -290,6 +509,23 @@ class NxtcpConnection:
 
         self.__do_close_connection()
 
+    def __handle_packet_compress(self, packet):
+        """
+        Handle a COMPRESS packet.
+        """
+
+        if self.encoder.compressor:
+            logger.debug("Ignoring COMPRESS packet, compression is already enabled")
+            return
+
+        # the acknowledgement itself is still send uncompressed
+        self.encoder.encode(CompressAckPacket(packet.threshold))
+
+        self.decoder.enable_compression(packet.dictionary)
+        self.encoder.enable_compression(packet.threshold, packet.dictionary, self.compress_level)
+
+        self.proxy.start_writing()
+
     def __handle_session_verb(self, verb):
         """
         Handle a SESSION verb.
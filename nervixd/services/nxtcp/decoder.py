@@ -1,3 +1,4 @@
+import zlib
 from struct import unpack_from
 
 from nervixd.util.decoder import BaseDecoder
@@ -19,8 +20,41 @@ class Decoder(BaseDecoder):
             PACKET_UNSUBSCRIBE: UnsubscribePacket,
             PACKET_PONG: PongPacket,
             PACKET_QUIT: QuitPacket,
+            PACKET_COMPRESS: CompressPacket,
+            PACKET_BATCH: self.__construct_batch,
         }
 
+        # packets that may be contained in a BATCH packet
+        self.batch_handler_map = {
+            PACKET_LOGIN: LoginPacket,
+            PACKET_LOGOUT: LogoutPacket,
+            PACKET_REQUEST: RequestPacket,
+            PACKET_POST: PostPacket,
+            PACKET_SUBSCRIBE: SubscribePacket,
+            PACKET_UNSUBSCRIBE: UnsubscribePacket,
+        }
+
+        # set when compression is enabled, holds the inflated frames
+        # of COMPRESSED packets that are not decoded yet
+        self.decompressor = None
+        self.inflated = None
+
+        # maximum number of bytes a single COMPRESSED packet may inflate to
+        self.max_inflated_size = 2 ** 20
+
+    def enable_compression(self, dictionary=b''):
+        """
+        Allow the peer to send COMPRESSED packets. The given dictionary
+        should be the same as used by the peer's compressor.
+        """
+
+        if dictionary:
+            self.decompressor = zlib.decompressobj(zdict=dictionary)
+        else:
+            self.decompressor = zlib.decompressobj()
+
+        self.inflated = BaseDecoder()
+
     def decode(self):
         """
         Decode a single packet from the chunks that are currently 
@@ -29,19 +63,76 @@ class Decoder(BaseDecoder):
         Returns None if no packet could be constructed.
         """
 
-        header = self.get(5)
+        while True:
+
+            # first decode the frames that were inflated before
+            if self.inflated is not None:
+
+                packet_type, frame = self.__get_frame(self.inflated)
+
+                if frame is not None:
+
+                    if packet_type == PACKET_COMPRESSED:
+                        raise DecodingError('Nested COMPRESSED packet')
+
+                    return self.__construct(packet_type, frame)
+
+            packet_type, frame = self.__get_frame(self)
+
+            if frame is None:
+                return
+
+            if packet_type != PACKET_COMPRESSED:
+                return self.__construct(packet_type, frame)
+
+            self.__inflate(frame)
+
+    def __get_frame(self, source):
+        """
+        Get the type and frame of the next packet from the given source
+        decoder. Returns (None, None) if no complete frame is available.
+        """
+
+        header = source.get(5)
 
         if not header:
-            return
+            return None, None
 
         length, packet_type = unpack_from('>IB', header)
 
-        frame = self.get(length, 5)
+        frame = source.get(length, 5)
 
         if frame is None:
-            return
+            return None, None
+
+        source.commit()
+
+        return packet_type, frame
+
+    def __inflate(self, frame):
+        """
+        Inflate the data of a COMPRESSED packet, making the frames it
+        contains available for decoding.
+        """
+
+        if not self.decompressor:
+            raise DecodingError('COMPRESSED packet received while compression is not enabled')
 
-        self.commit()
+        try:
+            data = self.decompressor.decompress(bytes(frame), self.max_inflated_size)
+
+        except zlib.error as e:
+            raise DecodingError('Invalid compressed data: {}'.format(e))
+
+        if self.decompressor.unconsumed_tail:
+            raise DecodingError('COMPRESSED packet exceeds {:d} bytes'.format(self.max_inflated_size))
+
+        self.inflated.add_chunk(data)
+
+    def __construct(self, packet_type, frame):
+        """
+        Construct the packet object for the given frame.
+        """
 
         handler = self.handler_map.get(packet_type, None)
 
@@ -52,6 +143,24 @@ class Decoder(BaseDecoder):
 
         return packet
 
+    def __construct_batch(self, frame):
+        """
+        Construct a BATCH packet, including the packets it contains.
+        """
+
+        packet = BatchPacket(frame)
+
+        for packet_type, subframe in packet.subframes:
+
+            handler = self.batch_handler_map.get(packet_type, None)
+
+            if not handler:
+                raise DecodingError('Packet type 0x{:02x} not allowed in BATCH packet'.format(packet_type))
+
+            packet.packets.append(handler(subframe))
+
+        return packet
+
 
 class DecodingError(RuntimeError):
     pass
@@ -64,10 +173,16 @@ class BasePacket:
         self.nextbyte = 0
 
     def get_uint8(self, offset):
+        if offset + 1 > len(self.frame):
+            raise DecodingError('Uint8 exceeds frame size {:d}'.format(len(self.frame)))
+
         self.nextbyte = offset + 1
         return unpack_from('>B', self.frame, offset)[0]
 
     def get_uint32(self, offset):
+        if offset + 4 > len(self.frame):
+            raise DecodingError('Uint32 exceeds frame size {:d}'.format(len(self.frame)))
+
         self.nextbyte = offset + 4
         return unpack_from('>I', self.frame, offset)[0]
 
@@ -97,6 +212,32 @@ class BasePacket:
 
         return bytes(self.frame[start: end])
 
+    def get_varint(self, offset):
+        value = 0
+        shift = 0
+
+        while True:
+
+            if offset >= len(self.frame):
+                raise DecodingError('Varint exceeds frame size {:d}'.format(len(self.frame)))
+
+            byte = self.frame[offset]
+            offset += 1
+
+            value |= (byte & 0x7f) << shift
+
+            if not byte & 0x80:
+                break
+
+            shift += 7
+
+            if shift > 28:
+                raise DecodingError('Varint exceeds 5 bytes')
+
+        self.nextbyte = offset
+
+        return value
+
 
 class LoginPacket(BasePacket):
     """
@@ -104,7 +245,9 @@ class LoginPacket(BasePacket):
         0: persist
         1: standby
         2: enforce
+        3: shared
     string: name
+    uint8: weight (optional, only for shared logins, defaults to 1)
     """
 
     def __init__(self, frame):
@@ -115,9 +258,15 @@ class LoginPacket(BasePacket):
         self.persist = (self.flags & (1 << 0)) > 0
         self.standby = (self.flags & (1 << 1)) > 0
         self.enforce = (self.flags & (1 << 2)) > 0
+        self.shared = (self.flags & (1 << 3)) > 0
 
         self.name = self.get_string(1)
 
+        self.weight = 1
+
+        if self.shared and self.nextbyte < len(self.frame):
+            self.weight = self.get_uint8(self.nextbyte)
+
 
 class LogoutPacket(BasePacket):
     """
@@ -223,3 +372,53 @@ class QuitPacket(BasePacket):
 
     def __init__(self, frame):
         BasePacket.__init__(self, frame)
+
+
+class CompressPacket(BasePacket):
+    """
+    uint32: threshold
+    blob: dictionary
+    """
+
+    def __init__(self, frame):
+        BasePacket.__init__(self, frame)
+
+        self.threshold = self.get_uint32(0)
+
+        self.dictionary = self.get_blob(4)
+
+
+class BatchPacket(BasePacket):
+    """
+    repeated until the end of the frame:
+        varint: length
+        uint8: type
+        bytes[length]: frame
+    """
+
+    def __init__(self, frame):
+        BasePacket.__init__(self, frame)
+
+        self.subframes = []
+
+        # filled by the decoder with the packets constructed from the
+        # subframes
+        self.packets = []
+
+        offset = 0
+
+        while offset < len(self.frame):
+
+            length = self.get_varint(offset)
+
+            packet_type = self.get_uint8(self.nextbyte)
+
+            start = self.nextbyte
+            end = start + length
+
+            if end > len(self.frame):
+                raise DecodingError('Subframe size of {:d} exceeds frame size {:d}'.format(length, len(self.frame)))
+
+            self.subframes.append((packet_type, self.frame[start: end]))
+
+            offset = end
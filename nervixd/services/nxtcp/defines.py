@@ -11,6 +11,7 @@ PACKET_ALIGN = 0x11
 PACKET_PING = 0x80
 PACKET_WELCOME = 0x82
 PACKET_BYEBYE = 0x83
+PACKET_COMPRESS_ACK = 0x86
 
 # UPSTREAM
 PACKET_LOGIN = 0x01
@@ -21,3 +22,14 @@ PACKET_SUBSCRIBE = 0x08
 PACKET_UNSUBSCRIBE = 0x10
 PACKET_PONG = 0x81
 PACKET_QUIT = 0x84
+PACKET_COMPRESS = 0x85
+PACKET_BATCH = 0x88
+
+# BOTH DIRECTIONS
+PACKET_COMPRESSED = 0x87
+
+# version of the protocol that is announced in the WELCOME packet
+#   1: initial version
+#   2: adds negotiated compression (COMPRESS, COMPRESS_ACK, COMPRESSED)
+#      and batched packets (BATCH)
+PROTOCOL_VERSION = 2
@@ -1,3 +1,4 @@
+import zlib
 import logging
 from struct import pack_into, pack
 
@@ -10,6 +11,30 @@ logger = logging.getLogger(__name__)
 
 class Encoder(BaseEncoder):
 
+    def __init__(self, *args, **kwargs):
+        BaseEncoder.__init__(self, *args, **kwargs)
+
+        # set when compression is enabled, encoded packets are then
+        # collected in the batch until the next flush
+        self.compressor = None
+        self.compress_threshold = 0
+        self.batch = []
+        self.batch_size = 0
+
+    def enable_compression(self, threshold, dictionary=b'', level=6):
+        """
+        Start compressing. From now on all packets that are encoded
+        between two flushes are compressed together into one COMPRESSED
+        packet, unless their combined size is below the threshold.
+        """
+
+        if dictionary:
+            self.compressor = zlib.compressobj(level, zdict=dictionary)
+        else:
+            self.compressor = zlib.compressobj(level)
+
+        self.compress_threshold = threshold
+
     def encode(self, packet):
         """
         Encode a packet object and append it to the internal 
@@ -18,10 +43,54 @@ class Encoder(BaseEncoder):
 
         chunk = packet.get_chunk()
 
-        self.add_encoded_chunk(chunk)
+        if self.compressor:
+            self.batch.append(chunk)
+            self.batch_size += len(chunk)
+
+        else:
+            self.add_encoded_chunk(chunk)
 
         # logger.debug("Encoded %s", packet)
 
+    def flush(self):
+        """
+        Move the packets that are collected in the batch to the
+        chunkbuffer, compressing them if they are large enough.
+        """
+
+        if not self.batch:
+            return
+
+        if self.batch_size < self.compress_threshold:
+            for chunk in self.batch:
+                self.add_encoded_chunk(chunk)
+
+        else:
+            data = b''.join(self.batch)
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.add_encoded_chunk(CompressedPacket(data).get_chunk())
+
+        self.batch = []
+        self.batch_size = 0
+
+    def fetch_chunk(self, chunksize=None):
+        """
+        Flushes the batch before fetching a chunk of bytes.
+        """
+
+        self.flush()
+
+        return BaseEncoder.fetch_chunk(self, chunksize)
+
+    def pop_pending(self):
+        """
+        Flushes the batch before popping all pending bytes.
+        """
+
+        self.flush()
+
+        return BaseEncoder.pop_pending(self)
+
 
 class BasePacket:
 
@@ -122,6 +191,8 @@ class MessagePacket(BasePacket):
     STATUS_OK = 0
     STATUS_TIMEOUT = 1
     STATUS_UNREACHABLE = 2
+    STATUS_OVERLOADED = 3
+    STATUS_RATE_LIMITED = 4
 
     def __init__(self, messageref, status, payload):
         BasePacket.__init__(self)
@@ -178,3 +249,23 @@ class ByeByePacket(BasePacket):
         BasePacket.__init__(self)
 
         self.set_type(PACKET_BYEBYE)
+
+
+class CompressAckPacket(BasePacket):
+
+    def __init__(self, threshold):
+        BasePacket.__init__(self)
+
+        self.set_type(PACKET_COMPRESS_ACK)
+
+        self.add_uint32_field(threshold)
+
+
+class CompressedPacket(BasePacket):
+
+    def __init__(self, data):
+        BasePacket.__init__(self)
+
+        self.set_type(PACKET_COMPRESSED)
+
+        self.add_field(data)
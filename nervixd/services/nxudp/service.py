@@ -0,0 +1,239 @@
+import socket
+import logging
+import struct
+from collections import OrderedDict
+
+from nervixd.services.nxtcp.decoder import Decoder, DecodingError, RequestPacket
+from nervixd.reactor.verbs import RequestVerb
+
+logger = logging.getLogger(__name__)
+
+
+class NxudpService:
+    """
+    Connectionless service for clients that send a lot of
+    unidirectional requests.
+
+    Each datagram carries one or more NXTCP frames. Only unidirectional
+    REQUEST packets are accepted, everything else is dropped. For every
+    peer address a lightweight pseudo-channel is kept on the reactor,
+    which is closed after it has been idle for idle_timeout seconds.
+    """
+
+    def __init__(self, controller, mainloop, reactor, tracer, address):
+        self.controller = controller
+        self.mainloop = mainloop
+        self.reactor = reactor
+        self.tracer = tracer
+        self.address = address
+
+        # maximum number of datagrams read per wakeup
+        self.max_datagrams = 64
+        self.datagram_size = 65535
+
+        # time after which an idle peer will be forgotten
+        self.idle_timeout = 30.0
+        self.expiry_resolution = 1.0
+
+        # peers, ordered from least to most recently seen, when there
+        # are max_peers the least recently seen one is forgotten to make
+        # room for a new one
+        self.peers = OrderedDict()
+        self.max_peers = 10000
+
+        # stats
+        self.nr_datagrams = 0
+        self.nr_dropped_packets = 0
+
+        self.decoder = Decoder()
+
+        self.__start()
+
+    def __start(self):
+        """
+        Start serving.
+        """
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+
+        self.proxy = self.mainloop.register(self.socket)
+        self.proxy.set_read_handler(self.__on_read)
+        self.proxy.set_interest(read=True)
+
+        self.expiry_timer = self.mainloop.timer()
+        self.expiry_timer.set_handler(self.__on_expiry_timer)
+        self.expiry_timer.set(self.expiry_resolution)
+
+        # let the controller know that a new service is running
+        description = f'NXUDP_SERVICE_{self.address[0]}:{self.address[1]}'
+        self.controller.register(self, description, self.__on_shutdown)
+
+    def __on_read(self):
+        """
+        Called from the mainloop when datagrams are ready to be read.
+        Reads up to max_datagrams datagrams before returning to the
+        mainloop.
+        """
+
+        for _ in range(self.max_datagrams):
+
+            try:
+                datagram, address = self.socket.recvfrom(self.datagram_size)
+
+            except (BlockingIOError, InterruptedError):
+                break
+
+            except ConnectionRefusedError:
+                # ICMP error caused by an earlier datagram, ignore it
+                continue
+
+            self.nr_datagrams += 1
+
+            self.__handle_datagram(datagram, address)
+
+    def __handle_datagram(self, datagram, address):
+        """
+        Decode all frames in a single datagram and pass them to the
+        reactor.
+        """
+
+        peer = self.__get_peer(address)
+
+        self.decoder.add_chunk(datagram)
+
+        try:
+            while True:
+
+                packet = self.decoder.decode()
+
+                if not packet:
+                    break
+
+                self.__handle_packet(peer, packet)
+
+        except (DecodingError, struct.error) as e:
+            logger.debug("Dropping remainder of datagram from %s:%s: %s", address[0], address[1], e)
+            self.nr_dropped_packets += 1
+
+        # frames never span multiple datagrams, so drop any remaining
+        # partial frame
+        self.decoder.reset()
+
+    def __handle_packet(self, peer, packet):
+        """
+        Called for each packet that was decoded from a datagram.
+        """
+
+        if not isinstance(packet, RequestPacket) or not packet.unidirectional:
+            self.nr_dropped_packets += 1
+            return
+
+        try:
+            verb = RequestVerb(
+                name=packet.name,
+                unidirectional=True,
+                messageref=None,
+                timeout=packet.timeout,
+                payload=packet.payload
+            )
+
+            peer.channel.put_upstream(verb)
+
+        except ValueError as e:
+            # the packet decoded fine but does not make a valid verb,
+            # for example because of an invalid name
+            logger.debug("Dropping invalid packet from %s:%s: %s", peer.address[0], peer.address[1], e)
+            self.nr_dropped_packets += 1
+
+    def __get_peer(self, address):
+        """
+        Return the peer for the given address, creating it if it does not
+        exist yet.
+        """
+
+        peer = self.peers.get(address, None)
+
+        if peer:
+            peer.last_seen = self.mainloop.now()
+            self.peers.move_to_end(address)
+
+        else:
+            while len(self.peers) >= self.max_peers:
+                _, oldest = self.peers.popitem(last=False)
+                oldest.close()
+
+            peer = NxudpPeer(self.reactor, address, self.mainloop.now())
+            self.peers[address] = peer
+
+        return peer
+
+    def __on_expiry_timer(self):
+        """
+        Called periodically to forget idle peers.
+        """
+
+        self._expire_peers()
+
+        self.expiry_timer.set(self.expiry_resolution)
+
+    def _expire_peers(self):
+        """
+        Close the channels of all peers that have been idle for longer
+        than idle_timeout.
+        """
+
+        deadline = self.mainloop.now() - self.idle_timeout
+
+        while self.peers:
+
+            address, peer = next(iter(self.peers.items()))
+
+            if peer.last_seen > deadline:
+                break
+
+            self.peers.popitem(last=False)
+            peer.close()
+
+    def __on_shutdown(self, action):
+        """ Called from controller when the service should shut down. The action parameter
+        indicates weather the service should shutdown immediatly (SHUTDOWN_NOW) or
+        soon (SHUTDOWN_SOON).
+        """
+
+        self.expiry_timer.cancel()
+
+        while self.peers:
+            address, peer = self.peers.popitem()
+            peer.close()
+
+        self.proxy.unregister()
+        self.socket.close()
+
+        self.controller.unregister(self)
+
+
+class NxudpPeer:
+    """
+    Pseudo-channel for a single peer address.
+    """
+
+    def __init__(self, reactor, address, now):
+        self.address = address
+        self.last_seen = now
+
+        self.channel = reactor.channel(f'NXUDP_CLIENT_{address[0]}:{address[1]}')
+        self.channel.set_downstream_handler(self.__on_downstream)
+
+    def __on_downstream(self):
+        """
+        There is no way to deliver verbs to the peer, so discard them.
+        """
+
+        self.channel.pop_downstream()
+
+    def close(self):
+        self.channel.close()
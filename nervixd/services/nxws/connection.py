@@ -0,0 +1,228 @@
+import logging
+from struct import pack
+
+from nervixd.services.nxtcp.connection import NxtcpConnection
+
+from .websocket import *
+
+logger = logging.getLogger(__name__)
+
+
+class NxwsConnection(NxtcpConnection):
+    """
+    NXTCP connection that is tunneled over a WebSocket.
+
+    Each binary WebSocket message carries one or more NXTCP frames. On
+    the way out all NXTCP packets that are queued at the time the socket
+    becomes writable are packed into a single WebSocket message, which
+    is compressed as a whole when permessage-deflate was negotiated.
+    """
+
+    # the capture format has no room for the WebSocket framing
+    capture_protocol = None
+
+    def __init__(self, controller, mainloop, reactor, tracer, client_sock, deflate_enabled=True):
+
+        self.deflate_enabled = deflate_enabled
+        self.deflate = None
+
+        self.handshake_done = False
+
+        self.max_message_size = 2 ** 20
+        self.frame_decoder = FrameDecoder(chunksize=65536, max_frame_size=self.max_message_size)
+        self.frame_encoder = FrameEncoder(chunksize=65536)
+
+        # payloads of the fragmented message that is being received
+        self.fragments = None
+        self.fragments_size = 0
+        self.fragments_compressed = False
+
+        NxtcpConnection.__init__(self, controller, mainloop, reactor, tracer, client_sock)
+
+    def _get_description(self):
+        """
+        Return the description used for the channel and controller.
+        """
+
+        peer_name, peer_port = self.socket.getpeername()
+        return f'NXWS_CLIENT_{peer_name}:{peer_port}'
+
+    def _get_backlog(self):
+        """
+        Return the number of bytes that are not written to the socket
+        yet, including those already packed into WebSocket messages.
+        """
+
+        return NxtcpConnection._get_backlog(self) + self.frame_encoder.pending
+
+    def _read(self):
+        """
+        Read a chunk from the socket, unwrap the WebSocket messages in it
+        and pass their payload to the NXTCP decoder. Returns zero if the
+        connection should be closed.
+        """
+
+        n = self.frame_decoder.read_from_socket(self.socket)
+
+        try:
+            if not self.handshake_done:
+                self.__handle_handshake()
+
+            if self.handshake_done:
+                if not self.__handle_frames():
+                    return 0
+
+        except HandshakeError as e:
+            logger.debug("Handshake failed: %s", e)
+            self.__send_now(build_error_response())
+            return 0
+
+        except ProtocolError as e:
+            logger.debug("Protocol error: %s", e)
+            self.__send_now(build_frame(OPCODE_CLOSE, pack('>H', e.code)))
+            return 0
+
+        return n
+
+    def _write(self):
+        """
+        Pack all queued NXTCP packets into a single WebSocket message and
+        write it to the socket.
+        """
+
+        # nothing but the handshake response may be send before the
+        # handshake is done
+        if self.handshake_done:
+
+            payload = self.encoder.pop_pending()
+
+            if payload:
+                self.__encode_message(payload)
+
+        return self.frame_encoder.write_to_socket(self.socket)
+
+    def __handle_handshake(self):
+        """
+        Handle the HTTP upgrade request, if it is received completely.
+        """
+
+        request = self.frame_decoder.decode_handshake()
+
+        if not request:
+            return
+
+        headers = parse_handshake(request)
+
+        extension = None
+
+        if self.deflate_enabled:
+            self.deflate = negotiate_deflate(headers.get('sec-websocket-extensions', ''))
+
+            if self.deflate:
+                extension = self.deflate.get_response()
+
+        self.frame_encoder.encode_raw(build_handshake_response(headers['sec-websocket-key'], extension))
+        self.handshake_done = True
+
+        # the welcome packet has been waiting for the handshake
+        self.proxy.start_writing()
+
+    def __handle_frames(self):
+        """
+        Handle all complete frames. Returns False if the client closed
+        the WebSocket.
+        """
+
+        while True:
+
+            frame = self.frame_decoder.decode()
+
+            if not frame:
+                return True
+
+            if frame.opcode >= OPCODE_CLOSE and (not frame.fin or len(frame.payload) > 125):
+                raise ProtocolError("Invalid control frame")
+
+            # control frames may be interleaved with fragmented messages
+            if frame.opcode == OPCODE_PING:
+                self.frame_encoder.encode_frame(OPCODE_PONG, frame.payload)
+                self.proxy.start_writing()
+                continue
+
+            elif frame.opcode == OPCODE_PONG:
+                continue
+
+            elif frame.opcode == OPCODE_CLOSE:
+                self.__send_now(build_frame(OPCODE_CLOSE, pack('>H', CLOSE_NORMAL)))
+                return False
+
+            if frame.opcode == OPCODE_BINARY:
+
+                if self.fragments is not None:
+                    raise ProtocolError("Expected continuation frame")
+
+                if frame.rsv1 and not self.deflate:
+                    raise ProtocolError("Compressed frame without negotiated compression")
+
+                self.fragments = [frame.payload]
+                self.fragments_size = len(frame.payload)
+                self.fragments_compressed = frame.rsv1
+
+            elif frame.opcode == OPCODE_CONTINUATION:
+
+                if self.fragments is None:
+                    raise ProtocolError("Unexpected continuation frame")
+
+                self.fragments.append(frame.payload)
+                self.fragments_size += len(frame.payload)
+
+            elif frame.opcode == OPCODE_TEXT:
+                raise ProtocolError("Only binary messages are supported", CLOSE_UNSUPPORTED_DATA)
+
+            else:
+                raise ProtocolError("Unknown opcode 0x{:x}".format(frame.opcode))
+
+            if self.fragments_size > self.max_message_size:
+                raise ProtocolError("Message too big", CLOSE_MESSAGE_TOO_BIG)
+
+            if frame.fin:
+                self.__handle_message()
+
+    def __handle_message(self):
+        """
+        Called when a complete message is received.
+        """
+
+        message = b''.join(self.fragments)
+
+        if self.fragments_compressed:
+            message = self.deflate.decompress(message, self.max_message_size)
+
+        self.fragments = None
+        self.fragments_size = 0
+        self.fragments_compressed = False
+
+        self.decoder.add_chunk(message)
+
+    def __encode_message(self, payload):
+        """
+        Wrap the payload in a binary WebSocket message.
+        """
+
+        if self.deflate:
+            self.frame_encoder.encode_frame(OPCODE_BINARY, self.deflate.compress(payload), rsv1=True)
+
+        else:
+            self.frame_encoder.encode_frame(OPCODE_BINARY, payload)
+
+    def __send_now(self, data):
+        """
+        Send data directly to the socket, used right before the
+        connection is closed.
+        """
+
+        try:
+            self.socket.send(data)
+
+        except OSError:
+            pass
@@ -0,0 +1,412 @@
+"""
+Minimal WebSocket (RFC 6455) implementation with support for the
+permessage-deflate extension (RFC 7692).
+"""
+
+import zlib
+import base64
+import hashlib
+from struct import pack, unpack_from
+
+from nervixd.util.decoder import BaseDecoder
+from nervixd.util.encoder import BaseEncoder
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xa
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_UNSUPPORTED_DATA = 1003
+CLOSE_MESSAGE_TOO_BIG = 1009
+
+DEFLATE_TRAILER = b'\x00\x00\xff\xff'
+
+
+class ProtocolError(RuntimeError):
+
+    def __init__(self, reason, code=CLOSE_PROTOCOL_ERROR):
+        RuntimeError.__init__(self, reason)
+        self.code = code
+
+
+class HandshakeError(ProtocolError):
+    pass
+
+
+def parse_handshake(request):
+    """
+    Parse the HTTP upgrade request, returning a dict with the lowercase
+    header names as keys.
+
+    Raises HandshakeError if the request is not a valid WebSocket
+    upgrade request.
+    """
+
+    lines = bytes(request).decode('latin-1').split('\r\n')
+
+    method, _, _ = lines[0].partition(' ')
+
+    if method != 'GET':
+        raise HandshakeError("Expected GET request")
+
+    headers = dict()
+
+    for line in lines[1:]:
+
+        if not line:
+            continue
+
+        key, sep, value = line.partition(':')
+
+        if not sep:
+            raise HandshakeError("Malformed header line")
+
+        key = key.strip().lower()
+        value = value.strip()
+
+        # repeated headers are combined as per RFC 7230
+        if key in headers:
+            headers[key] += ', ' + value
+        else:
+            headers[key] = value
+
+    if 'websocket' not in headers.get('upgrade', '').lower():
+        raise HandshakeError("Missing 'Upgrade: websocket' header")
+
+    if 'sec-websocket-key' not in headers:
+        raise HandshakeError("Missing Sec-WebSocket-Key header")
+
+    return headers
+
+
+def build_handshake_response(key, extension=None):
+    """
+    Build the '101 Switching Protocols' response for the given
+    Sec-WebSocket-Key.
+    """
+
+    accept = base64.b64encode(hashlib.sha1(key.encode() + GUID).digest())
+
+    response = bytearray()
+    response.extend(b'HTTP/1.1 101 Switching Protocols\r\n')
+    response.extend(b'Upgrade: websocket\r\n')
+    response.extend(b'Connection: Upgrade\r\n')
+    response.extend(b'Sec-WebSocket-Accept: ' + accept + b'\r\n')
+
+    if extension:
+        response.extend(b'Sec-WebSocket-Extensions: ' + extension.encode() + b'\r\n')
+
+    response.extend(b'\r\n')
+
+    return bytes(response)
+
+
+def build_error_response():
+    """
+    Build the response send when the handshake failed.
+    """
+
+    return b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n'
+
+
+def negotiate_deflate(extensions):
+    """
+    Select the first acceptable permessage-deflate offer from the
+    Sec-WebSocket-Extensions header. Returns a PerMessageDeflate object
+    or None if no acceptable offer was made.
+    """
+
+    for offer in extensions.split(','):
+
+        params = [param.strip() for param in offer.split(';')]
+
+        if params[0] != 'permessage-deflate':
+            continue
+
+        server_no_context_takeover = False
+        client_no_context_takeover = False
+        server_max_window_bits = 15
+
+        for param in params[1:]:
+
+            key, _, value = param.partition('=')
+            key = key.strip()
+            value = value.strip().strip('"')
+
+            if key == 'server_no_context_takeover':
+                server_no_context_takeover = True
+
+            elif key == 'client_no_context_takeover':
+                client_no_context_takeover = True
+
+            elif key == 'server_max_window_bits':
+                # zlib does not support raw deflate streams with a
+                # window of 8 bits, and answering with a larger window
+                # than offered fails the connection, so decline it
+                if not value.isdigit() or not 9 <= int(value) <= 15:
+                    break
+                server_max_window_bits = int(value)
+
+            elif key == 'client_max_window_bits':
+                # we can inflate any window size, so nothing to do here
+                pass
+
+            else:
+                # unknown parameter, decline this offer
+                break
+
+        else:
+            return PerMessageDeflate(
+                server_no_context_takeover,
+                client_no_context_takeover,
+                server_max_window_bits
+            )
+
+    return None
+
+
+class PerMessageDeflate:
+    """
+    State of the permessage-deflate extension for a single connection.
+
+    With context takeover (the default) the compressor and decompressor
+    are kept over multiple messages, so repeated content in subsequent
+    messages compresses to almost nothing.
+    """
+
+    def __init__(self, server_no_context_takeover=False, client_no_context_takeover=False,
+                 server_max_window_bits=15, level=6):
+        self.server_no_context_takeover = server_no_context_takeover
+        self.client_no_context_takeover = client_no_context_takeover
+        self.server_max_window_bits = server_max_window_bits
+        self.level = level
+
+        self.compressor = None
+        self.decompressor = None
+
+    def get_response(self):
+        """
+        Return the extension parameters that are send back to the client.
+        """
+
+        params = ['permessage-deflate']
+
+        if self.server_no_context_takeover:
+            params.append('server_no_context_takeover')
+
+        if self.client_no_context_takeover:
+            params.append('client_no_context_takeover')
+
+        if self.server_max_window_bits < 15:
+            params.append(f'server_max_window_bits={self.server_max_window_bits}')
+
+        return '; '.join(params)
+
+    def compress(self, message):
+        """
+        Compress a single message.
+        """
+
+        if not self.compressor or self.server_no_context_takeover:
+            self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, -self.server_max_window_bits)
+
+        data = self.compressor.compress(message) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        if data.endswith(DEFLATE_TRAILER):
+            data = data[:-4]
+
+        return data
+
+    def decompress(self, data, max_size):
+        """
+        Decompress a single message, raises ProtocolError if the
+        decompressed message exceeds max_size.
+        """
+
+        if not self.decompressor or self.client_no_context_takeover:
+            self.decompressor = zlib.decompressobj(-15)
+
+        try:
+            message = self.decompressor.decompress(data + DEFLATE_TRAILER, max_size)
+
+        except zlib.error as e:
+            raise ProtocolError(f"Invalid compressed data: {e}")
+
+        if self.decompressor.unconsumed_tail:
+            raise ProtocolError("Message too big", CLOSE_MESSAGE_TOO_BIG)
+
+        return message
+
+
+class Frame:
+
+    def __init__(self, fin, rsv1, opcode, payload):
+        self.fin = fin
+        self.rsv1 = rsv1
+        self.opcode = opcode
+        self.payload = payload
+
+    def __repr__(self):
+        return "<{cls} opcode={opcode} fin={fin} len={length}>".format(
+            cls=self.__class__.__name__,
+            opcode=self.opcode,
+            fin=self.fin,
+            length=len(self.payload),
+        )
+
+
+class FrameDecoder(BaseDecoder):
+    """
+    Decoder for frames send by the client.
+    """
+
+    def __init__(self, *args, max_frame_size=2 ** 20, **kwargs):
+        BaseDecoder.__init__(self, *args, **kwargs)
+
+        self.max_frame_size = max_frame_size
+
+    def decode_handshake(self):
+        """
+        Return the complete HTTP upgrade request, or None if it has not
+        been received completely yet.
+        """
+
+        try:
+            request = self.get_until(b'\r\n\r\n', 8192)
+
+        except IndexError:
+            raise HandshakeError("Handshake request too large")
+
+        if not request:
+            return None
+
+        self.commit()
+
+        return request
+
+    def decode(self):
+        """
+        Decode a single frame from the chunks that are currently present
+        in the chunkbuffer.
+
+        Returns None if no frame could be constructed.
+        """
+
+        header = self.get(2)
+
+        if not header:
+            return None
+
+        fin = (header[0] & 0x80) > 0
+        rsv1 = (header[0] & 0x40) > 0
+        opcode = header[0] & 0x0f
+        masked = (header[1] & 0x80) > 0
+        length = header[1] & 0x7f
+
+        if header[0] & 0x30:
+            raise ProtocolError("Unsupported reserved bits set")
+
+        if not masked:
+            raise ProtocolError("Client frames must be masked")
+
+        offset = 2
+
+        if length == 126:
+            ext = self.get(2, offset)
+            if ext is None:
+                return None
+            length = unpack_from('>H', ext)[0]
+            offset += 2
+
+        elif length == 127:
+            ext = self.get(8, offset)
+            if ext is None:
+                return None
+            length = unpack_from('>Q', ext)[0]
+            offset += 8
+
+        if length > self.max_frame_size:
+            raise ProtocolError("Frame too big", CLOSE_MESSAGE_TOO_BIG)
+
+        mask = self.get(4, offset)
+
+        if mask is None:
+            return None
+
+        offset += 4
+
+        payload = self.get(length, offset)
+
+        if payload is None:
+            return None
+
+        self.commit()
+
+        return Frame(fin, rsv1, opcode, unmask(payload, mask))
+
+
+class FrameEncoder(BaseEncoder):
+    """
+    Encoder for frames send by the server.
+    """
+
+    def encode_frame(self, opcode, payload, rsv1=False):
+        """
+        Encode a single unmasked, unfragmented frame.
+        """
+
+        self.add_encoded_chunk(build_frame(opcode, payload, rsv1))
+
+    def encode_raw(self, data):
+        """
+        Add raw bytes, used for the handshake response.
+        """
+
+        self.add_encoded_chunk(bytes(data))
+
+
+def build_frame(opcode, payload, rsv1=False):
+    """
+    Return a single unmasked, unfragmented frame as bytes.
+    """
+
+    first = 0x80 | opcode
+
+    if rsv1:
+        first |= 0x40
+
+    length = len(payload)
+
+    if length < 126:
+        header = pack('>BB', first, length)
+
+    elif length < 2 ** 16:
+        header = pack('>BBH', first, 126, length)
+
+    else:
+        header = pack('>BBQ', first, 127, length)
+
+    return header + bytes(payload)
+
+
+def unmask(payload, mask):
+    """
+    Apply the masking key to the payload.
+    """
+
+    length = len(payload)
+
+    if not length:
+        return b''
+
+    key = (bytes(mask) * (length // 4 + 1))[:length]
+
+    value = int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')
+
+    return value.to_bytes(length, 'big')
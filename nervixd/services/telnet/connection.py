@@ -1,9 +1,13 @@
+import logging
+
 from .decoder import *
 from .encoder import *
 
 from nervixd.reactor.verbs import *
 from nervixd.controller import SHUTDOWN_NOW, SHUTDOWN_SOON
 
+logger = logging.getLogger(__name__)
+
 
 class TelnetConnection:
 
@@ -25,6 +29,10 @@ class TelnetConnection:
             PingPacket: self.__handle_packet_ping,
             QuitPacket: self.__handle_packet_quit,
             HelpPacket: self.__handle_packet_help,
+            LagPacket: self.__handle_packet_lag,
+            ProfilePacket: self.__handle_packet_profile,
+            ModePacket: self.__handle_packet_mode,
+            RateLimitPacket: self.__handle_packet_rate_limit,
         }
 
         self.verb_handlers = {
@@ -51,8 +59,17 @@ class TelnetConnection:
         self.__close_connection = False
 
         # init protocol handlers
-        self.encoder = Encoder()
-        self.decoder = Decoder()
+        # scripted clients send many lines at once, they are read and
+        # answered in large chunks
+        self.encoder = Encoder(chunksize=65536)
+        self.decoder = Decoder(chunksize=65536)
+
+        # init capture
+        self.capture = None
+
+        if self.controller.capture:
+            self.capture = self.controller.capture.connection('telnet')
+            self.decoder.capture = self.capture
 
         # init channel
         self.channel = self.reactor.channel()
@@ -61,13 +78,15 @@ class TelnetConnection:
         description = f'TELNET_CLIENT_{peer_name}:{peer_port}'
         self.channel.set_description(description)
         self.channel.set_downstream_handler(self.__on_downstream)
+        self.channel.set_overload_handler(self.__on_overload)
+        self.overload_timer = None
 
         # register on controller
         self.controller.register(self, description, self.__on_shutdown)
 
         # send welcome
         self.encoder.encode(WelcomePacket(1, 1))
-        self.proxy.start_writing()
+        self.__start_writing()
 
     def __on_read(self):
         """
@@ -77,21 +96,33 @@ class TelnetConnection:
 
         n = self.decoder.read_from_socket(self.socket)
 
+        # the responses to all lines of this read are written together
+        self.encoder.start_batch()
+
         while True:
 
             try:
                 packet = self.decoder.decode()
 
             except DecodingError as e:
-                packet = None
-
                 self.__handle_invalid_request(e.args[0].encode())
 
+                # carry on with the lines after the invalid one
+                continue
+
             if not packet:
                 break
 
             self.__handle_packet(packet)
 
+            if not self.proxy.is_open():
+                return
+
+        self.encoder.flush()
+
+        if self.encoder.pending:
+            self.proxy.start_writing()
+
         if n == 0:
             # if zero bytes were read from the server, it means that
             # the client has closed the connection
@@ -108,9 +139,20 @@ class TelnetConnection:
         if n == 0:
             self.proxy.stop_writing()
 
+        self.channel.set_backlog(self.encoder.pending + self.encoder.batch_size)
+
         if self.__close_connection:
             self.__do_close_connection()
 
+    def __start_writing(self):
+        """
+        Start writing the encoded packets to the socket, unless they are
+        collected in a batch that is written once the batch is complete.
+        """
+
+        if not self.encoder.batching:
+            self.proxy.start_writing()
+
     def __on_downstream(self):
         """
         Called from the reactor when there are pending verbs to be
@@ -122,6 +164,21 @@ class TelnetConnection:
         if verb:
             self.__handle_verb(verb)
 
+        self.channel.set_backlog(self.encoder.pending + self.encoder.batch_size)
+
+    def __on_overload(self):
+        """
+        Called from the channel when the client does not keep up with
+        the verbs send to it. The connection is closed from a timer, as
+        the reactor is still busy with the channel at this point.
+        """
+
+        logger.warning("Disconnecting %s, it does not keep up", self.channel.description)
+
+        self.overload_timer = self.mainloop.timer()
+        self.overload_timer.set_handler(self.__do_close_connection)
+        self.overload_timer.set(0)
+
     def __handle_packet(self, packet):
         """
         Called when we have decoded an incoming packet from the client.
@@ -159,7 +216,7 @@ class TelnetConnection:
 
         if action == SHUTDOWN_SOON:
             self.encoder.encode(ByeByePacket())
-            self.proxy.start_writing()
+            self.__start_writing()
 
         if action == SHUTDOWN_NOW:
             self.__do_close_connection()
@@ -175,6 +232,12 @@ class TelnetConnection:
         # close proxy
         self.proxy.unregister()
 
+        if self.overload_timer:
+            self.overload_timer.cancel()
+
+        if self.capture:
+            self.capture.close()
+
         # close socket
         self.socket.close()
 
@@ -190,7 +253,7 @@ class TelnetConnection:
         """
 
         self.encoder.encode(InvalidRequestPacket(reason))
-        self.proxy.start_writing()
+        self.__start_writing()
 
     def __handle_packet_login(self, packet):
         """
@@ -201,7 +264,9 @@ class TelnetConnection:
             name=packet.name,
             enforce=packet.enforce,
             standby=packet.standby,
-            persist=packet.persist
+            persist=packet.persist,
+            shared=packet.shared,
+            weight=packet.weight
         ))
 
     def __handle_packet_logout(self, packet):
@@ -266,7 +331,7 @@ class TelnetConnection:
             packet.payload
         ))
 
-        self.proxy.start_writing()
+        self.__start_writing()
 
     def __handle_packet_quit(self, packet):
         """
@@ -284,7 +349,106 @@ class TelnetConnection:
             packet.topic
         ))
 
-        self.proxy.start_writing()
+        self.__start_writing()
+
+    def __handle_packet_lag(self, packet):
+        """
+        Handle a LAG packet.
+        """
+
+        monitor = self.mainloop.monitor
+
+        if not monitor:
+            self.__handle_invalid_request(b'Loop monitor is disabled')
+            return
+
+        self.encoder.encode(LagStatsPacket(b'TIMERS', monitor.lag))
+        self.encoder.encode(LagStatsPacket(b'HANDLERS', monitor.handler_time, monitor.nr_slow))
+
+        if packet.reset:
+            monitor.reset()
+
+        self.__start_writing()
+
+    def __handle_packet_profile(self, packet):
+        """
+        Handle a PROFILE packet.
+        """
+
+        profiler = self.controller.profiler
+
+        # profiling writes files on the server, like the other admin
+        # commands it is only allowed when enabled
+        if not self.controller.admin_commands:
+            self.__handle_invalid_request(b'Admin commands are disabled')
+            return
+
+        if not profiler:
+            self.__handle_invalid_request(b'Profiling is disabled')
+            return
+
+        if packet.stop:
+            path = profiler.stop()
+
+            if not path:
+                self.__handle_invalid_request(b'Profiler is not running')
+                return
+
+            self.encoder.encode(ProfilingPacket(b'STOPPED', path))
+
+        else:
+            path = profiler.start(packet.duration, packet.mode)
+
+            if not path:
+                self.__handle_invalid_request(b'Profiler is already running')
+                return
+
+            self.encoder.encode(ProfilingPacket(b'STARTED', path))
+
+        self.__start_writing()
+
+    def __handle_packet_mode(self, packet):
+        """
+        Handle a MODE packet.
+        """
+
+        self.encoder.compact = packet.machine
+
+        self.encoder.encode(ModeChangedPacket(b'MACHINE' if packet.machine else b'HUMAN'))
+
+        self.__start_writing()
+
+    def __handle_packet_rate_limit(self, packet):
+        """
+        Handle a RATELIMIT packet.
+        """
+
+        limiter = self.reactor.rate_limiter
+
+        if packet.target:
+
+            if not self.controller.admin_commands:
+                self.__handle_invalid_request(b'Admin commands are disabled')
+                return
+
+            try:
+                if packet.target == b'CHANNEL':
+                    limiter.set_channel_limit(packet.rate, packet.burst)
+
+                else:
+                    limiter.set_name_limit(packet.name, packet.rate, packet.burst)
+
+            except ValueError as e:
+                self.__handle_invalid_request(str(e).encode())
+                return
+
+        self.encoder.encode(RateLimitStatsPacket(b'CHANNEL', None, limiter.channel_limit))
+        self.encoder.encode(RateLimitStatsPacket(b'DEFAULT', None, limiter.default_name_limit))
+
+        for name, limit in sorted(limiter.name_limits.items()):
+            self.encoder.encode(RateLimitStatsPacket(b'NAME', name, limit))
+
+        self.__start_writing()
 
     def __handle_session_verb(self, verb):
         """
@@ -306,7 +470,7 @@ class TelnetConnection:
             state=packet_state,
         ))
 
-        self.proxy.start_writing()
+        self.__start_writing()
 
     def __handle_call_verb(self, verb):
         """
@@ -320,7 +484,7 @@ class TelnetConnection:
             payload=verb.payload
         ))
 
-        self.proxy.start_writing()
+        self.__start_writing()
 
     def __handle_message_verb(self, verb):
         """
@@ -333,7 +497,7 @@ class TelnetConnection:
             payload=verb.payload
         ))
 
-        self.proxy.start_writing()
+        self.__start_writing()
 
     def __handle_interest_verb(self, verb):
         """
@@ -347,4 +511,4 @@ class TelnetConnection:
             topic=verb.topic,
         ))
 
-        self.proxy.start_writing()
+        self.__start_writing()
@@ -1,3 +1,4 @@
+import re
 
 from nervixd.util.decoder import BaseDecoder
 
@@ -17,8 +18,15 @@ class Decoder(BaseDecoder):
             b'UNSUBSCRIBE': UnsubscribePacket,
             b'QUIT': QuitPacket,
             b'HELP': HelpPacket,
+            b'LAG': LagPacket,
+            b'PROFILE': ProfilePacket,
+            b'MODE': ModePacket,
+            b'RATELIMIT': RateLimitPacket,
         }
 
+        # set after a line that is too long, until its end is skipped
+        self.discarding = False
+
     def decode(self):
         """
         Decode a single packet from the chunks that are currently
@@ -27,54 +35,61 @@ class Decoder(BaseDecoder):
         Returns None if no packet could be constructed.
         """
 
-        line = self.get_until(b'\r\n', 1024)
+        while True:
+
+            if self.discarding:
+                if not self.skip_until(b'\r\n'):
+                    return None
 
-        if not line:
-            return
+                self.discarding = False
 
-        self.commit()
+            try:
+                line = self.get_until(b'\r\n', 1024)
 
-        # parse command from line
-        pos = 0
-        length = len(line)
+            except IndexError:
+                self.discarding = True
+                raise DecodingError('Line too long')
 
-        cmd = bytearray()
-        while pos < length:
+            if not line:
+                return None
 
-            c = line[pos]
+            self.commit()
 
-            if c in b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ':
-                cmd.append(c)
+            # the command is the word up to the first space, empty lines
+            # and lines starting with a space are skipped
+            cmd, _, line_args = bytes(line[:-2]).partition(b' ')
 
-            elif c in b'\r\n ':
+            if cmd:
                 break
 
-            else:
-                raise DecodingError("Unexpected character '{}' while parsing command".format(c))
+        handler = self.handler_map.get(cmd.upper(), None)
 
-            pos += 1
+        if not handler:
+            invalid = INVALID_COMMAND_CHARACTER.search(cmd)
 
-        if not cmd:
-            return
+            if invalid:
+                raise DecodingError("Unexpected character '{}' while parsing command".format(
+                    invalid.group().decode(errors='replace')))
 
-        cmd = cmd.upper()
+            raise DecodingError("Unknown command '{}'".format(cmd.decode()))
 
-        line = line[:-2]
-        line_args = line[pos:]
+        return handler(line_args)
 
-        # command is parsed, now find and execute the correct handler
-        handler = self.handler_map.get(bytes(cmd), None)
 
-        if not handler:
-            raise DecodingError("Unknown command '{}'".format(bytes(cmd).decode()))
+class DecodingError(RuntimeError):
+    pass
 
-        packet = handler(line_args)
 
-        return packet
+INVALID_COMMAND_CHARACTER = re.compile(rb'[^A-Za-z]')
 
+# the fields as they are read by BasePacket, each followed by a space or
+# the end of the line, and preceded by any number of spaces
+SPACES = re.compile(rb' *')
+STRING_FIELD = re.compile(rb' *([0-9A-Za-z_\-]+)(?: |\Z)')
+INTEGER_FIELD = re.compile(rb' *([0-9]+)(?: |\Z)')
 
-class DecodingError(RuntimeError):
-    pass
+# a rate limit as given to the RATELIMIT command
+RATE_LIMIT = re.compile(rb'([0-9]+(?:\.[0-9]+)?)(?::([0-9]+(?:\.[0-9]+)?))?\Z')
 
 
 class BasePacket:
@@ -86,15 +101,7 @@ class BasePacket:
         self.length = len(line)
 
     def skip_spaces(self):
-
-        while self.nextbyte < self.length:
-
-            c = self.line[self.nextbyte]
-
-            if c != ord(b' '):
-                break
-
-            self.nextbyte += 1
+        self.nextbyte = SPACES.match(self.line, self.nextbyte).end()
 
     def read_remaining(self):
 
@@ -104,73 +111,39 @@ class BasePacket:
             return None
 
         data = self.line[self.nextbyte:]
-        self.nextbyte += len(data)
+        self.nextbyte = self.length
 
         return bytes(data)
 
     def read_string(self):
+        """
+        Read a word of 0-9, A-Z, a-z, - and _ characters. Returns None,
+        without moving on, if there is no such word.
+        """
 
-        self.skip_spaces()
+        match = STRING_FIELD.match(self.line, self.nextbyte)
 
-        if self.nextbyte == self.length:
+        if not match:
             return None
 
-        startbyte = self.nextbyte
-
-        data = bytearray()
-
-        while self.nextbyte < self.length:
-
-            c = self.line[self.nextbyte]
-
-            # test for 0-9, A-Z, a-z, -, _
-            if 48 <= c <= 57 or 65 <= c <= 90 or 97 <= c <= 122 or c == ord('-') or c == ord('_'):
-                data.append(c)
-                self.nextbyte += 1
-
-            elif c == ord(' '):
-                self.nextbyte += 1
-                break
-
-            else:
-                self.nextbyte = startbyte
-                return None
+        self.nextbyte = match.end()
 
-        return bytes(data)
+        return match.group(1)
 
     def read_positive_integer(self):
+        """
+        Read a number. Returns None, without moving on, if there is no
+        number.
+        """
 
-        self.skip_spaces()
+        match = INTEGER_FIELD.match(self.line, self.nextbyte)
 
-        if self.nextbyte == self.length:
+        if not match:
             return None
 
-        startbyte = self.nextbyte
-
-        number = 0
+        self.nextbyte = match.end()
 
-        while self.nextbyte < self.length:
-
-            c = self.line[self.nextbyte]
-
-            # test for 0-9
-            if 48 <= c <= 57:
-                self.nextbyte += 1
-
-                digit = c - 48
-
-                number *= 10
-                number += digit
-
-            elif c == ord(' '):
-                self.nextbyte += 1
-                break
-
-            else:
-                self.nextbyte = startbyte
-                return None
-
-        return number
+        return int(match.group(1))
 
 
 class PingPacket(BasePacket):
@@ -186,7 +159,7 @@ class PingPacket(BasePacket):
 
 class LoginPacket(BasePacket):
     """
-    LOGIN name [ENFORCE] [STANDBY] [PERSIST]
+    LOGIN name [ENFORCE] [STANDBY] [PERSIST] [SHARED] [WEIGHT n]
     """
 
     def __init__(self, args):
@@ -198,17 +171,29 @@ class LoginPacket(BasePacket):
             raise DecodingError('Missing name field ')
 
         flags = set()
+        self.weight = 1
+
         while True:
             flag = self.read_string()
             if not flag:
                 break
 
             flag = flag.upper()
+
+            if flag == b'WEIGHT':
+                self.weight = self.read_positive_integer()
+
+                if self.weight is None or not 1 <= self.weight <= 255:
+                    raise DecodingError('Weight must be a number between 1 and 255')
+
+                continue
+
             flags.add(flag)
 
         self.enforce = b'ENFORCE' in flags
         self.standby = b'STANDBY' in flags
         self.persist = b'PERSIST' in flags
+        self.shared = b'SHARED' in flags
 
 
 class LogoutPacket(BasePacket):
@@ -339,3 +324,123 @@ class HelpPacket(BasePacket):
         BasePacket.__init__(self, args)
 
         self.topic = self.read_string()
+
+
+class LagPacket(BasePacket):
+    """
+    LAG [RESET]
+    """
+
+    def __init__(self, args):
+        BasePacket.__init__(self, args)
+
+        self.reset = False
+
+        word = self.read_string()
+
+        if word:
+            if word.upper() != b'RESET':
+                raise DecodingError('Unexpected argument: {}'.format(word))
+
+            self.reset = True
+
+
+class ProfilePacket(BasePacket):
+    """
+    PROFILE [seconds] [CPROFILE|SAMPLE]
+    PROFILE STOP
+    """
+
+    def __init__(self, args):
+        BasePacket.__init__(self, args)
+
+        self.stop = False
+        self.mode = None
+
+        self.duration = self.read_positive_integer()
+
+        if self.duration == 0:
+            raise DecodingError('Duration must be at least one second')
+
+        word = self.read_string()
+
+        if word:
+            word = word.upper()
+
+            if word == b'STOP' and self.duration is None:
+                self.stop = True
+
+            elif word in (b'CPROFILE', b'SAMPLE'):
+                self.mode = word.decode().lower()
+
+            else:
+                raise DecodingError('Unexpected argument: {}'.format(word))
+
+        remaining = self.read_remaining()
+
+        if remaining:
+            raise DecodingError('Unexpected arguments: {}'.format(remaining))
+
+
+class ModePacket(BasePacket):
+    """
+    MODE HUMAN|MACHINE
+    """
+
+    def __init__(self, args):
+        BasePacket.__init__(self, args)
+
+        word = self.read_string()
+
+        if not word or word.upper() not in (b'HUMAN', b'MACHINE'):
+            raise DecodingError('Mode must be HUMAN or MACHINE')
+
+        self.machine = word.upper() == b'MACHINE'
+
+
+class RateLimitPacket(BasePacket):
+    """
+    RATELIMIT
+    RATELIMIT CHANNEL|DEFAULT rate[:burst]|OFF
+    RATELIMIT NAME name rate[:burst]|OFF
+    """
+
+    def __init__(self, args):
+        BasePacket.__init__(self, args)
+
+        self.target = None
+        self.name = None
+        self.rate = None
+        self.burst = None
+
+        word = self.read_string()
+
+        if not word:
+            return
+
+        self.target = word.upper()
+
+        if self.target not in (b'CHANNEL', b'DEFAULT', b'NAME'):
+            raise DecodingError('Unexpected argument: {}'.format(word))
+
+        if self.target == b'NAME':
+            self.name = self.read_string()
+
+            if not self.name:
+                raise DecodingError('Missing name')
+
+        limit = self.read_remaining()
+
+        if not limit:
+            raise DecodingError('Missing rate limit')
+
+        if limit.upper() == b'OFF':
+            return
+
+        match = RATE_LIMIT.match(limit)
+
+        if not match:
+            raise DecodingError('Rate limit must be rate[:burst] or OFF')
+
+        self.rate = float(match.group(1))
+        self.burst = float(match.group(2)) if match.group(2) else None
@@ -3,15 +3,77 @@ from nervixd.util.encoder import BaseEncoder
 
 class Encoder(BaseEncoder):
 
+    def __init__(self, *args, **kwargs):
+        BaseEncoder.__init__(self, *args, **kwargs)
+
+        # set when packets are encoded in the compact machine format
+        self.compact = False
+
+        # set while packets are collected in the batch until the next
+        # flush, they are then added to the chunkbuffer as one chunk
+        self.batching = False
+        self.batch = []
+        self.batch_size = 0
+
     def encode(self, packet):
         """
         Encode a packet object and append it to the internal
         chunkbuffer.
         """
 
-        chunk = packet.get_chunk()
+        if self.compact:
+            chunk = packet.get_compact_chunk()
+        else:
+            chunk = packet.get_chunk()
+
+        if self.batching:
+            self.batch.append(chunk)
+            self.batch_size += len(chunk)
+
+        else:
+            self.add_encoded_chunk(chunk)
+
+    def start_batch(self):
+        """
+        Collect the packets that are encoded from now on in the batch,
+        until the next flush.
+        """
 
-        self.add_encoded_chunk(chunk)
+        self.batching = True
+
+    def flush(self):
+        """
+        Move the packets that are collected in the batch to the
+        chunkbuffer, and stop collecting them.
+        """
+
+        self.batching = False
+
+        if not self.batch:
+            return
+
+        self.add_encoded_chunk(b''.join(self.batch))
+
+        self.batch = []
+        self.batch_size = 0
+
+    def fetch_chunk(self, chunksize=None):
+        """
+        Flushes the batch before fetching a chunk of bytes.
+        """
+
+        self.flush()
+
+        return BaseEncoder.fetch_chunk(self, chunksize)
+
+    def pop_pending(self):
+        """
+        Flushes the batch before popping all pending bytes.
+        """
+
+        self.flush()
+
+        return BaseEncoder.pop_pending(self)
 
 
 class BasePacket:
@@ -41,6 +103,15 @@ class BasePacket:
 
         return bytes(chunk)
 
+    def get_compact_chunk(self):
+        """
+        Return a bytes object which contains the data encoded in the
+        compact machine format. Packets that have no compact form are
+        encoded as usual.
+        """
+
+        return self.get_chunk()
+
     def set_type(self, packettype):
         """
         Set the packet type.
@@ -69,86 +140,128 @@ class BasePacket:
 
 
 class SessionPacket(BasePacket):
+    """
+    SESSION name ENDED|STANDBY|ACTIVE
+    S name 0|1|2
+    """
+
     STATE_ENDED = 0
     STATE_STANDBY = 1
     STATE_ACTIVE = 2
 
     def __init__(self, name, state):
-        BasePacket.__init__(self)
-
-        self.set_type(B'SESSION')
+        self.name = name
+        self.state = state
 
-        self.add_string(name)
+    def get_chunk(self):
+        return b'SESSION %s %s\r\n' % (self.name, [b'ENDED', b'STANDBY', b'ACTIVE'][self.state])
 
-        state_str = [b'ENDED', b'STANDBY', b'ACTIVE'][state]
-        self.add_string(state_str)
+    def get_compact_chunk(self):
+        return b'S %s %d\r\n' % (self.name, self.state)
 
 
 class CallPacket(BasePacket):
+    """
+    CALL postref|UNI name payload
+    C postref|0 name payload
+    """
 
     def __init__(self, unidirectional, postref, name, payload):
-        BasePacket.__init__(self)
-
-        self.set_type(b'CALL')
+        self.unidirectional = unidirectional
+        self.postref = postref
+        self.name = name
+        self.payload = payload
 
-        if unidirectional:
-            self.add_string(b'UNI')
+    def get_chunk(self):
+        if self.unidirectional:
+            return b'CALL UNI %s %s\r\n' % (self.name, self.payload)
 
-        else:
-            self.add_integer(postref)
+        return b'CALL %d %s %s\r\n' % (self.postref, self.name, self.payload)
 
-        self.add_string(name)
+    def get_compact_chunk(self):
+        postref = 0 if self.unidirectional else self.postref
 
-        self.add_string(payload)
+        return b'C %d %s %s\r\n' % (postref, self.name, self.payload)
 
 
 class MessagePacket(BasePacket):
+    """
+    MESSAGE messageref OK payload
+    MESSAGE messageref TIMEOUT|UNREACHABLE|OVERLOADED|RATE_LIMITED
+    M messageref 0 payload
+    M messageref 1|2|3|4
+    """
+
     STATUS_OK = 0
     STATUS_TIMEOUT = 1
     STATUS_UNREACHABLE = 2
+    STATUS_OVERLOADED = 3
+    STATUS_RATE_LIMITED = 4
 
     def __init__(self, messageref, status, payload):
-        BasePacket.__init__(self)
+        self.messageref = messageref
+        self.status = status
+        self.payload = payload
+
+    def get_chunk(self):
+        if self.status == MessagePacket.STATUS_OK:
+            return b'MESSAGE %d OK %s\r\n' % (self.messageref, self.payload)
 
-        self.set_type(b'MESSAGE')
+        status_str = [b'OK', b'TIMEOUT', b'UNREACHABLE', b'OVERLOADED', b'RATE_LIMITED'][self.status]
 
-        self.add_integer(messageref)
+        return b'MESSAGE %d %s\r\n' % (self.messageref, status_str)
 
-        status_str = [b'OK', b'TIMEOUT', b'UNREACHABLE'][status]
-        self.add_string(status_str)
+    def get_compact_chunk(self):
+        if self.status == MessagePacket.STATUS_OK:
+            return b'M %d 0 %s\r\n' % (self.messageref, self.payload)
 
-        if status == MessagePacket.STATUS_OK:
-            self.add_string(payload)
+        return b'M %d %d\r\n' % (self.messageref, self.status)
 
 
 class InterestPacket(BasePacket):
+    """
+    INTEREST postref NO_INTEREST|INTEREST name topic
+    I postref 0|1 name topic
+    """
+
     STATUS_NO_INTEREST = 0
     STATUS_INTEREST = 1
 
     def __init__(self, postref, status, name, topic):
-        BasePacket.__init__(self)
+        self.postref = postref
+        self.status = status
+        self.name = name
+        self.topic = topic
 
-        self.set_type(b'INTEREST')
-
-        self.add_integer(postref)
-
-        interest_str = [b'NO_INTEREST', b'INTEREST'][status]
-        self.add_string(interest_str)
+    def get_chunk(self):
+        interest_str = [b'NO_INTEREST', b'INTEREST'][self.status]
 
-        self.add_string(name)
+        return b'INTEREST %d %s %s %s\r\n' % (self.postref, interest_str, self.name, self.topic)
 
-        self.add_string(topic)
+    def get_compact_chunk(self):
+        return b'I %d %d %s %s\r\n' % (self.postref, self.status, self.name, self.topic)
 
 
 class PongPacket(BasePacket):
+    """
+    PONG [payload]
+    P [payload]
+    """
 
     def __init__(self, payload):
-        BasePacket.__init__(self)
+        self.payload = payload
 
-        self.set_type(b'PONG')
+    def get_chunk(self):
+        if self.payload:
+            return b'PONG %s\r\n' % self.payload
 
-        if payload:
-            self.add_string(payload)
+        return b'PONG\r\n'
+
+    def get_compact_chunk(self):
+        if self.payload:
+            return b'P %s\r\n' % self.payload
+
+        return b'P\r\n'
 
 
 class WelcomePacket(BasePacket):
@@ -186,11 +299,94 @@ class InfoPacket(BasePacket):
 
 
 class InvalidRequestPacket(BasePacket):
+    """
+    ERROR [reason]
+    E [reason]
+    """
 
     def __init__(self, reason):
+        self.reason = reason
+
+    def get_chunk(self):
+        if self.reason:
+            return b'ERROR %s\r\n' % self.reason
+
+        return b'ERROR\r\n'
+
+    def get_compact_chunk(self):
+        if self.reason:
+            return b'E %s\r\n' % self.reason
+
+        return b'E\r\n'
+
+
+class LagStatsPacket(BasePacket):
+    """
+    Summary and buckets of a histogram of the loop monitor, all times in
+    milliseconds.
+    """
+
+    def __init__(self, kind, histogram, nr_slow=None):
+        BasePacket.__init__(self)
+
+        self.set_type(b'LAG')
+
+        self.add_string(kind)
+
+        self.add_string(b'count=%d' % histogram.count)
+
+        if nr_slow is not None:
+            self.add_string(b'slow=%d' % nr_slow)
+
+        self.add_string(b'mean=%.3f' % (histogram.mean() * 1000.0))
+        self.add_string(b'p50=%.3f' % (histogram.percentile(50) * 1000.0))
+        self.add_string(b'p99=%.3f' % (histogram.percentile(99) * 1000.0))
+        self.add_string(b'max=%.3f' % (histogram.max * 1000.0))
+
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            self.add_string(b'le_%gms=%d' % (bound * 1000.0, count))
+
+        self.add_string(b'gt_%gms=%d' % (histogram.bounds[-1] * 1000.0, histogram.counts[-1]))
+
+
+class ProfilingPacket(BasePacket):
+
+    def __init__(self, state, path):
+        BasePacket.__init__(self)
+
+        self.set_type(b'PROFILING')
+
+        self.add_string(state)
+
+        self.add_string(path.encode())
+
+
+class ModeChangedPacket(BasePacket):
+
+    def __init__(self, mode):
         BasePacket.__init__(self)
 
-        self.set_type(b'ERROR')
+        self.set_type(b'MODE')
+
+        self.add_string(mode)
+
+
+class RateLimitStatsPacket(BasePacket):
+
+    def __init__(self, target, name, limit):
+        BasePacket.__init__(self)
 
-        if reason:
-            self.add_string(reason)
+        self.set_type(b'RATELIMIT')
+
+        self.add_string(target)
+
+        if name:
+            self.add_string(name)
+
+        if limit:
+            rate, burst = limit
+            self.add_string(b'rate=%g' % rate)
+            self.add_string(b'burst=%g' % burst)
+
+        else:
+            self.add_string(b'OFF')
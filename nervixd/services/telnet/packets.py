@@ -47,6 +47,8 @@ class LoginPacket(BasePacket):
         self.enforce = None
         self.standby = None
         self.persist = None
+        self.shared = None
+        self.weight = None
 
 
 class LogoutPacket(BasePacket):
@@ -97,6 +99,8 @@ class MessagePacket(BasePacket):
     REASON_NONE = 0
     REASON_TIMEOUT = 1
     REASON_UNREACHABLE = 2
+    REASON_OVERLOADED = 3
+    REASON_RATE_LIMITED = 4
 
     def __init__(self):
         self.messageref = None
@@ -0,0 +1,219 @@
+import logging
+
+from nervixd.util.decoder import BaseDecoder
+from nervixd.util.encoder import BaseEncoder
+
+from .tracer import TraceFilter, VERB_TYPES
+
+logger = logging.getLogger(__name__)
+
+FILTER_KEYWORDS = {
+    b'NAME': 'names',
+    b'CHANNEL': 'channels',
+    b'VERB': 'verbs',
+}
+
+
+class TraceConnection:
+    """
+    A client of the trace service.
+
+    It understands the following commands, one per line:
+
+        TRACE [NAME name] [CHANNEL text] [VERB type] ...
+        STOP
+        QUIT
+
+    TRACE starts the trace, or replaces the filter of a running one.
+    Each keyword may be given more than once, see TraceFilter. STOP
+    ends the trace. Commands are answered with OK or ERROR and a
+    reason.
+
+    Events are dropped while more than max_buffer bytes wait to be
+    written to the client, so a slow client does not make the server
+    buffer an ever growing trace. The number of dropped events is
+    reported once the client caught up.
+    """
+
+    max_buffer = 2 ** 20
+
+    def __init__(self, controller, mainloop, service, client_sock):
+        self.controller = controller
+        self.mainloop = mainloop
+        self.service = service
+        self.socket = client_sock
+
+        self.command_handlers = {
+            b'TRACE': self.__handle_command_trace,
+            b'STOP': self.__handle_command_stop,
+            b'QUIT': self.__handle_command_quit,
+        }
+
+        self.__start()
+
+    def __start(self):
+        """
+        Start handling the connection.
+        """
+
+        # init socket
+        self.socket.setblocking(False)
+
+        self.proxy = self.mainloop.register(self.socket)
+        self.proxy.set_read_handler(self.__on_read)
+        self.proxy.set_write_handler(self.__on_write)
+        self.proxy.set_interest(read=True)
+
+        self.encoder = BaseEncoder(chunksize=65536)
+        self.decoder = BaseDecoder()
+
+        # set by the TRACE command, and the ids of the channels that
+        # were announced to this client
+        self.filter = None
+        self.announced = set()
+
+        self.nr_dropped = 0
+        self.closed = False
+
+        peer_name, peer_port = self.socket.getpeername()
+        self.description = f'TRACE_CLIENT_{peer_name}:{peer_port}'
+
+        # register on controller
+        self.controller.register(self, self.description, self.__on_shutdown)
+
+    def send(self, line):
+        """
+        Send a line to the client, unless too much is waiting already.
+        """
+
+        if self.encoder.pending > self.max_buffer:
+            self.nr_dropped += 1
+            return
+
+        self.encoder.add_encoded_chunk(line)
+        self.proxy.start_writing()
+
+    def __on_read(self):
+        """
+        Called from the mainloop when there is data from the socket to
+        be read.
+        """
+
+        n = self.decoder.read_from_socket(self.socket)
+
+        while not self.closed:
+
+            try:
+                line = self.decoder.get_until(b'\n', 1024)
+
+            except IndexError:
+                logger.warning("Disconnecting %s, it sent a line that is too long", self.description)
+                self.__do_close_connection()
+                return
+
+            if not line:
+                break
+
+            self.decoder.commit()
+
+            self.__handle_command(bytes(line).split())
+
+        if n == 0 and not self.closed:
+            self.__do_close_connection()
+
+    def __on_write(self):
+        """
+        Called from the mainloop when we should write data to the socket.
+        """
+
+        n = self.encoder.write_to_socket(self.socket)
+
+        if n == 0:
+            self.proxy.stop_writing()
+
+        # report what was dropped once everything else was written
+        if not self.encoder.pending and self.nr_dropped:
+            self.encoder.add_encoded_chunk(b'DROPPED %d\n' % self.nr_dropped)
+            self.nr_dropped = 0
+            self.proxy.start_writing()
+
+    def __handle_command(self, args):
+        if not args:
+            return
+
+        handler = self.command_handlers.get(args[0].upper(), None)
+
+        if not handler:
+            self.__reply(b'ERROR Unknown command, use TRACE, STOP or QUIT')
+            return
+
+        handler(args[1:])
+
+    def __handle_command_trace(self, args):
+        if len(args) % 2:
+            self.__reply(b'ERROR Expected a value after ' + args[-1])
+            return
+
+        filters = dict(names=[], channels=[], verbs=[])
+
+        for keyword, value in zip(args[0::2], args[1::2]):
+            key = FILTER_KEYWORDS.get(keyword.upper(), None)
+
+            if not key:
+                self.__reply(b'ERROR Unknown keyword ' + keyword + b', use NAME, CHANNEL or VERB')
+                return
+
+            if key == 'verbs':
+                value = value.decode(errors='replace').upper()
+
+                if value not in VERB_TYPES.values():
+                    self.__reply(b'ERROR Unknown verb type ' + value.encode())
+                    return
+
+            if key == 'channels':
+                value = value.decode(errors='replace')
+
+            filters[key].append(value)
+
+        self.filter = TraceFilter(**filters)
+        self.service.subscribe(self)
+
+        self.__reply(b'OK')
+
+    def __handle_command_stop(self, args):
+        self.service.unsubscribe(self)
+        self.filter = None
+        self.announced.clear()
+
+        self.__reply(b'OK')
+
+    def __handle_command_quit(self, args):
+        self.__do_close_connection()
+
+    def __reply(self, line):
+        self.encoder.add_encoded_chunk(line + b'\n')
+        self.proxy.start_writing()
+
+    def __on_shutdown(self, action):
+        """ Called form the controller when the connection should be shut down. The action parameter indicates
+        if the connection should be closed immediatly (SHUTDOWN_NOW) or soon (SHUTDOWN_SOON).
+        """
+
+        self.__do_close_connection()
+
+    def __do_close_connection(self):
+        """
+        Stop tracing and close the connection.
+        """
+
+        if self.closed:
+            return
+
+        self.closed = True
+
+        self.service.unsubscribe(self)
+
+        self.proxy.unregister()
+        self.socket.close()
+
+        self.controller.unregister(self)
@@ -0,0 +1,105 @@
+import socket
+
+from .connection import TraceConnection
+from .tracer import TraceTracer
+
+
+class TraceService:
+    """
+    The TraceService class.
+
+    Lets operators follow the traffic of the reactor live. Clients of
+    the service send a TRACE command with a filter, after which they
+    receive a line for every event that matches it, see TraceFilter and
+    encode_event().
+
+    While there are subscribers a TraceTracer is put in front of the
+    tracer of the reactor, when the last one leaves the original tracer
+    is put back.
+    """
+
+    def __init__(self, controller, mainloop, reactor, tracer, address):
+        self.controller = controller
+        self.mainloop = mainloop
+        self.reactor = reactor
+        self.tracer = tracer
+        self.address = address
+
+        # connections that have a filter set, in the order they did
+        self.subscribers = []
+
+        # number of payload bytes shown per verb
+        self.max_payload = 32
+
+        self.trace_tracer = None
+
+        self.__start()
+
+    def __start(self):
+        """
+        Start serving.
+        """
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setblocking(False)
+
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+        self.socket.listen()
+
+        self.proxy = self.mainloop.register(self.socket)
+        self.proxy.set_read_handler(self.__on_connect)
+        self.proxy.set_interest(read=True)
+
+        # let the controller know that a new service is running
+        description = f'TRACE_SERVICE_{self.address[0]}:{self.address[1]}'
+        self.controller.register(self, description, self.__on_shutdown)
+
+    def subscribe(self, connection):
+        """
+        Start sending events to the connection.
+        """
+
+        if connection in self.subscribers:
+            return
+
+        self.subscribers.append(connection)
+
+        if not self.trace_tracer:
+            self.trace_tracer = TraceTracer(self.reactor.tracer, self)
+            self.reactor.tracer = self.trace_tracer
+
+    def unsubscribe(self, connection):
+        """
+        Stop sending events to the connection.
+        """
+
+        if connection not in self.subscribers:
+            return
+
+        self.subscribers.remove(connection)
+
+        if not self.subscribers:
+            self.reactor.tracer = self.trace_tracer.tracer
+            self.trace_tracer = None
+
+    def __on_connect(self):
+        """
+        Called from the mainloop when a new connection is ready to be
+        accepted.
+        """
+
+        client_sock, address = self.socket.accept()
+
+        TraceConnection(self.controller, self.mainloop, self, client_sock)
+
+    def __on_shutdown(self, action):
+        """ Called from controller when the service should shut down. The action parameter
+        indicates weather the service should shutdown immediatly (SHUTDOWN_NOW) or
+        soon (SHUTDOWN_SOON).
+        """
+
+        self.proxy.unregister()
+        self.socket.close()
+
+        self.controller.unregister(self)
@@ -0,0 +1,212 @@
+import re
+import time
+
+from nervixd.reactor.verbs import *
+
+# the fields of each verb that are shown in a trace, in this order
+VERB_FIELDS = {
+    LoginVerb: ('name', 'enforce', 'standby', 'persist', 'shared', 'weight'),
+    LogoutVerb: ('name',),
+    SessionVerb: ('name', 'state'),
+    RequestVerb: ('name', 'unidirectional', 'messageref', 'timeout', 'payload'),
+    CallVerb: ('name', 'unidirectional', 'postref', 'payload'),
+    PostVerb: ('postref', 'payload'),
+    MessageVerb: ('messageref', 'status', 'reason', 'payload'),
+    SubscribeVerb: ('name', 'messageref', 'topic'),
+    InterestVerb: ('name', 'postref', 'status', 'topic'),
+    UnsubscribeVerb: ('name', 'topic'),
+}
+
+# the verb types as they are named in filters and traces
+VERB_TYPES = {cls: cls.__name__[:-len('Verb')].upper() for cls in VERB_FIELDS}
+
+# bytes that are escaped in the values of traces, and in the text at the
+# end of a trace, which may contain spaces
+UNSAFE_BYTES = re.compile(rb'[^\x21-\x5b\x5d-\x7e]')
+UNSAFE_TEXT_BYTES = re.compile(rb'[^\x20-\x5b\x5d-\x7e]')
+
+# event markers
+EVENT_OPEN = b'+'
+EVENT_CLOSE = b'-'
+EVENT_UPSTREAM = b'>'
+EVENT_DOWNSTREAM = b'<'
+EVENT_ERROR = b'!'
+
+
+class TraceFilter:
+    """
+    Selects the events a subscriber of the trace service receives.
+
+    Events pass when they match one of the names, one of the channels
+    and one of the verb types, an empty set matches everything. A
+    channel matches when the text is part of its description. Only
+    verbs that carry a name can match a name, so MESSAGE and POST verbs
+    are left out when filtering by name.
+    """
+
+    def __init__(self, names=(), channels=(), verbs=()):
+        self.names = set(names)
+        self.channels = set(channels)
+        self.verbs = set(verbs)
+
+    def match(self, channel, verb=None):
+        if self.channels and not any(text in channel.description for text in self.channels):
+            return False
+
+        if verb is None:
+            return not self.names and not self.verbs
+
+        if self.verbs and VERB_TYPES.get(verb.__class__, None) not in self.verbs:
+            return False
+
+        if self.names and getattr(verb, 'name', None) not in self.names:
+            return False
+
+        return True
+
+
+class TraceTracer:
+    """
+    Tracer that passes the events of the reactor on to the subscribers
+    of a trace service, besides passing them to the tracer it replaces.
+
+    It is only installed on the reactor while there are subscribers,
+    otherwise the reactor keeps calling its own tracer directly and
+    tracing costs nothing.
+    """
+
+    def __init__(self, tracer, service):
+        self.tracer = tracer
+        self.service = service
+
+        # short numbers for the channels seen in this trace
+        self.channel_ids = dict()
+        self.next_channel_id = 1
+
+    def __getattr__(self, attr):
+        # hooks that are not traced go straight to the replaced tracer
+        return getattr(self.tracer, attr)
+
+    def channel_closed(self, channel):
+        self.tracer.channel_closed(channel)
+
+        channel_id = self.channel_ids.pop(channel, None)
+
+        if channel_id is None:
+            return
+
+        line = encode_event(EVENT_CLOSE, channel_id)
+
+        for subscriber in self.service.subscribers:
+            if channel_id in subscriber.announced:
+                subscriber.announced.discard(channel_id)
+                subscriber.send(line)
+
+    def upstream_verb(self, sender, verb):
+        self.tracer.upstream_verb(sender, verb)
+        self.__trace(EVENT_UPSTREAM, sender, verb)
+
+    def downstream_verb(self, receiver, verb):
+        self.tracer.downstream_verb(receiver, verb)
+        self.__trace(EVENT_DOWNSTREAM, receiver, verb)
+
+    def invalid_upstream_verb(self, sender, verb, reason):
+        self.tracer.invalid_upstream_verb(sender, verb, reason)
+        self.__trace(EVENT_ERROR, sender, verb, reason)
+
+    def invalid_downstream_verb(self, receiver, verb, reason):
+        self.tracer.invalid_downstream_verb(receiver, verb, reason)
+        self.__trace(EVENT_ERROR, receiver, verb, reason)
+
+    def unknown_postref(self, sender, verb):
+        self.tracer.unknown_postref(sender, verb)
+        self.__trace(EVENT_ERROR, sender, verb, 'unknown postref')
+
+    def unowned_post(self, postref, sender, verb):
+        self.tracer.unowned_post(postref, sender, verb)
+        self.__trace(EVENT_ERROR, sender, verb, 'unowned post')
+
+    def request_rate_limited(self, sender, request):
+        self.tracer.request_rate_limited(sender, request)
+        self.__trace(EVENT_ERROR, sender, request, 'rate limited')
+
+    def channel_overloaded(self, channel):
+        self.tracer.channel_overloaded(channel)
+        self.__trace(EVENT_ERROR, channel, None, 'overloaded')
+
+    def __trace(self, event, channel, verb, reason=None):
+        subscribers = [subscriber for subscriber in self.service.subscribers if subscriber.filter.match(channel, verb)]
+
+        if not subscribers:
+            return
+
+        channel_id = self.channel_ids.get(channel, None)
+
+        if channel_id is None:
+            channel_id = self.next_channel_id
+            self.next_channel_id += 1
+            self.channel_ids[channel] = channel_id
+
+        # a channel is announced along with its description before its
+        # first event, as it was mostly opened before the trace started
+        # or before it got a description
+        for subscriber in subscribers:
+            if channel_id not in subscriber.announced:
+                subscriber.announced.add(channel_id)
+                subscriber.send(encode_event(EVENT_OPEN, channel_id, None, channel.description))
+
+        line = encode_event(event, channel_id, verb, reason, self.service.max_payload)
+
+        for subscriber in subscribers:
+            subscriber.send(line)
+
+
+def encode_event(event, channel_id, verb=None, text=None, max_payload=32):
+    """
+    Encode a trace event as a single line:
+
+        <time> <event> <channel> [<VERB> <field>=<value> ...] [<text>]
+
+    Byte values are escaped, payloads are cut off after max_payload
+    bytes and are followed by their length.
+    """
+
+    parts = [b'%.6f' % time.time(), event, b'%d' % channel_id]
+
+    if verb is not None:
+        parts.append(VERB_TYPES.get(verb.__class__, '?').encode())
+
+        for field in VERB_FIELDS.get(verb.__class__, ()):
+            value = getattr(verb, field, None)
+
+            if value is None:
+                continue
+
+            if field == 'payload':
+                parts.append(b'payload=%s/%d' % (escape(value[:max_payload]), len(value)))
+            else:
+                parts.append(b'%s=%s' % (field.encode(), encode_value(value)))
+
+    if text:
+        parts.append(escape(text.encode(), UNSAFE_TEXT_BYTES))
+
+    return b' '.join(parts) + b'\n'
+
+
+def encode_value(value):
+    if isinstance(value, bool):
+        return b'1' if value else b'0'
+
+    if isinstance(value, (bytes, bytearray)):
+        return escape(value)
+
+    return str(value).encode()
+
+
+def escape(value, unsafe=UNSAFE_BYTES):
+    """
+    Escape the bytes that would break up a trace line, or that are not
+    printable.
+    """
+
+    return unsafe.sub(lambda match: b'\\x%02x' % match.group()[0], value)
@@ -54,6 +54,15 @@ class BaseTracer:
     def session_activated(self, channel, name):
         pass
 
+    def channel_overloaded(self, channel):
+        pass
+
+    def request_rate_limited(self, sender, request):
+        pass
+
+    def interest_replayed(self, channel, name, count):
+        pass
+
 
 class bcolors:
     HEADER = '\033[95m'
@@ -116,5 +125,14 @@ class PrintTracer(BaseTracer):
     def invalid_downstream_verb(self, receiver, verb, reason):
         self._print("Invalid verb")
 
+    def channel_overloaded(self, channel):
+        self._print("WARNING: Channel overloaded", channel)
+
+    def request_rate_limited(self, sender, request):
+        self._print("WARNING: Request rate limited", sender, request)
+
     def session_activated(self, channel, name):
         self._print("Session activated")
+
+    def interest_replayed(self, channel, name, count):
+        self._print("<<< Sending interest", channel, name, count)
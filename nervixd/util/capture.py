@@ -0,0 +1,147 @@
+import logging
+from struct import Struct
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'NXCAP\x01'
+
+RECORD_OPEN = 1
+RECORD_DATA = 2
+RECORD_CLOSE = 3
+
+# type, connection id, microseconds since the start of the capture and
+# the length of the data that follows
+RECORD_HEADER = Struct('>BIQI')
+
+
+class Capture:
+    """
+    The Capture class.
+
+    Records the upstream traffic of client connections to a file, so it
+    can be replayed later on. The file starts with the MAGIC bytes,
+    followed by records that each consist of a RECORD_HEADER and its
+    data:
+
+    RECORD_OPEN: a connection was opened, the data is the name of the
+    protocol.
+
+    RECORD_DATA: bytes were received from a connection, the data holds
+    the bytes as they were read from the socket.
+
+    RECORD_CLOSE: a connection was closed, there is no data.
+
+    The records are in the order in which they happened. When the file
+    can not be written capturing stops, the server keeps running.
+    """
+
+    def __init__(self, path, clock):
+        self.path = path
+        self.clock = clock
+
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+        self.start = clock()
+
+        self.next_connection_id = 1
+
+        self.nr_records = 0
+
+    def is_open(self):
+        return self.file is not None
+
+    def connection(self, protocol):
+        """
+        Start capturing a new connection, returning a CaptureStream to
+        record its upstream traffic with.
+        """
+
+        connection_id = self.next_connection_id
+        self.next_connection_id += 1
+
+        self.write(RECORD_OPEN, connection_id, protocol.encode())
+
+        return CaptureStream(self, connection_id)
+
+    def write(self, record_type, connection_id, data=b''):
+        if not self.file:
+            return
+
+        timestamp = int((self.clock() - self.start) * 1000000)
+
+        try:
+            self.file.write(RECORD_HEADER.pack(record_type, connection_id, timestamp, len(data)))
+            self.file.write(data)
+
+        except OSError as e:
+            logger.error("Unable to write capture to %s, capturing stopped: %s", self.path, e)
+            self.close()
+            return
+
+        self.nr_records += 1
+
+    def close(self):
+        """
+        Stop capturing, flushing the records to the file.
+        """
+
+        if not self.file:
+            return
+
+        file = self.file
+        self.file = None
+
+        try:
+            file.close()
+
+        except OSError as e:
+            logger.error("Unable to write capture to %s: %s", self.path, e)
+            return
+
+        logger.info("Captured %d records to %s", self.nr_records, self.path)
+
+
+class CaptureStream:
+    """
+    Records the upstream traffic of a single connection.
+    """
+
+    def __init__(self, capture, connection_id):
+        self.capture = capture
+        self.connection_id = connection_id
+
+    def data(self, chunk):
+        self.capture.write(RECORD_DATA, self.connection_id, chunk)
+
+    def close(self):
+        self.capture.write(RECORD_CLOSE, self.connection_id)
+
+
+def read_capture(file):
+    """
+    Read the records from a capture file, yielding a (record_type,
+    connection_id, timestamp, data) tuple for each. The timestamp is in
+    seconds since the start of the capture.
+    """
+
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a capture file")
+
+    while True:
+        header = file.read(RECORD_HEADER.size)
+
+        if not header:
+            return
+
+        if len(header) < RECORD_HEADER.size:
+            raise ValueError("Capture file is truncated")
+
+        record_type, connection_id, timestamp, length = RECORD_HEADER.unpack(header)
+
+        data = file.read(length)
+
+        if len(data) < length:
+            raise ValueError("Capture file is truncated")
+
+        yield record_type, connection_id, timestamp / 1000000, data
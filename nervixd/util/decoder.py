@@ -12,6 +12,15 @@ class BaseDecoder:
         self.buffpos = 0
         self.autocommit_amount = 0
 
+        # bytes of buff before this position were already searched by
+        # get_until, for the sub and offset in scan_key, without finding
+        # the sub
+        self.scan_key = None
+        self.scan_position = 0
+
+        # CaptureStream that records the chunks read from the socket
+        self.capture = None
+
     def add_chunk(self, chunk):
         """
         Add a chunk of raw undecoded bytes to the internal chunkbuffer.
@@ -32,6 +41,9 @@ class BaseDecoder:
         except ConnectionResetError:
             chunk = b''
 
+        if self.capture and chunk:
+            self.capture.data(chunk)
+
         self.add_chunk(chunk)
 
         return len(chunk)
@@ -54,6 +66,16 @@ class BaseDecoder:
 
         return len(chunk)
 
+    def reset(self):
+        """
+        Discard all bytes that are currently buffered, decoded or not.
+        """
+
+        self.chunkbuffer.clear()
+        self.buff.clear()
+        self.autocommit_amount = 0
+        self.scan_position = 0
+
     def commit(self, amount=None):
         """
         Commit a number of bytes. This will allow for the cleanup of
@@ -63,7 +85,10 @@ class BaseDecoder:
             amount = self.autocommit_amount
 
         self.autocommit_amount -= amount
+        self.scan_position = max(0, self.scan_position - amount)
 
+        # bytearrays delete from the front by moving their start, so
+        # this does not copy the bytes that remain
         del self.buff[0:amount]
 
     def get(self, amount, offset=0):
@@ -93,31 +118,76 @@ class BaseDecoder:
         Return a bytes object containing all bytes until the specified
         sub is found.
         Returns None if the requested amount is not available.
+        Raises IndexError if the sub is not found within limit bytes.
+
+        The search continues where the previous call stopped, so bytes
+        that arrive in many chunks are searched only once.
         """
-        search_offset = offset
+        buff = self.buff
+        max_end = offset + limit
 
-        end = None
+        if self.scan_key == (sub, offset):
+            search_offset = max(offset, self.scan_position)
 
-        while len(self.buff) < limit:
+        else:
+            search_offset = offset
+            self.scan_key = (sub, offset)
 
-            index = self.buff.find(sub, search_offset)
+        while True:
+
+            index = buff.find(sub, search_offset, max_end)
 
             if index >= 0:
-                end = index + len(sub)
                 break
 
+            # the sub may start in the last bytes and end in the next chunk
+            search_offset = max(offset, min(len(buff), max_end) - len(sub) + 1)
+            self.scan_position = search_offset
+
+            if len(buff) >= max_end:
+                raise IndexError("Sub not found within limits")
+
             if len(self.chunkbuffer) <= 0:
                 return None
 
             chunk = self.chunkbuffer.pop()
 
-            self.buff.extend(chunk)
+            buff.extend(chunk)
+
+        end = index + len(sub)
 
-        if not end:
-            raise IndexError("Sub not found within limits")
+        # calling again before a commit finds the same sub
+        self.scan_position = index
 
-        data = self.buff[offset:end]
+        data = buff[offset:end]
 
         self.autocommit_amount = end
 
         return data
+
+    def skip_until(self, sub):
+        """
+        Discard all bytes up to and including the next occurrence of sub.
+        Returns False if it was not found yet, after discarding all bytes
+        that can not be part of it.
+        """
+        buff = self.buff
+
+        while True:
+
+            index = buff.find(sub)
+
+            if index >= 0:
+                self.commit(index + len(sub))
+                self.autocommit_amount = 0
+                return True
+
+            self.commit(max(0, len(buff) - len(sub) + 1))
+            self.autocommit_amount = 0
+
+            if len(self.chunkbuffer) <= 0:
+                return False
+
+            chunk = self.chunkbuffer.pop()
+
+            buff.extend(chunk)
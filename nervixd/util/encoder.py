@@ -15,6 +15,9 @@ class BaseEncoder:
         self.fetchpos = None
         self.commitpos = None
 
+        # number of bytes that are added but not commited yet
+        self.pending = 0
+
     def write_to_socket(self, socket, chunksize=None):
         """
         Write bytes from the internal chunkbuffer to the given socket.
@@ -31,7 +34,7 @@ class BaseEncoder:
 
             try:
                 n = socket.send(chunk)
-            except BrokenPipeError:
+            except (BrokenPipeError, ConnectionResetError):
                 n = 0
 
             self.commit(n)
@@ -102,6 +105,7 @@ class BaseEncoder:
         """
 
         self.commitpos += amount
+        self.pending -= amount
 
         if self.commitpos == len(self.currentchunk):
             self.currentchunk = None
@@ -110,6 +114,26 @@ class BaseEncoder:
             raise ValueError(
                 "Commit of {} bytes is not possible as that number of bytes are not fetched yet".format(amount))
 
+    def pop_pending(self):
+        """
+        Remove all bytes that are not yet commited from the internal
+        chunkbuffer and return them as a single bytes object. Returns an
+        empty bytes object if nothing is pending.
+        """
+
+        chunks = []
+
+        if self.currentchunk:
+            chunks.append(self.currentchunk[self.commitpos:])
+            self.currentchunk = None
+
+        while self.chunkbuffer:
+            chunks.append(self.chunkbuffer.pop())
+
+        self.pending = 0
+
+        return b''.join(chunks)
+
     def add_encoded_chunk(self, chunk):
         """
         Add a chunk of bytes to the internal chunkbuffer. The argument
@@ -120,3 +144,4 @@ class BaseEncoder:
             raise TypeError("Given chunk is not an instance of bytes")
 
         self.chunkbuffer.appendleft(chunk)
+        self.pending += len(chunk)
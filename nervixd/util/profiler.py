@@ -0,0 +1,163 @@
+import os
+import time
+import signal
+import cProfile
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLE = 'sample'
+
+
+class Profiler:
+    """
+    The Profiler class.
+
+    Profiles the running server for a limited time, after which the
+    results are dumped to a file in the output directory. Nothing is
+    hooked into the interpreter until the profiler is started, so it
+    costs nothing while it is not running.
+
+    Two modes are available. The cprofile mode profiles every function
+    call with cProfile, which gives exact call counts but slows the
+    server down considerably. Its output can be read with the pstats
+    module. The sample mode takes a sample of the stack at a fixed
+    interval of CPU time, which is cheap enough to run on a busy server.
+    Its output is in the folded stacks format used by flamegraph tools.
+    """
+
+    def __init__(self, mainloop, output_dir, mode=MODE_CPROFILE, duration=30.0):
+        self.mainloop = mainloop
+        self.output_dir = output_dir
+
+        # defaults for start()
+        self.mode = mode
+        self.duration = duration
+
+        self.profile = None
+        self.path = None
+
+        self.timer = self.mainloop.timer()
+        self.timer.set_handler(self.stop)
+
+    def is_running(self):
+        return self.profile is not None
+
+    def start(self, duration=None, mode=None):
+        """
+        Start profiling for the given number of seconds. Returns the
+        path of the file the results will be written to, or None if the
+        profiler is already running.
+        """
+
+        if self.profile:
+            return None
+
+        duration = duration or self.duration
+        mode = mode or self.mode
+
+        if mode == MODE_CPROFILE:
+            self.profile = cProfile.Profile()
+            extension = 'prof'
+
+        elif mode == MODE_SAMPLE:
+            self.profile = SamplingProfiler()
+            extension = 'folded'
+
+        else:
+            raise ValueError("Unknown profile mode '{}'".format(mode))
+
+        self.path = os.path.join(self.output_dir, 'nervixd-{pid}-{stamp}.{ext}'.format(
+            pid=os.getpid(),
+            stamp=time.strftime('%Y%m%d-%H%M%S'),
+            ext=extension,
+        ))
+
+        self.timer.set(duration)
+
+        logger.info("Profiling (%s) for %s seconds", mode, duration)
+
+        self.profile.enable()
+
+        return self.path
+
+    def stop(self):
+        """
+        Stop profiling and write the results. Returns the path of the
+        file, or None if the profiler was not running.
+        """
+
+        if not self.profile:
+            return None
+
+        self.profile.disable()
+        self.timer.cancel()
+
+        profile = self.profile
+        path = self.path
+
+        self.profile = None
+        self.path = None
+
+        try:
+            profile.dump_stats(path)
+
+        except OSError as e:
+            logger.error("Unable to write profile to %s: %s", path, e)
+            return None
+
+        logger.info("Profile written to %s", path)
+
+        return path
+
+
+class SamplingProfiler:
+    """
+    Profiler that samples the stack of the main thread every interval
+    seconds of CPU time, using the SIGPROF signal.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+
+        # number of samples per stack, a stack is a tuple of code
+        # objects starting at the outermost frame
+        self.stacks = Counter()
+
+        self.previous_handler = None
+
+    def enable(self):
+        self.previous_handler = signal.signal(signal.SIGPROF, self.__on_sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler or signal.SIG_DFL)
+
+    def dump_stats(self, path):
+        """
+        Write the samples in the folded stacks format, one line per
+        stack with the frames separated by semicolons followed by the
+        number of samples.
+        """
+
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('{} {}\n'.format(';'.join(map(describe_code, stack)), count))
+
+    def __on_sample(self, signo, frame):
+        stack = []
+
+        while frame:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+
+        stack.reverse()
+
+        self.stacks[tuple(stack)] += 1
+
+
+def describe_code(code):
+    return '{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
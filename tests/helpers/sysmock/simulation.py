@@ -0,0 +1,728 @@
+"""
+Deterministic simulation of many clients in virtual time.
+
+Where SysMock verifies the behaviour of the server against a scripted
+story, the Simulation lets thousands of virtual clients generate
+traffic against it. Like SysMock it patches socket.socket,
+selectors.DefaultSelector and time.monotonic, but the sockets are
+connected to VirtualClient objects that run inside the select() call of
+the mainloop. Whenever the server would block, the virtual time jumps to
+the next thing that happens, so minutes of keepalive traffic on 100k
+connections take seconds to simulate.
+
+Everything a client does is driven by its traffic model, the random
+numbers the models use come from the seeded random generator of the
+simulation, so a simulation can be repeated exactly.
+"""
+
+import math
+import time
+import heapq
+import select
+import random
+import tracemalloc
+from struct import unpack_from
+from collections import Counter
+from selectors import EVENT_READ, EVENT_WRITE, SelectorKey
+from unittest.mock import patch
+
+import tests.nxtcp_packet_definition as packets
+
+# filenos of the simulated sockets start here, lower ones are real
+FIRST_FILENO = 1000000
+
+
+class Simulation:
+
+    def __init__(self, seed=0, trace_memory=False):
+        self.random = random.Random(seed)
+        self.trace_memory = trace_memory
+
+        self.now = 0.0
+        self.end = 0.0
+        self.resolution = 0.001
+
+        # scheduled client actions, as (time, seqno, func, args)
+        self.events = []
+        self.next_seqno = 0
+
+        self.next_fileno = FIRST_FILENO
+        self.listeners = dict()
+
+        # server sockets that are readable, and clients that have input
+        # to process, both in the order in which they became so
+        self.readable = dict()
+        self.inbox = dict()
+
+        self.selector = None
+        self.clients = []
+
+        # cpu time spend outside select(), that is in the server
+        self.server_cpu = 0.0
+        self.cpu_mark = None
+
+        self.counters = Counter()
+
+        # patched with plain functions rather than mocks, time.monotonic
+        # is called too often for the overhead of a mock
+        self.patchers = [
+            patch('socket.socket', new=self.__get_socket),
+            patch('selectors.DefaultSelector', new=self.__get_selector),
+            patch('time.monotonic', new=self.monotonic),
+        ]
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+
+        for patcher in self.patchers:
+            patcher.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for patcher in self.patchers:
+            patcher.stop()
+
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def monotonic(self):
+        return self.now
+
+    def schedule(self, delay, func, *args):
+        """
+        Call the function after the given number of virtual seconds.
+        """
+
+        heapq.heappush(self.events, (self.now + delay, self.next_seqno, func, args))
+        self.next_seqno += 1
+
+    def add_clients(self, nr_clients, model_factory, address, ramp=0.0):
+        """
+        Create clients that connect to the address at random moments
+        within the next ramp seconds. Each client gets its own model,
+        created by calling the factory with the index of the client.
+        """
+
+        for i in range(nr_clients):
+            client = VirtualClient(self, ('client', len(self.clients)), model_factory(i))
+            self.clients.append(client)
+
+            self.schedule(self.random.uniform(0.0, ramp), client.connect, address)
+
+    def run(self, mainloop, duration):
+        """
+        Run the mainloop for the given number of virtual seconds.
+        """
+
+        self.end = self.now + duration
+        self.cpu_mark = time.process_time()
+
+        while self.now < self.end:
+            mainloop.run_once()
+
+        self.server_cpu += time.process_time() - self.cpu_mark
+        self.cpu_mark = None
+
+    def report(self):
+        """
+        Return the statistics of the simulation so far.
+        """
+
+        report = {
+            'virtual_seconds': self.now,
+            'server_cpu_seconds': round(self.server_cpu, 3),
+            'clients': len(self.clients),
+            'connected': sum(1 for client in self.clients if client.connected),
+            'disconnected_by_server': self.counters['server_close'],
+            'packets_up': self.counters['packets_up'],
+            'packets_down': self.counters['packets_down'],
+            'bytes_up': self.counters['bytes_up'],
+            'bytes_down': self.counters['bytes_down'],
+        }
+
+        report.update({
+            name: self.counters[name]
+            for name in sorted(self.counters) if name.startswith('model_')
+        })
+
+        if self.trace_memory:
+            report['server_memory_bytes'] = get_server_memory()
+
+        return report
+
+    def connect(self, client, address):
+        """
+        Called by a client to connect to a listening socket, returns the
+        server side socket of the connection or None when there is no
+        listener.
+        """
+
+        listener = self.listeners.get(address, None)
+
+        if not listener:
+            return None
+
+        sock = SimSocket(self)
+        sock.local_address = address
+        sock.remote_address = client.address
+        sock.client = client
+
+        listener.backlog.append(sock)
+        self.readable[listener.fileno()] = listener
+
+        return sock
+
+    def select(self, selector, timeout):
+        """
+        Called from the selector. Lets the clients do their thing until
+        there are events for the server or the timeout expires.
+        """
+
+        cpu = time.process_time()
+
+        if self.cpu_mark is not None:
+            self.server_cpu += cpu - self.cpu_mark
+
+        # like epoll, the timeout is rounded up to the resolution
+        if timeout is None:
+            deadline = self.end
+        else:
+            deadline = min(self.end, self.now + math.ceil(timeout / self.resolution) * self.resolution)
+
+        while True:
+            self.__run_clients()
+
+            events = selector.get_events()
+
+            if events or self.now >= deadline:
+                break
+
+            if self.events:
+                self.now = min(deadline, self.events[0][0])
+            else:
+                self.now = deadline
+
+        if self.cpu_mark is not None:
+            self.cpu_mark = time.process_time()
+
+        return events
+
+    def __run_clients(self):
+        """
+        Let the clients process their input and do the actions that are
+        due.
+        """
+
+        events = self.events
+
+        while self.inbox or (events and events[0][0] <= self.now):
+
+            if self.inbox:
+                inbox = self.inbox
+                self.inbox = dict()
+
+                for client in inbox:
+                    client.process()
+
+            while events and events[0][0] <= self.now:
+                _, _, func, args = heapq.heappop(events)
+                func(*args)
+
+    def get_fileno(self):
+        fileno = self.next_fileno
+        self.next_fileno += 1
+        return fileno
+
+    def __get_socket(self, socket_fam, socket_type):
+        return SimSocket(self)
+
+    def __get_selector(self):
+        self.selector = SimSelector(self)
+        return self.selector
+
+
+class SimSelector:
+    """
+    Selector that returns the events of the simulated sockets. Other
+    filedescriptors, like the control pipe of the mainloop, are polled
+    with the real select().
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+        # keys of the simulated sockets, and of those that want to write
+        self.keys = dict()
+        self.writers = dict()
+
+        self.real_keys = dict()
+
+    def register(self, fd, events, data=None):
+        key = SelectorKey(fd, fd, events, data)
+
+        if fd < FIRST_FILENO:
+            self.real_keys[fd] = key
+            return key
+
+        self.keys[fd] = key
+
+        if events & EVENT_WRITE:
+            self.writers[fd] = key
+        else:
+            self.writers.pop(fd, None)
+
+        return key
+
+    def modify(self, fd, events, data=None):
+        return self.register(fd, events, data)
+
+    def unregister(self, fd):
+        self.keys.pop(fd, None)
+        self.writers.pop(fd, None)
+        self.real_keys.pop(fd, None)
+
+    def select(self, timeout=None):
+        events = []
+
+        if self.real_keys:
+            readers = [fd for fd, key in self.real_keys.items() if key.events & EVENT_READ]
+            ready, _, _ = select.select(readers, [], [], 0)
+
+            events.extend((self.real_keys[fd], EVENT_READ) for fd in ready)
+
+        if events:
+            timeout = 0
+
+        return events + self.simulation.select(self, timeout)
+
+    def get_events(self):
+        """
+        Return the events of the simulated sockets, which are always
+        writable.
+        """
+
+        readable = self.simulation.readable
+        events = []
+
+        for fd in readable:
+            key = self.keys.get(fd, None)
+
+            if key and key.events & EVENT_READ:
+                events.append((key, key.events))
+
+        for fd, key in self.writers.items():
+            if fd not in readable or not key.events & EVENT_READ:
+                events.append((key, EVENT_WRITE))
+
+        return events
+
+
+class SimSocket:
+    """
+    Server side of a simulated connection, or a listening socket.
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self._fileno = simulation.get_fileno()
+
+        self.local_address = None
+        self.remote_address = None
+        self.client = None
+
+        self.backlog = []
+        self.input = bytearray()
+        self.eof = False
+        self.closed = False
+
+    def fileno(self):
+        return self._fileno
+
+    def setblocking(self, _):
+        pass
+
+    def setsockopt(self, *_):
+        pass
+
+    def bind(self, address):
+        self.local_address = address
+
+    def listen(self, backlog=0):
+        self.simulation.listeners[self.local_address] = self
+
+    def accept(self):
+        sock = self.backlog.pop(0)
+
+        if not self.backlog:
+            self.simulation.readable.pop(self._fileno, None)
+
+        return sock, sock.remote_address
+
+    def getpeername(self):
+        return self.remote_address
+
+    def send(self, data):
+        if self.client.closed:
+            raise BrokenPipeError()
+
+        self.client.receive(data)
+
+        self.simulation.counters['bytes_down'] += len(data)
+
+        return len(data)
+
+    def recv(self, n):
+        data = bytes(self.input[:n])
+        del self.input[:n]
+
+        if not self.input and not self.eof:
+            self.simulation.readable.pop(self._fileno, None)
+
+        return data
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.simulation.readable.pop(self._fileno, None)
+
+        if self.local_address in self.simulation.listeners and not self.client:
+            del self.simulation.listeners[self.local_address]
+
+        if self.client:
+            self.client.server_closed()
+
+    def receive(self, data):
+        """
+        Called by the client to send data to the server.
+        """
+
+        if self.closed:
+            return
+
+        self.input += data
+        self.simulation.readable[self._fileno] = self
+
+    def client_closed(self):
+        if self.closed:
+            return
+
+        self.eof = True
+        self.simulation.readable[self._fileno] = self
+
+
+class VirtualClient:
+    """
+    A NXTCP client in the simulation. The client answers pings when its
+    model is responsive, the downstream packets are passed to the model.
+    """
+
+    def __init__(self, simulation, address, model):
+        self.simulation = simulation
+        self.address = address
+        self.model = model
+
+        self.sock = None
+        self.connected = False
+        self.closed = False
+
+        self.input = bytearray()
+
+        self.handlers = {
+            packets.PACKET_WELCOME: self.__handle_welcome,
+            packets.PACKET_PING: self.__handle_ping,
+            packets.PACKET_SESSION: self.__handle_session,
+            packets.PACKET_CALL: self.__handle_call,
+            packets.PACKET_MESSAGE: self.__handle_message,
+            packets.PACKET_INTEREST: self.__handle_interest,
+            packets.PACKET_BYEBYE: self.__handle_byebye,
+        }
+
+    def connect(self, address):
+        self.sock = self.simulation.connect(self, address)
+
+        if not self.sock:
+            self.closed = True
+            return
+
+        self.connected = True
+
+    def send(self, packet):
+        """
+        Send an encoded packet to the server.
+        """
+
+        if self.closed:
+            return
+
+        counters = self.simulation.counters
+        counters['packets_up'] += 1
+        counters['bytes_up'] += len(packet)
+
+        self.sock.receive(packet)
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.connected = False
+
+        self.sock.client_closed()
+
+    def receive(self, data):
+        """
+        Called from the server side socket with data for the client.
+        """
+
+        self.input += data
+        self.simulation.inbox[self] = True
+
+    def server_closed(self):
+        self.simulation.counters['server_close'] += 1
+
+        self.closed = True
+        self.connected = False
+
+    def process(self):
+        """
+        Handle the complete packets received from the server.
+        """
+
+        data = self.input
+        offset = 0
+
+        while len(data) - offset >= 5:
+            length, packet_type = unpack_from('>IB', data, offset)
+
+            if len(data) - offset - 5 < length:
+                break
+
+            frame = bytes(data[offset + 5:offset + 5 + length])
+            offset += 5 + length
+
+            self.simulation.counters['packets_down'] += 1
+
+            handler = self.handlers.get(packet_type, None)
+
+            if handler:
+                handler(frame)
+
+        del data[:offset]
+
+    def __handle_welcome(self, frame):
+        self.model.on_welcome(self)
+
+    def __handle_ping(self, frame):
+        if self.model.responsive:
+            self.send(packets.pong())
+
+    def __handle_session(self, frame):
+        state = frame[0]
+        self.model.on_session(self, get_string(frame, 1), state)
+
+    def __handle_call(self, frame):
+        flags, postref = unpack_from('>BI', frame, 0)
+        name = get_string(frame, 5)
+        payload = get_blob(frame, 6 + len(name))
+
+        self.model.on_call(self, None if flags & 1 else postref, name, payload)
+
+    def __handle_message(self, frame):
+        status, messageref = unpack_from('>BI', frame, 0)
+        self.model.on_message(self, messageref, status)
+
+    def __handle_interest(self, frame):
+        status, postref = unpack_from('>BI', frame, 0)
+        self.model.on_interest(self, postref, bool(status), get_blob(frame, 5))
+
+    def __handle_byebye(self, frame):
+        self.model.on_byebye(self)
+
+
+class TrafficModel:
+    """
+    Base class of the traffic models, which decide what a client does.
+    The simulation and its random generator are available as the
+    simulation and random attributes.
+    """
+
+    # a client that does not answer pings is eventually disconnected
+    responsive = True
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.random = simulation.random
+
+    def count(self, name):
+        self.simulation.counters['model_' + name] += 1
+
+    def on_welcome(self, client):
+        pass
+
+    def on_session(self, client, name, state):
+        pass
+
+    def on_call(self, client, postref, name, payload):
+        pass
+
+    def on_message(self, client, messageref, status):
+        pass
+
+    def on_interest(self, client, postref, interest, topic):
+        pass
+
+    def on_byebye(self, client):
+        pass
+
+
+class IdleModel(TrafficModel):
+    """
+    Connects and only answers pings.
+    """
+
+
+class SilentModel(TrafficModel):
+    """
+    Connects and never answers anything, like a client that has died.
+    """
+
+    responsive = False
+
+
+class ServiceModel(TrafficModel):
+    """
+    Logs in to a shared name and answers every call.
+    """
+
+    def __init__(self, simulation, name):
+        TrafficModel.__init__(self, simulation)
+        self.name = name
+
+    def on_welcome(self, client):
+        client.send(packets.login(self.name, persist=False, standby=False, enforce=False, shared=True))
+
+    def on_call(self, client, postref, name, payload):
+        self.count('calls')
+
+        if postref is not None:
+            client.send(packets.post(postref, payload))
+
+
+class RequesterModel(TrafficModel):
+    """
+    Sends requests to a name at random intervals, with the given mean
+    rate per second.
+    """
+
+    def __init__(self, simulation, name, rate, timeout=5.0, payload=b'payload'):
+        TrafficModel.__init__(self, simulation)
+        self.name = name
+        self.rate = rate
+        self.timeout = timeout
+        self.payload = payload
+
+        self.messageref = 0
+
+    def on_welcome(self, client):
+        self.__schedule(client)
+
+    def on_message(self, client, messageref, status):
+        self.count('messages_ok' if status == 0 else 'messages_failed')
+
+    def __schedule(self, client):
+        self.simulation.schedule(self.random.expovariate(self.rate), self.__request, client)
+
+    def __request(self, client):
+        if client.closed:
+            return
+
+        self.messageref += 1
+        self.count('requests')
+
+        client.send(packets.request(self.name, False, self.messageref, int(self.timeout * 1000), self.payload))
+
+        self.__schedule(client)
+
+
+class SubscriberModel(TrafficModel):
+    """
+    Subscribes to a topic of a name and counts the messages received.
+    """
+
+    def __init__(self, simulation, name, topic):
+        TrafficModel.__init__(self, simulation)
+        self.name = name
+        self.topic = topic
+
+    def on_welcome(self, client):
+        client.send(packets.subscribe(1, self.name, self.topic))
+
+    def on_message(self, client, messageref, status):
+        self.count('deliveries')
+
+
+class PublisherModel(TrafficModel):
+    """
+    Logs in to a name and posts on every topic there is interest in, at
+    random intervals with the given mean rate per second per topic.
+    """
+
+    def __init__(self, simulation, name, rate, payload=b'payload'):
+        TrafficModel.__init__(self, simulation)
+        self.name = name
+        self.rate = rate
+        self.payload = payload
+
+        self.postrefs = dict()
+
+    def on_welcome(self, client):
+        client.send(packets.login(self.name, persist=False, standby=False, enforce=False))
+
+    def on_interest(self, client, postref, interest, topic):
+        if interest:
+            self.postrefs[topic] = postref
+            self.__schedule(client, topic)
+
+        else:
+            self.postrefs.pop(topic, None)
+
+    def __schedule(self, client, topic):
+        self.simulation.schedule(self.random.expovariate(self.rate), self.__post, client, topic)
+
+    def __post(self, client, topic):
+        postref = self.postrefs.get(topic, None)
+
+        if client.closed or postref is None:
+            return
+
+        self.count('posts')
+
+        client.send(packets.post(postref, self.payload))
+
+        self.__schedule(client, topic)
+
+
+def get_string(frame, offset):
+    length = frame[offset]
+    return frame[offset + 1:offset + 1 + length]
+
+
+def get_blob(frame, offset):
+    length, = unpack_from('>I', frame, offset)
+    return frame[offset + 4:offset + 4 + length]
+
+
+def get_server_memory():
+    """
+    Return the number of bytes allocated by the nervixd modules that are
+    still in use.
+    """
+
+    snapshot = tracemalloc.take_snapshot()
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(True, '*/nervixd/*')])
+
+    return sum(stat.size for stat in snapshot.statistics('filename'))
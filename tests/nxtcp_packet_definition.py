@@ -14,6 +14,8 @@ PACKET_SUBSCRIBE = 0x08
 PACKET_UNSUBSCRIBE = 0x10
 PACKET_PONG = 0x81
 PACKET_QUIT = 0x84
+PACKET_COMPRESS = 0x85
+PACKET_BATCH = 0x88
 
 # DOWNSTREAM
 PACKET_SESSION = 0x02
@@ -23,6 +25,10 @@ PACKET_INTEREST = 0x09
 PACKET_PING = 0x80
 PACKET_WELCOME = 0x82
 PACKET_BYEBYE = 0x83
+PACKET_COMPRESS_ACK = 0x86
+
+# BOTH DIRECTIONS
+PACKET_COMPRESSED = 0x87
 
 """
 Functions that create packets.
@@ -30,8 +36,8 @@ Send from CLIENT -> SERVER
 """
 
 
-def login(name, persist, standby, enforce):
-    flags = 0b000
+def login(name, persist, standby, enforce, shared=False, weight=None):
+    flags = 0b0000
 
     if persist:
         flags |= 0b001
@@ -42,9 +48,17 @@ def login(name, persist, standby, enforce):
     if enforce:
         flags |= 0b100
 
+    if shared:
+        flags |= 0b1000
+
     n = 2 + len(name)
+    packet = uint8(PACKET_LOGIN) + uint8(flags) + string(name)
+
+    if weight is not None:
+        n += 1
+        packet += uint8(weight)
 
-    return uint32(n) + uint8(PACKET_LOGIN) + uint8(flags) + string(name)
+    return uint32(n) + packet
 
 
 def logout(name):
@@ -91,6 +105,32 @@ def quit():
     return uint32(0) + uint8(PACKET_QUIT)
 
 
+def compress(threshold, dictionary):
+    n = 8 + len(dictionary)
+    return uint32(n) + uint8(PACKET_COMPRESS) + uint32(threshold) + blob(dictionary)
+
+
+def compressed(data):
+    """
+    Used in both directions, data should be the output of a zlib
+    compressor, flushed with Z_SYNC_FLUSH.
+    """
+    return uint32(len(data)) + uint8(PACKET_COMPRESSED) + data
+
+
+def batch(*packets):
+    """
+    Packs the given packets, as created by the functions above, into
+    a single BATCH packet.
+    """
+    body = b''
+
+    for pkt in packets:
+        body += varint(len(pkt) - 5) + pkt[4:]
+
+    return uint32(len(body)) + uint8(PACKET_BATCH) + body
+
+
 """
 Functions that create packets.
 Send from SERVER -> CLIENT
@@ -150,7 +190,7 @@ def ping():
 
 def welcome():
     server_version = 1
-    protocol_version = 1
+    protocol_version = 2
     return uint32(8) + uint8(PACKET_WELCOME) + uint32(server_version) + uint32(protocol_version)
 
 
@@ -158,6 +198,10 @@ def byebye():
     return uint32(0) + uint8(PACKET_BYEBYE)
 
 
+def compress_ack(threshold):
+    return uint32(4) + uint8(PACKET_COMPRESS_ACK) + uint32(threshold)
+
+
 """
 Helper functions to help construct packets
 """
@@ -171,6 +215,16 @@ def uint8(val):
     return pack('>B', val)
 
 
+def varint(val):
+    out = b''
+
+    while val > 0x7f:
+        out += uint8(0x80 | (val & 0x7f))
+        val >>= 7
+
+    return out + uint8(val)
+
+
 def string(val):
     return pack('>B', len(val)) + val
 
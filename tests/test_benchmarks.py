@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.e2e import run_scenario, percentile
+from benchmarks.scenarios import SCENARIOS
+from benchmarks import reactor as reactor_benchmarks
+from benchmarks import simulation
+from benchmarks.replay import Replay
+from benchmarks.server import find_free_port
+
+from nervixd.mainloop import Mainloop
+from nervixd.reactor import Reactor
+from nervixd.controller import Controller
+from nervixd.tracer import BaseTracer
+from nervixd.services.nxtcp.service import NxtcpService
+from nervixd.services.telnet.service import TelnetService
+from nervixd.util.capture import Capture, read_capture, RECORD_OPEN, RECORD_DATA, RECORD_CLOSE
+
+import tests.nxtcp_packet_definition as packets
+
+
+class Options:
+    server = 'inprocess'
+    host = '127.0.0.1'
+    duration = 0.2
+    setup_timeout = 10.0
+    clients = 2
+    owners = 2
+    subscribers = 4
+    topics = 10
+    window = 2
+    payload_size = 16
+
+
+class TestBenchmarks(unittest.TestCase):
+    """ Run every scenario briefly, to keep the benchmarks working.
+    """
+
+    def test_scenarios(self):
+        for name in SCENARIOS:
+            with self.subTest(scenario=name):
+                result = run_scenario(name, Options())
+
+                self.assertEqual(name, result['scenario'])
+                self.assertGreater(result['operations'], 0)
+                self.assertEqual(0, result['errors'])
+                self.assertIsNotNone(result['latency_us']['p99'])
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(51, percentile(ordered, 50))
+        self.assertEqual(100, percentile(ordered, 99))
+        self.assertEqual(100, percentile(ordered, 100))
+
+    def test_reactor_benchmarks(self):
+        results = reactor_benchmarks.run(reactor_benchmarks.BENCHMARKS, [10])
+
+        operations = {result['operation'] for result in results}
+
+        self.assertIn('round_trip', operations)
+        self.assertIn('close_per_subscription', operations)
+
+        for result in results:
+            self.assertGreater(result['ns_per_op'], 0)
+
+    def test_simulation(self):
+        options = SimulationOptions()
+
+        for name in simulation.SCENARIOS:
+            with self.subTest(scenario=name):
+                report = simulation.run_scenario(name, options)
+
+                self.assertEqual(30.0, report['virtual_seconds'])
+                self.assertGreater(report['packets_down'], 0)
+
+                # the same seed gives the same traffic
+                again = simulation.run_scenario(name, options)
+
+                for key in ('packets_up', 'packets_down', 'bytes_up', 'bytes_down', 'disconnected_by_server'):
+                    self.assertEqual(report[key], again[key])
+
+    def test_replay(self):
+        """ Replaying a capture against a server that captures as well results in the same capture.
+        """
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            original_path = os.path.join(tempdir, 'original.bin')
+            replayed_path = os.path.join(tempdir, 'replayed.bin')
+
+            now = [0.0]
+            capture = Capture(original_path, lambda: now[0])
+
+            nxtcp = capture.connection('nxtcp')
+            telnet = capture.connection('telnet')
+            nxtcp.data(packets.login(b'name', persist=False, standby=False, enforce=False))
+            now[0] += 0.1
+            telnet.data(b'login other\r\n')
+            telnet.data(b'request name payload\r\n')
+            now[0] += 0.1
+            nxtcp.close()
+            telnet.close()
+            capture.close()
+
+            mainloop = Mainloop()
+
+            nxtcp_address = ('127.0.0.1', find_free_port())
+            telnet_address = ('127.0.0.1', find_free_port())
+
+            controller = Controller(mainloop, None)
+            reactor = Reactor(mainloop, BaseTracer())
+
+            NxtcpService(controller, mainloop, reactor, reactor.tracer, nxtcp_address)
+            TelnetService(controller, mainloop, reactor, reactor.tracer, telnet_address)
+
+            controller.set_capture(Capture(replayed_path, mainloop.now))
+
+            with open(original_path, 'rb') as f:
+                replay = Replay(mainloop, read_capture(f), {'nxtcp': nxtcp_address, 'telnet': telnet_address}, 4.0)
+                replay.run()
+
+            # let the server close its side
+            for _ in range(100):
+                if len(controller.units) == 2:
+                    break
+
+                mainloop.run_once(0.1)
+
+            controller.capture.close()
+
+            report = replay.report()
+            self.assertEqual(2, report['connections'])
+            self.assertGreater(report['bytes_received'], 0)
+
+            # the bytes may be read in other chunks, and the connections
+            # may be accepted in another order
+            self.assertEqual(read_streams(original_path), read_streams(replayed_path))
+
+
+def read_streams(path):
+    """
+    Return the bytes of every connection in a capture, with its
+    protocol and whether it was closed.
+    """
+
+    protocols = dict()
+    streams = dict()
+    closed = set()
+
+    with open(path, 'rb') as f:
+        for record_type, connection_id, _, data in read_capture(f):
+
+            if record_type == RECORD_OPEN:
+                protocols[connection_id] = data
+                streams[connection_id] = b''
+
+            elif record_type == RECORD_DATA:
+                streams[connection_id] += data
+
+            elif record_type == RECORD_CLOSE:
+                closed.add(connection_id)
+
+    return sorted((protocols[i], streams[i], i in closed) for i in protocols)
+
+
+class SimulationOptions:
+    clients = 20
+    duration = 30.0
+    ramp = 1.0
+    rate = 1.0
+    seed = 0
+    memory = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import asyncio
+import unittest
+
+from nervixd.mainloop.aio import AsyncioMainloop
+from nervixd.services.nxtcp.decoder import Decoder, BatchPacket, RequestPacket as UpstreamRequestPacket, \
+    PostPacket as UpstreamPostPacket
+
+from nervix.client import Client, ConnectionLost, RequestTimeout, Unreachable
+from nervix.client.codec import RequestPacket, PostPacket, encode_batch
+
+from benchmarks.server import build_server, find_free_port
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_batch(self):
+        """
+        Test that a BATCH packet of the client is decoded by the server
+        into the packets it contains.
+        """
+
+        chunks = [
+            RequestPacket(b'name', 5, 1.5, b'payload'),
+            RequestPacket(b'name', None, 0, b'x' * 200),
+            PostPacket(7, b'post'),
+        ]
+
+        decoder = Decoder()
+        decoder.add_chunk(encode_batch([packet.get_chunk() for packet in chunks]))
+
+        batch = decoder.decode()
+        self.assertIsInstance(batch, BatchPacket)
+
+        request, unidirectional, post = batch.packets
+
+        self.assertIsInstance(request, UpstreamRequestPacket)
+        self.assertEqual(request.name, b'name')
+        self.assertEqual(request.messageref, 5)
+        self.assertEqual(request.timeout, 1.5)
+        self.assertEqual(request.payload, b'payload')
+
+        self.assertTrue(unidirectional.unidirectional)
+        self.assertEqual(unidirectional.payload, b'x' * 200)
+
+        self.assertIsInstance(post, UpstreamPostPacket)
+        self.assertEqual(post.postref, 7)
+        self.assertEqual(post.payload, b'post')
+
+
+class TestClient(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.port = find_free_port()
+        self.mainloop = AsyncioMainloop(asyncio.get_running_loop())
+        self.controller = build_server(self.mainloop, ('127.0.0.1', self.port))
+
+        self.clients = []
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            await client.close()
+
+        self.controller.start_server_shutdown()
+
+    async def connect(self, **kwargs):
+        client = Client('127.0.0.1', self.port, **kwargs)
+        await client.connect()
+        self.clients.append(client)
+        return client
+
+    async def test_request(self):
+        service = await self.connect()
+        session = service.login(b'service', lambda payload: payload.upper())
+        await session.wait_active()
+
+        client = await self.connect()
+        self.assertEqual(await client.request(b'service', b'hello'), b'HELLO')
+
+    async def test_async_handler(self):
+        async def handler(payload):
+            await asyncio.sleep(0.01)
+            return payload[::-1]
+
+        service = await self.connect()
+        await service.login(b'service', handler).wait_active()
+
+        client = await self.connect()
+        self.assertEqual(await client.request(b'service', b'abc'), b'cba')
+
+    async def test_pipelining(self):
+        """
+        Test that many outstanding requests are each matched with their
+        own answer.
+        """
+
+        service = await self.connect()
+        await service.login(b'service', lambda payload: payload).wait_active()
+
+        client = await self.connect()
+
+        futures = [client.request(b'service', b'%d' % i) for i in range(2000)]
+        self.assertEqual(client.in_flight, 2000)
+
+        answers = await asyncio.gather(*futures)
+
+        self.assertEqual(answers, [b'%d' % i for i in range(2000)])
+        self.assertEqual(client.in_flight, 0)
+
+    async def test_send(self):
+        received = []
+
+        service = await self.connect()
+        await service.login(b'service', received.append).wait_active()
+
+        client = await self.connect()
+
+        for i in range(100):
+            client.send(b'service', b'%d' % i)
+
+        # a request after the sends is answered after they are handled
+        service.sessions[b'service'].handler = lambda payload: received.append(payload) or b'done'
+        await client.request(b'service', b'last')
+
+        self.assertEqual(received, [b'%d' % i for i in range(100)] + [b'last'])
+
+    async def test_request_errors(self):
+        service = await self.connect()
+        await service.login(b'service', lambda payload: None).wait_active()
+
+        client = await self.connect()
+
+        with self.assertRaises(Unreachable):
+            await client.request(b'nobody', b'')
+
+        with self.assertRaises(RequestTimeout):
+            await client.request(b'service', b'', timeout=0.05)
+
+    async def test_publish(self):
+        interest = []
+
+        publisher = await self.connect()
+        publisher.set_interest_handler(lambda topic, status: interest.append((topic, status)))
+        await publisher.login(b'feed').wait_active()
+
+        self.assertFalse(publisher.publish(b'news', b'nothing'))
+
+        received = asyncio.Queue()
+
+        subscriber = await self.connect()
+        subscription = subscriber.subscribe(b'feed', b'news', received.put_nowait)
+
+        await self.wait_for(lambda: interest)
+        self.assertEqual(interest, [(b'news', True)])
+
+        self.assertTrue(publisher.publish(b'news', b'update'))
+        self.assertEqual(await received.get(), b'update')
+
+        subscription.cancel()
+
+        await self.wait_for(lambda: len(interest) == 2)
+        self.assertEqual(interest[1], (b'news', False))
+        self.assertFalse(publisher.publish(b'news', b'nothing'))
+
+    async def test_publish_wildcard(self):
+        publisher = await self.connect()
+        await publisher.login(b'feed').wait_active()
+
+        received = asyncio.Queue()
+
+        subscriber = await self.connect()
+        subscriber.subscribe(b'feed', b'news.*', received.put_nowait)
+
+        await self.wait_for(lambda: publisher.has_interest(b'news.sport'))
+
+        self.assertFalse(publisher.has_interest(b'weather'))
+        self.assertTrue(publisher.publish(b'news.sport', b'goal'))
+        self.assertEqual(await received.get(), b'goal')
+
+    async def test_reconnect(self):
+        """
+        Test that outstanding requests fail when the connection is lost,
+        and that names and subscriptions are restored after reconnecting.
+        """
+
+        service = await self.connect(reconnect_delay=0.01)
+        session = service.login(b'service', lambda payload: None)
+        await session.wait_active()
+
+        publisher = await self.connect()
+        await publisher.login(b'feed').wait_active()
+
+        received = asyncio.Queue()
+        service.subscribe(b'feed', b'news', received.put_nowait)
+        await self.wait_for(lambda: publisher.has_interest(b'news'))
+
+        client = await self.connect()
+        future = service.request(b'service', b'', timeout=5.0)
+
+        service.connection.transport.abort()
+
+        with self.assertRaises(ConnectionLost):
+            await future
+
+        with self.assertRaises(ConnectionLost):
+            service.request(b'service', b'')
+
+        await service.drain()
+        await session.wait_active()
+
+        service.sessions[b'service'].handler = lambda payload: b'back'
+        self.assertEqual(await client.request(b'service', b''), b'back')
+
+        await self.wait_for(lambda: publisher.has_interest(b'news'))
+        publisher.publish(b'news', b'update')
+        self.assertEqual(await received.get(), b'update')
+
+    async def wait_for(self, condition, timeout=5.0):
+        deadline = asyncio.get_running_loop().time() + timeout
+
+        while not condition():
+            self.assertLess(asyncio.get_running_loop().time(), deadline)
+            await asyncio.sleep(0.001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+
+from nervixd.mainloop.aio import AsyncioMainloop
+
+from nervix.client import Client, Pool
+
+from benchmarks.server import build_server, find_free_port
+
+
+class TestPool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        loop = asyncio.get_running_loop()
+
+        self.mainloop = AsyncioMainloop(loop)
+        self.addresses = [('127.0.0.1', find_free_port()) for _ in range(2)]
+        self.controllers = [build_server(self.mainloop, address) for address in self.addresses]
+
+        # a service that holds on to the requests until released, on
+        # both servers
+        self.calls = []
+        self.release = asyncio.Event()
+
+        async def handler(payload):
+            self.calls.append(payload)
+            await self.release.wait()
+            return payload
+
+        self.services = []
+
+        for host, port in self.addresses:
+            service = Client(host, port)
+            await service.connect()
+            await service.login(b'service', handler).wait_active()
+            self.services.append(service)
+
+        self.pool = Pool(self.addresses, size=2, max_in_flight=3, sticky=[b'ordered'], reconnect_delay=0.01)
+        await self.pool.connect()
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+        for service in self.services:
+            await service.close()
+
+        for controller in self.controllers:
+            controller.start_server_shutdown()
+
+    async def test_least_loaded(self):
+        """
+        Test that requests are spread over all connections, without
+        exceeding the in-flight limit of any of them.
+        """
+
+        tasks = [asyncio.ensure_future(self.pool.request(b'service', b'%d' % i)) for i in range(20)]
+
+        await self.wait_for(lambda: len(self.calls) == 12)
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(len(self.calls), 12)
+        self.assertEqual([client.in_flight for client in self.pool.clients], [3, 3, 3, 3])
+
+        self.release.set()
+
+        self.assertEqual(await asyncio.gather(*tasks), [b'%d' % i for i in range(20)])
+        self.assertEqual(self.pool.in_flight, 0)
+
+    async def test_sticky(self):
+        """
+        Test that all requests to a sticky name use the same connection.
+        """
+
+        sticky = self.pool.get_client(b'ordered')
+        received = []
+
+        for service in self.services:
+            service.login(b'ordered', lambda payload: received.append(payload) or payload)
+
+        await self.wait_for(lambda: all(service.sessions[b'ordered'].active for service in self.services))
+
+        tasks = [asyncio.ensure_future(self.pool.request(b'ordered', b'%d' % i)) for i in range(10)]
+
+        await asyncio.sleep(0)
+
+        # the in-flight limit applies to sticky names as well
+        self.assertEqual(sticky.in_flight, 3)
+        self.assertEqual(self.pool.in_flight, 3)
+
+        self.assertEqual(await asyncio.gather(*tasks), [b'%d' % i for i in range(10)])
+        self.assertEqual(received, [b'%d' % i for i in range(10)])
+
+    async def test_send(self):
+        received = []
+
+        for service in self.services:
+            service.sessions[b'service'].handler = received.append
+
+        for i in range(8):
+            self.pool.send(b'service', b'%d' % i)
+
+        await self.wait_for(lambda: len(received) == 8)
+
+        self.assertEqual(sorted(received), [b'%d' % i for i in range(8)])
+
+    async def test_connection_lost(self):
+        """
+        Test that requests avoid a connection while it is reconnecting.
+        """
+
+        lost = self.pool.clients[0]
+        lost.connection.transport.abort()
+
+        await asyncio.sleep(0)
+        self.assertFalse(lost.ready)
+
+        self.release.set()
+
+        answers = await asyncio.gather(*(self.pool.request(b'service', b'x') for _ in range(9)))
+        self.assertEqual(answers, [b'x'] * 9)
+
+        await lost.drain()
+        self.assertEqual(await self.pool.request(b'service', b'y'), b'y')
+
+    async def wait_for(self, condition, timeout=5.0):
+        deadline = asyncio.get_running_loop().time() + timeout
+
+        while not condition():
+            self.assertLess(asyncio.get_running_loop().time(), deadline)
+            await asyncio.sleep(0.001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import unittest
+
+from nervixd.mainloop import Mainloop
+from nervixd.mainloop.aio import AsyncioMainloop
+from nervixd.mainloop.monitor import LoopMonitor, Histogram, describe_handler
+from nervixd.reactor.verbs import LoginVerb
+
+
+class TestMainloop(unittest.TestCase):
+
+    def setUp(self):
+        self.mainloop = Mainloop()
+
+        self.pipes = [os.pipe() for _ in range(2)]
+
+    def tearDown(self):
+        for r, w in self.pipes:
+            os.close(r)
+            os.close(w)
+
+    def test_pending_round_robin(self):
+        turns = []
+
+        def handler(proxy, name, nr_turns):
+            turns.append(name)
+
+            if turns.count(name) == nr_turns:
+                proxy.set_pending(False)
+
+        proxy1 = self.mainloop.register(self.pipes[0][0])
+        proxy1.set_pending_handler(lambda: handler(proxy1, 'a', 3))
+        proxy1.set_pending(True)
+
+        proxy2 = self.mainloop.register(self.pipes[1][0])
+        proxy2.set_pending_handler(lambda: handler(proxy2, 'b', 1))
+        proxy2.set_pending(True)
+
+        # every pending proxy gets one turn per cycle
+        self.mainloop.run_once(10.0)
+        self.assertEqual(['a', 'b'], turns)
+
+        self.mainloop.run_once(10.0)
+        self.mainloop.run_once(10.0)
+        self.assertEqual(['a', 'b', 'a', 'a'], turns)
+
+        self.assertEqual(0, len(self.mainloop.fd_pending))
+
+    def test_pending_after_read(self):
+        """ A proxy that becomes pending while handling a read event gets its turn in the next cycle.
+        """
+
+        turns = []
+
+        r, w = self.pipes[0]
+
+        proxy = self.mainloop.register(r)
+
+        def on_read():
+            os.read(r, 1)
+            turns.append('read')
+            proxy.set_pending(True)
+            proxy.set_interest(read=False)
+
+        def on_pending():
+            turns.append('pending')
+            proxy.set_pending(False)
+
+        proxy.set_read_handler(on_read)
+        proxy.set_pending_handler(on_pending)
+        proxy.set_interest(read=True)
+
+        os.write(w, b'x')
+
+        self.mainloop.run_once(10.0)
+        self.assertEqual(['read'], turns)
+
+        self.mainloop.run_once(10.0)
+        self.assertEqual(['read', 'pending'], turns)
+
+    def test_unregister_pending(self):
+        proxy = self.mainloop.register(self.pipes[0][0])
+        proxy.set_pending_handler(lambda: self.fail("Unregistered proxy got a turn"))
+        proxy.set_pending(True)
+
+        proxy.unregister()
+
+        self.mainloop.run_once(0.01)
+
+    def test_call_soon(self):
+        calls = []
+
+        def callback(nr):
+            calls.append(nr)
+
+            # deferred from a deferred callback, waits for the next cycle
+            if nr == 1:
+                self.mainloop.call_soon(callback, 3)
+
+        self.mainloop.call_soon(callback, 1)
+        cancelled = self.mainloop.call_soon(callback, 99)
+        self.mainloop.call_soon(callback, nr=2)
+
+        cancelled.cancel()
+
+        # the cycle does not wait for IO while work is deferred
+        self.mainloop.run_once(10.0)
+        self.assertEqual([1, 2], calls)
+
+        self.mainloop.run_once(10.0)
+        self.assertEqual([1, 2, 3], calls)
+        self.assertEqual(0, len(self.mainloop.deferred))
+
+    def test_call_soon_budget(self):
+        calls = []
+
+        self.mainloop.deferred_budget = 0
+
+        for i in range(3):
+            self.mainloop.call_soon(calls.append, i)
+
+        # the budget is used up after the first call of each cycle
+        self.mainloop.run_once(10.0)
+        self.assertEqual([0], calls)
+
+        self.mainloop.run_once(10.0)
+        self.mainloop.run_once(10.0)
+        self.assertEqual([0, 1, 2], calls)
+
+    def test_call_later(self):
+        calls = []
+
+        self.mainloop.call_later(0.01, calls.append, 'later')
+        self.mainloop.call_later(10.0, calls.append, 'cancelled').cancel()
+
+        for _ in range(100):
+            if calls:
+                break
+
+            self.mainloop.run_once(1.0)
+
+        self.assertEqual(['later'], calls)
+
+    def test_many_timers(self):
+        """ Setting more timers in one cycle than the control pipe can buffer wakeups for should not block, the
+        mainloop sends a wakeup signal for every timer that is set.
+        """
+
+        calls = []
+
+        for i in range(100000):
+            self.mainloop.call_later(0.0, calls.append, i)
+
+        self.mainloop.run_once(1.0)
+
+        self.assertEqual(100000, len(calls))
+
+    def test_monitor(self):
+        monitor = LoopMonitor(self.mainloop.now, slow_threshold=0.01)
+        self.mainloop.set_monitor(monitor)
+
+        calls = []
+
+        self.mainloop.call_later(0, calls.append, 'timer')
+
+        with self.assertLogs('nervixd.mainloop.monitor', 'WARNING') as logs:
+            self.mainloop.call_soon(time.sleep, 0.02)
+
+            for _ in range(100):
+                if calls and monitor.nr_slow:
+                    break
+
+                self.mainloop.run_once(1.0)
+
+        self.assertEqual(['timer'], calls)
+        self.assertEqual(1, monitor.lag.count)
+        self.assertEqual(1, monitor.nr_slow)
+        self.assertIn('Slow deferred handler sleep', logs.output[0])
+
+
+class TestLoopMonitor(unittest.TestCase):
+
+    def test_histogram(self):
+        h = Histogram((0.001, 0.01, 0.1))
+
+        self.assertEqual(0.0, h.percentile(99))
+
+        for value in [0.0005] * 98 + [0.05, 3.0]:
+            h.add(value)
+
+        self.assertEqual([98, 0, 1, 1], h.counts)
+        self.assertEqual(0.001, h.percentile(50))
+        self.assertEqual(0.1, h.percentile(99))
+        self.assertEqual(3.0, h.percentile(100))
+        self.assertEqual(3.0, h.max)
+
+        h.reset()
+        self.assertEqual(0, h.count)
+
+    def test_slow_handler(self):
+        now = [0.0]
+
+        monitor = LoopMonitor(lambda: now[0], slow_threshold=0.1)
+        connection = DummyConnection('CLIENT_1')
+
+        def handler():
+            monitor.annotate(connection.channel, LoginVerb(name=b'name'))
+            now[0] += 0.25
+
+        with self.assertLogs('nervixd.mainloop.monitor', 'WARNING') as logs:
+            monitor.call('read', handler)
+
+        self.assertEqual(1, monitor.nr_slow)
+        self.assertIn('took 250.0 ms, last verb LoginVerb from CLIENT_1', logs.output[0])
+
+        # the verb is forgotten when the next handler is called
+        monitor.call('read', lambda: None)
+        self.assertIsNone(monitor.verb)
+
+    def test_describe_handler(self):
+        mainloop = Mainloop()
+        connection = DummyConnection('CLIENT_1')
+
+        self.assertEqual('DummyConnection.on_read of CLIENT_1', describe_handler(connection.on_read))
+        self.assertEqual('len of CLIENT_1', describe_handler(len, (connection.channel,)))
+
+        # timers are described by the handler they call
+        timer = mainloop.timer()
+        timer.set_handler(connection.on_read)
+        timer.set(1.0)
+
+        handler = mainloop.timer_handlers[timer.timer_id]
+        self.assertEqual('DummyConnection.on_read of CLIENT_1', describe_handler(handler))
+
+
+class DummyConnection:
+
+    def __init__(self, description):
+        self.channel = DummyChannel(description)
+
+    def on_read(self):
+        pass
+
+
+class DummyChannel:
+
+    def __init__(self, description):
+        self.description = description
+
+
+class TestAsyncioMainloop(TestMainloop):
+    """
+    Run the same tests on the asyncio based mainloop.
+    """
+
+    def setUp(self):
+        TestMainloop.setUp(self)
+
+        self.mainloop = AsyncioMainloop()
+
+    def tearDown(self):
+        self.mainloop.loop.close()
+
+        TestMainloop.tearDown(self)
+
+    def test_embedded(self):
+        """ The mainloop can run on an event loop driven by an asyncio application.
+        """
+
+        r, w = self.pipes[0]
+        received = []
+
+        def on_read():
+            received.append(os.read(r, 1))
+            self.mainloop.loop.stop()
+
+        proxy = self.mainloop.register(r)
+        proxy.set_read_handler(on_read)
+        proxy.set_interest(read=True)
+
+        self.mainloop.call_later(0.01, os.write, w, b'x')
+
+        self.mainloop.loop.run_forever()
+
+        self.assertEqual([b'x'], received)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import os
+import zlib
 import unittest
 from struct import pack
 
@@ -87,6 +89,22 @@ class TestState(unittest.TestCase):
             name=b'123'
         )
 
+        self.assertDecodePacket(
+            packets.login(b'123', False, False, False, shared=True),
+            LoginPacket,
+            shared=True,
+            weight=1,
+            name=b'123'
+        )
+
+        self.assertDecodePacket(
+            packets.login(b'123', False, False, False, shared=True, weight=5),
+            LoginPacket,
+            shared=True,
+            weight=5,
+            name=b'123'
+        )
+
     def test_logout(self):
         self.assertDecodePacket(
             packets.logout(b'thename'),
@@ -152,6 +170,106 @@ class TestState(unittest.TestCase):
             QuitPacket
         )
 
+    def test_compress(self):
+        self.assertDecodePacket(
+            packets.compress(64, b'thedictionary'),
+            CompressPacket,
+            threshold=64,
+            dictionary=b'thedictionary'
+        )
+
+    def test_batch(self):
+        payload = os.urandom(200)
+
+        d = Decoder()
+        d.add_chunk(packets.batch(
+            packets.post(1234, payload),
+            packets.request(b'name', True, 0, 1000, b'uni'),
+            packets.logout(b'name'),
+        ))
+
+        packet = d.decode()
+
+        self.assertIsInstance(packet, BatchPacket)
+        self.assertEqual(3, len(packet.packets))
+
+        post, request, logout = packet.packets
+
+        self.assertIsInstance(post, PostPacket)
+        self.assertEqual(1234, post.postref)
+        self.assertEqual(payload, post.payload)
+
+        self.assertIsInstance(request, RequestPacket)
+        self.assertTrue(request.unidirectional)
+        self.assertEqual(b'uni', request.payload)
+
+        self.assertIsInstance(logout, LogoutPacket)
+        self.assertEqual(b'name', logout.name)
+
+        self.assertIsNone(d.decode())
+
+    def test_batch_invalid(self):
+        # packets that do not translate into a verb are not allowed
+        d = Decoder()
+        d.add_chunk(packets.batch(packets.quit()))
+
+        with self.assertRaises(DecodingError):
+            d.decode()
+
+        # subframe that exceeds the BATCH frame
+        frame = packets.uint8(20) + packets.uint8(packets.PACKET_LOGOUT) + packets.string(b'name')
+        d = Decoder()
+        d.add_chunk(packets.uint32(len(frame)) + packets.uint8(packets.PACKET_BATCH) + frame)
+
+        with self.assertRaises(DecodingError):
+            d.decode()
+
+        # frames truncated in the varint, the type, or inside a subframe
+        subframe = packets.uint32(1234) + packets.blob(b'payload')
+        valid = packets.uint8(len(subframe)) + packets.uint8(packets.PACKET_POST) + subframe
+
+        truncated = [
+            valid + packets.uint8(0x80),
+            valid + packets.uint8(4),
+            packets.uint8(2) + packets.uint8(packets.PACKET_POST) + packets.uint8(0) + packets.uint8(1),
+        ]
+
+        for frame in truncated:
+            with self.subTest(frame=frame):
+                d = Decoder()
+                d.add_chunk(packets.uint32(len(frame)) + packets.uint8(packets.PACKET_BATCH) + frame)
+
+                with self.assertRaises(DecodingError):
+                    d.decode()
+
+    def test_compressed(self):
+        compressor = zlib.compressobj(zdict=b'dict')
+
+        def compressed(data):
+            return packets.compressed(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+        d = Decoder()
+        d.enable_compression(b'dict')
+
+        # compressed and raw packets may be mixed
+        d.add_chunk(compressed(packets.logout(b'name1') + packets.logout(b'name2')))
+        d.add_chunk(packets.logout(b'name3'))
+        d.add_chunk(compressed(packets.logout(b'name4')))
+
+        for name in [b'name1', b'name2', b'name3', b'name4']:
+            packet = d.decode()
+            self.assertIsInstance(packet, LogoutPacket)
+            self.assertEqual(name, packet.name)
+
+        self.assertIsNone(d.decode())
+
+    def test_compressed_not_enabled(self):
+        d = Decoder()
+        d.add_chunk(packets.compressed(zlib.compress(packets.quit())))
+
+        with self.assertRaises(DecodingError):
+            d.decode()
+
     def assertDecodePacket(self, chunk, cls, **attr):
         d = Decoder()
         d.add_chunk(chunk)
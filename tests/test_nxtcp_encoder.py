@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import zlib
 import unittest
 from struct import pack
 
@@ -87,7 +88,7 @@ class TestState(unittest.TestCase):
 
     def test_welcome(self):
         self.assertEncodePacket(
-            WelcomePacket(1, 1),
+            WelcomePacket(1, 2),
             packets.welcome()
         )
 
@@ -97,6 +98,49 @@ class TestState(unittest.TestCase):
             packets.byebye()
         )
 
+    def test_compress_ack(self):
+        self.assertEncodePacket(
+            CompressAckPacket(64),
+            packets.compress_ack(64)
+        )
+
+    def test_compression_threshold(self):
+        e = Encoder()
+        e.enable_compression(20)
+
+        # a batch below the threshold is send uncompressed
+        e.encode(PingPacket())
+        e.encode(ByeByePacket())
+
+        self.assertEqual(packets.ping() + packets.byebye(), e.pop_pending())
+
+        # a batch above the threshold is compressed as a whole
+        e.encode(SessionPacket(b'thename', SessionPacket.STATE_ACTIVE))
+        e.encode(SessionPacket(b'othername', SessionPacket.STATE_ACTIVE))
+
+        compressor = zlib.compressobj(6)
+        expected = packets.session(b'thename', packets.SESSION_STATE_ACTIVE)
+        expected += packets.session(b'othername', packets.SESSION_STATE_ACTIVE)
+        expected = compressor.compress(expected) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        self.assertEqual(packets.compressed(expected), e.fetch_chunk(4096))
+
+    def test_compression_dictionary(self):
+        dictionary = b'thename'
+
+        e = Encoder()
+        e.enable_compression(0, dictionary)
+        e.encode(SessionPacket(b'thename', SessionPacket.STATE_ACTIVE))
+
+        chunk = e.pop_pending()
+        self.assertEqual(packets.PACKET_COMPRESSED, chunk[4])
+
+        decompressor = zlib.decompressobj(zdict=dictionary)
+        self.assertEqual(
+            packets.session(b'thename', packets.SESSION_STATE_ACTIVE),
+            decompressor.decompress(chunk[5:])
+        )
+
     # def test_sync_ack(self):
     #     self.assertEncodePacket(
     #         SyncAckPacket(),
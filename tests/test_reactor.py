@@ -5,6 +5,8 @@ import unittest
 from collections import deque
 
 from nervixd.reactor import Reactor
+from nervixd.reactor.reactor import Channel
+from nervixd.reactor.state import BALANCE_LEAST_OUTSTANDING
 from nervixd.tracer import BaseTracer, PrintTracer
 
 from nervixd.reactor.verbs import *
@@ -682,6 +684,664 @@ class TestReactor(unittest.TestCase):
 
         # no exceptions should happen!
 
+    def test_overload_default_policy(self):
+        """
+        Test that by default an overloaded channel only loses messages on
+        subscriptions, its requests are neither failed nor is it
+        disconnected.
+        """
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        self.assertEqual(Channel.POLICY_DROP_OLDEST, ch1.overload_policy)
+
+        ch1.set_watermarks(2 ** 20, 2 ** 20, 4, 2)
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        ch1.pop_downstream()
+
+        for i in range(10):
+            self.assertChannelSend(ch2, RequestVerb(name=name1, unidirectional=False, messageref=i + 1, timeout=None,
+                                                    payload=b'payload'))
+
+        self.assertEqual(10, len(ch1.downstream_queue))
+        self.assertFalse(ch1.is_disconnecting)
+        self.assertEqual(0, reactor.nr_failed_requests)
+
+    def test_overload_drop_oldest(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+        topic1 = b'topic1'
+
+        ch2.set_watermarks(2 ** 20, 2 ** 20, 4, 2)
+        ch2.set_overload_policy(Channel.POLICY_DROP_OLDEST)
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertChannelRecv(ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE))
+
+        self.assertChannelSend(ch2, SubscribeVerb(name=name1, messageref=1234, topic=topic1))
+        self.assertChannelRecv(ch1,
+                               InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_INTEREST, topic=topic1))
+
+        # ch2 does not keep up, the fifth message drops the oldest three
+        for i in range(5):
+            self.assertChannelSend(ch1, PostVerb(postref=1, payload=b'payload%d' % i))
+
+        self.assertTrue(ch2.is_overloaded)
+        self.assertEqual(3, ch2.nr_dropped_verbs)
+        self.assertEqual(3, reactor.nr_dropped_verbs)
+
+        self.assertChannelRecv(ch2, MessageVerb(messageref=1234, status=MessageVerb.STATUS_OK,
+                                                reason=MessageVerb.REASON_NONE, payload=b'payload3'))
+        self.assertChannelRecv(ch2, MessageVerb(messageref=1234, status=MessageVerb.STATUS_OK,
+                                                reason=MessageVerb.REASON_NONE, payload=b'payload4'))
+        self.assertChannelRecv(ch2, None)
+
+        self.assertFalse(ch2.is_overloaded)
+
+    def test_overload_fail_requests(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        ch1.set_watermarks(2 ** 20, 2 ** 20, 2, 1)
+        ch1.set_overload_policy(Channel.POLICY_FAIL_REQUESTS)
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertChannelRecv(ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE))
+
+        # the third call overloads ch1, failing the two oldest calls
+        for messageref in range(1, 4):
+            self.assertChannelSend(ch2, RequestVerb(name=name1, unidirectional=False, messageref=messageref,
+                                                    timeout=None, payload=b'payload'))
+
+        self.assertChannelRecv(ch2, MessageVerb(messageref=1, status=MessageVerb.STATUS_NOK,
+                                                reason=MessageVerb.REASON_OVERLOADED, payload=None))
+        self.assertChannelRecv(ch2, MessageVerb(messageref=2, status=MessageVerb.STATUS_NOK,
+                                                reason=MessageVerb.REASON_OVERLOADED, payload=None))
+        self.assertChannelRecv(ch2, None)
+
+        # new requests fail right away while ch1 is overloaded
+        self.assertChannelSend(ch2, RequestVerb(name=name1, unidirectional=False, messageref=4,
+                                                timeout=None, payload=b'payload'))
+        self.assertChannelRecv(ch2, MessageVerb(messageref=4, status=MessageVerb.STATUS_NOK,
+                                                reason=MessageVerb.REASON_OVERLOADED, payload=None))
+
+        self.assertEqual(3, ch1.nr_failed_requests)
+        self.assertEqual(3, reactor.nr_failed_requests)
+
+        # the remaining call is still delivered, and can be answered
+        self.assertChannelRecv(ch1, CallVerb(unidirectional=False, postref=3, name=name1, payload=b'payload'))
+        self.assertFalse(ch1.is_overloaded)
+
+        self.assertChannelSend(ch1, PostVerb(postref=3, payload=b'answer'))
+        self.assertChannelRecv(ch2, MessageVerb(messageref=3, status=MessageVerb.STATUS_OK,
+                                                reason=MessageVerb.REASON_NONE, payload=b'answer'))
+
+    def test_overload_disconnect(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        overloads = []
+
+        ch1.set_watermarks(2 ** 20, 2 ** 20, 2, 1)
+        ch1.set_overload_policy(Channel.POLICY_DISCONNECT)
+        ch1.set_overload_handler(lambda: overloads.append(ch1))
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertChannelRecv(ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE))
+
+        for i in range(5):
+            self.assertChannelSend(ch2, RequestVerb(name=name1, unidirectional=True, messageref=None,
+                                                    timeout=None, payload=b'payload'))
+
+        # everything is dropped once the disconnect is asked for
+        self.assertEqual([ch1], overloads)
+        self.assertEqual(5, ch1.nr_dropped_verbs)
+        self.assertEqual(1, reactor.nr_overload_disconnects)
+        self.assertChannelRecv(ch1, None)
+
+    def test_backlog(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        received = []
+
+        ch1.set_watermarks(1000, 100, 10000, 10000)
+        ch1.set_downstream_handler(lambda: received.append(ch1.pop_downstream()))
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertEqual(1, len(received))
+
+        # the service is not able to deliver, verbs are held back
+        ch1.set_backlog(1001)
+
+        self.assertChannelSend(ch2, RequestVerb(name=name1, unidirectional=True, messageref=None,
+                                                timeout=None, payload=b'payload'))
+        self.assertEqual(1, len(received))
+        self.assertEqual(1, len(ch1.downstream_queue))
+
+        # not yet below the low watermark
+        ch1.set_backlog(500)
+        self.assertEqual(1, len(received))
+
+        ch1.set_backlog(100)
+        self.assertEqual(2, len(received))
+        self.assertIsInstance(received[1], CallVerb)
+
+    def test_rate_limit(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        reactor.rate_limiter.set_name_limit(name1, 1, 1)
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertChannelRecv(ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE))
+
+        self.assertChannelSend(ch2, RequestVerb(name=name1, unidirectional=True, messageref=None, timeout=None,
+                                                payload=b'payload1'))
+        self.assertChannelRecv(ch1, CallVerb(unidirectional=True, postref=None, name=name1, payload=b'payload1'))
+
+        # the second request exceeds the limit and does not reach the owner
+        self.assertChannelSend(ch2, RequestVerb(name=name1, unidirectional=False, messageref=1234, timeout=None,
+                                                payload=b'payload2'))
+        self.assertChannelRecv(ch2, MessageVerb(messageref=1234, status=MessageVerb.STATUS_NOK,
+                                                reason=MessageVerb.REASON_RATE_LIMITED, payload=None))
+        self.assertChannelRecv(ch1, None)
+
+    def test_shared_login(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        ch3 = reactor.channel()
+        name1 = b'name1'
+
+        self.do_test_chain([
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch2, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            # an exclusive login cannot take over a shared name
+            (ch3, LoginVerb(name=name1, enforce=True, standby=False, persist=False)),
+            (ch3, SessionVerb(name=name1, state=SessionVerb.STATE_ENDED)),
+
+            # calls are distributed round-robin
+            (ch3, RequestVerb(name=name1, unidirectional=False, messageref=1, timeout=None, payload=b'payload1')),
+            (ch1, CallVerb(unidirectional=False, postref=1, name=name1, payload=b'payload1')),
+
+            (ch3, RequestVerb(name=name1, unidirectional=False, messageref=2, timeout=None, payload=b'payload2')),
+            (ch2, CallVerb(unidirectional=False, postref=2, name=name1, payload=b'payload2')),
+
+            (ch3, RequestVerb(name=name1, unidirectional=True, messageref=None, timeout=None, payload=b'payload3')),
+            (ch1, CallVerb(unidirectional=True, postref=None, name=name1, payload=b'payload3')),
+
+            # each call is answered by the owner that received it
+            (ch2, PostVerb(postref=2, payload=b'answer2')),
+            (ch3, MessageVerb(messageref=2, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'answer2')),
+
+            (ch1, PostVerb(postref=1, payload=b'answer1')),
+            (ch3, MessageVerb(messageref=1, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'answer1')),
+
+            (ch1, None),
+            (ch2, None),
+            (ch3, None),
+        ])
+
+    def test_shared_login_unowned_post(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        ch3 = reactor.channel()
+        name1 = b'name1'
+
+        self.do_test_chain([
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch2, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch3, RequestVerb(name=name1, unidirectional=False, messageref=1, timeout=None, payload=b'payload1')),
+            (ch1, CallVerb(unidirectional=False, postref=1, name=name1, payload=b'payload1')),
+
+            # the other shared owner may not answer the call
+            (ch2, PostVerb(postref=1, payload=b'answer')),
+            (ch3, None),
+        ])
+
+        self.assertIn('unowned_post', self.tracequeue)
+
+    def test_shared_login_standby(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        ch3 = reactor.channel()
+        ch4 = reactor.channel()
+        name1 = b'name1'
+
+        self.do_test_chain([
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch2, LoginVerb(name=name1, enforce=False, standby=True, persist=False, shared=True)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_STANDBY)),
+
+            (ch3, LoginVerb(name=name1, enforce=False, standby=True, persist=False, shared=True)),
+            (ch3, SessionVerb(name=name1, state=SessionVerb.STATE_STANDBY)),
+
+            (ch4, LoginVerb(name=name1, enforce=False, standby=True, persist=False)),
+            (ch4, SessionVerb(name=name1, state=SessionVerb.STATE_STANDBY)),
+
+            # the shared candidates take over together
+            (ch1, LogoutVerb(name=name1)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ENDED)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+            (ch3, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+            (ch4, None),
+
+            # the exclusive candidate waits for the last shared owner
+            (ch2, LogoutVerb(name=name1)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_ENDED)),
+            (ch4, None),
+        ])
+
+        ch3.close()
+
+        self.do_test_chain([
+            (ch3, SessionVerb(name=name1, state=SessionVerb.STATE_ENDED)),
+            (ch4, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+            (ch4, None),
+        ])
+
+    def test_shared_login_interest(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        ch3 = reactor.channel()
+        name1 = b'name1'
+        topic1 = b'topic1'
+
+        self.do_test_chain([
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch2, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            # every shared owner receives the interest
+            (ch3, SubscribeVerb(name=name1, topic=topic1, messageref=1)),
+            (ch1, InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_INTEREST, topic=topic1)),
+            (ch2, InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_INTEREST, topic=topic1)),
+
+            # and every shared owner may post on it
+            (ch2, PostVerb(postref=1, payload=b'data')),
+            (ch3, MessageVerb(messageref=1, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data')),
+
+            (ch1, None),
+            (ch2, None),
+            (ch3, None),
+        ])
+
+    def test_shared_login_mismatch(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        ch3 = reactor.channel()
+        ch4 = reactor.channel()
+        name1 = b'name1'
+        topic1 = b'topic1'
+
+        self.do_test_chain([
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch2, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch3, SubscribeVerb(name=name1, topic=topic1, messageref=1)),
+            (ch1, InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_INTEREST, topic=topic1)),
+            (ch2, InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_INTEREST, topic=topic1)),
+
+            # a shared owner cannot take the name exclusively while
+            # other owners share it, its session is only confirmed
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch2, LogoutVerb(name=name1)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_ENDED)),
+
+            # as the only shared owner it takes the name exclusively,
+            # without receiving the interest again
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            # so shared logins of others are refused
+            (ch4, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch4, SessionVerb(name=name1, state=SessionVerb.STATE_ENDED)),
+
+            # and the exclusive owner may share it again
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch4, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch4, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+            (ch4, InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_INTEREST, topic=topic1)),
+
+            (ch1, PostVerb(postref=1, payload=b'data')),
+            (ch3, MessageVerb(messageref=1, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data')),
+
+            (ch1, None),
+            (ch2, None),
+            (ch3, None),
+            (ch4, None),
+        ])
+
+    def test_shared_login_least_outstanding(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        ch3 = reactor.channel()
+        name1 = b'name1'
+
+        reactor.set_balance_policy(name1, BALANCE_LEAST_OUTSTANDING)
+
+        self.do_test_chain([
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch2, LoginVerb(name=name1, enforce=False, standby=False, persist=False, shared=True)),
+            (ch2, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch3, RequestVerb(name=name1, unidirectional=False, messageref=1, timeout=None, payload=b'payload1')),
+            (ch1, CallVerb(unidirectional=False, postref=1, name=name1, payload=b'payload1')),
+
+            (ch3, RequestVerb(name=name1, unidirectional=False, messageref=2, timeout=None, payload=b'payload2')),
+            (ch2, CallVerb(unidirectional=False, postref=2, name=name1, payload=b'payload2')),
+
+            (ch2, PostVerb(postref=2, payload=b'answer2')),
+            (ch3, MessageVerb(messageref=2, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'answer2')),
+
+            # ch1 is still busy with the first call
+            (ch3, RequestVerb(name=name1, unidirectional=False, messageref=3, timeout=None, payload=b'payload3')),
+            (ch2, CallVerb(unidirectional=False, postref=3, name=name1, payload=b'payload3')),
+
+            (ch1, None),
+            (ch2, None),
+            (ch3, None),
+        ])
+
+    def test_subscribe_wildcard(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        ch3 = reactor.channel()
+        name1 = b'name1'
+
+        self.do_test_chain([
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            # the owner learns about the wildcard interest once
+            (ch2, SubscribeVerb(name=name1, topic=b'file;*', messageref=1)),
+            (ch1, InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_INTEREST, topic=b'file;*')),
+
+            (ch3, SubscribeVerb(name=name1, topic=b'file;a', messageref=2)),
+            (ch1, InterestVerb(postref=2, name=name1, status=InterestVerb.STATUS_INTEREST, topic=b'file;a')),
+
+            (ch3, SubscribeVerb(name=name1, topic=b'*', messageref=3)),
+            (ch1, InterestVerb(postref=3, name=name1, status=InterestVerb.STATUS_INTEREST, topic=b'*')),
+
+            # a message on a topic reaches the wildcard subscribers too,
+            # but a channel receives it once, on its exact subscription
+            (ch1, PostVerb(postref=2, payload=b'data1')),
+            (ch2, MessageVerb(messageref=1, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data1')),
+            (ch3, MessageVerb(messageref=2, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data1')),
+            (ch2, None),
+            (ch3, None),
+
+            # as does a message on a narrower wildcard topic
+            (ch1, PostVerb(postref=1, payload=b'data2')),
+            (ch2, MessageVerb(messageref=1, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data2')),
+            (ch3, MessageVerb(messageref=3, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data2')),
+
+            (ch1, PostVerb(postref=3, payload=b'data3')),
+            (ch3, MessageVerb(messageref=3, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data3')),
+            (ch2, None),
+        ])
+
+        ch2.close()
+
+        self.do_test_chain([
+            (ch1, InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_NO_INTEREST, topic=b'file;*')),
+
+            (ch1, PostVerb(postref=2, payload=b'data4')),
+            (ch3, MessageVerb(messageref=2, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data4')),
+            (ch3, None),
+        ])
+
+        self.assertEqual(1, len(reactor.state.interest_tries[name1]))
+
+    def test_subscribe_wildcard_overlap(self):
+
+        reactor = self.get_test_reactor()
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        self.do_test_chain([
+            (ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False)),
+            (ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE)),
+
+            (ch2, SubscribeVerb(name=name1, topic=b'*', messageref=1)),
+            (ch1, InterestVerb(postref=1, name=name1, status=InterestVerb.STATUS_INTEREST, topic=b'*')),
+
+            (ch2, SubscribeVerb(name=name1, topic=b'file;*', messageref=2)),
+            (ch1, InterestVerb(postref=2, name=name1, status=InterestVerb.STATUS_INTEREST, topic=b'file;*')),
+
+            (ch2, SubscribeVerb(name=name1, topic=b'file;a', messageref=3)),
+            (ch1, InterestVerb(postref=3, name=name1, status=InterestVerb.STATUS_INTEREST, topic=b'file;a')),
+
+            # overlapping wildcards deliver a message once, on the most
+            # specific of them
+            (ch1, PostVerb(postref=2, payload=b'data1')),
+            (ch2, MessageVerb(messageref=2, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data1')),
+            (ch2, None),
+
+            (ch1, PostVerb(postref=3, payload=b'data2')),
+            (ch2, MessageVerb(messageref=3, status=MessageVerb.STATUS_OK, reason=MessageVerb.REASON_NONE,
+                              payload=b'data2')),
+            (ch2, None),
+        ])
+
+    def test_interest_replay(self):
+
+        reactor = self.get_test_reactor()
+        reactor.interest_replay_chunk = 2
+
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        for i in range(5):
+            self.assertChannelSend(ch2, SubscribeVerb(name=name1, topic=b'topic%d' % i, messageref=i + 1))
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertChannelRecv(ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE))
+
+        # only the first chunk is send right away
+        topics = {ch1.pop_downstream().topic for _ in range(2)}
+        self.assertChannelRecv(ch1, None)
+
+        # interest that is gone is not replayed
+        remaining = {b'topic%d' % i for i in range(5)} - topics
+        gone = remaining.pop()
+        self.assertChannelSend(ch2, UnsubscribeVerb(name=name1, topic=gone))
+        self.assertEqual(InterestVerb.STATUS_NO_INTEREST, ch1.pop_downstream().status)
+
+        while reactor.interest_replays:
+            reactor.mainloop.run_deferred()
+
+        replayed = set()
+        while ch1.downstream_queue:
+            verb = ch1.pop_downstream()
+            self.assertEqual(InterestVerb.STATUS_INTEREST, verb.status)
+            replayed.add(verb.topic)
+
+        self.assertSetEqual(remaining, replayed)
+
+    def test_interest_replay_renewed(self):
+
+        reactor = self.get_test_reactor()
+        reactor.interest_replay_chunk = 2
+
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        for i in range(5):
+            self.assertChannelSend(ch2, SubscribeVerb(name=name1, topic=b'topic%d' % i, messageref=i + 1))
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertChannelRecv(ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE))
+
+        topics = {ch1.pop_downstream().topic for _ in range(2)}
+
+        # interest that is renewed during the replay is send right away,
+        # and not again by the replay
+        renewed = ({b'topic%d' % i for i in range(5)} - topics).pop()
+        self.assertChannelSend(ch2, UnsubscribeVerb(name=name1, topic=renewed))
+        self.assertChannelSend(ch2, SubscribeVerb(name=name1, topic=renewed, messageref=10))
+
+        self.assertEqual(InterestVerb.STATUS_NO_INTEREST, ch1.pop_downstream().status)
+        self.assertEqual(InterestVerb.STATUS_INTEREST, ch1.pop_downstream().status)
+
+        while reactor.interest_replays:
+            reactor.mainloop.run_deferred()
+
+        replayed = [ch1.pop_downstream().topic for _ in range(len(ch1.downstream_queue))]
+
+        self.assertEqual(2, len(replayed))
+        self.assertNotIn(renewed, replayed)
+
+    def test_interest_replay_logout(self):
+
+        reactor = self.get_test_reactor()
+        reactor.interest_replay_chunk = 2
+
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        for i in range(5):
+            self.assertChannelSend(ch2, SubscribeVerb(name=name1, topic=b'topic%d' % i, messageref=i + 1))
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertChannelSend(ch1, LogoutVerb(name=name1))
+
+        # the replay stops once the channel lost the name
+        reactor.mainloop.run_deferred()
+
+        self.assertEqual(4, len(ch1.downstream_queue))
+        self.assertEqual({}, reactor.interest_replays)
+
+    def test_fan_out_slices(self):
+
+        reactor = self.get_test_reactor()
+        reactor.fanout_slice = 2
+
+        ch1 = reactor.channel()
+        name1 = b'name1'
+        topic1 = b'topic1'
+
+        subscribers = [reactor.channel() for _ in range(5)]
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+
+        for ch in subscribers:
+            self.assertChannelSend(ch, SubscribeVerb(name=name1, topic=topic1, messageref=1))
+
+        # a subscriber that leaves before its turn is skipped
+        subscribers[-1].close()
+
+        self.assertChannelSend(ch1, PostVerb(postref=1, payload=b'data'))
+
+        received = [ch for ch in subscribers if ch.downstream_queue]
+        self.assertEqual(2, len(received))
+
+        reactor.mainloop.run_deferred()
+        received = [ch for ch in subscribers if ch.downstream_queue]
+        self.assertEqual(4, len(received))
+
+        reactor.mainloop.run_deferred()
+        self.assertEqual([], reactor.mainloop.deferred)
+        self.assertEqual(0, len(subscribers[-1].downstream_queue))
+
+    def test_close_slices(self):
+
+        reactor = self.get_test_reactor()
+        reactor.close_slice = 2
+
+        ch1 = reactor.channel()
+        ch2 = reactor.channel()
+        name1 = b'name1'
+
+        self.assertChannelSend(ch1, LoginVerb(name=name1, enforce=False, standby=False, persist=False))
+        self.assertChannelRecv(ch1, SessionVerb(name=name1, state=SessionVerb.STATE_ACTIVE))
+
+        for i in range(3):
+            self.assertChannelSend(ch2, SubscribeVerb(name=name1, topic=b'topic%d' % i, messageref=i + 1))
+            ch1.pop_downstream()
+
+        ch2.close()
+
+        # the first slice of subscriptions is released right away
+        self.assertEqual(2, len(ch1.downstream_queue))
+
+        while reactor.mainloop.deferred:
+            reactor.mainloop.run_deferred()
+
+        self.assertEqual(3, len(ch1.downstream_queue))
+        self.assertEqual(set(), reactor.state.get_channel_subscriptions(ch2))
+        self.assertEqual(0, len(reactor.state.get_post_watchers_from_channel(ch2)))
+
     def assertChannelSend(self, channel, verb):
         channel.put_upstream(verb)
 
@@ -760,6 +1420,8 @@ class DummyMainloop:
 
     def __init__(self):
         self.timer_handlers = dict()
+        self.deferred = []
+        self.monitor = None
 
     def now(self):
         return 1234.5
@@ -768,8 +1430,30 @@ class DummyMainloop:
         timer = DummyTimer(self)
         return timer
 
+    def call_soon(self, func, *args):
+        call = DummyDeferred(func, args)
+        self.deferred.append(call)
+        return call
+
+    def call_later(self, delay, func, *args):
+        timer = self.timer()
+        timer.set_handler(func, *args)
+        timer.set(delay)
+        return timer
+
+    def run_deferred(self):
+        calls = self.deferred
+        self.deferred = []
+
+        for call in calls:
+            if not call.cancelled:
+                call.func(*call.args)
+
     def trigger_timers(self):
-        for handler in self.timer_handlers.values():
+        handlers = list(self.timer_handlers.values())
+        self.timer_handlers.clear()
+
+        for handler in handlers:
             handler()
 
     def _update_timer_handler(self, timerid, handler):
@@ -780,6 +1464,17 @@ class DummyMainloop:
             self.timer_handlers.pop(timerid, None)
 
 
+class DummyDeferred:
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
 class DummyTimer:
     next_timer_id = 1
 
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from nervixd.reactor.ratelimit import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.time = 100.0
+        self.limiter = RateLimiter(lambda: self.time)
+
+    def test_disabled(self):
+        self.assertFalse(self.limiter.enabled)
+
+        for _ in range(1000):
+            self.assertTrue(self.limiter.allow('ch1', b'name'))
+
+    def test_channel_limit(self):
+        self.limiter.set_channel_limit(10, 3)
+        self.assertTrue(self.limiter.enabled)
+
+        # the burst is available right away
+        for _ in range(3):
+            self.assertTrue(self.limiter.allow('ch1', b'name'))
+
+        self.assertFalse(self.limiter.allow('ch1', b'name'))
+
+        # other channels have their own bucket
+        self.assertTrue(self.limiter.allow('ch2', b'name'))
+
+        # after 0.15 second one and a half token is added
+        self.time += 0.15
+        self.assertTrue(self.limiter.allow('ch1', b'name'))
+        self.assertFalse(self.limiter.allow('ch1', b'name'))
+
+        # the bucket does not fill beyond the burst
+        self.time += 10.0
+        for _ in range(3):
+            self.assertTrue(self.limiter.allow('ch1', b'name'))
+
+        self.assertFalse(self.limiter.allow('ch1', b'name'))
+
+        self.assertEqual(3, self.limiter.nr_rejected)
+
+    def test_name_limit(self):
+        self.limiter.set_name_limit(b'name1', 1, 2)
+
+        # the bucket is shared by all channels
+        self.assertTrue(self.limiter.allow('ch1', b'name1'))
+        self.assertTrue(self.limiter.allow('ch2', b'name1'))
+        self.assertFalse(self.limiter.allow('ch3', b'name1'))
+
+        # other names are not limited
+        self.assertTrue(self.limiter.allow('ch1', b'name2'))
+
+    def test_default_name_limit(self):
+        self.limiter.set_name_limit(None, 1, 1)
+        self.limiter.set_name_limit(b'name1', 1, 2)
+
+        self.assertTrue(self.limiter.allow('ch1', b'name1'))
+        self.assertTrue(self.limiter.allow('ch1', b'name1'))
+
+        self.assertTrue(self.limiter.allow('ch1', b'name2'))
+        self.assertFalse(self.limiter.allow('ch1', b'name2'))
+
+    def test_both_limits(self):
+        """ A rejected request must not take a token from the other bucket.
+        """
+
+        self.limiter.set_channel_limit(1, 2)
+        self.limiter.set_name_limit(b'name1', 1, 1)
+
+        self.assertTrue(self.limiter.allow('ch1', b'name1'))
+        self.assertFalse(self.limiter.allow('ch1', b'name1'))
+
+        self.assertTrue(self.limiter.allow('ch1', b'name2'))
+        self.assertFalse(self.limiter.allow('ch1', b'name2'))
+
+    def test_runtime_change(self):
+        self.limiter.set_channel_limit(1, 5)
+
+        self.assertTrue(self.limiter.allow('ch1', b'name'))
+
+        # lowering the burst takes away tokens of existing buckets
+        self.limiter.set_channel_limit(1, 1)
+        self.assertTrue(self.limiter.allow('ch1', b'name'))
+        self.assertFalse(self.limiter.allow('ch1', b'name'))
+
+        self.limiter.set_channel_limit(None)
+        self.assertFalse(self.limiter.enabled)
+        self.assertEqual(0, len(self.limiter.channel_buckets))
+
+    def test_invalid_limit(self):
+        with self.assertRaises(ValueError):
+            self.limiter.set_channel_limit(0)
+
+        with self.assertRaises(ValueError):
+            self.limiter.set_channel_limit(10, 0.5)
+
+    def test_prune(self):
+        self.limiter.prune_threshold = 4
+        self.limiter.set_name_limit(None, 1, 1)
+
+        for i in range(4):
+            self.limiter.allow('ch1', b'name%d' % i)
+
+        # all buckets are full again after a second, so they are pruned
+        self.time += 1.0
+        self.limiter.allow('ch1', b'name4')
+
+        self.assertEqual(1, len(self.limiter.name_buckets))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@
 
 import unittest
 
-from nervixd.reactor.state import State
+from nervixd.reactor.state import State, BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING, BALANCE_WEIGHTED
 
 
 class TestState(unittest.TestCase):
@@ -601,6 +601,75 @@ class TestState(unittest.TestCase):
         s.del_channel_subscription(ch, name2, topic2)
         self.assertEqual(set(), s.get_channel_subscriptions(ch))
 
+    def test_shared_owners(self):
+        s = State()
+        name = 'testname'
+
+        channel1 = self.get_dummy_channel()
+        channel2 = self.get_dummy_channel()
+
+        s.add_shared_name_owner(name, channel1, False)
+        s.add_shared_name_owner(name, channel2, False)
+
+        self.assertTrue(s.is_name_owned(name))
+        self.assertIsNone(s.get_name_owner(name))
+        self.assertEqual([channel1, channel2], s.get_name_owners(name))
+
+        selected = [s.select_shared_name_owner(name, BALANCE_ROUND_ROBIN).channel for _ in range(4)]
+        self.assertEqual([channel1, channel2, channel1, channel2], selected)
+
+        self.assertTrue(s.del_shared_name_owner(name, channel1))
+        self.assertFalse(s.del_shared_name_owner(name, channel1))
+        self.assertEqual([channel2], s.get_name_owners(name))
+
+        self.assertTrue(s.del_shared_name_owner(name, channel2))
+        self.assertFalse(s.is_name_shared(name))
+        self.assertIsNone(s.select_shared_name_owner(name, BALANCE_ROUND_ROBIN))
+
+    def test_shared_owners_weighted(self):
+        s = State()
+        name = 'testname'
+
+        channel1 = self.get_dummy_channel()
+        channel2 = self.get_dummy_channel()
+
+        s.add_shared_name_owner(name, channel1, False, 3)
+        s.add_shared_name_owner(name, channel2, False, 1)
+
+        selected = [s.select_shared_name_owner(name, BALANCE_WEIGHTED).channel for _ in range(8)]
+
+        # the calls are spread evenly, not in bursts
+        self.assertEqual([channel1, channel1, channel2, channel1] * 2, selected)
+
+    def test_shared_owners_least_outstanding(self):
+        s = State()
+        name = 'testname'
+
+        channel1 = self.get_dummy_channel()
+        channel2 = self.get_dummy_channel()
+
+        candidate1 = s.add_shared_name_owner(name, channel1, False)
+        candidate2 = s.add_shared_name_owner(name, channel2, False)
+
+        post1 = s.new_post(name, b'')
+        s.assign_post(post1.nr, s.select_shared_name_owner(name, BALANCE_LEAST_OUTSTANDING))
+
+        post2 = s.new_post(name, b'')
+        s.assign_post(post2.nr, s.select_shared_name_owner(name, BALANCE_LEAST_OUTSTANDING))
+
+        self.assertEqual(1, candidate1.outstanding)
+        self.assertEqual(1, candidate2.outstanding)
+        self.assertEqual(channel1, s.get_post_owner(post1.nr))
+        self.assertTrue(s.is_post_owner(post2.nr, channel2))
+        self.assertFalse(s.is_post_owner(post2.nr, channel1))
+
+        s.discard_post(post1.nr)
+        self.assertEqual(0, candidate1.outstanding)
+
+        # channel1 has the least outstanding posts, twice in a row
+        self.assertEqual(channel1, s.select_shared_name_owner(name, BALANCE_LEAST_OUTSTANDING).channel)
+        self.assertEqual(channel1, s.select_shared_name_owner(name, BALANCE_LEAST_OUTSTANDING).channel)
+
     dummy_channel_follownr = 1
 
     def get_dummy_channel(self):
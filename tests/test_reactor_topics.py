@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from nervixd.reactor.topics import TopicTrie, is_wildcard, get_prefix
+
+
+class TestTopicTrie(unittest.TestCase):
+
+    def test_match(self):
+        trie = TopicTrie()
+
+        trie.add(b'', 1)
+        trie.add(b'file-changes;', 2)
+        trie.add(b'file-changes;suffix=.JPG', 3)
+        trie.add(b'other', 4)
+
+        self.assertEqual(4, len(trie))
+
+        self.assertEqual([1, 2, 3], trie.match(b'file-changes;suffix=.JPG,subdir=/var/files'))
+        self.assertEqual([1, 2], trie.match(b'file-changes;suffix=.PNG'))
+        self.assertEqual([1], trie.match(b'file'))
+        self.assertEqual([1, 4], trie.match(b'other'))
+
+    def test_remove(self):
+        trie = TopicTrie()
+
+        trie.add(b'abc', 1)
+        trie.add(b'abcdef', 2)
+
+        self.assertIsNone(trie.remove(b'ab'))
+        self.assertIsNone(trie.remove(b'xyz'))
+
+        self.assertEqual(2, trie.remove(b'abcdef'))
+        self.assertEqual([1], trie.match(b'abcdef'))
+
+        # the branch below the remaining prefix is pruned
+        self.assertEqual({}, trie.root.children[ord('a')].children[ord('b')].children[ord('c')].children)
+
+        self.assertEqual(1, trie.remove(b'abc'))
+        self.assertEqual({}, trie.root.children)
+        self.assertEqual(0, len(trie))
+
+    def test_wildcard(self):
+        self.assertTrue(is_wildcard(b'topic*'))
+        self.assertTrue(is_wildcard(b'*'))
+        self.assertFalse(is_wildcard(b'topic'))
+
+        self.assertEqual(b'topic', get_prefix(b'topic*'))
+        self.assertEqual(b'', get_prefix(b'*'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import tempfile
+import unittest
+
+from nervixd.mainloop import Mainloop
+from nervixd.reactor import Reactor
+from nervixd.tracer import BaseTracer
+from nervixd.controller import Controller
+from nervixd.util.capture import Capture, read_capture, RECORD_OPEN, RECORD_DATA, RECORD_CLOSE
+from nervixd.services.nxshm.ring import RingBuffer
+from nervixd.services.nxshm.service import NxshmService
+from nervixd.services.nxshm.connection import HANDSHAKE_MAGIC
+
+import tests.nxtcp_packet_definition as packets
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'ring')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_read(self):
+        ring = RingBuffer.create(self.path, 16)
+
+        self.assertEqual(0, ring.readable())
+        self.assertEqual(16, ring.writable())
+        self.assertEqual(b'', ring.read(10))
+
+        self.assertEqual(5, ring.write(b'12345'))
+        self.assertEqual(5, ring.readable())
+
+        self.assertEqual(b'123', ring.read(3))
+        self.assertEqual(b'45', ring.read(10))
+        self.assertEqual(b'', ring.read(10))
+
+    def test_full(self):
+        ring = RingBuffer.create(self.path, 8)
+
+        self.assertEqual(8, ring.write(b'0123456789'))
+        self.assertEqual(0, ring.write(b'x'))
+        self.assertEqual(0, ring.writable())
+
+        self.assertEqual(b'0123', ring.read(4))
+        self.assertEqual(4, ring.write(b'abcdef'))
+        self.assertEqual(b'4567abcd', ring.read(100))
+
+    def test_wrap_around(self):
+        ring = RingBuffer.create(self.path, 8)
+
+        for i in range(20):
+            data = bytes([i]) * 5
+            self.assertEqual(5, ring.write(data))
+            self.assertEqual(data, ring.read(5))
+
+    def test_shared(self):
+        producer = RingBuffer.create(self.path, 32)
+        consumer = RingBuffer.open(self.path)
+
+        self.assertEqual(32, consumer.capacity)
+
+        producer.write(b'hello')
+        self.assertEqual(b'hello', consumer.read(32))
+        self.assertEqual(32, producer.writable())
+
+        self.assertFalse(producer.is_consumer_sleeping())
+        consumer.set_consumer_sleeping(True)
+        self.assertTrue(producer.is_consumer_sleeping())
+
+
+class TestNxshmService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'nxshm.sock')
+
+        self.mainloop = Mainloop()
+        self.controller = Controller(self.mainloop, None)
+        self.reactor = Reactor(self.mainloop, BaseTracer())
+
+        self.service = NxshmService(self.controller, self.mainloop, self.reactor, BaseTracer(), self.path)
+        self.service.ring_dir = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_login(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self.mainloop.run_once(0.1)
+
+        upstream, downstream = self.handshake(sock)
+
+        self.assertEqual(packets.welcome(), self.read_ring(downstream, len(packets.welcome())))
+
+        # the server is sleeping, so the doorbell should be rang
+        self.assertTrue(upstream.is_consumer_sleeping())
+        upstream.write(packets.login(b'testname', False, False, False))
+        sock.send(b'\x00')
+
+        expected = packets.session(b'testname', packets.SESSION_STATE_ACTIVE)
+        self.assertEqual(expected, self.read_ring(downstream, len(expected)))
+
+        # the server is now polling, so no doorbell is required
+        self.assertFalse(upstream.is_consumer_sleeping())
+        upstream.write(packets.logout(b'testname'))
+
+        expected = packets.session(b'testname', packets.SESSION_STATE_ENDED)
+        self.assertEqual(expected, self.read_ring(downstream, len(expected)))
+
+        # closing the doorbell closes the connection and removes the rings
+        sock.close()
+        self.mainloop.run_once(0.1)
+        self.assertEqual([], [f for f in os.listdir(self.tmpdir.name) if f.startswith('nxshm-')])
+
+    def test_adaptive_polling(self):
+        """
+        Test that the server polls every cycle without setting timers
+        while there is traffic, goes to sleep after being idle for a
+        while, and wakes up again on the doorbell.
+        """
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self.mainloop.run_once(0.1)
+
+        upstream, downstream = self.handshake(sock)
+        self.read_ring(downstream, len(packets.welcome()))
+
+        upstream.write(packets.login(b'testname', False, False, False))
+        sock.send(b'\x00')
+
+        expected = packets.session(b'testname', packets.SESSION_STATE_ACTIVE)
+        self.assertEqual(expected, self.read_ring(downstream, len(expected)))
+
+        nr_timers = len(self.mainloop.timer_deadlines)
+
+        for _ in range(50):
+            self.mainloop.run_once(0)
+
+        self.assertFalse(upstream.is_consumer_sleeping())
+        self.assertEqual(nr_timers, len(self.mainloop.timer_deadlines))
+
+        for _ in range(1000):
+            if upstream.is_consumer_sleeping():
+                break
+
+            self.mainloop.run_once(0.01)
+
+        self.assertTrue(upstream.is_consumer_sleeping())
+
+        upstream.write(packets.logout(b'testname'))
+        sock.send(b'\x00')
+
+        expected = packets.session(b'testname', packets.SESSION_STATE_ENDED)
+        self.assertEqual(expected, self.read_ring(downstream, len(expected)))
+
+        sock.close()
+        self.mainloop.run_once(0.1)
+
+    def test_capture(self):
+        """
+        Test that the frames read from the upstream ring are captured as
+        an NXTCP connection.
+        """
+
+        capture_path = os.path.join(self.tmpdir.name, 'capture')
+        self.controller.set_capture(Capture(capture_path, self.mainloop.now))
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self.mainloop.run_once(0.1)
+
+        upstream, downstream = self.handshake(sock)
+        self.read_ring(downstream, len(packets.welcome()))
+
+        upstream.write(packets.login(b'testname', False, False, False))
+        sock.send(b'\x00')
+
+        expected = packets.session(b'testname', packets.SESSION_STATE_ACTIVE)
+        self.assertEqual(expected, self.read_ring(downstream, len(expected)))
+
+        sock.close()
+        self.mainloop.run_once(0.1)
+        self.controller.capture.close()
+
+        with open(capture_path, 'rb') as f:
+            records = [(record_type, data) for record_type, _, _, data in read_capture(f)]
+
+        self.assertEqual([
+            (RECORD_OPEN, b'nxtcp'),
+            (RECORD_DATA, packets.login(b'testname', False, False, False)),
+            (RECORD_CLOSE, b''),
+        ], records)
+
+    def handshake(self, sock):
+        buff = b''
+
+        while True:
+            buff += sock.recv(1024)
+
+            if len(buff) < len(HANDSHAKE_MAGIC) + 1:
+                continue
+
+            pos = len(HANDSHAKE_MAGIC)
+            paths = []
+
+            while len(paths) < 2 and pos < len(buff):
+                length = buff[pos]
+                if len(buff) < pos + 1 + length:
+                    break
+                paths.append(buff[pos + 1:pos + 1 + length].decode())
+                pos += 1 + length
+
+            if len(paths) == 2:
+                self.assertEqual(HANDSHAKE_MAGIC, buff[:len(HANDSHAKE_MAGIC)])
+                return RingBuffer.open(paths[0]), RingBuffer.open(paths[1])
+
+    def read_ring(self, ring, amount):
+        data = b''
+
+        for _ in range(1000):
+            data += ring.read(amount - len(data))
+
+            if len(data) >= amount:
+                break
+
+            self.mainloop.run_once(0.01)
+
+        return data
+
+
+if __name__ == '__main__':
+    unittest.main()
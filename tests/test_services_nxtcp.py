@@ -1,7 +1,16 @@
+import zlib
+import socket
 import unittest
 import signal
 
 from nervixd.main import main
+from nervixd.mainloop import Mainloop
+from nervixd.mainloop.aio import AsyncioMainloop
+from nervixd.reactor import Reactor
+from nervixd.reactor.verbs import LoginVerb, PostVerb
+from nervixd.tracer import BaseTracer
+from nervixd.controller import Controller
+from nervixd.services.nxtcp.connection import NxtcpConnection
 
 from tests.helpers.sysmock.story import Story, TcpPeer
 from tests.helpers.sysmock.mock import SysMock
@@ -226,6 +235,27 @@ class Test(unittest.TestCase):
         with SysMock(s):
             main(['--nxtcp', ':9999'])
 
+    def test_batch(self):
+        """ Test if all requests in a BATCH packet are delivered to the owner of the name.
+        """
+
+        s = setup_story(2)
+
+        s.do_remote_send(PEER1, LHOST, packets.login(b'testname', False, False, False))
+        s.expect_local_send(LHOST, PEER1, packets.session(b'testname', packets.SESSION_STATE_ACTIVE))
+
+        s.do_remote_send(PEER2, LHOST, packets.batch(
+            packets.request(b'testname', True, 0, 0, b'payload1'),
+            packets.request(b'testname', True, 0, 0, b'payload2'),
+            packets.request(b'testname', True, 0, 0, b'payload3'),
+        ))
+        s.expect_local_send(LHOST, PEER1, packets.call(True, 0, b'testname', b'payload1'))
+        s.expect_local_send(LHOST, PEER1, packets.call(True, 0, b'testname', b'payload2'))
+        s.expect_local_send(LHOST, PEER1, packets.call(True, 0, b'testname', b'payload3'))
+
+        with SysMock(s):
+            main(['--nxtcp', ':9999'])
+
     def test_request_timeout_1(self):
         """ Test if the second client will receive a MESSAGE_TIMEOUT packet when a
         request is done to an owned session, but not responded to by the first client.
@@ -519,6 +549,36 @@ class Test(unittest.TestCase):
         with SysMock(s):
             main(['--nxtcp', ':9999'])
 
+    def test_compression(self):
+        """ Test if compression can be negotiated, and if batches below the threshold
+        are still send uncompressed.
+        """
+
+        dictionary = b'testname'
+
+        client = zlib.compressobj(zdict=dictionary)
+        server = zlib.compressobj(6, zdict=dictionary)
+
+        def compressed(compressor, data):
+            return packets.compressed(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+        s = setup_story(1)
+
+        s.do_remote_send(PEER1, LHOST, packets.compress(10, dictionary))
+        s.expect_local_send(LHOST, PEER1, packets.compress_ack(10))
+
+        s.do_remote_send(PEER1, LHOST, compressed(client, packets.login(b'testname', False, False, False)))
+        s.expect_local_send(LHOST, PEER1, compressed(
+            server,
+            packets.session(b'testname', packets.SESSION_STATE_ACTIVE)
+        ))
+
+        s.expect_local_wait(10.0)
+        s.expect_local_send(LHOST, PEER1, packets.ping())
+
+        with SysMock(s):
+            main(['--nxtcp', ':9999'])
+
     def test_quit_byebye(self):
         """ Test if the server will close the connection when a quit packet is received.
         """
@@ -569,3 +629,138 @@ class Test(unittest.TestCase):
 
         with SysMock(s):
             main(['--nxtcp', ':9999'])
+
+
+class TestFlowControl(unittest.TestCase):
+    """ These tests use a real mainloop and loopback socket, as they depend on the number of
+    mainloop cycles it takes to handle the input.
+    """
+
+    mainloop_class = Mainloop
+
+    def setUp(self):
+        self.mainloop = self.mainloop_class()
+        self.controller = Controller(self.mainloop, None)
+        self.reactor = Reactor(self.mainloop, BaseTracer())
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+
+        self.client = socket.create_connection(listener.getsockname())
+        server_sock, _ = listener.accept()
+        listener.close()
+
+        self.connection = NxtcpConnection(self.controller, self.mainloop, self.reactor, BaseTracer(), server_sock)
+
+        # an owner of the name that receives the calls
+        self.owner = self.reactor.channel('owner')
+        self.owner.put_upstream(LoginVerb(name=b'name', enforce=False, standby=False, persist=False))
+        self.owner.pop_downstream()
+
+    def tearDown(self):
+        self.client.close()
+        self.controller.start_server_shutdown()
+
+    def test_turn_budget(self):
+        self.connection.max_packets_per_turn = 10
+
+        self.client.sendall(b''.join(
+            packets.request(b'name', True, 0, 0, b'payload%d' % i)
+            for i in range(25)
+        ))
+
+        self.run_until(lambda: len(self.owner.downstream_queue) > 0)
+        self.assertEqual(10, len(self.owner.downstream_queue))
+        self.assertFalse(self.connection.reading)
+
+        # the remaining packets are handled in the next cycles
+        self.mainloop.run_once(0)
+        self.assertEqual(20, len(self.owner.downstream_queue))
+
+        self.mainloop.run_once(0)
+        self.assertEqual(25, len(self.owner.downstream_queue))
+        self.assertTrue(self.connection.reading)
+
+    def test_outstanding_requests(self):
+        self.connection.channel.set_max_outstanding_requests(2)
+
+        self.client.sendall(b''.join(
+            packets.request(b'name', False, messageref, 0, b'payload')
+            for messageref in range(1, 4)
+        ))
+
+        self.run_until(lambda: len(self.owner.downstream_queue) == 2)
+
+        # the third request waits until one of the first two is answered
+        self.mainloop.run_once(0.01)
+        self.assertEqual(2, len(self.owner.downstream_queue))
+        self.assertFalse(self.connection.reading)
+
+        call = self.owner.pop_downstream()
+        self.owner.put_upstream(PostVerb(postref=call.postref, payload=b'answer'))
+
+        self.run_until(lambda: len(self.owner.downstream_queue) == 2)
+        self.assertEqual(2, self.connection.channel.nr_outstanding_requests)
+
+    def test_batch_turn_budget(self):
+        self.connection.max_packets_per_turn = 10
+
+        self.client.sendall(packets.batch(*[
+            packets.request(b'name', True, 0, 0, b'payload%d' % i)
+            for i in range(25)
+        ]))
+
+        # every packet in the batch counts against the budget
+        self.run_until(lambda: len(self.owner.downstream_queue) > 0)
+        self.assertEqual(10, len(self.owner.downstream_queue))
+
+        self.mainloop.run_once(0)
+        self.assertEqual(20, len(self.owner.downstream_queue))
+
+        self.mainloop.run_once(0)
+        self.assertEqual(25, len(self.owner.downstream_queue))
+        self.assertTrue(self.connection.reading)
+
+    def test_batch_outstanding_requests(self):
+        self.connection.channel.set_max_outstanding_requests(2)
+
+        self.client.sendall(packets.batch(*[
+            packets.request(b'name', False, messageref, 0, b'payload')
+            for messageref in range(1, 4)
+        ]))
+
+        self.run_until(lambda: len(self.owner.downstream_queue) == 2)
+
+        # the third request in the batch waits until one of the first
+        # two is answered
+        self.mainloop.run_once(0.01)
+        self.assertEqual(2, len(self.owner.downstream_queue))
+        self.assertEqual(1, len(self.connection.pending_verbs))
+
+        call = self.owner.pop_downstream()
+        self.owner.put_upstream(PostVerb(postref=call.postref, payload=b'answer'))
+
+        self.run_until(lambda: len(self.owner.downstream_queue) == 2)
+        self.assertEqual(2, self.connection.channel.nr_outstanding_requests)
+        self.assertEqual(0, len(self.connection.pending_verbs))
+
+    def run_until(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+
+            self.mainloop.run_once(0.01)
+
+        self.fail("Condition not met")
+
+
+class TestFlowControlAsyncio(TestFlowControl):
+    """ The same tests on the asyncio based mainloop.
+    """
+
+    mainloop_class = AsyncioMainloop
+
+    def tearDown(self):
+        TestFlowControl.tearDown(self)
+        self.mainloop.loop.close()
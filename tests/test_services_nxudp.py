@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import socket
+import unittest
+
+from nervixd.mainloop import Mainloop
+from nervixd.reactor import Reactor
+from nervixd.reactor.verbs import *
+from nervixd.tracer import BaseTracer
+from nervixd.controller import Controller
+from nervixd.services.nxudp.service import NxudpService
+
+import tests.nxtcp_packet_definition as packets
+
+
+class TestNxudpService(unittest.TestCase):
+
+    def setUp(self):
+        self.mainloop = Mainloop()
+        self.controller = Controller(self.mainloop, None)
+        self.reactor = Reactor(self.mainloop, BaseTracer())
+
+        self.service = NxudpService(self.controller, self.mainloop, self.reactor, BaseTracer(), ('127.0.0.1', 0))
+        self.address = self.service.socket.getsockname()
+
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        # an owner of the name that receives the calls
+        self.owner = self.reactor.channel('owner')
+        self.owner.put_upstream(LoginVerb(name=b'name', enforce=False, standby=False, persist=False))
+        self.owner.pop_downstream()
+
+    def tearDown(self):
+        self.client.close()
+        self.controller.start_server_shutdown()
+
+    def test_batched_requests(self):
+        datagram = b''.join(
+            packets.request(b'name', True, 0, 0, b'payload%d' % i)
+            for i in range(10)
+        )
+
+        self.client.sendto(datagram, self.address)
+        self.run_until(lambda: len(self.owner.downstream_queue) == 10)
+
+        for i in range(10):
+            call = self.owner.pop_downstream()
+            self.assertIsInstance(call, CallVerb)
+            self.assertTrue(call.unidirectional)
+            self.assertEqual(b'payload%d' % i, call.payload)
+
+        self.assertEqual(1, len(self.service.peers))
+
+    def test_drop_non_unidirectional(self):
+        datagram = packets.request(b'name', False, 1234, 0, b'bidirectional')
+        datagram += packets.login(b'other', False, False, False)
+        datagram += packets.request(b'name', True, 0, 0, b'unidirectional')
+
+        self.client.sendto(datagram, self.address)
+        self.run_until(lambda: self.service.nr_datagrams == 1)
+
+        self.assertEqual(b'unidirectional', self.owner.pop_downstream().payload)
+        self.assertEqual(0, len(self.owner.downstream_queue))
+        self.assertEqual(2, self.service.nr_dropped_packets)
+
+    def test_truncated_frame(self):
+        datagram = packets.request(b'name', True, 0, 0, b'first')
+        datagram += packets.request(b'name', True, 0, 0, b'second')[:-3]
+
+        self.client.sendto(datagram, self.address)
+        self.client.sendto(packets.request(b'name', True, 0, 0, b'third'), self.address)
+        self.run_until(lambda: self.service.nr_datagrams == 2)
+
+        self.assertEqual(b'first', self.owner.pop_downstream().payload)
+        self.assertEqual(b'third', self.owner.pop_downstream().payload)
+        self.assertEqual(0, len(self.owner.downstream_queue))
+
+    def test_invalid_name(self):
+        """
+        Test that a request the reactor rejects is dropped, without
+        stopping the service.
+        """
+
+        datagram = packets.request(b'bad.name', True, 0, 0, b'invalid')
+        datagram += packets.request(b'name', True, 0, 0, b'valid')
+
+        self.client.sendto(datagram, self.address)
+        self.run_until(lambda: self.service.nr_datagrams == 1)
+
+        self.assertEqual(b'valid', self.owner.pop_downstream().payload)
+        self.assertEqual(1, self.service.nr_dropped_packets)
+
+    def test_max_peers(self):
+        self.service.max_peers = 2
+
+        clients = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(3)]
+        channels = len(self.reactor.channels)
+
+        try:
+            for i, client in enumerate(clients):
+                client.sendto(packets.request(b'name', True, 0, 0, b'payload'), self.address)
+                self.run_until(lambda: self.service.nr_datagrams == i + 1)
+
+            ports = [client.getsockname()[1] for client in clients]
+
+        finally:
+            for client in clients:
+                client.close()
+
+        self.assertEqual(ports[1:], [port for host, port in self.service.peers])
+        self.assertEqual(channels + 2, len(self.reactor.channels))
+
+    def test_idle_expiry(self):
+        self.client.sendto(packets.request(b'name', True, 0, 0, b'payload'), self.address)
+        self.run_until(lambda: self.service.nr_datagrams == 1)
+
+        channels = len(self.reactor.channels)
+
+        self.service._expire_peers()
+        self.assertEqual(1, len(self.service.peers))
+
+        self.service.idle_timeout = 0.0
+        self.service._expire_peers()
+        self.assertEqual(0, len(self.service.peers))
+        self.assertEqual(channels - 1, len(self.reactor.channels))
+
+    def run_until(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+
+            self.mainloop.run_once(0.01)
+
+        self.fail("Condition not met")
+
+
+if __name__ == '__main__':
+    unittest.main()
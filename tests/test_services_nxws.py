@@ -0,0 +1,251 @@
+import os
+import zlib
+import unittest
+from struct import pack
+
+from nervixd.main import main
+from nervixd.services.nxws.websocket import *
+
+from tests.helpers.sysmock.story import Story, TcpPeer
+from tests.helpers.sysmock.mock import SysMock
+
+import tests.nxtcp_packet_definition as packets
+
+LHOST = TcpPeer('', 9999)
+PEER1 = TcpPeer('peer1', 9001)
+
+KEY = 'dGhlIHNhbXBsZSBub25jZQ=='
+ACCEPT = b's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+
+def upgrade_request(extensions=None):
+    request = 'GET /nervix HTTP/1.1\r\n'
+    request += 'Host: localhost:9999\r\n'
+    request += 'Upgrade: websocket\r\n'
+    request += 'Connection: Upgrade\r\n'
+    request += 'Sec-WebSocket-Key: ' + KEY + '\r\n'
+    request += 'Sec-WebSocket-Version: 13\r\n'
+
+    if extensions:
+        request += 'Sec-WebSocket-Extensions: ' + extensions + '\r\n'
+
+    return (request + '\r\n').encode()
+
+
+def upgrade_response(extension=None):
+    response = b'HTTP/1.1 101 Switching Protocols\r\n'
+    response += b'Upgrade: websocket\r\n'
+    response += b'Connection: Upgrade\r\n'
+    response += b'Sec-WebSocket-Accept: ' + ACCEPT + b'\r\n'
+
+    if extension:
+        response += b'Sec-WebSocket-Extensions: ' + extension + b'\r\n'
+
+    return response + b'\r\n'
+
+
+def client_frame(opcode, payload, fin=True, rsv1=False):
+    """ Create a masked frame as send by a client.
+    """
+
+    first = (0x80 if fin else 0) | (0x40 if rsv1 else 0) | opcode
+    mask = b'\x12\x34\x56\x78'
+
+    if len(payload) < 126:
+        header = pack('>BB', first, 0x80 | len(payload))
+    else:
+        header = pack('>BBH', first, 0x80 | 126, len(payload))
+
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+    return header + mask + masked
+
+
+def setup_story(extensions=None, extension=None):
+    s = Story()
+    s.expect_local_listen(LHOST)
+    s.do_remote_connect(PEER1, LHOST)
+
+    s.do_remote_send(PEER1, LHOST, upgrade_request(extensions))
+    s.expect_local_send(LHOST, PEER1, upgrade_response(extension))
+
+    return s
+
+
+class TestWebSocket(unittest.TestCase):
+
+    def test_frame_decoder(self):
+        d = FrameDecoder()
+
+        payload = os.urandom(300)
+        frame = client_frame(OPCODE_BINARY, payload)
+
+        d.add_chunk(frame[:5])
+        self.assertIsNone(d.decode())
+
+        d.add_chunk(frame[5:])
+        decoded = d.decode()
+
+        self.assertEqual(OPCODE_BINARY, decoded.opcode)
+        self.assertTrue(decoded.fin)
+        self.assertEqual(payload, decoded.payload)
+        self.assertIsNone(d.decode())
+
+    def test_unmasked_frame(self):
+        d = FrameDecoder()
+        d.add_chunk(build_frame(OPCODE_BINARY, b'payload'))
+
+        with self.assertRaises(ProtocolError):
+            d.decode()
+
+    def test_build_frame(self):
+        self.assertEqual(b'\x82\x03abc', build_frame(OPCODE_BINARY, b'abc'))
+        self.assertEqual(b'\xc2\x7e\x01\x00', build_frame(OPCODE_BINARY, bytes(256), rsv1=True)[:4])
+        self.assertEqual(b'\x82\x7f' + pack('>Q', 2 ** 16), build_frame(OPCODE_BINARY, bytes(2 ** 16))[:10])
+
+    def test_negotiate_deflate(self):
+        self.assertIsNone(negotiate_deflate(''))
+        self.assertIsNone(negotiate_deflate('x-webkit-deflate-frame'))
+        self.assertIsNone(negotiate_deflate('permessage-deflate; unknown_param'))
+
+        deflate = negotiate_deflate('permessage-deflate; client_max_window_bits')
+        self.assertEqual('permessage-deflate', deflate.get_response())
+
+        deflate = negotiate_deflate('permessage-deflate; server_max_window_bits=10; server_no_context_takeover')
+        self.assertEqual('permessage-deflate; server_no_context_takeover; server_max_window_bits=10',
+                         deflate.get_response())
+
+        # a window of 8 bits is not supported, the next offer is used
+        self.assertIsNone(negotiate_deflate('permessage-deflate; server_max_window_bits=8'))
+
+        deflate = negotiate_deflate('permessage-deflate; server_max_window_bits=8, permessage-deflate')
+        self.assertEqual('permessage-deflate', deflate.get_response())
+
+    def test_deflate_context_takeover(self):
+        server = PerMessageDeflate()
+        client = PerMessageDeflate()
+
+        message = b'{"topic": "tank-temperature", "value": 12.5}' * 10
+
+        first = server.compress(message)
+        second = server.compress(message)
+
+        # the second message may refer back to the first one
+        self.assertLess(len(second), len(first))
+
+        self.assertEqual(message, client.decompress(first, 2 ** 20))
+        self.assertEqual(message, client.decompress(second, 2 ** 20))
+
+    def test_deflate_too_big(self):
+        server = PerMessageDeflate()
+        client = PerMessageDeflate()
+
+        with self.assertRaises(ProtocolError):
+            client.decompress(server.compress(bytes(1000)), 100)
+
+
+class TestNxwsService(unittest.TestCase):
+
+    def test_welcome(self):
+        s = setup_story()
+        s.expect_local_send(LHOST, PEER1, build_frame(OPCODE_BINARY, packets.welcome()))
+
+        with SysMock(s):
+            main(['--nxws', ':9999'])
+
+    def test_invalid_handshake(self):
+        s = Story()
+        s.expect_local_listen(LHOST)
+        s.do_remote_connect(PEER1, LHOST)
+
+        s.do_remote_send(PEER1, LHOST, b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        s.expect_local_send(LHOST, PEER1, build_error_response())
+        s.expect_local_close(LHOST, PEER1)
+
+        with SysMock(s):
+            main(['--nxws', ':9999'])
+
+    def test_login(self):
+        s = setup_story()
+        s.expect_local_send(LHOST, PEER1, build_frame(OPCODE_BINARY, packets.welcome()))
+
+        s.do_remote_send(PEER1, LHOST, client_frame(OPCODE_BINARY, packets.login(b'testname', False, False, False)))
+        s.expect_local_send(LHOST, PEER1, build_frame(
+            OPCODE_BINARY,
+            packets.session(b'testname', packets.SESSION_STATE_ACTIVE)
+        ))
+
+        with SysMock(s):
+            main(['--nxws', ':9999'])
+
+    def test_batched_message(self):
+        """ Test if all packets queued within one read event are send in a single message.
+        """
+
+        s = setup_story()
+        s.expect_local_send(LHOST, PEER1, build_frame(OPCODE_BINARY, packets.welcome()))
+
+        s.do_remote_send(PEER1, LHOST, client_frame(
+            OPCODE_BINARY,
+            packets.login(b'name1', False, False, False) + packets.login(b'name2', False, False, False)
+        ))
+        s.expect_local_send(LHOST, PEER1, build_frame(
+            OPCODE_BINARY,
+            packets.session(b'name1', packets.SESSION_STATE_ACTIVE) +
+            packets.session(b'name2', packets.SESSION_STATE_ACTIVE)
+        ))
+
+        with SysMock(s):
+            main(['--nxws', ':9999'])
+
+    def test_fragmented_message(self):
+        login = packets.login(b'testname', False, False, False)
+
+        s = setup_story()
+        s.expect_local_send(LHOST, PEER1, build_frame(OPCODE_BINARY, packets.welcome()))
+
+        s.do_remote_send(PEER1, LHOST, client_frame(OPCODE_BINARY, login[:4], fin=False) +
+                         client_frame(OPCODE_PING, b'ping') +
+                         client_frame(OPCODE_CONTINUATION, login[4:]))
+        s.expect_local_send(LHOST, PEER1, build_frame(OPCODE_PONG, b'ping'))
+        s.expect_local_send(LHOST, PEER1, build_frame(
+            OPCODE_BINARY,
+            packets.session(b'testname', packets.SESSION_STATE_ACTIVE)
+        ))
+
+        with SysMock(s):
+            main(['--nxws', ':9999'])
+
+    def test_deflate(self):
+        server = PerMessageDeflate()
+        client = zlib.compressobj(6, zlib.DEFLATED, -15)
+
+        login = client.compress(packets.login(b'testname', False, False, False)) + client.flush(zlib.Z_SYNC_FLUSH)
+
+        s = setup_story('permessage-deflate; client_max_window_bits', b'permessage-deflate')
+        s.expect_local_send(LHOST, PEER1, build_frame(OPCODE_BINARY, server.compress(packets.welcome()), rsv1=True))
+
+        s.do_remote_send(PEER1, LHOST, client_frame(OPCODE_BINARY, login[:-4], rsv1=True))
+        s.expect_local_send(LHOST, PEER1, build_frame(
+            OPCODE_BINARY,
+            server.compress(packets.session(b'testname', packets.SESSION_STATE_ACTIVE)),
+            rsv1=True
+        ))
+
+        with SysMock(s):
+            main(['--nxws', ':9999'])
+
+    def test_close(self):
+        s = setup_story()
+        s.expect_local_send(LHOST, PEER1, build_frame(OPCODE_BINARY, packets.welcome()))
+
+        s.do_remote_send(PEER1, LHOST, client_frame(OPCODE_CLOSE, pack('>H', CLOSE_NORMAL)))
+        s.expect_local_send(LHOST, PEER1, build_frame(OPCODE_CLOSE, pack('>H', CLOSE_NORMAL)))
+        s.expect_local_close(LHOST, PEER1)
+
+        with SysMock(s):
+            main(['--nxws', ':9999'])
+
+
+if __name__ == '__main__':
+    unittest.main()
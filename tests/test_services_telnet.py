@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import socket
+import tempfile
+import unittest
+
+from nervixd.mainloop import Mainloop
+from nervixd.reactor import Reactor
+from nervixd.controller import Controller
+from nervixd.tracer import BaseTracer
+from nervixd.services.telnet.service import TelnetService
+from nervixd.util.profiler import Profiler
+
+from benchmarks.server import find_free_port
+
+
+class TestTelnetService(unittest.TestCase):
+
+    def setUp(self):
+        self.mainloop = Mainloop()
+        self.controller = Controller(self.mainloop, None)
+        self.tracer = BaseTracer()
+        self.reactor = Reactor(self.mainloop, self.tracer)
+
+        self.address = ('127.0.0.1', find_free_port())
+
+        TelnetService(self.controller, self.mainloop, self.reactor, self.tracer, self.address)
+
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def connect(self):
+        sock = socket.create_connection(self.address)
+        sock.setblocking(False)
+        self.sockets.append(sock)
+
+        self.assertTrue(self.read_lines(sock, 1)[0].startswith(b'WELCOME '))
+
+        return sock
+
+    def read_lines(self, sock, count):
+        """
+        Run the mainloop until the given number of lines was received.
+        """
+
+        data = b''
+
+        for _ in range(200):
+            try:
+                data += sock.recv(65536)
+
+            except BlockingIOError:
+                pass
+
+            if data.count(b'\n') >= count:
+                break
+
+            self.mainloop.run_once(0.01)
+
+        return data.splitlines()
+
+    def test_burst(self):
+        """
+        Test that all lines a client sends at once are answered in order,
+        also when some of them are invalid.
+        """
+
+        sock = self.connect()
+
+        lines = [b'PING %d' % i if i % 100 else b'DANCE' for i in range(1000)]
+        sock.sendall(b''.join(line + b'\r\n' for line in lines))
+
+        answers = self.read_lines(sock, 1000)
+
+        self.assertEqual(len(answers), 1000)
+        self.assertEqual(answers[0], b"ERROR Unknown command 'DANCE'")
+        self.assertEqual(answers[1:100], [b'PONG %d' % i for i in range(1, 100)])
+
+    def test_machine_mode(self):
+        service = self.connect()
+        service.sendall(b'MODE MACHINE\r\nLOGIN service\r\n')
+
+        self.assertEqual(self.read_lines(service, 2), [b'MODE MACHINE', b'S service 2'])
+
+        client = self.connect()
+        client.sendall(b'MODE machine\r\nREQUEST 5 service hello world\r\nREQUEST 6 nobody hello\r\n')
+
+        self.assertEqual(self.read_lines(client, 2), [b'MODE MACHINE', b'M 6 2'])
+        self.assertEqual(self.read_lines(service, 1), [b'C 1 service hello world'])
+
+        service.sendall(b'POST 1 bye\r\nMODE HUMAN\r\nPING\r\n')
+
+        self.assertEqual(self.read_lines(client, 1), [b'M 5 0 bye'])
+        self.assertEqual(self.read_lines(service, 2), [b'MODE HUMAN', b'PONG'])
+
+    def test_rate_limit(self):
+        sock = self.connect()
+        sock.sendall(b'RATELIMIT CHANNEL 10\r\n')
+
+        self.assertEqual(self.read_lines(sock, 1), [b'ERROR Admin commands are disabled'])
+        self.assertFalse(self.reactor.rate_limiter.enabled)
+
+        self.controller.admin_commands = True
+
+        sock.sendall(b'RATELIMIT CHANNEL 10\r\nRATELIMIT NAME service 5:20\r\n')
+
+        self.assertEqual(self.read_lines(sock, 5), [
+            b'RATELIMIT CHANNEL rate=10 burst=10',
+            b'RATELIMIT DEFAULT OFF',
+            b'RATELIMIT CHANNEL rate=10 burst=10',
+            b'RATELIMIT DEFAULT OFF',
+            b'RATELIMIT NAME service rate=5 burst=20',
+        ])
+
+        limiter = self.reactor.rate_limiter
+
+        self.assertEqual((10.0, 10.0), limiter.channel_limit)
+        self.assertEqual({b'service': (5.0, 20.0)}, limiter.name_limits)
+
+        sock.sendall(b'RATELIMIT CHANNEL off\r\nRATELIMIT NAME service OFF\r\n')
+        self.read_lines(sock, 5)
+
+        self.assertFalse(limiter.enabled)
+
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            self.controller.set_profiler(Profiler(self.mainloop, tempdir))
+
+            sock = self.connect()
+            sock.sendall(b'PROFILE\r\n')
+
+            self.assertEqual(self.read_lines(sock, 1), [b'ERROR Admin commands are disabled'])
+            self.assertFalse(self.controller.profiler.is_running())
+
+            self.controller.admin_commands = True
+
+            sock.sendall(b'PROFILE\r\nPROFILE STOP\r\n')
+
+            started, stopped = self.read_lines(sock, 2)
+            self.assertTrue(started.startswith(b'PROFILING STARTED '))
+            self.assertTrue(stopped.startswith(b'PROFILING STOPPED '))
+            self.assertFalse(self.controller.profiler.is_running())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import socket
+import unittest
+
+from nervixd.mainloop import Mainloop
+from nervixd.reactor import Reactor
+from nervixd.controller import Controller
+from nervixd.tracer import BaseTracer
+from nervixd.reactor.verbs import RequestVerb
+from nervixd.services.telnet.service import TelnetService
+from nervixd.services.trace.service import TraceService
+from nervixd.services.trace.tracer import TraceTracer, TraceFilter, encode_event, EVENT_UPSTREAM
+
+from benchmarks.server import find_free_port
+
+
+class TestTraceService(unittest.TestCase):
+
+    def setUp(self):
+        self.mainloop = Mainloop()
+        self.controller = Controller(self.mainloop, None)
+        self.tracer = BaseTracer()
+        self.reactor = Reactor(self.mainloop, self.tracer)
+
+        self.telnet_address = ('127.0.0.1', find_free_port())
+        self.trace_address = ('127.0.0.1', find_free_port())
+
+        TelnetService(self.controller, self.mainloop, self.reactor, self.tracer, self.telnet_address)
+        self.service = TraceService(self.controller, self.mainloop, self.reactor, self.tracer, self.trace_address)
+
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def connect(self, address):
+        sock = socket.create_connection(address)
+        sock.setblocking(False)
+        self.sockets.append(sock)
+        return sock
+
+    def telnet(self, *lines):
+        sock = self.connect(self.telnet_address)
+        sock.sendall(b''.join(line + b'\r\n' for line in lines))
+        return sock
+
+    def trace(self, command):
+        sock = self.connect(self.trace_address)
+        sock.sendall(command + b'\n')
+
+        self.assertEqual(self.read_lines(sock, 1), [b'OK'])
+
+        return sock
+
+    def read_lines(self, sock, count):
+        """
+        Run the mainloop until the given number of lines was received.
+        """
+
+        data = b''
+
+        for _ in range(200):
+            try:
+                data += sock.recv(65536)
+
+            except BlockingIOError:
+                pass
+
+            if data.count(b'\n') >= count:
+                break
+
+            self.mainloop.run_once(0.01)
+
+        return data.splitlines()
+
+    def run_until(self, condition):
+        for _ in range(200):
+            if condition():
+                return
+
+            self.mainloop.run_once(0.01)
+
+        self.fail("Condition not met")
+
+    def test_install(self):
+        """
+        Test that the reactor only calls the trace tracer while there
+        are subscribers.
+        """
+
+        self.assertIs(self.reactor.tracer, self.tracer)
+
+        sock = self.trace(b'TRACE')
+        self.assertIsInstance(self.reactor.tracer, TraceTracer)
+
+        sock.sendall(b'STOP\n')
+        self.assertEqual(self.read_lines(sock, 1), [b'OK'])
+        self.assertIs(self.reactor.tracer, self.tracer)
+
+        self.trace(b'TRACE')
+        self.assertIsInstance(self.reactor.tracer, TraceTracer)
+
+        self.sockets.pop().close()
+        self.run_until(lambda: self.reactor.tracer is self.tracer)
+
+    def test_filter_name(self):
+        trace = self.trace(b'TRACE NAME first')
+
+        # the verbs of the second name are traced first, if at all
+        self.telnet(b'LOGIN second', b'LOGIN first')
+
+        lines = [line.split(b' ')[1:] for line in self.read_lines(trace, 3)]
+
+        self.assertEqual(lines[0][0:2], [b'+', b'1'])
+        self.assertTrue(lines[0][2].startswith(b'TELNET_CLIENT_127.0.0.1:'))
+
+        self.assertEqual(lines[1], [b'>', b'1', b'LOGIN', b'name=first', b'enforce=0', b'standby=0', b'persist=0',
+                                    b'shared=0', b'weight=1'])
+
+        self.assertEqual(lines[2], [b'<', b'1', b'SESSION', b'name=first', b'state=1'])
+
+        self.assertEqual(len(lines), 3)
+
+    def test_filter_verb_and_channel(self):
+        service = self.telnet(b'LOGIN service')
+        self.run_until(lambda: self.reactor.state.is_name_owned(b'service'))
+
+        client_port = service.getsockname()[1]
+
+        trace = self.trace(b'TRACE VERB call CHANNEL :%d' % client_port)
+
+        self.telnet(b'REQUEST UNI service hello world', b'REQUEST UNI other hello')
+
+        lines = self.read_lines(trace, 2)
+
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith(b':%d' % client_port))
+        self.assertTrue(lines[1].split(b' ', 1)[1].startswith(b'< 1 CALL name=service unidirectional=1'))
+
+    def test_invalid_commands(self):
+        sock = self.connect(self.trace_address)
+        sock.sendall(b'WATCH\nTRACE NAME\nTRACE VERB dance\nTRACE COLOR red\n')
+
+        lines = self.read_lines(sock, 4)
+
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(all(line.startswith(b'ERROR ') for line in lines))
+        self.assertIs(self.reactor.tracer, self.tracer)
+
+    def test_slow_subscriber(self):
+        """
+        Test that events are dropped while too much waits to be written
+        to a subscriber, and that the number dropped is reported.
+        """
+
+        trace = self.trace(b'TRACE VERB request')
+        self.service.subscribers[0].max_buffer = 200
+
+        self.telnet(*[b'REQUEST UNI service x%d' % i for i in range(30)])
+
+        lines = []
+        self.run_until(lambda: lines.extend(self.read_lines(trace, 1)) or (lines and lines[-1].startswith(b'DROPPED')))
+
+        dropped = int(lines[-1].split()[1])
+
+        self.assertGreater(dropped, 0)
+        self.assertEqual(len(lines) - 2 + dropped, 30)
+
+    def test_encode_event(self):
+        verb = RequestVerb(name=b'a name', unidirectional=True, messageref=None, timeout=1.0, payload=b'\x00' * 40)
+
+        line = encode_event(EVENT_UPSTREAM, 7, verb, None, 4)
+
+        self.assertTrue(line.endswith(
+            b' > 7 REQUEST name=a\\x20name unidirectional=1 timeout=1.0 payload=\\x00\\x00\\x00\\x00/40\n'))
+
+    def test_filter(self):
+        class Channel:
+            description = 'NXTCP_CLIENT_127.0.0.1:1234'
+
+        verb = RequestVerb(name=b'name')
+
+        self.assertTrue(TraceFilter().match(Channel, verb))
+        self.assertTrue(TraceFilter(names=[b'other', b'name']).match(Channel, verb))
+        self.assertFalse(TraceFilter(names=[b'other']).match(Channel, verb))
+        self.assertTrue(TraceFilter(channels=[':1234']).match(Channel, verb))
+        self.assertFalse(TraceFilter(channels=[':4321']).match(Channel, verb))
+        self.assertTrue(TraceFilter(verbs=['REQUEST']).match(Channel, verb))
+        self.assertFalse(TraceFilter(verbs=['POST']).match(Channel, verb))
+
+        # events without a verb only pass filters without names or verbs
+        self.assertTrue(TraceFilter(channels=[':1234']).match(Channel))
+        self.assertFalse(TraceFilter(names=[b'name']).match(Channel))
+
+
+if __name__ == '__main__':
+    unittest.main()
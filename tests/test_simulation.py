@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from nervixd.mainloop import Mainloop
+from benchmarks.server import build_server
+
+from tests.helpers.sysmock.simulation import Simulation, IdleModel, SilentModel, ServiceModel, RequesterModel, \
+    SubscriberModel, PublisherModel
+
+ADDRESS = ('', 9999)
+
+
+class TestSimulation(unittest.TestCase):
+
+    def test_keepalive(self):
+        """ Clients that do not answer pings are disconnected after 20 virtual seconds, the others stay.
+        """
+
+        with Simulation() as sim:
+            mainloop = Mainloop()
+            build_server(mainloop, ADDRESS)
+
+            sim.add_clients(1000, lambda i: SilentModel(sim) if i % 4 == 0 else IdleModel(sim), ADDRESS)
+
+            sim.run(mainloop, 19.0)
+            self.assertEqual(1000, sim.report()['connected'])
+
+            sim.run(mainloop, 2.0)
+            report = sim.report()
+
+            self.assertEqual(21.0, report['virtual_seconds'])
+            self.assertEqual(750, report['connected'])
+            self.assertEqual(250, report['disconnected_by_server'])
+
+            # clients that are alive are pinged every 10 seconds, and answer with a pong
+            self.assertEqual(1500, report['packets_up'])
+
+    def test_requests(self):
+        with Simulation(seed=1) as sim:
+            mainloop = Mainloop()
+            build_server(mainloop, ADDRESS)
+
+            sim.add_clients(2, lambda i: ServiceModel(sim, b'service'), ADDRESS)
+            sim.add_clients(10, lambda i: RequesterModel(sim, b'service', rate=10.0), ADDRESS, ramp=1.0)
+            sim.add_clients(1, lambda i: RequesterModel(sim, b'nobody', rate=1.0, timeout=0.5), ADDRESS)
+
+            sim.run(mainloop, 10.0)
+            report = sim.report()
+
+        self.assertGreater(report['model_requests'], 900)
+        self.assertEqual(report['model_calls'], report['model_messages_ok'])
+        self.assertEqual(report['model_requests'], report['model_messages_ok'] + report['model_messages_failed'])
+        self.assertGreater(report['model_messages_failed'], 0)
+
+    def test_subscriptions(self):
+        with Simulation() as sim:
+            mainloop = Mainloop()
+            build_server(mainloop, ADDRESS)
+
+            sim.add_clients(1, lambda i: PublisherModel(sim, b'feed', rate=10.0), ADDRESS)
+            sim.add_clients(10, lambda i: SubscriberModel(sim, b'feed', b'topic-%d' % (i % 2)), ADDRESS, ramp=1.0)
+
+            sim.run(mainloop, 10.0)
+            report = sim.report()
+
+        # every post reaches the five subscribers of its topic, once they are all subscribed
+        self.assertGreater(report['model_posts'], 100)
+        self.assertLessEqual(report['model_deliveries'], 5 * report['model_posts'])
+        self.assertGreater(report['model_deliveries'], 4 * report['model_posts'])
+
+
+if __name__ == '__main__':
+    unittest.main()
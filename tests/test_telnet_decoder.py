@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import sys
+import time
 import unittest
 
 from nervixd.services.telnet.decoder import *
@@ -144,9 +146,20 @@ class TestState(unittest.TestCase):
             persist=True,
         )
 
+        self.assertDecodePacket(
+            b'LOGIN name1 SHARED weight 3\r\n',
+            LoginPacket,
+            name=b'name1',
+            shared=True,
+            weight=3,
+        )
+
         with self.assertRaises(DecodingError):
             self.parse_packet(b'LOGIN\r\n')
 
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'LOGIN name1 SHARED WEIGHT 0\r\n')
+
     def test_logout(self):
 
         self.assertDecodePacket(
@@ -291,6 +304,146 @@ class TestState(unittest.TestCase):
             topic=b'topic'
         )
 
+    def test_lag(self):
+
+        self.assertDecodePacket(
+            b'LAG\r\n',
+            LagPacket,
+            reset=False
+        )
+
+        self.assertDecodePacket(
+            b'LAG reset\r\n',
+            LagPacket,
+            reset=True
+        )
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'LAG test\r\n')
+
+    def test_profile(self):
+
+        self.assertDecodePacket(
+            b'PROFILE\r\n',
+            ProfilePacket,
+            duration=None,
+            mode=None,
+            stop=False
+        )
+
+        self.assertDecodePacket(
+            b'PROFILE 10 sample\r\n',
+            ProfilePacket,
+            duration=10,
+            mode='sample',
+            stop=False
+        )
+
+        self.assertDecodePacket(
+            b'PROFILE STOP\r\n',
+            ProfilePacket,
+            stop=True
+        )
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'PROFILE 0\r\n')
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'PROFILE 10 STOP\r\n')
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'PROFILE SAMPLE 10\r\n')
+
+    def test_mode(self):
+        self.assertDecodePacket(b'MODE machine\r\n', ModePacket, machine=True)
+        self.assertDecodePacket(b'MODE HUMAN\r\n', ModePacket, machine=False)
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'MODE\r\n')
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'MODE robot\r\n')
+
+    def test_rate_limit(self):
+        self.assertDecodePacket(b'RATELIMIT\r\n', RateLimitPacket, target=None)
+        self.assertDecodePacket(b'RATELIMIT channel 10\r\n', RateLimitPacket, target=b'CHANNEL', name=None, rate=10.0,
+                                burst=None)
+        self.assertDecodePacket(b'RATELIMIT DEFAULT 0.5:2\r\n', RateLimitPacket, target=b'DEFAULT', rate=0.5,
+                                burst=2.0)
+        self.assertDecodePacket(b'RATELIMIT NAME name1 OFF\r\n', RateLimitPacket, target=b'NAME', name=b'name1',
+                                rate=None)
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'RATELIMIT SPEED 10\r\n')
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'RATELIMIT CHANNEL\r\n')
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'RATELIMIT NAME 10\r\n')
+
+        with self.assertRaises(DecodingError):
+            self.parse_packet(b'RATELIMIT CHANNEL fast\r\n')
+
+    def test_line_too_long(self):
+        """
+        Test that a line that is too long is reported once and skipped,
+        also when it arrives in small chunks, after which decoding
+        continues with the next line.
+        """
+
+        d = Decoder()
+
+        d.add_chunk(b'PING ' + b'x' * 2000)
+
+        with self.assertRaises(DecodingError):
+            d.decode()
+
+        for _ in range(100):
+            d.add_chunk(b'x' * 100)
+            self.assertEqual(d.decode(), None)
+
+        self.assertLess(len(d.buff), 2)
+
+        d.add_chunk(b'xxx\r\nPING hello\r\n')
+
+        packet = d.decode()
+        self.assertIsInstance(packet, PingPacket)
+        self.assertEqual(packet.payload, b'hello')
+
+    def test_decode_burst(self):
+        """
+        Test that a burst of lines larger than the line limit is decoded
+        completely.
+        """
+
+        d = Decoder()
+        d.add_chunk(b'PING %d\r\n' % 1 * 1000 + b'LAG\r\n')
+
+        packets = []
+
+        while True:
+            packet = d.decode()
+
+            if not packet:
+                break
+
+            packets.append(packet)
+
+        self.assertEqual(len(packets), 1001)
+        self.assertIsInstance(packets[-1], LagPacket)
+
+    def test_decode_benchmark(self):
+        """
+        Decode a burst of lines like a scripted client would send them.
+        The rate is not asserted, run this file with 'benchmark' as
+        argument to see it.
+        """
+
+        nr_lines, seconds = benchmark_decode(1000)
+
+        self.assertEqual(nr_lines, 1000)
+
     def assertDecodePacket(self, chunk, cls, **attr):
         d = Decoder()
         d.add_chunk(chunk)
@@ -312,5 +465,43 @@ class TestState(unittest.TestCase):
         return d.decode()
 
 
+BENCHMARK_LINES = [
+    b'REQUEST 1234 service 5 some payload of a request\r\n',
+    b'REQUEST UNI service payload\r\n',
+    b'POST 42 a posted payload\r\n',
+    b'SUBSCRIBE 7 feed some.topic\r\n',
+    b'LOGIN name ENFORCE STANDBY PERSIST\r\n',
+    b'PING\r\n',
+]
+
+
+def benchmark_decode(nr_lines):
+    """
+    Decode nr_lines lines that arrive in chunks of 64 KiB, returning
+    the number of packets decoded and the seconds it took.
+    """
+
+    data = b''.join(BENCHMARK_LINES[i % len(BENCHMARK_LINES)] for i in range(nr_lines))
+    chunks = [data[i:i + 65536] for i in range(0, len(data), 65536)]
+
+    decoder = Decoder()
+    nr_packets = 0
+
+    start = time.perf_counter()
+
+    for chunk in chunks:
+        decoder.add_chunk(chunk)
+
+        while decoder.decode():
+            nr_packets += 1
+
+    return nr_packets, time.perf_counter() - start
+
+
 if __name__ == '__main__':
-    unittest.main()
+    if sys.argv[1:] == ['benchmark']:
+        nr_packets, seconds = benchmark_decode(200000)
+        print('{:d} lines decoded in {:.3f}s, {:.0f} lines/s'.format(nr_packets, seconds, nr_packets / seconds))
+
+    else:
+        unittest.main()
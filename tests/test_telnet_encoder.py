@@ -3,6 +3,7 @@
 import unittest
 
 from nervixd.services.telnet.encoder import *
+from nervixd.mainloop.monitor import Histogram
 
 
 class TestState(unittest.TestCase):
@@ -117,6 +118,69 @@ class TestState(unittest.TestCase):
         chunk = e.fetch_chunk()
         self.assertIsNotNone(chunk)
 
+    def test_lag_stats(self):
+        h = Histogram((0.001, 0.01))
+        h.add(0.0005)
+        h.add(0.02)
+
+        self.assertEncodePacket(
+            LagStatsPacket(b'HANDLERS', h, 1),
+            b'LAG HANDLERS count=2 slow=1 mean=10.250 p50=1.000 p99=20.000 max=20.000 '
+            b'le_1ms=1 le_10ms=0 gt_10ms=1\r\n'
+        )
+
+    def test_profiling(self):
+        self.assertEncodePacket(
+            ProfilingPacket(b'STARTED', '/tmp/nervixd-1.prof'),
+            b'PROFILING STARTED /tmp/nervixd-1.prof\r\n'
+        )
+
+    def test_compact(self):
+        self.assertEncodeCompactPacket(SessionPacket(b'name1', SessionPacket.STATE_ACTIVE), b'S name1 2\r\n')
+        self.assertEncodeCompactPacket(CallPacket(False, 111, b'name', b'pay load'), b'C 111 name pay load\r\n')
+        self.assertEncodeCompactPacket(CallPacket(True, None, b'name', b'payload'), b'C 0 name payload\r\n')
+        self.assertEncodeCompactPacket(MessagePacket(999, MessagePacket.STATUS_OK, b''), b'M 999 0 \r\n')
+        self.assertEncodeCompactPacket(MessagePacket(999, MessagePacket.STATUS_OK, b'a b'), b'M 999 0 a b\r\n')
+        self.assertEncodeCompactPacket(MessagePacket(999, MessagePacket.STATUS_TIMEOUT, b'a'), b'M 999 1\r\n')
+        self.assertEncodeCompactPacket(InterestPacket(123, InterestPacket.STATUS_INTEREST, b'name', b'topic'),
+                                       b'I 123 1 name topic\r\n')
+        self.assertEncodeCompactPacket(PongPacket(b''), b'P\r\n')
+        self.assertEncodeCompactPacket(PongPacket(b'payload'), b'P payload\r\n')
+        self.assertEncodeCompactPacket(InvalidRequestPacket(b'reason'), b'E reason\r\n')
+
+        # packets without a compact form are encoded as usual
+        self.assertEncodeCompactPacket(ByeByePacket(), b'BYEBYE\r\n')
+
+    def test_batch(self):
+        e = Encoder()
+        e.start_batch()
+
+        e.encode(PongPacket(b'1'))
+        e.encode(PongPacket(b'2'))
+
+        self.assertEqual(e.pending, 0)
+        self.assertEqual(e.batch_size, 16)
+
+        e.flush()
+
+        self.assertFalse(e.batching)
+        self.assertEqual(len(e.chunkbuffer), 1)
+        self.assertEqual(e.fetch_chunk(), b'PONG 1\r\nPONG 2\r\n')
+
+        # the batch is also flushed when fetching a chunk
+        e = Encoder()
+        e.start_batch()
+        e.encode(PongPacket(b'1'))
+
+        self.assertEqual(e.fetch_chunk(), b'PONG 1\r\n')
+
+    def assertEncodeCompactPacket(self, packet, encoded):
+        e = Encoder()
+        e.compact = True
+        e.encode(packet)
+
+        self.assertEqual(e.fetch_chunk(), encoded)
+
     def assertEncodePacket(self, packet, encoded):
         e = Encoder()
         e.encode(packet)
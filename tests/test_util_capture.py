@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import tempfile
+import unittest
+
+from nervixd.mainloop import Mainloop
+from nervixd.reactor import Reactor
+from nervixd.controller import Controller
+from nervixd.tracer import BaseTracer
+from nervixd.services.nxtcp.service import NxtcpService
+from nervixd.services.telnet.service import TelnetService
+from nervixd.util.capture import Capture, read_capture, RECORD_OPEN, RECORD_DATA, RECORD_CLOSE
+
+from benchmarks.server import find_free_port
+
+import tests.nxtcp_packet_definition as packets
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'capture.bin')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def read_records(self):
+        with open(self.path, 'rb') as f:
+            return list(read_capture(f))
+
+    def test_records(self):
+        now = [10.0]
+
+        capture = Capture(self.path, lambda: now[0])
+
+        stream1 = capture.connection('nxtcp')
+        now[0] += 0.5
+        stream2 = capture.connection('telnet')
+        stream1.data(b'abc')
+        now[0] += 0.25
+        stream2.data(b'def')
+        stream1.close()
+
+        capture.close()
+        self.assertFalse(capture.is_open())
+
+        # nothing is recorded after the capture is closed
+        stream2.close()
+
+        self.assertEqual([
+            (RECORD_OPEN, 1, 0.0, b'nxtcp'),
+            (RECORD_OPEN, 2, 0.5, b'telnet'),
+            (RECORD_DATA, 1, 0.5, b'abc'),
+            (RECORD_DATA, 2, 0.75, b'def'),
+            (RECORD_CLOSE, 1, 0.75, b''),
+        ], self.read_records())
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'something else')
+
+        with open(self.path, 'rb') as f:
+            with self.assertRaises(ValueError):
+                list(read_capture(f))
+
+        capture = Capture(self.path, lambda: 0.0)
+        capture.connection('nxtcp').data(b'abc')
+        capture.close()
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        with open(self.path, 'wb') as f:
+            f.write(data[:-1])
+
+        with self.assertRaises(ValueError):
+            self.read_records()
+
+    def test_write_error(self):
+        capture = Capture(self.path, lambda: 0.0)
+
+        def fail(data):
+            raise OSError("No space left on device")
+
+        capture.file.write = fail
+
+        with self.assertLogs('nervixd.util.capture', 'ERROR'):
+            capture.connection('nxtcp')
+
+        self.assertFalse(capture.is_open())
+
+    def test_connections(self):
+        """ The bytes received by NXTCP and telnet connections are recorded as they were read.
+        """
+
+        mainloop = Mainloop()
+        controller = Controller(mainloop, None)
+        reactor = Reactor(mainloop, BaseTracer())
+
+        controller.set_capture(Capture(self.path, mainloop.now))
+
+        nxtcp_address = ('127.0.0.1', find_free_port())
+        telnet_address = ('127.0.0.1', find_free_port())
+
+        NxtcpService(controller, mainloop, reactor, reactor.tracer, nxtcp_address)
+        TelnetService(controller, mainloop, reactor, reactor.tracer, telnet_address)
+
+        nxtcp_client = socket.create_connection(nxtcp_address)
+        nxtcp_data = packets.login(b'name', persist=False, standby=False, enforce=False)
+        nxtcp_client.sendall(nxtcp_data)
+
+        telnet_client = socket.create_connection(telnet_address)
+        telnet_client.sendall(b'login other\r\n')
+
+        for _ in range(100):
+            if reactor.state.is_name_owned(b'name') and reactor.state.is_name_owned(b'other'):
+                break
+
+            mainloop.run_once(0.1)
+
+        nxtcp_client.close()
+        telnet_client.close()
+
+        for _ in range(100):
+            if len(controller.units) == 2:
+                break
+
+            mainloop.run_once(0.1)
+
+        controller.capture.close()
+
+        records = [(record_type, connection_id, data) for record_type, connection_id, _, data in self.read_records()]
+
+        nxtcp_id = records[[data for _, _, data in records].index(b'nxtcp')][1]
+        telnet_id = records[[data for _, _, data in records].index(b'telnet')][1]
+
+        def stream(connection_id):
+            return [(record_type, data) for record_type, i, data in records if i == connection_id]
+
+        self.assertEqual([(RECORD_OPEN, b'nxtcp'), (RECORD_DATA, nxtcp_data), (RECORD_CLOSE, b'')], stream(nxtcp_id))
+        self.assertEqual([(RECORD_OPEN, b'telnet'), (RECORD_DATA, b'login other\r\n'), (RECORD_CLOSE, b'')],
+                         stream(telnet_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
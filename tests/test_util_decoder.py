@@ -121,13 +121,93 @@ class TestState(unittest.TestCase):
         )
         
         with self.assertRaises(IndexError):
-            e.get_until(b'de', 5)
+            e.get_until(b'de', 4)
+
+        self.assertEqual(
+            e.get_until(b'de', 5),
+            b'abcde'
+        )
         
         self.assertEqual(
             e.get_until(b'mno', 1024),
             None
         )
         
+    def test_get_until_split_sub(self):
+        """
+        Test that a sub is found when it is split over chunks that
+        arrive one by one.
+        """
+
+        e = BaseDecoder()
+
+        for chunk in (b'ab', b'c\r', b'\nde', b'f\r\n'):
+            e.add_chunk(chunk)
+
+            if chunk.endswith(b'\r'):
+                self.assertEqual(e.get_until(b'\r\n', 1024), None)
+
+        self.assertEqual(
+            e.get_until(b'\r\n', 1024),
+            b'abc\r\n'
+        )
+
+        e.commit()
+
+        self.assertEqual(
+            e.get_until(b'\r\n', 1024),
+            b'def\r\n'
+        )
+
+    def test_get_until_many_chunks(self):
+        """
+        Test that a long line that arrives in many small chunks is
+        searched once, and raises IndexError when it gets too long.
+        """
+
+        e = BaseDecoder()
+
+        for i in range(99):
+            e.add_chunk(b'x' * 10)
+            self.assertEqual(e.get_until(b'\n', 1000), None)
+            self.assertEqual(e.scan_position, (i + 1) * 10)
+
+        e.add_chunk(b'x' * 10)
+
+        with self.assertRaises(IndexError):
+            e.get_until(b'\n', 1000)
+
+    def test_get_until_buffered_lines(self):
+        """
+        Test that lines are found while more than limit bytes are
+        buffered.
+        """
+
+        e = BaseDecoder()
+        e.add_chunk(b'line\n' * 100)
+
+        for _ in range(100):
+            self.assertEqual(e.get_until(b'\n', 10), b'line\n')
+            e.commit()
+
+        self.assertEqual(e.get_until(b'\n', 10), None)
+
+    def test_skip_until(self):
+
+        e = BaseDecoder()
+
+        e.add_chunk(b'abc\r')
+        self.assertFalse(e.skip_until(b'\r\n'))
+        self.assertEqual(e.buff, b'\r')
+
+        e.add_chunk(b'\ndef\r\n')
+        self.assertTrue(e.skip_until(b'\r\n'))
+
+        self.assertEqual(
+            e.get_until(b'\r\n', 1024),
+            b'def\r\n'
+        )
+
     def test_autocommit_get(self):
         
         e = BaseDecoder()
@@ -203,6 +203,35 @@ class TestState(unittest.TestCase):
         
 
 
+    def test_write_socket_reset(self):
+
+        s = DummySocket()
+        e = BaseEncoder()
+
+        e.add_encoded_chunk(b'123456789')
+
+        s.prepare(ConnectionResetError)
+        n = e.write_to_socket(s)
+
+        self.assertEqual(n, 0)
+
+    def test_pop_pending(self):
+
+        e = BaseEncoder()
+
+        self.assertEqual(e.pop_pending(), b'')
+
+        e.add_encoded_chunk(b'1234')
+        e.add_encoded_chunk(b'5678')
+        e.add_encoded_chunk(b'9')
+
+        self.assertEqual(e.fetch_chunk(2), b'12')
+        e.commit(2)
+
+        self.assertEqual(e.pop_pending(), b'3456789')
+        self.assertEqual(e.fetch_chunk(), None)
+
+
 class DummySocket:
     
     def __init__(self):
@@ -212,6 +241,9 @@ class DummySocket:
         self.size = amount
     
     def send(self, data):
+        if not isinstance(self.size, int):
+            raise self.size()
+
         chunk = data[0:self.size]
         
         self.buff += chunk
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import pstats
+import tempfile
+import unittest
+
+from nervixd.mainloop import Mainloop
+from nervixd.util.profiler import Profiler, MODE_SAMPLE
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.mainloop = Mainloop()
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_cprofile(self):
+        profiler = Profiler(self.mainloop, self.tempdir.name, duration=0.01)
+
+        path = profiler.start()
+        self.assertTrue(path.endswith('.prof'))
+        self.assertTrue(profiler.is_running())
+
+        # only one profile at a time
+        self.assertIsNone(profiler.start())
+
+        # stopped by a timer once the duration has passed
+        for _ in range(100):
+            if not profiler.is_running():
+                break
+
+            self.mainloop.run_once(1.0)
+
+        self.assertFalse(profiler.is_running())
+        self.assertIsNone(profiler.stop())
+
+        stats = pstats.Stats(path)
+        self.assertTrue(stats.total_calls)
+
+    def test_sample(self):
+        profiler = Profiler(self.mainloop, self.tempdir.name)
+
+        path = profiler.start(mode=MODE_SAMPLE)
+        self.assertTrue(path.endswith('.folded'))
+
+        def busy():
+            deadline = time.process_time() + 0.1
+            while time.process_time() < deadline:
+                pass
+
+        busy()
+
+        self.assertEqual(path, profiler.stop())
+
+        with open(path) as f:
+            lines = f.read().splitlines()
+
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn('busy (test_util_profiler.py:', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_unwritable(self):
+        profiler = Profiler(self.mainloop, os.path.join(self.tempdir.name, 'missing'))
+
+        profiler.start()
+
+        with self.assertLogs('nervixd.util.profiler', 'ERROR'):
+            self.assertIsNone(profiler.stop())
+
+
+if __name__ == '__main__':
+    unittest.main()